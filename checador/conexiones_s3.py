@@ -0,0 +1,233 @@
+"""
+Clientes de boto3 compartidos y conteo de llamadas a S3 / Spaces
+
+S3Boto3Storage crea una sesión y un cliente de boto3 por instancia y por
+hilo, y los storages se instancian seguido (campos de modelo, borrado y copia
+de archivos, reportes). Cada cliente nuevo carga el modelo del servicio y
+abre su propio pool de conexiones, así que las conexiones TLS con Spaces casi
+nunca se reutilizan.
+
+Aquí hay un cliente por combinación de endpoint, región y credenciales,
+compartido por todos los storages y todos los hilos del proceso (los clientes
+de botocore son seguros entre hilos), con un pool de S3_MAX_POOL_CONNECTIONS
+conexiones y TCP keep-alive. Los resources de boto3 no son seguros entre
+hilos: cada hilo tiene el suyo, pero todos usan el cliente compartido.
+
+Cada llamada a la API suma a checador_s3_llamadas_total y, dentro de un
+RegistroS3 activo (LlamadasS3Middleware), al conteo de la petición con la
+operación y la llave, lo que deja ver HEAD/PUT repetidos sobre el mismo objeto.
+"""
+import contextvars
+import json
+import logging
+import threading
+import time
+from collections import Counter
+
+import botocore
+from botocore.config import Config
+from django.conf import settings
+
+from checador.metricas import S3_LLAMADAS
+
+logger = logging.getLogger(__name__)
+
+_clientes = {}
+_sesiones = {}
+_lock = threading.Lock()
+_recursos = threading.local()
+
+_registro_actual = contextvars.ContextVar('registro_s3', default=None)
+
+
+def _llave(storage, firmado):
+    return (
+        storage.endpoint_url, storage.region_name, storage.use_ssl, storage.verify,
+        storage.session_profile, storage.access_key, storage.secret_key, storage.security_token,
+        storage.addressing_style, storage.signature_version, firmado,
+    )
+
+
+def _config(storage, firmado):
+    config = storage.client_config.merge(Config(
+        max_pool_connections=getattr(settings, 'S3_MAX_POOL_CONNECTIONS', 20),
+        tcp_keepalive=getattr(settings, 'S3_TCP_KEEPALIVE', True),
+        retries={'mode': 'standard', 'max_attempts': getattr(settings, 'S3_MAX_INTENTOS', 3)},
+    ))
+    if not firmado:
+        config = config.merge(Config(signature_version=botocore.UNSIGNED))
+    return config
+
+
+def _sesion(storage, llave):
+    # boto3.Session no es segura entre hilos: solo se usa con _lock tomado
+    sesion = _sesiones.get(llave)
+    if sesion is None:
+        sesion = _sesiones[llave] = storage._create_session()
+    return sesion
+
+
+def _argumentos(storage, firmado):
+    return {
+        'region_name': storage.region_name,
+        'use_ssl': storage.use_ssl,
+        'endpoint_url': storage.endpoint_url,
+        'config': _config(storage, firmado),
+        'verify': storage.verify,
+    }
+
+
+def obtener_cliente(storage, firmado=True):
+    """Cliente de botocore compartido para la configuración del storage"""
+    llave = _llave(storage, firmado)
+    cliente = _clientes.get(llave)
+    if cliente is None:
+        with _lock:
+            cliente = _clientes.get(llave)
+            if cliente is None:
+                cliente = _sesion(storage, llave).client('s3', **_argumentos(storage, firmado))
+                _instrumentar(cliente)
+                _clientes[llave] = cliente
+                logger.info(f"🔌 Cliente S3 creado para {storage.endpoint_url or 'AWS'} ({len(_clientes)} en el proceso)")
+    return cliente
+
+
+def obtener_recurso(storage, firmado=True):
+    """Resource de S3 del hilo actual montado sobre el cliente compartido"""
+    llave = _llave(storage, firmado)
+    recursos = getattr(_recursos, 'por_llave', None)
+    if recursos is None:
+        recursos = _recursos.por_llave = {}
+    recurso = recursos.get(llave)
+    if recurso is None:
+        cliente = obtener_cliente(storage, firmado)
+        with _lock:
+            recurso = _sesion(storage, llave).resource('s3', **_argumentos(storage, firmado))
+        # Buckets y objetos toman el cliente del resource al crearse
+        recurso.meta.client = cliente
+        recursos[llave] = recurso
+    return recurso
+
+
+def limpiar():
+    """Descarta los clientes compartidos (pruebas o cambio de credenciales)"""
+    with _lock:
+        _clientes.clear()
+        _sesiones.clear()
+    _recursos.__dict__.clear()
+
+
+class ConexionesCompartidasMixin:
+    """Hace que un S3Boto3Storage use los clientes compartidos del proceso"""
+
+    @property
+    def connection(self):
+        return obtener_recurso(self)
+
+    @property
+    def unsigned_connection(self):
+        return obtener_recurso(self, firmado=False)
+
+
+# === CONTEO DE LLAMADAS ===
+
+def _antes(params, model, context, **kwargs):
+    context['checador_s3'] = (time.perf_counter(), model.name, params.get('Key', ''))
+
+
+def _despues(context, **kwargs):
+    # after-call-error no recibe el modelo de la operación: todo sale del contexto
+    medicion = context.pop('checador_s3', None)
+    if medicion is None:
+        return
+    inicio, operacion, llave = medicion
+    S3_LLAMADAS.inc(operacion=operacion)
+    registro = _registro_actual.get()
+    if registro is not None:
+        registro.registrar(operacion, llave, (time.perf_counter() - inicio) * 1000)
+
+
+def _instrumentar(cliente):
+    eventos = cliente.meta.events
+    eventos.register('before-parameter-build.s3', _antes, unique_id='checador-s3-antes')
+    eventos.register('after-call.s3', _despues, unique_id='checador-s3-despues')
+    eventos.register('after-call-error.s3', _despues, unique_id='checador-s3-error')
+
+
+class RegistroS3:
+    """
+    Cuenta las llamadas a S3 hechas en el contexto actual mientras está
+    activo (como context manager)
+
+    Atributos:
+        llamadas: Número de llamadas a la API
+        ms: Tiempo total en S3 (milisegundos)
+        operaciones: Counter por operación (HeadObject, PutObject, ...)
+        objetos: Counter por (operación, llave)
+    """
+
+    def __init__(self):
+        self.llamadas = 0
+        self.ms = 0.0
+        self.operaciones = Counter()
+        self.objetos = Counter()
+        self._token = None
+
+    def registrar(self, operacion, llave, ms):
+        self.llamadas += 1
+        self.ms += ms
+        self.operaciones[operacion] += 1
+        if llave:
+            self.objetos[(operacion, llave)] += 1
+
+    def __enter__(self):
+        self._token = _registro_actual.set(self)
+        return self
+
+    def __exit__(self, *exc_info):
+        _registro_actual.reset(self._token)
+        self._token = None
+        return False
+
+    def repetidas(self):
+        """(operación, llave, veces) de las llamadas hechas más de una vez sobre el mismo objeto"""
+        return [(operacion, llave, veces) for (operacion, llave), veces in self.objetos.most_common() if veces > 1]
+
+
+class LlamadasS3Middleware:
+    """
+    Cuenta las llamadas a S3 de cada petición y avisa cuando pasan de
+    S3_MAX_LLAMADAS o cuando se repite una operación sobre el mismo objeto.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.max_llamadas = getattr(settings, 'S3_MAX_LLAMADAS', 10)
+        self.encabezados = getattr(settings, 'S3_LLAMADAS_ENCABEZADOS', True)
+
+    def __call__(self, request):
+        with RegistroS3() as registro:
+            response = self.get_response(request)
+
+        repetidas = registro.repetidas()
+        if registro.llamadas > self.max_llamadas or repetidas:
+            logger.warning('⚠️ Llamadas a S3 de más en la petición %s', json.dumps({
+                'metodo': request.method,
+                'ruta': request.path,
+                'estado': response.status_code,
+                'llamadas': registro.llamadas,
+                'ms': round(registro.ms, 1),
+                'operaciones': dict(registro.operaciones),
+                'repetidas': [
+                    {'operacion': operacion, 'llave': llave, 'veces': veces}
+                    for operacion, llave, veces in repetidas[:5]
+                ],
+            }, ensure_ascii=False))
+
+        if self.encabezados and registro.llamadas:
+            response['X-S3-Llamadas'] = str(registro.llamadas)
+            metrica = f's3;dur={registro.ms:.1f};desc="{registro.llamadas} llamadas"'
+            existente = response.get('Server-Timing')
+            response['Server-Timing'] = f'{existente}, {metrica}' if existente else metrica
+
+        return response
@@ -0,0 +1,315 @@
+"""
+Métricas de la aplicación en formato de texto de Prometheus
+
+Registro en memoria, sin dependencias, de contadores, medidores (gauges) e
+histogramas. Todas las métricas se definen en este módulo para que cualquier
+proceso (workers de gunicorn y procesos del pool de reconocimiento) sepa
+exportar las que escribieron los demás.
+
+Modo multiproceso: con METRICAS_DIR cada proceso vuelca su estado a
+METRICAS_DIR/metricas_<pid>.json (escritura diferida METRICAS_INTERVALO_ESCRITURA
+segundos y al salir) y /metrics combina todos los archivos: los contadores e
+histogramas se suman y de cada medidor se toma el valor más reciente. Sin
+METRICAS_DIR solo se exporta el proceso que atiende la petición.
+"""
+import atexit
+import glob
+import json
+import logging
+import math
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+BUCKETS_SEGUNDOS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+class _Registro:
+    """Valores de todas las métricas del proceso actual"""
+
+    def __init__(self):
+        self.metricas = {}
+        self._reiniciar()
+
+    def _reiniciar(self):
+        self._pid = os.getpid()
+        self._lock = threading.Lock()
+        self._valores = {}
+        self._temporizador = None
+        self._atexit = False
+
+    def _verificar_proceso(self):
+        # Tras un fork el hijo no debe reportar lo que acumuló el padre
+        if self._pid != os.getpid():
+            self._reiniciar()
+
+    def actualizar(self, nombre, clave, funcion):
+        """Aplica funcion(valor_actual) -> nuevo valor bajo el lock"""
+        self._verificar_proceso()
+        with self._lock:
+            serie = self._valores.setdefault(nombre, {})
+            serie[clave] = funcion(serie.get(clave))
+        self._programar_escritura()
+
+    def instantanea(self):
+        self._verificar_proceso()
+        with self._lock:
+            return {
+                nombre: {clave: _copiar(valor) for clave, valor in serie.items()}
+                for nombre, serie in self._valores.items()
+            }
+
+    # === MODO MULTIPROCESO ===
+
+    @staticmethod
+    def directorio():
+        return getattr(settings, 'METRICAS_DIR', '') or ''
+
+    def _programar_escritura(self):
+        if not self.directorio():
+            return
+        with self._lock:
+            if not self._atexit:
+                atexit.register(self.escribir)
+                self._atexit = True
+            if self._temporizador is not None:
+                return
+            self._temporizador = threading.Timer(
+                getattr(settings, 'METRICAS_INTERVALO_ESCRITURA', 1.0), self.escribir
+            )
+            self._temporizador.daemon = True
+            self._temporizador.start()
+
+    def escribir(self):
+        """Vuelca el estado del proceso a su archivo (escritura atómica)"""
+        directorio = self.directorio()
+        if not directorio:
+            return
+        with self._lock:
+            self._temporizador = None
+        datos = {
+            nombre: [[list(clave), valor] for clave, valor in serie.items()]
+            for nombre, serie in self.instantanea().items()
+        }
+        ruta = os.path.join(directorio, f'metricas_{os.getpid()}.json')
+        temporal = f'{ruta}.tmp'
+        try:
+            os.makedirs(directorio, exist_ok=True)
+            with open(temporal, 'w') as archivo:
+                json.dump(datos, archivo)
+            os.replace(temporal, ruta)
+        except OSError as e:
+            logger.error(f"❌ No se pudieron escribir las métricas en {ruta}: {e}")
+
+    def combinadas(self):
+        """
+        Valores de todos los procesos (o solo de este sin METRICAS_DIR)
+
+        Returns:
+            dict: nombre -> {tupla de etiquetas: valor}
+        """
+        directorio = self.directorio()
+        if not directorio:
+            return self.instantanea()
+
+        self.escribir()
+        combinadas = {}
+        for ruta in glob.glob(os.path.join(directorio, 'metricas_*.json')):
+            try:
+                with open(ruta) as archivo:
+                    datos = json.load(archivo)
+            except (OSError, ValueError):
+                continue
+            for nombre, serie in datos.items():
+                metrica = self.metricas.get(nombre)
+                if metrica is None:
+                    continue
+                destino = combinadas.setdefault(nombre, {})
+                for clave, valor in serie:
+                    clave = tuple(clave)
+                    destino[clave] = metrica.combinar(destino.get(clave), valor)
+        return combinadas
+
+
+def _copiar(valor):
+    return list(valor) if isinstance(valor, list) else valor
+
+
+_registro = _Registro()
+
+
+class _Metrica:
+    tipo = None
+
+    def __init__(self, nombre, ayuda, etiquetas=()):
+        self.nombre = nombre
+        self.ayuda = ayuda
+        self.etiquetas = tuple(etiquetas)
+        _registro.metricas[nombre] = self
+
+    def _clave(self, etiquetas):
+        return tuple(str(etiquetas.get(etiqueta, '')) for etiqueta in self.etiquetas)
+
+    def _etiquetas_texto(self, clave, extra=None):
+        pares = list(zip(self.etiquetas, clave))
+        if extra:
+            pares.append(extra)
+        if not pares:
+            return ''
+        return '{' + ','.join(f'{etiqueta}="{_escapar(valor)}"' for etiqueta, valor in pares) + '}'
+
+    def exportar(self, serie):
+        lineas = [f'# HELP {self.nombre} {self.ayuda}', f'# TYPE {self.nombre} {self.tipo}']
+        for clave in sorted(serie):
+            lineas.extend(self._lineas(clave, serie[clave]))
+        return lineas
+
+
+class Contador(_Metrica):
+    """Valor que solo aumenta"""
+
+    tipo = 'counter'
+
+    def inc(self, cantidad=1, **etiquetas):
+        _registro.actualizar(self.nombre, self._clave(etiquetas), lambda valor: (valor or 0) + cantidad)
+
+    @staticmethod
+    def combinar(actual, otro):
+        return (actual or 0) + otro
+
+    def _lineas(self, clave, valor):
+        return [f'{self.nombre}{self._etiquetas_texto(clave)} {_numero(valor)}']
+
+
+class Medidor(_Metrica):
+    """Valor instantáneo; entre procesos gana la escritura más reciente"""
+
+    tipo = 'gauge'
+
+    def set(self, valor, **etiquetas):
+        _registro.actualizar(self.nombre, self._clave(etiquetas), lambda _: [valor, time.time()])
+
+    @staticmethod
+    def combinar(actual, otro):
+        return otro if actual is None or otro[1] >= actual[1] else actual
+
+    def _lineas(self, clave, valor):
+        return [f'{self.nombre}{self._etiquetas_texto(clave)} {_numero(valor[0])}']
+
+
+class Histograma(_Metrica):
+    """Distribución de observaciones (en segundos) por buckets"""
+
+    tipo = 'histogram'
+
+    def __init__(self, nombre, ayuda, etiquetas=(), buckets=BUCKETS_SEGUNDOS):
+        super().__init__(nombre, ayuda, etiquetas)
+        self.buckets = tuple(buckets)
+
+    def observe(self, valor, **etiquetas):
+        def sumar(actual):
+            # [conteo por bucket (no acumulado)..., conteo +Inf, suma]
+            actual = actual or [0] * (len(self.buckets) + 2)
+            for i, limite in enumerate(self.buckets):
+                if valor <= limite:
+                    actual[i] += 1
+                    break
+            else:
+                actual[len(self.buckets)] += 1
+            actual[-1] += valor
+            return actual
+
+        _registro.actualizar(self.nombre, self._clave(etiquetas), sumar)
+
+    @contextmanager
+    def medir(self, **etiquetas):
+        """Observa la duración del bloque"""
+        inicio = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - inicio, **etiquetas)
+
+    @staticmethod
+    def combinar(actual, otro):
+        return list(otro) if actual is None else [a + b for a, b in zip(actual, otro)]
+
+    def _lineas(self, clave, valor):
+        lineas = []
+        acumulado = 0
+        for limite, conteo in zip(self.buckets + (math.inf,), valor[:-1]):
+            acumulado += conteo
+            le = '+Inf' if limite == math.inf else _numero(limite)
+            lineas.append(f'{self.nombre}_bucket{self._etiquetas_texto(clave, ("le", le))} {acumulado}')
+        etiquetas = self._etiquetas_texto(clave)
+        lineas.append(f'{self.nombre}_sum{etiquetas} {_numero(valor[-1])}')
+        lineas.append(f'{self.nombre}_count{etiquetas} {acumulado}')
+        return lineas
+
+
+def _escapar(valor):
+    return valor.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _numero(valor):
+    return repr(float(valor)) if not float(valor).is_integer() else str(int(valor))
+
+
+def exportar():
+    """Texto de exposición de Prometheus con todas las métricas definidas"""
+    valores = _registro.combinadas()
+    lineas = []
+    for nombre, metrica in _registro.metricas.items():
+        lineas.extend(metrica.exportar(valores.get(nombre, {})))
+    return '\n'.join(lineas) + '\n'
+
+
+def limpiar_directorio(directorio):
+    """Borra los archivos de una ejecución anterior (al arrancar gunicorn)"""
+    for ruta in glob.glob(os.path.join(directorio, 'metricas_*.json*')):
+        try:
+            os.remove(ruta)
+        except OSError:
+            pass
+
+
+# === MÉTRICAS DE LA APLICACIÓN ===
+
+ETAPA_SEGUNDOS = Histograma(
+    'checador_etapa_segundos',
+    'Duración de cada etapa de carga, reconocimiento y registro de marcas',
+    etiquetas=('etapa',)
+)
+RECONOCIMIENTOS = Contador(
+    'checador_reconocimientos_total',
+    'Reconocimientos faciales por resultado (coincidencia, sin_coincidencia, galeria_vacia)',
+    etiquetas=('resultado',)
+)
+RECHAZOS = Contador(
+    'checador_rechazos_imagen_total',
+    'Imágenes rechazadas antes de buscar en la galería, por motivo',
+    etiquetas=('motivo',)
+)
+GALERIA_ROSTROS = Medidor(
+    'checador_galeria_rostros',
+    'Encodings cargados en la galería de rostros'
+)
+FOTOS_SUBIDAS = Contador(
+    'checador_fotos_subidas_total',
+    'Subidas de fotos de registro desde el spool por resultado (subida, reintento, error)',
+    etiquetas=('resultado',)
+)
+FOTOS_PENDIENTES = Medidor(
+    'checador_fotos_pendientes',
+    'Fotos de registro en el spool local esperando subirse'
+)
+S3_LLAMADAS = Contador(
+    'checador_s3_llamadas_total',
+    'Llamadas a la API de S3 / Spaces por operación (HeadObject, PutObject, GetObject, ...)',
+    etiquetas=('operacion',)
+)
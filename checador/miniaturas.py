@@ -0,0 +1,141 @@
+"""
+Miniaturas de las fotos de rostro y de marcas de asistencia
+
+Cada foto guardada tiene versiones reducidas (MINIATURAS_TAMANOS, lado mayor
+en px) en WebP, generadas una vez al subirla y guardadas junto a la original
+con una llave predecible:
+
+    asistencias/foto_20250101_080000.jpg
+    asistencias/miniaturas/foto_20250101_080000_96.webp
+    asistencias/miniaturas/foto_20250101_080000_320.webp
+
+Como la llave se deriva del nombre de la original, las URLs se arman sin
+consultar el storage. Las fotos anteriores se procesan con el comando
+generar_miniaturas.
+"""
+import io
+import logging
+import posixpath
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+
+logger = logging.getLogger(__name__)
+
+FORMATO = 'WEBP'
+EXTENSION = 'webp'
+CALIDAD = 80
+
+
+def tamanos():
+    """{nombre: lado mayor en px}, de la más chica a la más grande"""
+    return getattr(settings, 'MINIATURAS_TAMANOS', {'chica': 96, 'mediana': 320})
+
+
+def ruta_miniatura(nombre, lado):
+    """Llave de la miniatura de `lado` px de la foto `nombre`"""
+    directorio, archivo = posixpath.split(nombre)
+    base = posixpath.splitext(archivo)[0]
+    return posixpath.join(directorio, 'miniaturas', f'{base}_{lado}.{EXTENSION}')
+
+
+def urls_miniaturas(archivo):
+    """
+    URLs de cada miniatura de un FieldFile
+
+    Returns:
+        dict {nombre: url} o None si el campo no tiene foto
+    """
+    if not archivo:
+        return None
+    try:
+        return {
+            nombre: archivo.storage.url(ruta_miniatura(archivo.name, lado))
+            for nombre, lado in tamanos().items()
+        }
+    except Exception as e:
+        logger.error(f"❌ Error obteniendo URL de miniatura: {e}")
+        return None
+
+
+def _guardar(storage, nombre, contenido):
+    # MediaStorage agrega un timestamp al nombre; la miniatura necesita su llave exacta
+    guardar = getattr(storage, 'guardar_sin_renombrar', None)
+    if guardar is not None:
+        return guardar(nombre, contenido)
+    if storage.exists(nombre):
+        storage.delete(nombre)
+    return storage.save(nombre, contenido)
+
+
+def _decodificar(archivo):
+    from PIL import Image, ImageOps
+
+    imagen = Image.open(archivo)
+    lado_mayor = max(tamanos().values())
+    # JPEG: decodificar directamente a baja resolución
+    imagen.draft('RGB', (lado_mayor, lado_mayor))
+    imagen = ImageOps.exif_transpose(imagen)
+    imagen.load()
+    return imagen
+
+
+def generar_miniaturas(storage, nombre, imagen=None, origen=None):
+    """
+    Genera y guarda las miniaturas de una foto
+
+    Args:
+        storage: Storage de la foto original
+        nombre: Nombre de la original en el storage
+        imagen: Imagen PIL ya decodificada
+        origen: Archivo o path local con la foto; sin imagen ni origen se
+            lee la original del storage
+
+    Returns:
+        list: Llaves guardadas
+    """
+    from PIL import Image
+
+    if imagen is None:
+        if origen is not None:
+            if hasattr(origen, 'seek'):
+                origen.seek(0)
+            imagen = _decodificar(origen)
+        else:
+            with storage.open(nombre, 'rb') as archivo:
+                imagen = _decodificar(archivo)
+    if imagen.mode not in ('RGB', 'RGBA'):
+        imagen = imagen.convert('RGB')
+
+    guardadas = []
+    # De la más grande a la más chica, reduciendo la anterior
+    for lado in sorted(tamanos().values(), reverse=True):
+        imagen = imagen.copy()
+        imagen.thumbnail((lado, lado), Image.Resampling.LANCZOS)
+        salida = io.BytesIO()
+        imagen.save(salida, format=FORMATO, quality=CALIDAD)
+        guardadas.append(_guardar(storage, ruta_miniatura(nombre, lado), ContentFile(salida.getvalue())))
+    return guardadas
+
+
+def generar_miniaturas_seguro(storage, nombre, imagen=None, origen=None):
+    """generar_miniaturas sin propagar errores: la foto original ya quedó guardada"""
+    try:
+        guardadas = generar_miniaturas(storage, nombre, imagen, origen)
+        logger.info(f"🖼️ Miniaturas de {nombre}: {len(guardadas)}")
+        return guardadas
+    except Exception as e:
+        logger.error(f"❌ Error generando miniaturas de {nombre}: {e}")
+        return []
+
+
+def eliminar_miniaturas(storage, nombre):
+    """Borra las miniaturas de una foto (las que no existan se ignoran)"""
+    for lado in tamanos().values():
+        ruta = ruta_miniatura(nombre, lado)
+        try:
+            storage.delete(ruta)
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            logger.error(f"❌ Error eliminando miniatura {ruta}: {e}")
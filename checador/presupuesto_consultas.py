@@ -0,0 +1,135 @@
+"""
+Presupuesto de consultas SQL por petición (diagnóstico de N+1)
+
+RegistroConsultas envuelve la ejecución de SQL de todas las conexiones con
+execute_wrapper y acumula el número de consultas, el tiempo total en base de
+datos y cuántas veces se repite cada forma de consulta (el SQL con los
+parámetros ya separados y las listas IN colapsadas). Una forma repetida
+muchas veces en una sola petición es casi siempre un N+1.
+
+PresupuestoConsultasMiddleware es opcional (QUERY_BUDGET_ACTIVO) y cuando
+la petición excede el presupuesto escribe una línea de log en JSON y agrega
+encabezados a la respuesta. Las pruebas usan el mismo registro a través de
+checador.testing.PresupuestoConsultasMixin.
+"""
+import json
+import logging
+import re
+import time
+from collections import Counter
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+_LISTA_IN = re.compile(r'\bIN \((?:%s(?:, )?)+\)', re.IGNORECASE)
+_CONTROL_TRANSACCION = re.compile(r'^\s*(SAVEPOINT|RELEASE SAVEPOINT|ROLLBACK TO SAVEPOINT)\b', re.IGNORECASE)
+
+
+def forma_sql(sql):
+    """Forma de una consulta: SQL parametrizado con las listas IN colapsadas"""
+    return _LISTA_IN.sub('IN (...)', sql)
+
+
+class RegistroConsultas:
+    """
+    Cuenta las consultas ejecutadas mientras está activo (como context manager)
+
+    Atributos:
+        consultas: Número de sentencias ejecutadas
+        ms: Tiempo total en base de datos (milisegundos)
+        formas: Counter de formas de consulta
+    """
+
+    def __init__(self):
+        self.consultas = 0
+        self.ms = 0.0
+        self.formas = Counter()
+        self._pila = None
+
+    def __call__(self, execute, sql, params, many, context):
+        inicio = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.ms += (time.perf_counter() - inicio) * 1000
+            self.consultas += 1
+            # Los savepoints llevan nombres únicos; no son formas que repetir
+            if not _CONTROL_TRANSACCION.match(sql):
+                self.formas[forma_sql(sql)] += 1
+
+    def __enter__(self):
+        self._pila = ExitStack()
+        for alias in connections:
+            self._pila.enter_context(connections[alias].execute_wrapper(self))
+        return self
+
+    def __exit__(self, *exc_info):
+        self._pila.close()
+        self._pila = None
+        return False
+
+    def repetidas(self, minimo):
+        """Formas ejecutadas al menos `minimo` veces, de la más repetida a la menos"""
+        return [(forma, veces) for forma, veces in self.formas.most_common() if veces >= minimo]
+
+    def excesos(self, max_consultas=None, max_repeticiones=None):
+        """
+        Returns:
+            dict: Con 'consultas' y/o 'repetidas' si se excedió el presupuesto;
+            vacío si no
+        """
+        excesos = {}
+        if max_consultas is not None and self.consultas > max_consultas:
+            excesos['consultas'] = self.consultas
+        if max_repeticiones is not None:
+            repetidas = self.repetidas(max_repeticiones + 1)
+            if repetidas:
+                excesos['repetidas'] = repetidas
+        return excesos
+
+
+class PresupuestoConsultasMiddleware:
+    """
+    Mide las consultas de cada petición y avisa cuando exceden
+    QUERY_BUDGET_MAX_CONSULTAS o cuando una misma forma se repite más de
+    QUERY_BUDGET_MAX_REPETICIONES veces.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.max_consultas = getattr(settings, 'QUERY_BUDGET_MAX_CONSULTAS', 50)
+        self.max_repeticiones = getattr(settings, 'QUERY_BUDGET_MAX_REPETICIONES', 5)
+        self.encabezados = getattr(settings, 'QUERY_BUDGET_ENCABEZADOS', True)
+
+    def __call__(self, request):
+        with RegistroConsultas() as registro:
+            response = self.get_response(request)
+
+        excesos = registro.excesos(self.max_consultas, self.max_repeticiones)
+        if excesos:
+            logger.warning('⚠️ Presupuesto de consultas excedido %s', json.dumps({
+                'metodo': request.method,
+                'ruta': request.path,
+                'estado': response.status_code,
+                'consultas': registro.consultas,
+                'ms': round(registro.ms, 1),
+                'max_consultas': self.max_consultas,
+                'repetidas': [
+                    {'sql': forma[:300], 'veces': veces}
+                    for forma, veces in excesos.get('repetidas', [])[:5]
+                ],
+            }, ensure_ascii=False))
+
+        if self.encabezados:
+            response['X-DB-Consultas'] = str(registro.consultas)
+            response['X-DB-Tiempo-Ms'] = f'{registro.ms:.1f}'
+            metrica = f'db;dur={registro.ms:.1f};desc="{registro.consultas} consultas"'
+            existente = response.get('Server-Timing')
+            response['Server-Timing'] = f'{existente}, {metrica}' if existente else metrica
+            if excesos:
+                response['X-DB-Presupuesto-Excedido'] = ','.join(excesos)
+
+        return response
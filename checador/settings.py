@@ -382,3 +382,115 @@ FILE_UPLOAD_HANDLERS = [
 # Directorio específico para archivos temporales de reportes
 REPORTES_TEMP_DIR = 'reportes/temp'
 REPORTES_STORAGE_LOCATION = 'reportes'
+# Bytes que un reporte Excel se mantiene en memoria antes de pasar a un archivo temporal
+REPORTES_SPOOL_MAX_BYTES = get_env('REPORTES_SPOOL_MAX_BYTES', default=str(8 * 1024 * 1024), cast=int)
+# Hilos que generan reportes en segundo plano dentro de cada proceso
+REPORTES_TRABAJOS_WORKERS = get_env('REPORTES_TRABAJOS_WORKERS', default='1', cast=int)
+# Minutos tras los que un trabajo 'procesando' se considera interrumpido
+REPORTES_TRABAJO_TIMEOUT_MINUTOS = get_env('REPORTES_TRABAJO_TIMEOUT_MINUTOS', default='30', cast=int)
+# Segundos de validez de las URLs firmadas de descarga
+REPORTES_URL_EXPIRACION = get_env('REPORTES_URL_EXPIRACION', default='3600', cast=int)
+# Reutilizar Excel ya generados cuando los datos del periodo no cambiaron
+REPORTES_CACHE_ACTIVO = get_env('REPORTES_CACHE_ACTIVO', default='True', cast=bool)
+
+# === SUBIDA DE FOTOS DE REGISTRO ===
+# Guardar la marca sin esperar al almacenamiento; la foto se sube después desde un spool local
+FOTOS_SUBIDA_ASINCRONA = get_env('FOTOS_SUBIDA_ASINCRONA', default='True', cast=bool)
+# Directorio local donde esperan las fotos hasta quedar subidas (no debe ser efímero)
+FOTOS_SPOOL_DIR = BASE_DIR / get_env('FOTOS_SPOOL_DIR', default='media/spool/')
+# Hilos que suben fotos en segundo plano dentro de cada proceso
+FOTOS_SUBIDA_WORKERS = get_env('FOTOS_SUBIDA_WORKERS', default='1', cast=int)
+# Intentos por ronda antes de dejar la foto al job de reintentos (cada minuto)
+FOTOS_SUBIDA_REINTENTOS = get_env('FOTOS_SUBIDA_REINTENTOS', default='3', cast=int)
+# Minutos tras los que una subida en curso se considera interrumpida
+FOTOS_SUBIDA_TIMEOUT_MINUTOS = get_env('FOTOS_SUBIDA_TIMEOUT_MINUTOS', default='10', cast=int)
+
+# === CONEXIONES A S3 / SPACES ===
+# Conexiones HTTP del pool del cliente S3 compartido por todos los storages e hilos del proceso
+S3_MAX_POOL_CONNECTIONS = get_env('S3_MAX_POOL_CONNECTIONS', default='20', cast=int)
+# Mantener vivas las conexiones ociosas con Spaces (TCP keep-alive)
+S3_TCP_KEEPALIVE = get_env('S3_TCP_KEEPALIVE', default='True', cast=bool)
+# Intentos por llamada a S3 (reintentos estándar de botocore ante errores transitorios)
+S3_MAX_INTENTOS = get_env('S3_MAX_INTENTOS', default='3', cast=int)
+# Middleware opcional que cuenta las llamadas a S3 de cada petición
+S3_LLAMADAS_ACTIVO = get_env('S3_LLAMADAS_ACTIVO', default='False', cast=bool)
+# Llamadas a S3 por petición antes de registrar un aviso (también se avisa si se repite una llamada sobre el mismo objeto)
+S3_MAX_LLAMADAS = get_env('S3_MAX_LLAMADAS', default='10', cast=int)
+# Agregar X-S3-Llamadas y Server-Timing a las respuestas
+S3_LLAMADAS_ENCABEZADOS = get_env('S3_LLAMADAS_ENCABEZADOS', default='True', cast=bool)
+if S3_LLAMADAS_ACTIVO:
+    MIDDLEWARE.insert(0, 'checador.conexiones_s3.LlamadasS3Middleware')
+
+# === PRESUPUESTO DE CONSULTAS (DIAGNÓSTICO N+1) ===
+# Middleware opcional que mide consultas SQL y tiempo en BD por petición
+QUERY_BUDGET_ACTIVO = get_env('QUERY_BUDGET_ACTIVO', default='False', cast=bool)
+# Consultas por petición antes de registrar un aviso
+QUERY_BUDGET_MAX_CONSULTAS = get_env('QUERY_BUDGET_MAX_CONSULTAS', default='50', cast=int)
+# Veces que puede repetirse una misma forma de consulta antes de considerarla N+1
+QUERY_BUDGET_MAX_REPETICIONES = get_env('QUERY_BUDGET_MAX_REPETICIONES', default='5', cast=int)
+# Agregar X-DB-Consultas, X-DB-Tiempo-Ms y Server-Timing a las respuestas
+QUERY_BUDGET_ENCABEZADOS = get_env('QUERY_BUDGET_ENCABEZADOS', default='True', cast=bool)
+if QUERY_BUDGET_ACTIVO:
+    MIDDLEWARE.insert(0, 'checador.presupuesto_consultas.PresupuestoConsultasMiddleware')
+
+# === MÉTRICAS (/metrics) ===
+# Directorio compartido donde cada proceso vuelca sus métricas para combinarlas
+# entre workers de gunicorn y el pool de reconocimiento; vacío = solo el proceso actual
+METRICAS_DIR = get_env('METRICAS_DIR', default='')
+# Segundos máximos entre una actualización y su escritura en METRICAS_DIR
+METRICAS_INTERVALO_ESCRITURA = get_env('METRICAS_INTERVALO_ESCRITURA', default='1.0', cast=float)
+# Token Bearer opcional para que Prometheus lea /metrics sin usuario staff
+METRICAS_TOKEN = get_env('METRICAS_TOKEN', default='')
+
+# === CONFIGURACIÓN DE RECONOCIMIENTO FACIAL ===
+# Tipo de dato para guardar encodings: 'float32' (512 bytes) o 'float16' (256 bytes)
+FACE_ENCODING_DTYPE = get_env('FACE_ENCODING_DTYPE', default='float32')
+
+# Lado mayor (px) al que se decodifican las fotos subidas (modo draft de JPEG); 0 = resolución original
+IMAGEN_MAX_LADO = get_env('IMAGEN_MAX_LADO', default='1280', cast=int)
+# Calidad del JPEG que se guarda de cada foto de marca o de registro de rostro
+IMAGEN_CALIDAD_JPEG = get_env('IMAGEN_CALIDAD_JPEG', default='85', cast=int)
+# Miniaturas WebP de las fotos guardadas: nombre -> lado mayor en px (ver checador.miniaturas)
+MINIATURAS_TAMANOS = {'chica': 96, 'mediana': 320}
+
+# Detector de rostros: 'hog' (dlib sobre imagen reducida), 'haar' (OpenCV) o 'legacy' (HOG a resolución completa)
+FACE_DETECTOR_BACKEND = get_env('FACE_DETECTOR_BACKEND', default='hog')
+# Lado mayor (px) de la copia reducida sobre la que se detecta; 0 desactiva la reducción
+FACE_DETECTION_MAX_SIDE = get_env('FACE_DETECTION_MAX_SIDE', default='640', cast=int)
+# Veces que el detector HOG amplía la imagen para encontrar rostros pequeños
+FACE_DETECTION_UPSAMPLE = get_env('FACE_DETECTION_UPSAMPLE', default='0', cast=int)
+
+# Pool de procesos de reconocimiento por worker de gunicorn (0 = reconocer en el mismo proceso)
+FACE_RECOGNITION_WORKERS = get_env('FACE_RECOGNITION_WORKERS', default='1', cast=int)
+# Máximo de reconocimientos en curso por worker antes de responder 503
+FACE_RECOGNITION_MAX_PENDING = get_env('FACE_RECOGNITION_MAX_PENDING', default='4', cast=int)
+# Segundos máximos de espera por un reconocimiento antes de responder 504
+FACE_RECOGNITION_TIMEOUT = get_env('FACE_RECOGNITION_TIMEOUT', default='30', cast=int)
+
+# Segundos entre verificaciones de la galería de rostros contra la base de datos
+# (cambios hechos por otros workers); 0 = verificar en cada reconocimiento
+FACE_GALLERY_VERIFICACION_SEGUNDOS = get_env('FACE_GALLERY_VERIFICACION_SEGUNDOS', default='5', cast=float)
+
+# Índice aproximado (IVF) para galerías grandes; la coincidencia se confirma con distancia exacta
+FACE_GALLERY_INDICE = get_env('FACE_GALLERY_INDICE', default='false', cast=bool)
+# Encodings mínimos en la galería para usar el índice (por debajo la búsqueda lineal es más rápida)
+FACE_GALLERY_INDICE_MINIMO = get_env('FACE_GALLERY_INDICE_MINIMO', default='20000', cast=int)
+# Listas del índice que se revisan por búsqueda (más = mejor recall, más lento)
+FACE_GALLERY_INDICE_SONDAS = get_env('FACE_GALLERY_INDICE_SONDAS', default='8', cast=int)
+# Margen bajo FACE_TOLERANCE para aceptar el candidato del índice sin búsqueda lineal
+FACE_GALLERY_INDICE_MARGEN = get_env('FACE_GALLERY_INDICE_MARGEN', default='0.15', cast=float)
+# Directorio donde se persiste el índice, junto a media
+FACE_GALLERY_INDICE_DIR = BASE_DIR / get_env('FACE_GALLERY_INDICE_DIR', default='media/indices/')
+
+# === SINCRONIZACIÓN DE MARCAS DE KIOSCOS ===
+# Tokens de los kioscos (encabezado X-Kiosco-Token); sin un token válido no se aceptan lotes sin conexión
+KIOSCO_TOKENS = get_env('KIOSCO_TOKENS', default='', cast=list)
+# Horas hacia atrás que se acepta una marca capturada sin conexión
+SINCRONIZACION_VENTANA_HORAS = get_env('SINCRONIZACION_VENTANA_HORAS', default='72', cast=int)
+# Segundos de desfase de reloj tolerados para marcas con momento en el futuro
+SINCRONIZACION_TOLERANCIA_FUTURO = get_env('SINCRONIZACION_TOLERANCIA_FUTURO', default='300', cast=int)
+
+# === CONFIGURACIÓN DE TURNOS ESPERADOS ===
+# Días hacia atrás y hacia adelante que se mantienen materializados en TurnoEsperado
+TURNOS_ESPERADOS_DIAS_ATRAS = get_env('TURNOS_ESPERADOS_DIAS_ATRAS', default='62', cast=int)
+TURNOS_ESPERADOS_DIAS_ADELANTE = get_env('TURNOS_ESPERADOS_DIAS_ADELANTE', default='62', cast=int)
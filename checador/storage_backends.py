@@ -1,12 +1,24 @@
 import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
 from django.conf import settings
+from django.db import models, transaction
+from django.db.models.signals import class_prepared, post_delete, post_save
+from django.dispatch import receiver
 from django.utils import timezone
 from storages.backends.s3boto3 import S3Boto3Storage
+from storages.utils import clean_name
 from zoneinfo import ZoneInfo
 import logging
 
+from checador.conexiones_s3 import ConexionesCompartidasMixin
+from checador.miniaturas import eliminar_miniaturas, ruta_miniatura, tamanos
+
 logger = logging.getLogger(__name__)
 
+EXTENSIONES_IMAGEN = ('.jpg', '.jpeg', '.png', '.webp')
+
 # Zona horaria de México
 MEXICO_TZ = ZoneInfo('America/Mexico_City')
 
@@ -15,7 +27,7 @@ def ahora_mexico():
     """Retorna datetime actual en zona horaria de México"""
     return timezone.now().astimezone(MEXICO_TZ)
 
-class StaticStorage(S3Boto3Storage):
+class StaticStorage(ConexionesCompartidasMixin, S3Boto3Storage):
     """Storage personalizado para archivos estáticos"""
     location = 'static'
     default_acl = 'public-read'
@@ -26,7 +38,7 @@ class StaticStorage(S3Boto3Storage):
         super().__init__(*args, **kwargs)
         logger.info("💫 StaticStorage inicializado para DigitalOcean Spaces")
 
-class MediaStorage(S3Boto3Storage):
+class MediaStorage(ConexionesCompartidasMixin, S3Boto3Storage):
     """Storage personalizado para archivos media (fotos de tickets)"""
     location = 'media'
     default_acl = 'public-read'
@@ -52,14 +64,33 @@ class MediaStorage(S3Boto3Storage):
         logger.info(f"💾 Guardando archivo media: {new_name}")
         return super()._save(new_name, content)
 
-class ReportesStorage(S3Boto3Storage):
+    def guardar_sin_renombrar(self, name, content):
+        """Guarda (o reemplaza) con la llave exacta, sin timestamp; lo usan las miniaturas"""
+        return super()._save(name, content)
+
+    def eliminar_lote(self, names):
+        """Borra varias llaves con DeleteObjects (hasta 1000 por llamada)"""
+        llaves = [self._normalize_name(clean_name(name)) for name in names]
+        for inicio in range(0, len(llaves), 1000):
+            respuesta = self.bucket.meta.client.delete_objects(
+                Bucket=self.bucket_name,
+                Delete={'Objects': [{'Key': llave} for llave in llaves[inicio:inicio + 1000]], 'Quiet': True},
+            )
+            for error in respuesta.get('Errors', []):
+                logger.error(f"❌ Error eliminando archivo {error.get('Key')}: {error.get('Message')}")
+
+class ReportesStorage(ConexionesCompartidasMixin, S3Boto3Storage):
     """Storage específico para archivos de reportes"""
     location = 'reportes'
     default_acl = 'private'  # Los reportes son privados por defecto
     file_overwrite = True
+    querystring_auth = True  # Descargas con URL firmada
     
     def __init__(self, *args, **kwargs):
-        kwargs['custom_domain'] = getattr(settings, 'AWS_S3_CUSTOM_DOMAIN', None)
+        # Sin dominio CDN: el CDN no puede servir objetos privados y con
+        # custom_domain las URLs no se firman
+        kwargs['custom_domain'] = None
+        kwargs.setdefault('querystring_expire', getattr(settings, 'REPORTES_URL_EXPIRACION', 3600))
         super().__init__(*args, **kwargs)
         logger.info("📊 ReportesStorage inicializado para DigitalOcean Spaces")
     
@@ -80,6 +111,23 @@ class SecureMediaStorage(MediaStorage):
         super().__init__(*args, **kwargs)
         logger.info("🔐 SecureMediaStorage inicializado para archivos privados")
 
+_instancias = {}
+_instancias_lock = threading.Lock()
+
+
+def storage_compartido(storage_class):
+    """
+    Instancia única por proceso de un storage, para el código que antes
+    creaba una en cada llamada (borrado y copia de archivos, reportes)
+    """
+    storage = _instancias.get(storage_class)
+    if storage is None:
+        with _instancias_lock:
+            storage = _instancias.get(storage_class)
+            if storage is None:
+                storage = _instancias[storage_class] = storage_class()
+    return storage
+
 # === UTILIDADES PARA MANEJO DE ARCHIVOS ===
 
 def upload_ticket_photo(instance, filename):
@@ -145,9 +193,11 @@ def delete_file_from_storage(file_path, storage_class=MediaStorage):
     Elimina un archivo del storage de manera segura
     """
     try:
-        storage = storage_class()
+        storage = storage_compartido(storage_class)
         if storage.exists(file_path):
             storage.delete(file_path)
+            if os.path.splitext(file_path)[1].lower() in EXTENSIONES_IMAGEN:
+                eliminar_miniaturas(storage, file_path)
             logger.info(f"🗑️ Archivo eliminado: {file_path}")
             return True
         else:
@@ -162,8 +212,8 @@ def copy_file_to_reportes_storage(source_file, destination_name):
     Copia un archivo al storage de reportes
     """
     try:
-        media_storage = MediaStorage()
-        reportes_storage = ReportesStorage()
+        media_storage = storage_compartido(MediaStorage)
+        reportes_storage = storage_compartido(ReportesStorage)
         
         # Leer archivo fuente
         file_content = media_storage.open(source_file.name).read()
@@ -177,100 +227,143 @@ def copy_file_to_reportes_storage(source_file, destination_name):
         logger.error(f"❌ Error copiando archivo a reportes: {e}")
         return None
 
-def optimize_image_for_storage(image_file, max_size=(1920, 1080), quality=85):
+# === LIMPIEZA DE ARCHIVOS DE MODELOS ===
+#
+# Solo los modelos con LimpiezaArchivosMixin escuchan post_save/post_delete
+# (se conectan al preparar la clase). El nombre de cada archivo se recuerda
+# desde que la instancia se carga de la base de datos, así que guardar no
+# vuelve a consultar la fila; los archivos que quedan sin usar se borran
+# después del commit, en lote y en un hilo aparte. Si el proceso termina con
+# borrados pendientes, solo quedan archivos huérfanos en el storage.
+
+_por_borrar = {}
+_por_borrar_lock = threading.Lock()
+_borrado_lock = threading.Lock()
+_vaciado_programado = False
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _obtener_executor():
+    """Executor del proceso, creado al primer uso"""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='archivos')
+        return _executor
+
+
+def eliminar_archivos(storage, nombres):
     """
-    Optimiza una imagen antes de subirla al storage
+    Borra archivos de un storage junto con sus miniaturas; con
+    MediaStorage en lotes de DeleteObjects en lugar de una llamada por llave
     """
-    try:
-        from PIL import Image
-        from io import BytesIO
-        import os
-        
-        # Abrir imagen
-        img = Image.open(image_file)
-        
-        # Convertir a RGB si es necesario
-        if img.mode in ('RGBA', 'LA', 'P'):
-            img = img.convert('RGB')
-        
-        # Redimensionar si es necesario
-        img.thumbnail(max_size, Image.Resampling.LANCZOS)
-        
-        # Guardar optimizada
-        output = BytesIO()
-        img.save(output, format='JPEG', quality=quality, optimize=True)
-        output.seek(0)
-        
-        # Calcular reducción de tamaño
-        original_size = image_file.size
-        new_size = len(output.getvalue())
-        reduction = ((original_size - new_size) / original_size) * 100
-        
-        logger.info(f"🖼️ Imagen optimizada: {reduction:.1f}% de reducción")
-        
-        return output
-    except Exception as e:
-        logger.error(f"❌ Error optimizando imagen: {e}")
-        return image_file
-
-# === MIDDLEWARE PARA MANEJO DE ARCHIVOS ===
-
-class FileUploadMiddleware:
+    llaves = []
+    for nombre in nombres:
+        llaves.append(nombre)
+        if os.path.splitext(nombre)[1].lower() in EXTENSIONES_IMAGEN:
+            llaves.extend(ruta_miniatura(nombre, lado) for lado in tamanos().values())
+
+    eliminar_lote = getattr(storage, 'eliminar_lote', None)
+    if eliminar_lote is not None:
+        try:
+            eliminar_lote(llaves)
+        except Exception as e:
+            logger.error(f"❌ Error eliminando {len(llaves)} archivo(s): {e}")
+            return
+    else:
+        for llave in llaves:
+            try:
+                storage.delete(llave)
+            except FileNotFoundError:
+                pass
+            except Exception as e:
+                logger.error(f"❌ Error eliminando archivo {llave}: {e}")
+    logger.info(f"🗑️ Archivos eliminados: {len(nombres)} ({len(llaves)} llaves con miniaturas)")
+
+
+def programar_borrado(storage, nombres):
+    """Borra los archivos cuando la transacción actual confirme"""
+    nombres = [nombre for nombre in nombres if nombre]
+    if nombres:
+        transaction.on_commit(lambda: _encolar_borrado(storage, nombres))
+
+
+def _encolar_borrado(storage, nombres):
+    global _vaciado_programado
+    with _por_borrar_lock:
+        _por_borrar.setdefault(storage, set()).update(nombres)
+        if _vaciado_programado:
+            return
+        _vaciado_programado = True
+    _obtener_executor().submit(vaciar_borrados)
+
+
+def vaciar_borrados():
+    """Borra todo lo pendiente; lo que se encole mientras tanto sale en el siguiente lote"""
+    global _vaciado_programado
+    with _borrado_lock:
+        with _por_borrar_lock:
+            pendientes = dict(_por_borrar)
+            _por_borrar.clear()
+            _vaciado_programado = False
+        for storage, nombres in pendientes.items():
+            eliminar_archivos(storage, sorted(nombres))
+
+
+class LimpiezaArchivosMixin:
     """
-    Middleware para manejar uploads de archivos grandes y optimización
+    Para modelos con FileField/ImageField: al reemplazar o vaciar un archivo,
+    o al borrar la instancia, el archivo anterior se borra del storage.
+    Va antes de models.Model en las bases.
     """
-    def __init__(self, get_response):
-        self.get_response = get_response
-
-    def __call__(self, request):
-        # Procesar archivos antes de la vista
-        if request.method == 'POST' and request.FILES:
-            for field_name, file_obj in request.FILES.items():
-                if file_obj.content_type.startswith('image/'):
-                    # Optimizar imágenes automáticamente
-                    optimized = optimize_image_for_storage(file_obj)
-                    if optimized != file_obj:
-                        request.FILES[field_name] = optimized
-                        logger.info(f"🔧 Imagen optimizada automáticamente: {field_name}")
-        
-        response = self.get_response(request)
-        return response
-
-# === SEÑALES PARA MANEJO AUTOMÁTICO ===
-
-from django.db.models.signals import post_delete, pre_save
-from django.dispatch import receiver
 
-@receiver(post_delete)
-def delete_file_on_model_delete(sender, instance, **kwargs):
-    """
-    Elimina archivos del storage cuando se elimina un modelo
-    """
-    # Buscar campos de archivo en el modelo
-    for field in instance._meta.fields:
-        if hasattr(field, 'upload_to'):
-            file_field = getattr(instance, field.name)
-            if file_field:
-                delete_file_from_storage(file_field.name)
-
-@receiver(pre_save)
-def delete_old_file_on_change(sender, instance, **kwargs):
-    """
-    Elimina archivo anterior cuando se actualiza con uno nuevo
-    """
-    if not instance.pk:
-        return  # Es un nuevo objeto, no hay archivo anterior
-    
-    try:
-        old_instance = sender.objects.get(pk=instance.pk)
-    except sender.DoesNotExist:
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Nombres tal como están en la base de datos (los diferidos no se conocen)
+        instance._archivos_cargados = instance.nombres_archivos()
+        return instance
+
+    @classmethod
+    def campos_archivo(cls):
+        return [campo for campo in cls._meta.concrete_fields if isinstance(campo, models.FileField)]
+
+    def nombres_archivos(self):
+        """{attname: nombre} de los campos de archivo cargados en la instancia"""
+        nombres = {}
+        for campo in self.campos_archivo():
+            if campo.attname in self.__dict__:
+                valor = self.__dict__[campo.attname]
+                nombres[campo.attname] = getattr(valor, 'name', valor) or None
+        return nombres
+
+
+def _borrar_archivos_reemplazados(sender, instance, raw=False, update_fields=None, **kwargs):
+    if raw:
         return
-    
-    # Verificar campos de archivo
-    for field in instance._meta.fields:
-        if hasattr(field, 'upload_to'):
-            old_file = getattr(old_instance, field.name)
-            new_file = getattr(instance, field.name)
-            
-            if old_file and old_file != new_file:
-                delete_file_from_storage(old_file.name)
\ No newline at end of file
+    anteriores = getattr(instance, '_archivos_cargados', {})
+    actuales = instance.nombres_archivos()
+    for campo in sender.campos_archivo():
+        if update_fields is not None and campo.name not in update_fields:
+            continue
+        anterior = anteriores.get(campo.attname)
+        if anterior and campo.attname in actuales and anterior != actuales[campo.attname]:
+            programar_borrado(campo.storage, [anterior])
+    instance._archivos_cargados = {**anteriores, **actuales}
+
+
+def _borrar_archivos_de_instancia(sender, instance, **kwargs):
+    nombres = instance.nombres_archivos()
+    for campo in sender.campos_archivo():
+        nombre = nombres.get(campo.attname)
+        if nombre:
+            programar_borrado(campo.storage, [nombre])
+
+
+@receiver(class_prepared)
+def conectar_limpieza_archivos(sender, **kwargs):
+    """Conecta la limpieza solo a los modelos concretos que la piden"""
+    if issubclass(sender, LimpiezaArchivosMixin) and not sender._meta.abstract:
+        post_save.connect(_borrar_archivos_reemplazados, sender=sender, weak=False)
+        post_delete.connect(_borrar_archivos_de_instancia, sender=sender, weak=False)
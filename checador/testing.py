@@ -0,0 +1,35 @@
+"""
+Utilidades para pruebas
+"""
+from contextlib import contextmanager
+
+from checador.presupuesto_consultas import RegistroConsultas
+
+
+class PresupuestoConsultasMixin:
+    """
+    Mixin para TestCase que fija el presupuesto de consultas de un bloque.
+
+    A diferencia de assertNumQueries no exige un número exacto: falla si se
+    pasa de max_consultas o si una misma forma de consulta se repite más de
+    max_repeticiones veces (patrón N+1).
+
+    Uso:
+        with self.assertPresupuestoConsultas(8, max_repeticiones=1):
+            self.client.get(url)
+    """
+
+    @contextmanager
+    def assertPresupuestoConsultas(self, max_consultas, max_repeticiones=None):
+        with RegistroConsultas() as registro:
+            yield registro
+
+        excesos = registro.excesos(max_consultas, max_repeticiones)
+        if excesos:
+            detalle = '\n'.join(
+                f'  {veces}x {forma[:200]}' for forma, veces in registro.formas.most_common(5)
+            )
+            self.fail(
+                f'Presupuesto de consultas excedido: {registro.consultas} consultas '
+                f'(máximo {max_consultas}, repeticiones máximas {max_repeticiones})\n{detalle}'
+            )
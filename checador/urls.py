@@ -58,6 +58,9 @@ urlpatterns = [
     path('api/registros/', include('registros.urls')),
     path('api/', include('turnos.urls')),
     path('api/reportes/', include('reportes.urls')),
+
+    # Métricas (Prometheus, solo staff)
+    path('metrics', views.metricas_view, name='metricas'),
 ]
 
 # Servir archivos media en desarrollo
@@ -3,15 +3,19 @@ from django.contrib.auth import login, logout, authenticate
 from django.contrib.auth.decorators import login_required, user_passes_test
 from django.contrib import messages
 from django.contrib.auth.models import User
-from django.db.models import Count, Q
+from django.db.models import Count, F, Q, Sum
 from django.utils import timezone
-from django.http import JsonResponse
+from django.http import HttpResponse, JsonResponse
+from urllib.parse import urlencode
 from django.views.decorators.http import require_POST
-from datetime import datetime, timedelta, date
+from datetime import datetime, timedelta, date, time
 from calendar import monthrange
+import hmac
 import json
+from django.conf import settings
+from checador import metricas
 from empleados.models import Empleado
-from registros.models import RegistroAsistencia
+from registros.models import RegistroAsistencia, ResumenDiario, ResumenMensual
 from turnos.models import Turno, RolMensual
 
 
@@ -131,17 +135,16 @@ def dashboard_view(request):
         ).first()
         context['registro_hoy'] = registro_hoy
         
-        # Estadísticas del mes actual
-        primer_dia_mes = hoy.replace(day=1)
-        registros_mes = RegistroAsistencia.objects.filter(
+        # Estadísticas del mes actual (una fila de ResumenMensual)
+        resumen_mes = ResumenMensual.objects.filter(
             empleado=empleado,
-            fecha__gte=primer_dia_mes,
-            fecha__lte=hoy
-        )
+            anio=hoy.year,
+            mes=hoy.month
+        ).first() or ResumenMensual()
         
-        context['dias_trabajados'] = registros_mes.filter(hora_entrada__isnull=False).count()
-        context['retardos_mes'] = registros_mes.filter(retardo=True).count()
-        context['horas_totales'] = sum([r.horas_trabajadas for r in registros_mes])
+        context['dias_trabajados'] = resumen_mes.dias_trabajados
+        context['retardos_mes'] = resumen_mes.retardos
+        context['horas_totales'] = resumen_mes.horas_trabajadas
         
         # Últimos 7 registros
         context['ultimos_registros'] = RegistroAsistencia.objects.filter(
@@ -156,7 +159,9 @@ def dashboard_view(request):
     if request.user.is_staff:
         hoy = timezone.now().date()
         context['total_empleados'] = Empleado.objects.filter(activo=True).count()
-        context['registros_hoy'] = RegistroAsistencia.objects.filter(fecha=hoy).count()
+        context['registros_hoy'] = ResumenDiario.objects.filter(fecha=hoy).aggregate(
+            total=Sum('registros')
+        )['total'] or 0
         context['empleados_sin_rostro'] = Empleado.objects.filter(
             activo=True,
             embedding_rostro__isnull=True
@@ -198,10 +203,96 @@ def empleados_lista_view(request):
     return render(request, 'empleados/lista.html', context)
 
 
+# Orden del listado de registros; coincide con el índice
+# registros_fecha_hora_id_idx (en PostgreSQL DESC deja los NULL primero)
+ORDEN_REGISTROS = (
+    F('fecha').desc(),
+    F('hora_entrada').desc(nulls_first=True),
+    F('id').desc(),
+)
+ORDEN_REGISTROS_INVERSO = (
+    F('fecha').asc(),
+    F('hora_entrada').asc(nulls_last=True),
+    F('id').asc(),
+)
+REGISTROS_POR_PAGINA = 50
+
+
+def _cursor_registro(registro):
+    """Cursor 'fecha|hora_entrada|id' de un registro para la paginación por llave"""
+    # Con microsegundos: las marcas se guardan con ellos y un cursor truncado
+    # repetiría o saltaría registros del mismo segundo
+    hora = registro.hora_entrada.isoformat() if registro.hora_entrada else ''
+    return f"{registro.fecha.isoformat()}|{hora}|{registro.pk}"
+
+
+def _leer_cursor(valor):
+    """Convierte un cursor en (fecha, hora_entrada o None, id); None si no es válido"""
+    try:
+        fecha, hora, pk = valor.split('|')
+        return (
+            datetime.strptime(fecha, '%Y-%m-%d').date(),
+            time.fromisoformat(hora) if hora else None,
+            int(pk),
+        )
+    except (ValueError, AttributeError):
+        return None
+
+
+def _despues_de(fecha, hora, pk):
+    """Registros que van después del cursor en ORDEN_REGISTROS"""
+    if hora is None:
+        mismo_dia = Q(hora_entrada__isnull=False) | Q(hora_entrada__isnull=True, id__lt=pk)
+    else:
+        mismo_dia = Q(hora_entrada__lt=hora) | Q(hora_entrada=hora, id__lt=pk)
+    return Q(fecha__lt=fecha) | (Q(fecha=fecha) & mismo_dia)
+
+
+def _antes_de(fecha, hora, pk):
+    """Registros que van antes del cursor en ORDEN_REGISTROS"""
+    if hora is None:
+        mismo_dia = Q(hora_entrada__isnull=True, id__gt=pk)
+    else:
+        mismo_dia = Q(hora_entrada__isnull=True) | Q(hora_entrada__gt=hora) | Q(hora_entrada=hora, id__gt=pk)
+    return Q(fecha__gt=fecha) | (Q(fecha=fecha) & mismo_dia)
+
+
+def _pagina_registros(registros, despues=None, antes=None, tamano=REGISTROS_POR_PAGINA):
+    """
+    Paginación por llave (fecha, hora_entrada, id): cada página lee solo
+    tamano + 1 filas sin importar qué tan lejos esté del inicio.
+
+    Returns:
+        tuple: (lista de registros, cursor siguiente o None, cursor anterior o None)
+    """
+    cursor = _leer_cursor(antes) if antes else None
+    if cursor:
+        filas = list(registros.filter(_antes_de(*cursor)).order_by(*ORDEN_REGISTROS_INVERSO)[:tamano + 1])
+        hay_anterior = len(filas) > tamano
+        pagina = filas[:tamano][::-1]
+        hay_siguiente = True
+    else:
+        cursor = _leer_cursor(despues) if despues else None
+        if cursor:
+            registros = registros.filter(_despues_de(*cursor))
+        filas = list(registros.order_by(*ORDEN_REGISTROS)[:tamano + 1])
+        hay_anterior = cursor is not None
+        pagina = filas[:tamano]
+        hay_siguiente = len(filas) > tamano
+
+    if not pagina:
+        return pagina, None, None
+    return (
+        pagina,
+        _cursor_registro(pagina[-1]) if hay_siguiente else None,
+        _cursor_registro(pagina[0]) if hay_anterior else None,
+    )
+
+
 @login_required
 @user_passes_test(lambda u: u.is_staff)
 def registros_lista_view(request):
-    """Lista de registros de asistencia (solo para staff)"""
+    """Lista de registros de asistencia (solo para staff), paginada por llave"""
     fecha_inicio = request.GET.get('fecha_inicio', '')
     fecha_fin = request.GET.get('fecha_fin', '')
     empleado_id = request.GET.get('empleado', '')
@@ -225,23 +316,55 @@ def registros_lista_view(request):
     if empleado_id:
         registros = registros.filter(empleado_id=empleado_id)
     
-    # Estadísticas
+    # Estadísticas: de los resúmenes por departamento y día salvo que se
+    # filtre por empleado
+    if empleado_id:
+        totales = registros.aggregate(
+            registros=Count('id'),
+            retardos=Count('id', filter=Q(retardo=True)),
+            horas_trabajadas=Sum('horas_trabajadas'),
+            registros_completos=Count('id', filter=Q(hora_entrada__isnull=False, hora_salida__isnull=False)),
+        )
+    else:
+        totales = ResumenDiario.objects.filter(
+            fecha__gte=fecha_inicio,
+            fecha__lte=fecha_fin
+        ).aggregate(
+            registros=Sum('registros'),
+            retardos=Sum('retardos'),
+            horas_trabajadas=Sum('horas_trabajadas'),
+            registros_completos=Sum('registros_completos'),
+        )
     stats = {
-        'total_registros': registros.count(),
-        'retardos': registros.filter(retardo=True).count(),
-        'horas_totales': sum([r.horas_trabajadas for r in registros]),
-        'registros_completos': registros.filter(hora_entrada__isnull=False, hora_salida__isnull=False).count(),
+        'total_registros': totales['registros'] or 0,
+        'retardos': totales['retardos'] or 0,
+        'horas_totales': totales['horas_trabajadas'] or 0,
+        'registros_completos': totales['registros_completos'] or 0,
     }
     
-    empleados = Empleado.objects.filter(activo=True).order_by('codigo_empleado')
+    empleados = Empleado.objects.select_related('user').filter(activo=True).order_by('codigo_empleado')
     
-    context = {
-        'registros': registros.order_by('-fecha', '-hora_entrada'),
-        'empleados': empleados,
+    pagina, cursor_siguiente, cursor_anterior = _pagina_registros(
+        registros,
+        despues=request.GET.get('despues'),
+        antes=request.GET.get('antes')
+    )
+    filtros = {
         'fecha_inicio': fecha_inicio.strftime('%Y-%m-%d'),
         'fecha_fin': fecha_fin.strftime('%Y-%m-%d'),
+        'empleado': empleado_id,
+    }
+    
+    context = {
+        'registros': pagina,
+        'empleados': empleados,
+        'fecha_inicio': filtros['fecha_inicio'],
+        'fecha_fin': filtros['fecha_fin'],
         'empleado_selected': empleado_id,
         'stats': stats,
+        'url_siguiente': f"?{urlencode({**filtros, 'despues': cursor_siguiente})}" if cursor_siguiente else None,
+        'url_anterior': f"?{urlencode({**filtros, 'antes': cursor_anterior})}" if cursor_anterior else None,
+        'url_primera': f"?{urlencode(filtros)}",
     }
     
     return render(request, 'registros/lista.html', context)
@@ -418,3 +541,34 @@ def eliminar_rol_view(request):
 
     except Exception as e:
         return JsonResponse({'success': False, 'error': str(e)}, status=500)
+
+
+def _puede_ver_metricas(request):
+    """Staff con sesión o con JWT, o el token de METRICAS_TOKEN (para el scraper)"""
+    if request.user.is_authenticated and request.user.is_staff:
+        return True
+
+    encabezado = request.META.get('HTTP_AUTHORIZATION', '')
+    if not encabezado.startswith('Bearer '):
+        return False
+    token = encabezado[len('Bearer '):].strip()
+
+    token_metricas = getattr(settings, 'METRICAS_TOKEN', '')
+    if token_metricas and hmac.compare_digest(token.encode(), token_metricas.encode()):
+        return True
+
+    from rest_framework.exceptions import AuthenticationFailed
+    from rest_framework_simplejwt.authentication import JWTAuthentication
+    try:
+        resultado = JWTAuthentication().authenticate(request)
+    except AuthenticationFailed:
+        return False
+    return bool(resultado and resultado[0].is_staff)
+
+
+def metricas_view(request):
+    """Métricas de reconocimiento y registro en formato de texto de Prometheus"""
+    if not _puede_ver_metricas(request):
+        return HttpResponse('No autorizado\n', status=403, content_type='text/plain')
+
+    return HttpResponse(metricas.exportar(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -9,7 +9,7 @@ class EmpleadoAdmin(admin.ModelAdmin):
     list_display = ('codigo_empleado', 'get_nombre', 'departamento', 'puesto', 'activo', 'tiene_rostro_registrado', 'acciones_rostro')
     list_filter = ('activo', 'departamento', 'fecha_ingreso')
     search_fields = ('codigo_empleado', 'user__username', 'user__first_name', 'user__last_name')
-    readonly_fields = ('fecha_creacion', 'fecha_actualizacion', 'tiene_rostro_registrado')
+    readonly_fields = ('fecha_creacion', 'fecha_actualizacion', 'tiene_rostro_registrado', 'vista_rostro')
     actions = ['eliminar_rostros_seleccionados']
     
     fieldsets = (
@@ -20,7 +20,7 @@ class EmpleadoAdmin(admin.ModelAdmin):
             'fields': ('codigo_empleado', 'departamento', 'puesto', 'horas_semana', 'fecha_ingreso')
         }),
         ('Reconocimiento Facial', {
-            'fields': ('foto_rostro', 'tiene_rostro_registrado')
+            'fields': ('foto_rostro', 'vista_rostro', 'tiene_rostro_registrado')
         }),
         ('Estado', {
             'fields': ('activo', 'fecha_creacion', 'fecha_actualizacion')
@@ -31,6 +31,14 @@ class EmpleadoAdmin(admin.ModelAdmin):
         return obj.nombre_completo
     get_nombre.short_description = 'Nombre'
     
+    def vista_rostro(self, obj):
+        """Miniatura de la foto de rostro (no descarga la original)"""
+        miniaturas = obj.miniaturas_rostro
+        if not miniaturas:
+            return '-'
+        return format_html('<img src="{}" alt="Rostro" loading="lazy">', miniaturas['mediana'])
+    vista_rostro.short_description = 'Vista previa'
+    
     def acciones_rostro(self, obj):
         """Botones de acción para gestionar el rostro"""
         registro_url = reverse('empleados:register_face', args=[obj.pk])
@@ -0,0 +1,140 @@
+"""
+Formato binario versionado para los encodings faciales.
+
+Estructura (little-endian):
+    - 2 bytes: firma b'FE'
+    - 1 byte:  versión del formato
+    - 1 byte:  tipo de dato (1 = float32, 2 = float16)
+    - 2 bytes: número de dimensiones (uint16)
+    - N bytes: valores del encoding
+
+Los encodings guardados con pickle (formato anterior) se siguen leyendo
+durante la transición, pero solo se permiten las clases de numpy necesarias
+para reconstruir un arreglo.
+"""
+
+import io
+import pickle
+import struct
+
+import numpy as np
+
+FIRMA = b'FE'
+VERSION = 1
+CABECERA = struct.Struct('<2sBBH')
+
+TIPOS = {
+    1: np.dtype('<f4'),
+    2: np.dtype('<f2'),
+}
+CODIGOS_TIPO = {dtype: codigo for codigo, dtype in TIPOS.items()}
+
+# Clases permitidas al leer pickles heredados
+_GLOBALES_PERMITIDOS = {
+    ('numpy.core.multiarray', '_reconstruct'),
+    ('numpy._core.multiarray', '_reconstruct'),
+    ('numpy.core.multiarray', 'scalar'),
+    ('numpy._core.multiarray', 'scalar'),
+    ('numpy', 'ndarray'),
+    ('numpy', 'dtype'),
+    ('_codecs', 'encode'),
+}
+
+
+class _UnpicklerRestringido(pickle.Unpickler):
+    """Unpickler que solo reconstruye arreglos de numpy"""
+
+    def find_class(self, module, name):
+        if (module, name) in _GLOBALES_PERMITIDOS:
+            return super().find_class(module, name)
+        raise pickle.UnpicklingError(f'Clase no permitida en encoding facial: {module}.{name}')
+
+
+def es_formato_legado(blob) -> bool:
+    """Indica si el blob fue guardado con pickle (formato anterior)"""
+    return bytes(blob[:2]) != FIRMA
+
+
+def codificar_encoding(encoding, dtype='float32') -> bytes:
+    """
+    Serializa un encoding facial al formato binario versionado.
+
+    Args:
+        encoding: Arreglo de numpy (o secuencia) con el encoding
+        dtype: 'float32' o 'float16'
+
+    Returns:
+        bytes con cabecera + valores little-endian
+    """
+    tipo = np.dtype(dtype).newbyteorder('<')
+    valores = np.ascontiguousarray(np.asarray(encoding, dtype=tipo).ravel())
+    cabecera = CABECERA.pack(FIRMA, VERSION, CODIGOS_TIPO[tipo], valores.size)
+    return cabecera + valores.tobytes()
+
+
+def _leer_cabecera(blob):
+    firma, version, codigo_tipo, dimensiones = CABECERA.unpack_from(blob)
+    if version != VERSION or codigo_tipo not in TIPOS:
+        raise ValueError(f'Formato de encoding no soportado (versión {version}, tipo {codigo_tipo})')
+    return TIPOS[codigo_tipo], dimensiones
+
+
+def _decodificar_legado(blob) -> np.ndarray:
+    return np.asarray(_UnpicklerRestringido(io.BytesIO(bytes(blob))).load())
+
+
+def decodificar_encoding(blob):
+    """
+    Deserializa un encoding facial.
+
+    Args:
+        blob: bytes/memoryview guardado en Empleado.embedding_rostro
+
+    Returns:
+        numpy array (vista sin copia sobre el blob) o None si está vacío
+    """
+    if not blob:
+        return None
+    if es_formato_legado(blob):
+        return _decodificar_legado(blob)
+    tipo, dimensiones = _leer_cabecera(blob)
+    return np.frombuffer(blob, dtype=tipo, count=dimensiones, offset=CABECERA.size)
+
+
+def decodificar_lote(blobs, dimensiones=128) -> np.ndarray:
+    """
+    Deserializa muchos encodings en una sola matriz float32 (N x dimensiones).
+
+    Los blobs en formato binario del mismo tipo se concatenan y se leen con un
+    solo np.frombuffer; solo los pickles heredados se procesan uno por uno.
+    """
+    cargas = {}
+    legados = []
+    orden = []
+    for blob in blobs:
+        if es_formato_legado(blob):
+            orden.append(('legado', len(legados)))
+            legados.append(_decodificar_legado(blob))
+            continue
+        tipo, dims = _leer_cabecera(blob)
+        if dims != dimensiones:
+            raise ValueError(f'Encoding con {dims} dimensiones, se esperaban {dimensiones}')
+        lista = cargas.setdefault(tipo, [])
+        orden.append((tipo, len(lista)))
+        lista.append(memoryview(blob)[CABECERA.size:])
+
+    matrices = {
+        tipo: np.frombuffer(b''.join(lista), dtype=tipo).reshape(-1, dimensiones)
+        for tipo, lista in cargas.items()
+    }
+
+    if len(matrices) == 1 and not legados:
+        return np.ascontiguousarray(next(iter(matrices.values())), dtype=np.float32)
+
+    resultado = np.empty((len(orden), dimensiones), dtype=np.float32)
+    for fila, (origen, indice) in enumerate(orden):
+        if origen == 'legado':
+            resultado[fila] = legados[indice]
+        else:
+            resultado[fila] = matrices[origen][indice]
+    return resultado
@@ -0,0 +1,128 @@
+"""
+Convierte los encodings faciales guardados con pickle al formato binario versionado.
+
+Los helpers de codificación están copiados aquí (y no importados de
+empleados.face_encoding) para que la migración no cambie si el módulo de la
+app cambia después.
+"""
+import io
+import logging
+import pickle
+import struct
+
+import numpy as np
+from django.conf import settings
+from django.db import migrations
+
+logger = logging.getLogger(__name__)
+
+TAMANO_LOTE = 500
+
+FIRMA = b'FE'
+VERSION = 1
+CABECERA = struct.Struct('<2sBBH')
+TIPOS = {
+    1: np.dtype('<f4'),
+    2: np.dtype('<f2'),
+}
+CODIGOS_TIPO = {dtype: codigo for codigo, dtype in TIPOS.items()}
+
+_GLOBALES_PERMITIDOS = {
+    ('numpy.core.multiarray', '_reconstruct'),
+    ('numpy._core.multiarray', '_reconstruct'),
+    ('numpy.core.multiarray', 'scalar'),
+    ('numpy._core.multiarray', 'scalar'),
+    ('numpy', 'ndarray'),
+    ('numpy', 'dtype'),
+    ('_codecs', 'encode'),
+}
+
+
+class _UnpicklerRestringido(pickle.Unpickler):
+    """Unpickler que solo reconstruye arreglos de numpy"""
+
+    def find_class(self, module, name):
+        if (module, name) in _GLOBALES_PERMITIDOS:
+            return super().find_class(module, name)
+        raise pickle.UnpicklingError(f'Clase no permitida en encoding facial: {module}.{name}')
+
+
+def es_formato_legado(blob):
+    return bytes(blob[:2]) != FIRMA
+
+
+def codificar(encoding, dtype):
+    tipo = np.dtype(dtype).newbyteorder('<')
+    valores = np.ascontiguousarray(np.asarray(encoding, dtype=tipo).ravel())
+    return CABECERA.pack(FIRMA, VERSION, CODIGOS_TIPO[tipo], valores.size) + valores.tobytes()
+
+
+def decodificar_legado(blob):
+    return np.asarray(_UnpicklerRestringido(io.BytesIO(bytes(blob))).load(), dtype=np.float64)
+
+
+def decodificar_binario(blob):
+    _, version, codigo_tipo, dimensiones = CABECERA.unpack_from(blob)
+    if version != VERSION or codigo_tipo not in TIPOS:
+        raise ValueError(f'Formato de encoding no soportado (versión {version}, tipo {codigo_tipo})')
+    return np.frombuffer(blob, dtype=TIPOS[codigo_tipo], count=dimensiones, offset=CABECERA.size)
+
+
+def _lotes(Empleado):
+    """Filas con encoding por lotes de pk, sin mantener abierto un cursor sobre la tabla"""
+    ultimo = 0
+    while True:
+        lote = list(
+            Empleado.objects.filter(pk__gt=ultimo, embedding_rostro__isnull=False)
+            .order_by('pk')
+            .values_list('id', 'embedding_rostro')[:TAMANO_LOTE]
+        )
+        if not lote:
+            return
+        yield lote
+        ultimo = lote[-1][0]
+
+
+def _convertir(apps, convertir_blob):
+    """
+    Reescribe cada blob con convertir_blob (None = no cambia). Los blobs
+    que no se pueden leer quedan en NULL: el empleado vuelve a registrar su rostro.
+    """
+    Empleado = apps.get_model('empleados', 'Empleado')
+    invalidos = []
+    for lote in _lotes(Empleado):
+        for empleado_id, blob in lote:
+            if not blob:
+                continue
+            try:
+                nuevo = convertir_blob(blob)
+            except Exception as e:
+                logger.warning(f"⚠️ Encoding ilegible del empleado #{empleado_id}, se descarta: {e}")
+                invalidos.append(empleado_id)
+                continue
+            if nuevo is not None:
+                Empleado.objects.filter(pk=empleado_id).update(embedding_rostro=nuevo)
+    if invalidos:
+        Empleado.objects.filter(pk__in=invalidos).update(embedding_rostro=None)
+
+
+def convertir_a_binario(apps, schema_editor):
+    dtype = getattr(settings, 'FACE_ENCODING_DTYPE', 'float32')
+    _convertir(apps, lambda blob: codificar(decodificar_legado(blob), dtype) if es_formato_legado(blob) else None)
+
+
+def convertir_a_pickle(apps, schema_editor):
+    _convertir(apps, lambda blob: None if es_formato_legado(blob) else pickle.dumps(
+        np.asarray(decodificar_binario(blob), dtype=np.float64)
+    ))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('empleados', '0002_alter_empleado_foto_rostro'),
+    ]
+
+    operations = [
+        migrations.RunPython(convertir_a_binario, convertir_a_pickle),
+    ]
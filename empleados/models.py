@@ -1,11 +1,12 @@
 from django.db import models
 from django.contrib.auth.models import User
-import pickle
-import numpy as np
+from django.conf import settings
 
-from checador.storage_backends import MediaStorage
+from checador.miniaturas import urls_miniaturas
+from checador.storage_backends import LimpiezaArchivosMixin, MediaStorage
+from .face_encoding import codificar_encoding, decodificar_encoding
 
-class Empleado(models.Model):
+class Empleado(LimpiezaArchivosMixin, models.Model):
     """Modelo para representar a un empleado del sistema"""
 
     user = models.OneToOneField(
@@ -67,19 +68,27 @@ class Empleado(models.Model):
         verbose_name_plural = 'Empleados'
         ordering = ['codigo_empleado']
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Departamento tal como está en la base de datos (None si se difirió)
+        instance._departamento_cargado = instance.__dict__.get('departamento')
+        return instance
+
     def __str__(self):
         return f"{self.codigo_empleado} - {self.user.get_full_name() or self.user.username}"
 
     def set_face_encoding(self, encoding_array):
-        """Guarda el encoding facial como bytes"""
+        """Guarda el encoding facial en el formato binario versionado"""
         if encoding_array is not None:
-            self.embedding_rostro = pickle.dumps(encoding_array)
+            self.embedding_rostro = codificar_encoding(
+                encoding_array,
+                dtype=getattr(settings, 'FACE_ENCODING_DTYPE', 'float32')
+            )
 
     def get_face_encoding(self):
-        """Recupera el encoding facial como numpy array"""
-        if self.embedding_rostro:
-            return pickle.loads(self.embedding_rostro)
-        return None
+        """Recupera el encoding facial como numpy array (acepta pickles heredados)"""
+        return decodificar_encoding(self.embedding_rostro)
 
     @property
     def nombre_completo(self):
@@ -91,11 +100,14 @@ class Empleado(models.Model):
         """Verifica si el empleado tiene un rostro registrado"""
         return bool(self.embedding_rostro)
     
+    @property
+    def miniaturas_rostro(self):
+        """URLs de las miniaturas de foto_rostro ({'chica': ..., 'mediana': ...})"""
+        return urls_miniaturas(self.foto_rostro)
+    
     def eliminar_rostro(self):
         """Elimina el registro facial del empleado"""
         self.embedding_rostro = None
-        if self.foto_rostro:
-            # Eliminar el archivo físico de la foto
-            self.foto_rostro.delete(save=False)
-            self.foto_rostro = None
+        # La foto y sus miniaturas se borran del storage al confirmar (LimpiezaArchivosMixin)
+        self.foto_rostro = None
         self.save()
@@ -17,13 +17,14 @@ class EmpleadoListSerializer(serializers.ModelSerializer):
     user = UserNestedSerializer(read_only=True)
     nombre_completo = serializers.ReadOnlyField()
     tiene_rostro_registrado = serializers.ReadOnlyField()
+    miniaturas_rostro = serializers.ReadOnlyField()
     
     class Meta:
         model = Empleado
         fields = (
             'id', 'codigo_empleado', 'user', 'nombre_completo',
             'departamento', 'puesto', 'activo', 'tiene_rostro_registrado',
-            'foto_rostro'
+            'foto_rostro', 'miniaturas_rostro'
         )
 
 
@@ -32,12 +33,13 @@ class EmpleadoDetailSerializer(serializers.ModelSerializer):
     user = UserNestedSerializer(read_only=True)
     nombre_completo = serializers.ReadOnlyField()
     tiene_rostro_registrado = serializers.ReadOnlyField()
+    miniaturas_rostro = serializers.ReadOnlyField()
     
     class Meta:
         model = Empleado
         fields = (
             'id', 'codigo_empleado', 'user', 'nombre_completo',
-            'foto_rostro', 'departamento', 'puesto', 'horas_semana',
+            'foto_rostro', 'miniaturas_rostro', 'departamento', 'puesto', 'horas_semana',
             'fecha_ingreso', 'activo', 'tiene_rostro_registrado',
             'fecha_creacion', 'fecha_actualizacion'
         )
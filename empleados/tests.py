@@ -1,3 +1,97 @@
+import importlib
+import pickle
+from collections import OrderedDict
+
+import numpy as np
+from django.apps import apps
+from django.contrib.auth.models import User
 from django.test import TestCase
 
-# Create your tests here.
+from empleados.face_encoding import (
+    CABECERA,
+    codificar_encoding,
+    decodificar_encoding,
+    decodificar_lote,
+    es_formato_legado,
+)
+from empleados.models import Empleado
+
+migracion_binario = importlib.import_module('empleados.migrations.0003_convertir_embeddings_binario')
+
+
+class FormatoEncodingTest(TestCase):
+    """Formato binario versionado 'FE' v1 de los encodings"""
+
+    def setUp(self):
+        self.encoding = np.random.default_rng(0).normal(size=128)
+
+    def test_ida_y_vuelta(self):
+        for dtype, tamano, tolerancia in (('float32', 4, 1e-6), ('float16', 2, 1e-2)):
+            with self.subTest(dtype=dtype):
+                blob = codificar_encoding(self.encoding, dtype=dtype)
+
+                self.assertEqual(blob[:2], b'FE')
+                self.assertEqual(len(blob), CABECERA.size + 128 * tamano)
+                self.assertFalse(es_formato_legado(blob))
+                np.testing.assert_allclose(decodificar_encoding(blob), self.encoding, rtol=tolerancia, atol=tolerancia)
+
+    def test_lote_mezcla_formatos(self):
+        blobs = [
+            codificar_encoding(self.encoding, 'float32'),
+            codificar_encoding(self.encoding, 'float16'),
+            pickle.dumps(self.encoding),
+        ]
+
+        matriz = decodificar_lote(blobs)
+
+        self.assertEqual(matriz.shape, (3, 128))
+        for fila in matriz:
+            np.testing.assert_allclose(fila, self.encoding, atol=1e-2)
+
+    def test_version_desconocida(self):
+        blob = bytearray(codificar_encoding(self.encoding))
+        blob[2] = 9
+        with self.assertRaises(ValueError):
+            decodificar_encoding(bytes(blob))
+
+    def test_pickle_con_clases_no_permitidas(self):
+        with self.assertRaises(pickle.UnpicklingError):
+            decodificar_encoding(pickle.dumps(OrderedDict(a=1)))
+
+
+class MigracionEncodingsTest(TestCase):
+    """La migración 0003 convierte los pickles heredados y descarta los ilegibles"""
+
+    def crear_empleado(self, codigo, blob):
+        return Empleado.objects.create(
+            user=User.objects.create_user(codigo), codigo_empleado=codigo,
+            departamento='Operaciones', embedding_rostro=blob
+        )
+
+    def test_convierte_pickles_heredados(self):
+        encoding = np.random.default_rng(1).normal(size=128)
+        legado = self.crear_empleado('E001', pickle.dumps(encoding))
+        binario = self.crear_empleado('E002', codificar_encoding(encoding))
+        malicioso = self.crear_empleado('E003', pickle.dumps(OrderedDict(a=1)))
+        sin_rostro = self.crear_empleado('E004', None)
+
+        with self.assertLogs(migracion_binario.logger, 'WARNING'):
+            migracion_binario.convertir_a_binario(apps, None)
+
+        for empleado in (legado, binario, malicioso, sin_rostro):
+            empleado.refresh_from_db()
+        self.assertFalse(es_formato_legado(legado.embedding_rostro))
+        np.testing.assert_allclose(legado.get_face_encoding(), encoding, rtol=1e-6)
+        self.assertEqual(bytes(binario.embedding_rostro), codificar_encoding(encoding))
+        self.assertIsNone(malicioso.embedding_rostro)
+        self.assertIsNone(sin_rostro.embedding_rostro)
+
+    def test_reversa(self):
+        encoding = np.random.default_rng(2).normal(size=128)
+        empleado = self.crear_empleado('E001', codificar_encoding(encoding))
+
+        migracion_binario.convertir_a_pickle(apps, None)
+
+        empleado.refresh_from_db()
+        self.assertTrue(es_formato_legado(empleado.embedding_rostro))
+        np.testing.assert_allclose(decodificar_encoding(empleado.embedding_rostro), encoding, rtol=1e-6)
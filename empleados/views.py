@@ -92,14 +92,11 @@ class EmpleadoViewSet(viewsets.ModelViewSet):
         # Usar el servicio de reconocimiento facial
         success, message = FacialRecognitionService.register_employee_face(
             empleado,
-            foto_rostro
+            foto_rostro,
+            guardar_foto=True
         )
         
         if success:
-            # Guardar la foto también en el modelo
-            empleado.foto_rostro = foto_rostro
-            empleado.save()
-            
             return Response({
                 'success': True,
                 'message': message,
@@ -183,14 +180,11 @@ def register_face_post(request, empleado_id):
     # Usar el servicio de reconocimiento facial
     success, message = FacialRecognitionService.register_employee_face(
         empleado,
-        foto_rostro
+        foto_rostro,
+        guardar_foto=True
     )
     
     if success:
-        # Guardar la foto también en el modelo
-        empleado.foto_rostro = foto_rostro
-        empleado.save()
-        
         return JsonResponse({
             'success': True,
             'message': message,
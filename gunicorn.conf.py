@@ -0,0 +1,36 @@
+"""
+Configuración de gunicorn.
+
+Los workers usan hilos (gthread) para que una marca esperando al pool de
+reconocimiento no bloquee al resto de las peticiones (admin, API JWT).
+El trabajo de dlib corre en procesos aparte (registros.recognition_pool).
+"""
+import os
+
+bind = '0.0.0.0:8080'
+workers = int(os.environ.get('GUNICORN_WORKERS', '2'))
+worker_class = 'gthread'
+threads = int(os.environ.get('GUNICORN_THREADS', '4'))
+timeout = 120
+
+
+def on_starting(server):
+    """Descarta las métricas multiproceso de la ejecución anterior"""
+    from decouple import config
+    directorio = config('METRICAS_DIR', default='')
+    if directorio:
+        from checador.metricas import limpiar_directorio
+        limpiar_directorio(directorio)
+
+
+def post_worker_init(worker):
+    """
+    Arranca el pool de reconocimiento al iniciar cada worker. El worker web
+    no importa dlib/OpenCV (carga diferida); solo lo hacen los procesos del
+    pool, o el propio worker si FACE_RECOGNITION_WORKERS=0.
+    """
+    from registros.recognition_pool import RecognitionPool
+    try:
+        RecognitionPool.precalentar()
+    except Exception as e:
+        worker.log.warning(f"No se pudo precalentar el pool de reconocimiento: {e}")
@@ -1,5 +1,6 @@
 from django.contrib import admin
-from .models import RegistroAsistencia
+from django.utils.html import format_html
+from .models import RegistroAsistencia, MarcaSincronizada, ResumenDiario, ResumenMensual
 
 
 @admin.register(RegistroAsistencia)
@@ -7,7 +8,7 @@ class RegistroAsistenciaAdmin(admin.ModelAdmin):
     list_display = ('empleado', 'fecha', 'hora_entrada', 'hora_salida', 'horas_trabajadas', 'retardo', 'reconocimiento_facial')
     list_filter = ('fecha', 'retardo', 'reconocimiento_facial', 'justificado')
     search_fields = ('empleado__codigo_empleado', 'empleado__user__first_name', 'empleado__user__last_name')
-    readonly_fields = ('fecha_creacion', 'fecha_actualizacion', 'esta_completo', 'tiempo_trabajado_str')
+    readonly_fields = ('fecha_creacion', 'fecha_actualizacion', 'esta_completo', 'tiempo_trabajado_str', 'vista_foto')
     date_hierarchy = 'fecha'
     
     fieldsets = (
@@ -18,7 +19,7 @@ class RegistroAsistenciaAdmin(admin.ModelAdmin):
             'fields': ('hora_entrada', 'hora_salida', 'horas_trabajadas', 'tiempo_trabajado_str')
         }),
         ('Reconocimiento Facial', {
-            'fields': ('reconocimiento_facial', 'foto_registro', 'confianza_reconocimiento')
+            'fields': ('reconocimiento_facial', 'foto_registro', 'vista_foto', 'confianza_reconocimiento')
         }),
         ('Ubicación', {
             'fields': ('ubicacion', 'latitud', 'longitud'),
@@ -32,3 +33,44 @@ class RegistroAsistenciaAdmin(admin.ModelAdmin):
             'classes': ('collapse',)
         }),
     )
+    
+    def vista_foto(self, obj):
+        """Miniatura de la foto de registro (no descarga la original)"""
+        miniaturas = obj.miniaturas_foto
+        if not miniaturas:
+            return '-'
+        return format_html('<img src="{}" alt="Foto de registro" loading="lazy">', miniaturas['mediana'])
+    vista_foto.short_description = 'Vista previa'
+
+
+@admin.register(MarcaSincronizada)
+class MarcaSincronizadaAdmin(admin.ModelAdmin):
+    list_display = ('clave_idempotencia', 'dispositivo', 'tipo', 'momento_cliente', 'empleado', 'exito', 'mensaje')
+    list_filter = ('exito', 'tipo', 'dispositivo')
+    search_fields = ('clave_idempotencia', 'empleado__codigo_empleado')
+    readonly_fields = ('fecha_creacion',)
+    raw_id_fields = ('empleado', 'registro')
+
+
+class ResumenSoloLecturaAdmin(admin.ModelAdmin):
+    """Los resúmenes se mantienen solos; se corrigen con reconstruir_resumenes"""
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(ResumenDiario)
+class ResumenDiarioAdmin(ResumenSoloLecturaAdmin):
+    list_display = ('fecha', 'departamento', 'registros', 'dias_trabajados', 'retardos', 'horas_trabajadas', 'faltas')
+    list_filter = ('departamento',)
+    date_hierarchy = 'fecha'
+
+
+@admin.register(ResumenMensual)
+class ResumenMensualAdmin(ResumenSoloLecturaAdmin):
+    list_display = ('empleado', 'anio', 'mes', 'departamento', 'dias_trabajados', 'retardos', 'horas_trabajadas', 'faltas')
+    list_filter = ('anio', 'mes', 'departamento')
+    search_fields = ('empleado__codigo_empleado',)
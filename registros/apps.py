@@ -3,3 +3,7 @@ from django.apps import AppConfig
 
 class RegistrosConfig(AppConfig):
     name = 'registros'
+
+    def ready(self):
+        """Registra las señales de la app"""
+        from registros import signals  # noqa: F401
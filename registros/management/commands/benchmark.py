@@ -0,0 +1,230 @@
+"""
+Management command para medir el rendimiento del flujo de asistencia
+
+Mide la búsqueda en la galería de rostros con galerías sintéticas de varios
+tamaños (lineal y con índice IVF) y, sobre los datos de la base (ver generar_datos_sinteticos), la
+detección de ausentes, la generación del Excel, la vista del rol mensual y
+el rol semanal. Guarda los resultados en JSON para comparar corridas.
+"""
+import json
+import platform
+import statistics
+import time
+from datetime import datetime, timedelta
+
+import django
+import numpy as np
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import RequestFactory
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from checador.presupuesto_consultas import RegistroConsultas
+from empleados.models import Empleado
+from registros.models import RegistroAsistencia
+from registros.services.face_gallery import FaceGallery
+from registros.services.face_index import IndiceIVF
+from registros.services.facial_recognition import FacialRecognitionService
+from registros.services.resumen_service import MEXICO_TZ, ResumenService
+from turnos.models import RolMensual
+
+CASOS = ['galeria', 'ausentes', 'excel', 'rol_mensual', 'rol_semanal']
+
+
+class Command(BaseCommand):
+    help = 'Mide galería de rostros, ausencias, Excel, rol mensual y rol semanal y guarda un JSON'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--repeticiones',
+            type=int,
+            default=5,
+            help='Corridas medidas por caso, después de una de calentamiento (default: 5)'
+        )
+        parser.add_argument(
+            '--tamanos-galeria',
+            type=str,
+            default='100,1000,10000',
+            help='Tamaños de galería sintética separados por coma (default: 100,1000,10000)'
+        )
+        parser.add_argument(
+            '--casos',
+            type=str,
+            default=','.join(CASOS),
+            help=f'Casos a medir separados por coma (default: {",".join(CASOS)})'
+        )
+        parser.add_argument(
+            '--salida',
+            type=str,
+            help='Archivo JSON de resultados (default: benchmark_<fecha>.json)'
+        )
+        parser.add_argument(
+            '--comparar',
+            type=str,
+            help='JSON de una corrida anterior para mostrar la diferencia de medianas'
+        )
+
+    def handle(self, *args, **options):
+        casos = [caso.strip() for caso in options['casos'].split(',') if caso.strip()]
+        desconocidos = set(casos) - set(CASOS)
+        if desconocidos:
+            raise CommandError(f'Casos desconocidos: {", ".join(sorted(desconocidos))}')
+        try:
+            tamanos = [int(tamano) for tamano in options['tamanos_galeria'].split(',') if tamano.strip()]
+        except ValueError:
+            raise CommandError('--tamanos-galeria debe ser una lista de enteros')
+
+        self.repeticiones = max(1, options['repeticiones'])
+        self.resultados = {}
+        hoy = ResumenService.hoy()
+
+        if 'galeria' in casos:
+            rng = np.random.default_rng(0)
+            for tamano in tamanos:
+                self._medir_galeria(rng, tamano)
+
+        if 'ausentes' in casos:
+            from reportes.services.ausencias_service import AusenciasAlertService
+            ahora = datetime.now(MEXICO_TZ)
+            self._medir('ausentes', lambda: AusenciasAlertService.obtener_ausentes(ahora))
+
+        if 'excel' in casos:
+            from reportes.services.excel_service import ExcelReportService
+            fin_mes_anterior = hoy.replace(day=1) - timedelta(days=1)
+            inicio_mes_anterior = fin_mes_anterior.replace(day=1)
+            self._medir('excel_mes_anterior', lambda: ExcelReportService(
+                inicio_mes_anterior, fin_mes_anterior
+            ).generar_reporte_completo().close())
+            inicio_semana = hoy - timedelta(days=hoy.weekday() + 7)
+            self._medir('excel_semana_anterior', lambda: ExcelReportService(
+                inicio_semana, inicio_semana + timedelta(days=6)
+            ).generar_reporte_completo().close())
+
+        # Usuario en memoria: las vistas solo revisan is_staff
+        staff = User(username='benchmark', is_staff=True, is_superuser=True)
+
+        if 'rol_mensual' in casos:
+            from checador.views import rol_mensual_view
+            request = RequestFactory().get('/rol-mensual/', {'year': hoy.year, 'month': hoy.month})
+            request.user = staff
+            self._medir('rol_mensual_view', lambda: rol_mensual_view(request))
+
+        if 'rol_semanal' in casos:
+            from turnos.views import AsignacionTurnoViewSet
+            vista = AsignacionTurnoViewSet.as_view({'get': 'rol_semanal'})
+            lunes = hoy - timedelta(days=hoy.weekday())
+
+            def rol_semanal():
+                request = APIRequestFactory().get('/api/asignaciones/rol_semanal/', {
+                    'fecha_inicio': lunes.isoformat(),
+                    'fecha_fin': (lunes + timedelta(days=6)).isoformat(),
+                })
+                force_authenticate(request, user=staff)
+                return vista(request).render()
+
+            self._medir('rol_semanal', rol_semanal)
+
+        reporte = {
+            'fecha': datetime.now().isoformat(timespec='seconds'),
+            'entorno': {
+                'python': platform.python_version(),
+                'django': django.get_version(),
+                'numpy': np.__version__,
+                'base_de_datos': connection.vendor,
+                'maquina': platform.machine(),
+            },
+            'datos': {
+                'empleados': Empleado.objects.filter(activo=True).count(),
+                'registros': RegistroAsistencia.objects.count(),
+                'roles_mensuales': RolMensual.objects.count(),
+            },
+            'repeticiones': self.repeticiones,
+            'resultados': self.resultados,
+        }
+
+        salida = options['salida'] or f'benchmark_{datetime.now():%Y%m%d_%H%M%S}.json'
+        with open(salida, 'w', encoding='utf-8') as archivo:
+            json.dump(reporte, archivo, indent=2, ensure_ascii=False)
+        self.stdout.write(self.style.SUCCESS(f'✓ Resultados guardados en {salida}'))
+
+        if options['comparar']:
+            self._comparar(options['comparar'])
+
+    def _medir_galeria(self, rng, tamano):
+        matriz = rng.normal(0, 1 / np.sqrt(128), (tamano, FaceGallery.DIMENSIONES)).astype(np.float32)
+        estado = FaceGallery.construir_estado(np.arange(1, tamano + 1), matriz)
+        # Consultas cercanas a un empleado de la galería, como una marca real
+        consultas = matriz[rng.integers(0, tamano, 32)] + rng.normal(0, 0.02, (32, FaceGallery.DIMENSIONES))
+        consultas = consultas.astype(np.float32)
+
+        def buscar():
+            for consulta in consultas:
+                FaceGallery.buscar(consulta, estado=estado)
+
+        self._medir(f'galeria_{tamano}', buscar, por_llamada=len(consultas))
+        self._medir(f'galeria_{tamano}_lote32', lambda: FaceGallery.buscar_lote(consultas, estado=estado))
+
+        inicio = time.perf_counter()
+        indice = IndiceIVF.entrenar(np.arange(1, tamano + 1), matriz)
+        entrenamiento_ms = round((time.perf_counter() - inicio) * 1000, 1)
+        estado_ivf = FaceGallery.construir_estado(np.arange(1, tamano + 1), matriz, indice=indice)
+        umbral = FacialRecognitionService.FACE_TOLERANCE
+        exactos = [FaceGallery.buscar(consulta, estado=estado)[0] for consulta in consultas]
+        aproximados = [FaceGallery.buscar(consulta, estado=estado_ivf, umbral=umbral)[0] for consulta in consultas]
+
+        def buscar_ivf():
+            for consulta in consultas:
+                FaceGallery.buscar(consulta, estado=estado_ivf, umbral=umbral)
+
+        self._medir(f'galeria_{tamano}_ivf', buscar_ivf, por_llamada=len(consultas))
+        self.resultados[f'galeria_{tamano}_ivf'].update({
+            'entrenamiento_ms': entrenamiento_ms,
+            'coinciden_con_exacta': sum(a == e for a, e in zip(aproximados, exactos)) / len(consultas),
+        })
+
+    def _medir(self, nombre, funcion, por_llamada=1):
+        """Una corrida de calentamiento y luego `repeticiones` corridas medidas"""
+        self.stdout.write(f'⏱️  {nombre}...', ending='')
+        self.stdout.flush()
+        funcion()
+
+        tiempos = []
+        consultas = 0
+        for _ in range(self.repeticiones):
+            with RegistroConsultas() as registro:
+                inicio = time.perf_counter()
+                funcion()
+                tiempos.append((time.perf_counter() - inicio) * 1000 / por_llamada)
+            consultas = registro.consultas
+
+        tiempos.sort()
+        resultado = {
+            'min_ms': round(tiempos[0], 3),
+            'mediana_ms': round(statistics.median(tiempos), 3),
+            'p95_ms': round(tiempos[min(len(tiempos) - 1, int(len(tiempos) * 0.95))], 3),
+            'max_ms': round(tiempos[-1], 3),
+            'consultas': consultas // por_llamada if por_llamada > 1 else consultas,
+        }
+        self.resultados[nombre] = resultado
+        self.stdout.write(f' mediana {resultado["mediana_ms"]} ms, {resultado["consultas"]} consultas')
+
+    def _comparar(self, ruta):
+        try:
+            with open(ruta, encoding='utf-8') as archivo:
+                anteriores = json.load(archivo)['resultados']
+        except (OSError, ValueError, KeyError) as e:
+            self.stdout.write(self.style.ERROR(f'No se pudo leer {ruta}: {e}'))
+            return
+
+        self.stdout.write(f'\nComparación contra {ruta} (mediana):')
+        for nombre, actual in self.resultados.items():
+            anterior = anteriores.get(nombre)
+            if not anterior or not anterior.get('mediana_ms'):
+                self.stdout.write(f'  {nombre}: {actual["mediana_ms"]} ms (sin referencia)')
+                continue
+            cambio = (actual['mediana_ms'] - anterior['mediana_ms']) / anterior['mediana_ms'] * 100
+            estilo = self.style.ERROR if cambio > 10 else self.style.SUCCESS if cambio < -10 else str
+            self.stdout.write(estilo(
+                f'  {nombre}: {anterior["mediana_ms"]} → {actual["mediana_ms"]} ms ({cambio:+.1f}%)'
+            ))
@@ -0,0 +1,251 @@
+"""
+Management command para generar datos sintéticos de prueba y benchmark
+
+Crea empleados con encodings aleatorios de 128 dimensiones, sus horarios,
+asignaciones de turno y roles mensuales, y los registros de asistencia de
+los últimos meses. Todo se inserta con bulk_create; al final se materializan
+los turnos esperados y se reconstruyen los resúmenes.
+"""
+import random
+from datetime import date, datetime, timedelta
+
+import numpy as np
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from empleados.face_encoding import codificar_encoding
+from empleados.models import Empleado
+from horarios.models import Horario
+from registros.models import RegistroAsistencia
+from registros.services.resumen_service import ResumenService
+from turnos.models import AsignacionTurno, RolMensual, Turno, TurnoEsperado
+from turnos.services import TurnoEsperadoService
+
+DEPARTAMENTOS = ['Operaciones', 'Almacén', 'Administración', 'Ventas', 'Mantenimiento', 'Sistemas']
+PUESTOS = ['Operador', 'Auxiliar', 'Supervisor', 'Analista', 'Técnico']
+NOMBRES = ['Ana', 'Luis', 'María', 'José', 'Carmen', 'Jorge', 'Lucía', 'Pedro', 'Sofía', 'Miguel']
+APELLIDOS = ['García', 'Hernández', 'López', 'Martínez', 'Pérez', 'Sánchez', 'Ramírez', 'Torres']
+
+
+class Command(BaseCommand):
+    help = 'Genera empleados, horarios, turnos y registros de asistencia sintéticos'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--empleados',
+            type=int,
+            default=100,
+            help='Número de empleados a crear (default: 100)'
+        )
+        parser.add_argument(
+            '--meses',
+            type=int,
+            default=2,
+            help='Meses de registros de asistencia hasta ayer (default: 2)'
+        )
+        parser.add_argument(
+            '--prefijo',
+            type=str,
+            default='SIM',
+            help='Prefijo de los códigos de empleado y usuarios generados (default: SIM)'
+        )
+        parser.add_argument(
+            '--semilla',
+            type=int,
+            default=42,
+            help='Semilla aleatoria para generar siempre los mismos datos (default: 42)'
+        )
+        parser.add_argument(
+            '--limpiar',
+            action='store_true',
+            help='Eliminar antes los datos generados con el mismo prefijo'
+        )
+
+    def handle(self, *args, **options):
+        prefijo = options['prefijo'].upper()
+        if options['empleados'] <= 0 or options['meses'] <= 0:
+            self.stdout.write(self.style.ERROR('--empleados y --meses deben ser mayores que cero'))
+            return
+
+        self.aleatorio = random.Random(options['semilla'])
+        self.rng = np.random.default_rng(options['semilla'])
+
+        if options['limpiar']:
+            self._limpiar(prefijo)
+        elif Empleado.objects.filter(codigo_empleado__startswith=prefijo).exists():
+            self.stdout.write(self.style.ERROR(
+                f'Ya existen empleados con el prefijo {prefijo}. Use --limpiar o cambie --prefijo'
+            ))
+            return
+
+        turnos = list(Turno.objects.filter(activo=True, cruza_medianoche=False))
+        if not turnos:
+            call_command('init_turnos', stdout=self.stdout)
+            turnos = list(Turno.objects.filter(activo=True, cruza_medianoche=False))
+
+        hoy = ResumenService.hoy()
+        fecha_fin = hoy - timedelta(days=1)
+        mes = hoy.replace(day=1)
+        for _ in range(options['meses'] - 1):
+            mes = (mes - timedelta(days=1)).replace(day=1)
+        fecha_inicio = mes
+
+        with transaction.atomic():
+            empleados = self._crear_empleados(prefijo, options['empleados'])
+            self._crear_horarios(empleados, turnos, fecha_inicio, hoy)
+
+        self.stdout.write('Materializando turnos esperados...')
+        TurnoEsperadoService.materializar(
+            [empleado.id for empleado in empleados], fecha_inicio, TurnoEsperadoService.horizonte(hoy)[1]
+        )
+
+        total = self._crear_registros(empleados, fecha_inicio, fecha_fin)
+
+        self.stdout.write('Reconstruyendo resúmenes...')
+        ResumenService.reconstruir(fecha_inicio, fecha_fin, [empleado.id for empleado in empleados])
+
+        self.stdout.write(self.style.SUCCESS(
+            f'✓ {len(empleados)} empleados y {total} registros de asistencia '
+            f'({fecha_inicio} - {fecha_fin}) con prefijo {prefijo}'
+        ))
+
+    def _limpiar(self, prefijo):
+        usuarios = User.objects.filter(empleado__codigo_empleado__startswith=prefijo)
+        empleados = Empleado.objects.filter(codigo_empleado__startswith=prefijo)
+        self.stdout.write(self.style.WARNING(f'Eliminando {empleados.count()} empleados con prefijo {prefijo}...'))
+        with transaction.atomic():
+            # Borrado directo de las tablas grandes: las señales por registro
+            # no hacen falta porque los resúmenes se reconstruyen al final
+            for modelo in (RegistroAsistencia, TurnoEsperado, RolMensual):
+                consulta = modelo.objects.filter(empleado__in=empleados)
+                consulta._raw_delete(consulta.db)
+            usuarios.delete()
+
+    def _encoding(self):
+        # Vectores de norma ~1 como los de dlib; dos aleatorios quedan a
+        # distancia ~1.4, lejos de la tolerancia de coincidencia (0.6)
+        return self.rng.normal(0, 1 / np.sqrt(128), 128).astype(np.float32)
+
+    def _crear_empleados(self, prefijo, cantidad):
+        self.stdout.write(f'Creando {cantidad} empleados...')
+        contrasena = make_password(None)
+        usuarios = User.objects.bulk_create([
+            User(
+                username=f'{prefijo.lower()}_{i:05d}',
+                first_name=self.aleatorio.choice(NOMBRES),
+                last_name=self.aleatorio.choice(APELLIDOS),
+                password=contrasena
+            )
+            for i in range(cantidad)
+        ], batch_size=1000)
+        if usuarios[0].pk is None:
+            # Bases de datos sin RETURNING (MySQL): releer los ids
+            usuarios = list(User.objects.filter(
+                username__startswith=f'{prefijo.lower()}_'
+            ).order_by('username'))
+
+        dtype = getattr(settings, 'FACE_ENCODING_DTYPE', 'float32')
+        empleados = Empleado.objects.bulk_create([
+            Empleado(
+                user=usuario,
+                codigo_empleado=f'{prefijo}{i:05d}',
+                embedding_rostro=codificar_encoding(self._encoding(), dtype=dtype),
+                departamento=self.aleatorio.choice(DEPARTAMENTOS),
+                puesto=self.aleatorio.choice(PUESTOS),
+                fecha_ingreso=date(2020, 1, 1) + timedelta(days=self.aleatorio.randrange(1500))
+            )
+            for i, usuario in enumerate(usuarios)
+        ], batch_size=1000)
+        if empleados[0].pk is None:
+            empleados = list(Empleado.objects.filter(
+                codigo_empleado__startswith=prefijo
+            ).order_by('codigo_empleado'))
+        return empleados
+
+    def _crear_horarios(self, empleados, turnos, fecha_inicio, hoy):
+        """
+        Reparte a los empleados entre los tres orígenes de horario: la mitad
+        con AsignacionTurno, un 30% con Horario semanal y el resto con
+        RolMensual día por día.
+        """
+        self.stdout.write('Creando horarios, asignaciones y roles mensuales...')
+        asignaciones, horarios, roles = [], [], []
+        fin_roles = TurnoEsperadoService.horizonte(hoy)[1]
+
+        for i, empleado in enumerate(empleados):
+            turno = self.aleatorio.choice(turnos)
+            grupo = i % 10
+            if grupo < 5:
+                asignaciones.append(AsignacionTurno(
+                    empleado=empleado,
+                    turno=turno,
+                    fecha_inicio=fecha_inicio,
+                    aplica_sabado=grupo == 0
+                ))
+            elif grupo < 8:
+                for dia_semana in range(5):
+                    horarios.append(Horario(
+                        empleado=empleado,
+                        turno=turno,
+                        dia_semana=dia_semana,
+                        hora_entrada=turno.hora_entrada,
+                        hora_salida=turno.hora_salida
+                    ))
+            else:
+                fecha = fecha_inicio
+                while fecha <= fin_roles:
+                    descanso = fecha.weekday() >= 5 or self.aleatorio.random() < 0.05
+                    roles.append(RolMensual(
+                        empleado=empleado,
+                        fecha=fecha,
+                        turno=None if descanso else self.aleatorio.choice(turnos),
+                        es_descanso=descanso
+                    ))
+                    fecha += timedelta(days=1)
+
+        AsignacionTurno.objects.bulk_create(asignaciones, batch_size=1000)
+        Horario.objects.bulk_create(horarios, batch_size=1000)
+        RolMensual.objects.bulk_create(roles, batch_size=1000)
+
+    def _crear_registros(self, empleados, fecha_inicio, fecha_fin, tamano_lote=5000):
+        """Un registro por día laborable con 92% de asistencia y entradas alrededor de la hora esperada"""
+        self.stdout.write('Creando registros de asistencia...')
+        esperados = TurnoEsperado.objects.filter(
+            empleado__in=[empleado.id for empleado in empleados],
+            fecha__gte=fecha_inicio,
+            fecha__lte=fecha_fin,
+            hora_entrada__isnull=False,
+            es_descanso=False
+        ).values_list('empleado_id', 'fecha', 'hora_entrada', 'hora_salida', 'tolerancia_minutos').iterator()
+
+        total = 0
+        lote = []
+        for empleado_id, fecha, hora_entrada, hora_salida, tolerancia in esperados:
+            if self.aleatorio.random() >= 0.92:
+                continue
+            esperada = datetime.combine(fecha, hora_entrada)
+            entrada = esperada + timedelta(minutes=self.aleatorio.gauss(-5, 8))
+            registro = RegistroAsistencia(
+                empleado_id=empleado_id,
+                fecha=fecha,
+                hora_entrada=entrada.time().replace(microsecond=0),
+                reconocimiento_facial=True,
+                confianza_reconocimiento=round(self.aleatorio.uniform(55, 95), 2),
+                retardo=entrada > esperada + timedelta(minutes=tolerancia or 0)
+            )
+            if hora_salida and self.aleatorio.random() < 0.97:
+                salida = datetime.combine(fecha, hora_salida) + timedelta(minutes=self.aleatorio.gauss(5, 10))
+                registro.hora_salida = salida.time().replace(microsecond=0)
+                registro.calcular_horas_trabajadas()
+            lote.append(registro)
+
+            if len(lote) >= tamano_lote:
+                total += len(RegistroAsistencia.objects.bulk_create(lote))
+                lote = []
+        if lote:
+            total += len(RegistroAsistencia.objects.bulk_create(lote))
+        return total
@@ -0,0 +1,90 @@
+"""
+Management command para generar las miniaturas de las fotos ya guardadas
+
+Recorre las fotos de registro (RegistroAsistencia.foto_registro) y de rostro
+(Empleado.foto_rostro) y genera las que no tienen miniaturas (ver
+checador.miniaturas). Las fotos nuevas ya se guardan con sus miniaturas.
+"""
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+
+from django.core.management.base import BaseCommand
+
+from checador.miniaturas import generar_miniaturas, ruta_miniatura, tamanos
+from empleados.models import Empleado
+from registros.models import RegistroAsistencia
+
+FOTOS = {
+    'registros': (RegistroAsistencia, 'foto_registro'),
+    'rostros': (Empleado, 'foto_rostro'),
+}
+
+
+class Command(BaseCommand):
+    help = 'Genera las miniaturas WebP de las fotos de registro y de rostro existentes'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--fotos',
+            choices=['registros', 'rostros', 'todas'],
+            default='todas',
+            help='Qué fotos procesar (default: todas)'
+        )
+        parser.add_argument(
+            '--forzar',
+            action='store_true',
+            help='Regenerar también las fotos que ya tienen miniaturas'
+        )
+        parser.add_argument(
+            '--hilos',
+            type=int,
+            default=4,
+            help='Fotos procesadas en paralelo; el trabajo es sobre todo de red (default: 4)'
+        )
+        parser.add_argument(
+            '--limite',
+            type=int,
+            help='Máximo de fotos a procesar en esta corrida'
+        )
+
+    def handle(self, *args, **options):
+        grupos = list(FOTOS) if options['fotos'] == 'todas' else [options['fotos']]
+        lado_mayor = max(tamanos().values())
+
+        for grupo in grupos:
+            modelo, campo_nombre = FOTOS[grupo]
+            storage = modelo._meta.get_field(campo_nombre).storage
+            nombres = (
+                modelo.objects.exclude(**{f'{campo_nombre}__isnull': True})
+                .exclude(**{campo_nombre: ''})
+                .order_by('pk')
+                .values_list(campo_nombre, flat=True)
+            )
+            if options['limite']:
+                nombres = nombres[:options['limite']]
+
+            def procesar(nombre):
+                if not options['forzar'] and storage.exists(ruta_miniatura(nombre, lado_mayor)):
+                    return 'existentes'
+                try:
+                    generar_miniaturas(storage, nombre)
+                    return 'generadas'
+                except Exception as e:
+                    self.stdout.write(self.style.ERROR(f'  ❌ {nombre}: {e}'))
+                    return 'errores'
+
+            self.stdout.write(f'Procesando fotos de {grupo}...')
+            conteo = {'generadas': 0, 'existentes': 0, 'errores': 0}
+            pendientes = nombres.iterator()
+            with ThreadPoolExecutor(max_workers=max(1, options['hilos'])) as executor:
+                # Por lotes: map() encolaría todas las fotos de una vez
+                while lote := list(islice(pendientes, 500)):
+                    for resultado in executor.map(procesar, lote):
+                        conteo[resultado] += 1
+                    self.stdout.write(f'  {sum(conteo.values())} fotos...')
+
+            estilo = self.style.WARNING if conteo['errores'] else self.style.SUCCESS
+            self.stdout.write(estilo(
+                f"✓ {grupo}: {conteo['generadas']} generadas, {conteo['existentes']} ya tenían miniaturas, "
+                f"{conteo['errores']} con error"
+            ))
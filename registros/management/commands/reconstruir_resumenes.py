@@ -0,0 +1,64 @@
+"""
+Management command para recalcular ResumenDiario y ResumenMensual
+"""
+from datetime import datetime
+from django.core.management.base import BaseCommand
+from django.db.models import Min
+
+from empleados.models import Empleado
+from registros.models import RegistroAsistencia
+from registros.services.resumen_service import ResumenService
+
+
+class Command(BaseCommand):
+    help = 'Reconstruye los resúmenes diarios (por departamento) y mensuales (por empleado) de asistencia'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--fecha-inicio',
+            type=str,
+            help='Primer día (formato: YYYY-MM-DD). Por defecto: el registro más antiguo'
+        )
+        parser.add_argument(
+            '--fecha-fin',
+            type=str,
+            help='Último día (formato: YYYY-MM-DD). Por defecto: hoy'
+        )
+        parser.add_argument(
+            '--empleado',
+            type=str,
+            help='Código de empleado (por defecto: todos)'
+        )
+
+    def handle(self, *args, **options):
+        fecha_fin = ResumenService.hoy()
+        fecha_inicio = RegistroAsistencia.objects.aggregate(minima=Min('fecha'))['minima'] or fecha_fin
+        try:
+            if options['fecha_inicio']:
+                fecha_inicio = datetime.strptime(options['fecha_inicio'], '%Y-%m-%d').date()
+            if options['fecha_fin']:
+                fecha_fin = datetime.strptime(options['fecha_fin'], '%Y-%m-%d').date()
+        except ValueError:
+            self.stdout.write(self.style.ERROR('Formato de fecha inválido. Use YYYY-MM-DD'))
+            return
+
+        if fecha_fin < fecha_inicio:
+            self.stdout.write(self.style.ERROR('La fecha fin debe ser posterior a la fecha de inicio'))
+            return
+
+        empleados = None
+        if options['empleado']:
+            empleados = list(
+                Empleado.objects.filter(codigo_empleado=options['empleado']).values_list('id', flat=True)
+            )
+            if not empleados:
+                self.stdout.write(self.style.ERROR(f'No existe el empleado {options["empleado"]}'))
+                return
+
+        self.stdout.write(self.style.WARNING(
+            f'Reconstruyendo resúmenes del {fecha_inicio} al {fecha_fin} (meses completos)...'
+        ))
+
+        total = ResumenService.reconstruir(fecha_inicio, fecha_fin, empleados)
+
+        self.stdout.write(self.style.SUCCESS(f'✓ {total} filas de resumen escritas'))
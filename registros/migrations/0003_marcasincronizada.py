@@ -0,0 +1,36 @@
+# Generated by Django 6.0 on 2026-10-17 01:18
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('empleados', '0003_convertir_embeddings_binario'),
+        ('registros', '0002_alter_registroasistencia_fecha_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MarcaSincronizada',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('clave_idempotencia', models.CharField(max_length=64, unique=True, verbose_name='Clave de Idempotencia')),
+                ('dispositivo', models.CharField(blank=True, max_length=100, verbose_name='Dispositivo')),
+                ('tipo', models.CharField(choices=[('entrada', 'Entrada'), ('salida', 'Salida')], max_length=10, verbose_name='Tipo')),
+                ('momento_cliente', models.DateTimeField(help_text='Fecha y hora en que se capturó la marca en el kiosco', verbose_name='Momento en el Cliente')),
+                ('exito', models.BooleanField(default=False, verbose_name='Éxito')),
+                ('mensaje', models.CharField(blank=True, max_length=255, verbose_name='Mensaje')),
+                ('confianza_reconocimiento', models.FloatField(blank=True, null=True, verbose_name='Confianza del Reconocimiento')),
+                ('fecha_creacion', models.DateTimeField(auto_now_add=True)),
+                ('empleado', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='marcas_sincronizadas', to='empleados.empleado', verbose_name='Empleado')),
+                ('registro', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='marcas_sincronizadas', to='registros.registroasistencia', verbose_name='Registro')),
+            ],
+            options={
+                'verbose_name': 'Marca Sincronizada',
+                'verbose_name_plural': 'Marcas Sincronizadas',
+                'ordering': ['-fecha_creacion'],
+            },
+        ),
+    ]
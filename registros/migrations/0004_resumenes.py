@@ -0,0 +1,62 @@
+# Generated by Django 6.0 on 2026-10-17 01:31
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('empleados', '0003_convertir_embeddings_binario'),
+        ('registros', '0003_marcasincronizada'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ResumenDiario',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('registros', models.IntegerField(default=0, verbose_name='Registros')),
+                ('dias_trabajados', models.IntegerField(default=0, help_text='Registros con hora de entrada', verbose_name='Días Trabajados')),
+                ('registros_completos', models.IntegerField(default=0, verbose_name='Registros Completos')),
+                ('retardos', models.IntegerField(default=0, verbose_name='Retardos')),
+                ('horas_trabajadas', models.FloatField(default=0, verbose_name='Horas Trabajadas')),
+                ('dias_esperados', models.IntegerField(default=0, help_text='Días laborables ya transcurridos según TurnoEsperado', verbose_name='Días Esperados')),
+                ('asistencias_esperadas', models.IntegerField(default=0, help_text='Días esperados ya transcurridos que sí tienen registro', verbose_name='Asistencias en Días Esperados')),
+                ('fecha_actualizacion', models.DateTimeField(auto_now=True)),
+                ('fecha', models.DateField(verbose_name='Fecha')),
+                ('departamento', models.CharField(max_length=100, verbose_name='Departamento')),
+            ],
+            options={
+                'verbose_name': 'Resumen Diario',
+                'verbose_name_plural': 'Resúmenes Diarios',
+                'ordering': ['-fecha', 'departamento'],
+                'unique_together': {('fecha', 'departamento')},
+            },
+        ),
+        migrations.CreateModel(
+            name='ResumenMensual',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('registros', models.IntegerField(default=0, verbose_name='Registros')),
+                ('dias_trabajados', models.IntegerField(default=0, help_text='Registros con hora de entrada', verbose_name='Días Trabajados')),
+                ('registros_completos', models.IntegerField(default=0, verbose_name='Registros Completos')),
+                ('retardos', models.IntegerField(default=0, verbose_name='Retardos')),
+                ('horas_trabajadas', models.FloatField(default=0, verbose_name='Horas Trabajadas')),
+                ('dias_esperados', models.IntegerField(default=0, help_text='Días laborables ya transcurridos según TurnoEsperado', verbose_name='Días Esperados')),
+                ('asistencias_esperadas', models.IntegerField(default=0, help_text='Días esperados ya transcurridos que sí tienen registro', verbose_name='Asistencias en Días Esperados')),
+                ('fecha_actualizacion', models.DateTimeField(auto_now=True)),
+                ('anio', models.PositiveSmallIntegerField(verbose_name='Año')),
+                ('mes', models.PositiveSmallIntegerField(verbose_name='Mes')),
+                ('departamento', models.CharField(help_text='Departamento del empleado al calcular el resumen', max_length=100, verbose_name='Departamento')),
+                ('empleado', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='resumenes_mensuales', to='empleados.empleado', verbose_name='Empleado')),
+            ],
+            options={
+                'verbose_name': 'Resumen Mensual',
+                'verbose_name_plural': 'Resúmenes Mensuales',
+                'ordering': ['-anio', '-mes', 'empleado'],
+                'indexes': [models.Index(fields=['anio', 'mes'], name='registros_r_anio_5fcd30_idx')],
+                'unique_together': {('empleado', 'anio', 'mes')},
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 6.0 on 2026-10-17 01:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('empleados', '0003_convertir_embeddings_binario'),
+        ('registros', '0004_resumenes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='registroasistencia',
+            index=models.Index(fields=['-fecha', '-hora_entrada', '-id'], name='registros_fecha_hora_id_idx'),
+        ),
+    ]
@@ -0,0 +1,47 @@
+"""
+Llena ResumenDiario y ResumenMensual con la historia existente.
+
+A diferencia del resto de las migraciones de datos, esta usa
+ResumenService (y con él los modelos actuales, no los históricos): el
+cálculo de los resúmenes, incluida la materialización de TurnoEsperado, es
+el mismo del comando reconstruir_resumenes y no conviene duplicarlo aquí.
+Se procesa año por año para acotar la memoria y el tamaño de cada
+transacción.
+"""
+from datetime import date
+
+from django.db import migrations
+from django.db.models import Max, Min
+
+
+def llenar_resumenes(apps, schema_editor):
+    from registros.services.resumen_service import ResumenService
+
+    RegistroAsistencia = apps.get_model('registros', 'RegistroAsistencia')
+    limites = RegistroAsistencia.objects.aggregate(minima=Min('fecha'), maxima=Max('fecha'))
+    if limites['minima'] is None:
+        return
+
+    fecha_fin = max(limites['maxima'], ResumenService.hoy())
+    for anio in range(limites['minima'].year, fecha_fin.year + 1):
+        ResumenService.reconstruir(
+            max(limites['minima'], date(anio, 1, 1)), min(fecha_fin, date(anio, 12, 31))
+        )
+
+
+def vaciar_resumenes(apps, schema_editor):
+    apps.get_model('registros', 'ResumenDiario').objects.all().delete()
+    apps.get_model('registros', 'ResumenMensual').objects.all().delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('empleados', '0003_convertir_embeddings_binario'),
+        ('registros', '0005_registro_indice_paginacion'),
+        ('turnos', '0004_turnoesperado'),
+    ]
+
+    operations = [
+        migrations.RunPython(llenar_resumenes, vaciar_resumenes),
+    ]
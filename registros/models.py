@@ -1,9 +1,11 @@
-from django.db import models
+from django.db import models, transaction
 from django.utils import timezone
 from datetime import datetime, timedelta
 from zoneinfo import ZoneInfo
 
-from checador.storage_backends import MediaStorage
+from checador.metricas import ETAPA_SEGUNDOS
+from checador.miniaturas import urls_miniaturas
+from checador.storage_backends import LimpiezaArchivosMixin, MediaStorage
 from empleados.models import Empleado
 
 # Zona horaria de México
@@ -15,7 +17,7 @@ def fecha_mexico():
     return timezone.now().astimezone(MEXICO_TZ).date()
 
 
-class RegistroAsistencia(models.Model):
+class RegistroAsistencia(LimpiezaArchivosMixin, models.Model):
     """Modelo para registrar asistencias de empleados"""
 
     TIPO_REGISTRO_CHOICES = [
@@ -110,6 +112,10 @@ class RegistroAsistencia(models.Model):
         verbose_name_plural = 'Registros de Asistencia'
         ordering = ['-fecha', '-hora_entrada']
         unique_together = ['empleado', 'fecha']
+        indexes = [
+            # Paginación por llave del listado de registros
+            models.Index(fields=['-fecha', '-hora_entrada', '-id'], name='registros_fecha_hora_id_idx'),
+        ]
 
     def __str__(self):
         return f"{self.empleado.codigo_empleado} - {self.fecha}"
@@ -129,13 +135,19 @@ class RegistroAsistencia(models.Model):
             return self.horas_trabajadas
         return 0
 
-    def verificar_retardo(self):
-        """Verifica si el empleado llegó tarde según su horario"""
+    def verificar_retardo(self, resolver=None):
+        """
+        Verifica si el empleado llegó tarde según su horario.
+        
+        Args:
+            resolver: ScheduleResolver precargado (para recalcular muchos
+                registros sin consultar el turno uno por uno)
+        """
         if not self.hora_entrada:
             return False
 
         # Obtener el horario/turno del empleado para este día
-        turno_info = self._obtener_turno_del_dia()
+        turno_info = self._obtener_turno_del_dia(resolver)
         if not turno_info:
             return False
 
@@ -158,63 +170,62 @@ class RegistroAsistencia(models.Model):
         self.retardo = entrada_real > (entrada_esperada + tolerancia)
         return self.retardo
 
-    def _obtener_turno_del_dia(self):
+    def _obtener_turno_del_dia(self, resolver=None):
         """
         Obtiene la información del turno para este día.
         Retorna: (hora_entrada, tolerancia_minutos, cruza_medianoche) o None
-        Prioridad: RolMensual > Horario > AsignacionTurno
+        Prioridad: RolMensual > Horario > AsignacionTurno (ver ScheduleResolver)
         """
-        from turnos.models import RolMensual, AsignacionTurno
-
-        dia_semana = self.fecha.isoweekday()
-
-        # 1. Buscar en RolMensual
-        try:
-            rol = RolMensual.objects.select_related('turno').get(
-                empleado=self.empleado,
-                fecha=self.fecha,
-                es_descanso=False,
-                turno__isnull=False
-            )
-            if rol.turno:
-                return (rol.turno.hora_entrada, 10, rol.turno.cruza_medianoche)
-        except RolMensual.DoesNotExist:
-            pass
-
-        # 2. Buscar en Horario del día
-        try:
-            horario = self.empleado.horarios.select_related('turno').get(
-                dia_semana=dia_semana,
-                activo=True
-            )
-            cruza = horario.turno.cruza_medianoche if horario.turno else (horario.hora_salida < horario.hora_entrada)
-            return (horario.hora_entrada, horario.tolerancia_minutos, cruza)
-        except:
-            pass
-
-        # 3. Buscar en AsignacionTurno
-        from django.db.models import Q
-        asignaciones = AsignacionTurno.objects.filter(
-            empleado=self.empleado,
-            activo=True,
-            fecha_inicio__lte=self.fecha
-        ).filter(
-            Q(fecha_fin__isnull=True) | Q(fecha_fin__gte=self.fecha)
-        ).select_related('turno')
-
-        for asignacion in asignaciones:
-            if asignacion.aplica_en_fecha(self.fecha):
-                return (asignacion.turno.hora_entrada, 10, asignacion.turno.cruza_medianoche)
-
-        return None
+        from turnos.services import ScheduleResolver
+
+        if resolver is None:
+            resolver = ScheduleResolver([self.empleado_id], self.fecha)
+        turno = resolver.turno(self.empleado_id, self.fecha)
+        if turno is None or turno.es_descanso:
+            return None
+        return (turno.hora_entrada, turno.tolerancia_minutos, turno.cruza_medianoche)
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Aporte a los resúmenes tal como está en la base de datos
+        instance._aporte_resumen = instance.aporte_resumen()
+        return instance
+
+    def aporte_resumen(self):
+        """Lo que este registro suma a ResumenDiario/ResumenMensual"""
+        if self.pk is None or self.empleado_id is None or self.fecha is None:
+            return None
+        return {
+            'empleado_id': self.empleado_id,
+            'fecha': self.fecha,
+            'registros': 1,
+            'dias_trabajados': 1 if self.hora_entrada else 0,
+            'registros_completos': 1 if self.hora_entrada and self.hora_salida else 0,
+            'retardos': 1 if self.retardo else 0,
+            'horas_trabajadas': self.horas_trabajadas or 0,
+        }
 
     def save(self, *args, **kwargs):
-        """Override save para calcular campos automáticamente"""
+        """
+        Override save para calcular campos automáticamente y aplicar la
+        diferencia a los resúmenes en la misma transacción
+        """
+        from registros.services.resumen_service import ResumenService
+
         if self.hora_entrada and self.hora_salida:
             self.calcular_horas_trabajadas()
         if self.hora_entrada:
             self.verificar_retardo()
-        super().save(*args, **kwargs)
+        with ETAPA_SEGUNDOS.medir(etapa='guardar_registro'), transaction.atomic():
+            super().save(*args, **kwargs)
+            aporte = self.aporte_resumen()
+            ResumenService.registrar_cambio(
+                getattr(self, '_aporte_resumen', None),
+                aporte,
+                empleado=self.empleado if RegistroAsistencia.empleado.is_cached(self) else None
+            )
+        self._aporte_resumen = aporte
 
     @property
     def esta_completo(self):
@@ -229,3 +240,175 @@ class RegistroAsistencia(models.Model):
             minutos = int((self.horas_trabajadas - horas) * 60)
             return f"{horas}h {minutos}m"
         return "0h 0m"
+
+    @property
+    def miniaturas_foto(self):
+        """URLs de las miniaturas de foto_registro ({'chica': ..., 'mediana': ...})"""
+        return urls_miniaturas(self.foto_registro)
+
+
+class MarcaSincronizada(models.Model):
+    """
+    Marca enviada por un kiosco desde su cola local (modo sin conexión).
+    La clave de idempotencia permite reintentar el mismo lote sin duplicar
+    asistencias: una clave ya procesada devuelve el resultado guardado.
+    """
+
+    clave_idempotencia = models.CharField(
+        max_length=64,
+        unique=True,
+        verbose_name='Clave de Idempotencia'
+    )
+    dispositivo = models.CharField(
+        max_length=100,
+        blank=True,
+        verbose_name='Dispositivo'
+    )
+    tipo = models.CharField(
+        max_length=10,
+        choices=RegistroAsistencia.TIPO_REGISTRO_CHOICES,
+        verbose_name='Tipo'
+    )
+    momento_cliente = models.DateTimeField(
+        verbose_name='Momento en el Cliente',
+        help_text='Fecha y hora en que se capturó la marca en el kiosco'
+    )
+    empleado = models.ForeignKey(
+        Empleado,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='marcas_sincronizadas',
+        verbose_name='Empleado'
+    )
+    registro = models.ForeignKey(
+        RegistroAsistencia,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='marcas_sincronizadas',
+        verbose_name='Registro'
+    )
+    exito = models.BooleanField(
+        default=False,
+        verbose_name='Éxito'
+    )
+    mensaje = models.CharField(
+        max_length=255,
+        blank=True,
+        verbose_name='Mensaje'
+    )
+    confianza_reconocimiento = models.FloatField(
+        null=True,
+        blank=True,
+        verbose_name='Confianza del Reconocimiento'
+    )
+
+    fecha_creacion = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = 'Marca Sincronizada'
+        verbose_name_plural = 'Marcas Sincronizadas'
+        ordering = ['-fecha_creacion']
+
+    def __str__(self):
+        return f"{self.clave_idempotencia} - {self.tipo}"
+
+    def como_resultado(self, duplicada=False):
+        """Resultado por marca que se devuelve al kiosco"""
+        momento = self.momento_cliente.astimezone(MEXICO_TZ)
+        return {
+            'clave': self.clave_idempotencia,
+            'success': self.exito,
+            'message': self.mensaje,
+            'duplicada': duplicada,
+            'tipo': self.tipo,
+            'empleado': self.empleado.nombre_completo if self.empleado else None,
+            'codigo': self.empleado.codigo_empleado if self.empleado else None,
+            'confianza': (
+                f'{self.confianza_reconocimiento:.1f}%'
+                if self.confianza_reconocimiento is not None else None
+            ),
+            'hora': momento.strftime('%H:%M:%S'),
+            'registro_id': self.registro_id,
+        }
+
+
+class TotalesAsistencia(models.Model):
+    """Contadores comunes de los resúmenes de asistencia"""
+
+    registros = models.IntegerField(default=0, verbose_name='Registros')
+    dias_trabajados = models.IntegerField(
+        default=0,
+        verbose_name='Días Trabajados',
+        help_text='Registros con hora de entrada'
+    )
+    registros_completos = models.IntegerField(default=0, verbose_name='Registros Completos')
+    retardos = models.IntegerField(default=0, verbose_name='Retardos')
+    horas_trabajadas = models.FloatField(default=0, verbose_name='Horas Trabajadas')
+    dias_esperados = models.IntegerField(
+        default=0,
+        verbose_name='Días Esperados',
+        help_text='Días laborables ya transcurridos según TurnoEsperado'
+    )
+    asistencias_esperadas = models.IntegerField(
+        default=0,
+        verbose_name='Asistencias en Días Esperados',
+        help_text='Días esperados ya transcurridos que sí tienen registro'
+    )
+
+    fecha_actualizacion = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        abstract = True
+
+    @property
+    def faltas(self):
+        """Días laborables transcurridos sin registro"""
+        return max(0, self.dias_esperados - self.asistencias_esperadas)
+
+
+class ResumenDiario(TotalesAsistencia):
+    """Totales de asistencia por departamento y día"""
+
+    fecha = models.DateField(verbose_name='Fecha')
+    departamento = models.CharField(max_length=100, verbose_name='Departamento')
+
+    class Meta:
+        verbose_name = 'Resumen Diario'
+        verbose_name_plural = 'Resúmenes Diarios'
+        ordering = ['-fecha', 'departamento']
+        unique_together = ['fecha', 'departamento']
+
+    def __str__(self):
+        return f"{self.departamento} - {self.fecha}"
+
+
+class ResumenMensual(TotalesAsistencia):
+    """Totales de asistencia por empleado y mes"""
+
+    empleado = models.ForeignKey(
+        Empleado,
+        on_delete=models.CASCADE,
+        related_name='resumenes_mensuales',
+        verbose_name='Empleado'
+    )
+    anio = models.PositiveSmallIntegerField(verbose_name='Año')
+    mes = models.PositiveSmallIntegerField(verbose_name='Mes')
+    departamento = models.CharField(
+        max_length=100,
+        verbose_name='Departamento',
+        help_text='Departamento del empleado al calcular el resumen'
+    )
+
+    class Meta:
+        verbose_name = 'Resumen Mensual'
+        verbose_name_plural = 'Resúmenes Mensuales'
+        ordering = ['-anio', '-mes', 'empleado']
+        unique_together = ['empleado', 'anio', 'mes']
+        indexes = [
+            models.Index(fields=['anio', 'mes']),
+        ]
+
+    def __str__(self):
+        return f"{self.empleado.codigo_empleado} - {self.anio}/{self.mes:02d}"
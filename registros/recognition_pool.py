@@ -0,0 +1,241 @@
+"""
+Pool de procesos dedicado al reconocimiento facial.
+
+El reconocimiento (dlib) es trabajo de CPU que bloquea al worker de gunicorn
+que lo ejecuta. Este módulo lo delega a un pool acotado de procesos: cada
+proceso carga los modelos de dlib y la galería de encodings una sola vez y
+las vistas de asistencia envían trabajos con timeout y un límite de
+trabajos pendientes.
+
+Este módulo no importa modelos de Django a nivel de módulo porque los
+procesos del pool lo importan antes de ejecutar django.setup().
+"""
+
+import logging
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FuturesTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+
+class ReconocimientoOcupadoError(Exception):
+    """Se alcanzó el límite de trabajos de reconocimiento pendientes"""
+
+
+class ReconocimientoTimeoutError(Exception):
+    """El reconocimiento no terminó dentro del tiempo permitido"""
+
+
+def _inicializar_worker():
+    """Prepara Django, los modelos de dlib y la galería en el proceso del pool"""
+    # El proceso hereda el entorno de gunicorn; sin esto ReportesConfig.ready()
+    # arrancaría otro scheduler dentro de cada worker de reconocimiento.
+    os.environ.pop('SERVER_SOFTWARE', None)
+    os.environ.pop('RUN_MAIN', None)
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'checador.settings')
+
+    import django
+    django.setup()
+
+    from registros.services import FacialRecognitionService, FaceGallery
+    inicio = time.perf_counter()
+    FacialRecognitionService.precargar()
+    try:
+        FaceGallery.cargar()
+    except Exception as e:
+        logger.warning(f"⚠️ No se pudo precargar la galería de rostros: {e}")
+    logger.info(
+        f"🧠 Worker de reconocimiento {os.getpid()} listo en "
+        f"{(time.perf_counter() - inicio) * 1000:.0f} ms"
+    )
+
+
+def _ping():
+    return os.getpid()
+
+
+def _reconocer(image, validar=True):
+    """Ejecuta el reconocimiento dentro del proceso del pool"""
+    from django.db import close_old_connections
+    from registros.services import FacialRecognitionService
+
+    close_old_connections()
+    tiempos = {}
+    empleado, confianza, mensaje = FacialRecognitionService.recognize_employee(
+        image, tiempos=tiempos, validate=validar
+    )
+    return empleado, confianza, mensaje, tiempos
+
+
+def _extraer_encodings(images):
+    """Extrae encodings de un lote de imágenes dentro del proceso del pool"""
+    from registros.services import FacialRecognitionService
+
+    tiempos = {}
+    resultados = FacialRecognitionService.extraer_encodings_lote(images, tiempos=tiempos)
+    return resultados, tiempos
+
+
+class RecognitionPool:
+    """Pool de procesos por worker de gunicorn para reconocimiento facial"""
+
+    _lock = threading.Lock()
+    _executor = None
+    _cupos = None
+
+    @staticmethod
+    def _num_workers():
+        return getattr(settings, 'FACE_RECOGNITION_WORKERS', 1)
+
+    @classmethod
+    def _obtener_executor(cls):
+        with cls._lock:
+            if cls._executor is None:
+                max_pendientes = getattr(settings, 'FACE_RECOGNITION_MAX_PENDING', 4)
+                cls._cupos = threading.BoundedSemaphore(max_pendientes)
+                cls._executor = ProcessPoolExecutor(
+                    max_workers=cls._num_workers(),
+                    mp_context=multiprocessing.get_context('spawn'),
+                    initializer=_inicializar_worker,
+                )
+            return cls._executor
+
+    @classmethod
+    def _reiniciar(cls):
+        """Descarta un pool roto (p. ej. un worker terminado por OOM)"""
+        with cls._lock:
+            if cls._executor is not None:
+                cls._executor.shutdown(wait=False, cancel_futures=True)
+            cls._executor = None
+
+    @classmethod
+    def precalentar(cls):
+        """
+        Arranca los procesos del pool para que la carga de modelos ocurra
+        al iniciar el worker de gunicorn y no en la primera marca. En modo
+        en línea (FACE_RECOGNITION_WORKERS=0) los carga en este proceso.
+        """
+        if cls._num_workers() <= 0:
+            from registros.services import FacialRecognitionService
+            FacialRecognitionService.precargar()
+            return
+        executor = cls._obtener_executor()
+        for _ in range(cls._num_workers()):
+            executor.submit(_ping)
+
+    @classmethod
+    def _ejecutar(cls, funcion, *args, timeout=None):
+        """
+        Envía un trabajo al pool respetando el límite de pendientes.
+
+        Returns:
+            Tupla (resultado de la función, ms totales incluyendo la espera)
+        """
+        executor = cls._obtener_executor()
+        cupos = cls._cupos
+        if not cupos.acquire(blocking=False):
+            raise ReconocimientoOcupadoError('Demasiadas solicitudes de reconocimiento en curso')
+
+        inicio = time.perf_counter()
+        try:
+            future = executor.submit(funcion, *args)
+        except BrokenProcessPool:
+            cupos.release()
+            cls._reiniciar()
+            raise ReconocimientoOcupadoError('El servicio de reconocimiento se está reiniciando')
+        except Exception:
+            cupos.release()
+            raise
+        # El cupo se libera cuando el proceso termina, no cuando la vista deja de esperar
+        future.add_done_callback(lambda _: cupos.release())
+
+        try:
+            resultado = future.result(
+                timeout=timeout or getattr(settings, 'FACE_RECOGNITION_TIMEOUT', 30)
+            )
+        except FuturesTimeoutError:
+            future.cancel()
+            raise ReconocimientoTimeoutError('El reconocimiento facial tardó demasiado')
+        except BrokenProcessPool:
+            cls._reiniciar()
+            raise ReconocimientoOcupadoError('El servicio de reconocimiento se está reiniciando')
+
+        return resultado, (time.perf_counter() - inicio) * 1000
+
+    @staticmethod
+    def _registrar_tiempos(tiempos, tiempos_worker, total_ms):
+        from checador.metricas import ETAPA_SEGUNDOS
+
+        # Las etapas del worker ya se observaron en su proceso
+        espera = total_ms - sum(tiempos_worker.values())
+        ETAPA_SEGUNDOS.observe(max(espera, 0.0) / 1000, etapa='espera')
+        if tiempos is not None:
+            tiempos.update(tiempos_worker)
+            tiempos['espera'] = round(espera, 2)
+
+    @classmethod
+    def reconocer(cls, image, tiempos=None, validar=True):
+        """
+        Reconoce a un empleado usando el pool de procesos.
+
+        Args:
+            image: numpy array con la imagen
+            tiempos: Diccionario opcional donde se registran los ms por etapa
+            validar: Si debe validar la calidad de la imagen
+
+        Returns:
+            Tupla (empleado o None, confianza, mensaje)
+
+        Raises:
+            ReconocimientoOcupadoError: si hay demasiados trabajos pendientes
+            ReconocimientoTimeoutError: si el trabajo excede FACE_RECOGNITION_TIMEOUT
+        """
+        if cls._num_workers() <= 0:
+            # Modo en línea (desarrollo/pruebas): reconocer en el mismo proceso
+            from registros.services import FacialRecognitionService
+            return FacialRecognitionService.recognize_employee(
+                image, tiempos=tiempos, validate=validar
+            )
+
+        (empleado, confianza, mensaje, tiempos_worker), total_ms = cls._ejecutar(
+            _reconocer, image, validar
+        )
+        cls._registrar_tiempos(tiempos, tiempos_worker, total_ms)
+        return empleado, confianza, mensaje
+
+    @classmethod
+    def extraer_encodings(cls, images, tiempos=None):
+        """
+        Extrae los encodings de varias imágenes en un solo trabajo del pool.
+        La búsqueda en la galería la hace quien llama, en lote.
+
+        Args:
+            images: Lista de numpy arrays
+            tiempos: Diccionario opcional donde se registran los ms por etapa
+
+        Returns:
+            Lista de tuplas (encoding o None, mensaje) en el mismo orden
+
+        Raises:
+            ReconocimientoOcupadoError: si hay demasiados trabajos pendientes
+            ReconocimientoTimeoutError: si el lote excede el tiempo permitido
+        """
+        if not images:
+            return []
+        if cls._num_workers() <= 0:
+            from registros.services import FacialRecognitionService
+            return FacialRecognitionService.extraer_encodings_lote(images, tiempos=tiempos)
+
+        # El timeout escala con el tamaño del lote
+        timeout = getattr(settings, 'FACE_RECOGNITION_TIMEOUT', 30) * len(images)
+        (resultados, tiempos_worker), total_ms = cls._ejecutar(
+            _extraer_encodings, images, timeout=timeout
+        )
+        cls._registrar_tiempos(tiempos, tiempos_worker, total_ms)
+        return resultados
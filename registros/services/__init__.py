@@ -1,3 +1,4 @@
 from .facial_recognition import FacialRecognitionService
+from .face_gallery import FaceGallery
 
-__all__ = ['FacialRecognitionService']
+__all__ = ['FacialRecognitionService', 'FaceGallery']
@@ -0,0 +1,66 @@
+"""
+Carga diferida de la pila de reconocimiento facial.
+
+face_recognition (dlib y sus modelos), OpenCV y PIL tardan segundos en
+importarse y ocupan cientos de MB. Los módulos de servicios los usan a
+través de ModuloPerezoso, que los importa en el primer acceso a un
+atributo; así los procesos que nunca reconocen (migrate, comandos, el
+scheduler, workers web con pool de reconocimiento) no pagan ese costo.
+
+Los procesos que sí reconocen llaman a precargar() al arrancar para no
+hacerlo en la primera marca.
+"""
+
+import importlib
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class ModuloPerezoso:
+    """Sustituto de un módulo que lo importa al primer acceso a un atributo"""
+
+    def __init__(self, nombre):
+        self._nombre = nombre
+        self._modulo = None
+        self._lock = threading.Lock()
+
+    def _cargar(self):
+        modulo = self._modulo
+        if modulo is None:
+            with self._lock:
+                if self._modulo is None:
+                    inicio = time.perf_counter()
+                    self._modulo = importlib.import_module(self._nombre)
+                    logger.info(
+                        f"📦 {self._nombre} importado en {(time.perf_counter() - inicio) * 1000:.0f} ms"
+                    )
+                modulo = self._modulo
+        return modulo
+
+    @property
+    def cargado(self):
+        return self._modulo is not None
+
+    def __getattr__(self, atributo):
+        return getattr(self._cargar(), atributo)
+
+    def __repr__(self):
+        estado = 'cargado' if self.cargado else 'sin cargar'
+        return f'<ModuloPerezoso {self._nombre} ({estado})>'
+
+
+face_recognition = ModuloPerezoso('face_recognition')
+cv2 = ModuloPerezoso('cv2')
+Image = ModuloPerezoso('PIL.Image')
+ImageOps = ModuloPerezoso('PIL.ImageOps')
+
+MODULOS = (face_recognition, cv2, Image, ImageOps)
+
+
+def precargar():
+    """Importa todos los módulos diferidos (hook de arranque de los workers que reconocen)"""
+    for modulo in MODULOS:
+        modulo._cargar()
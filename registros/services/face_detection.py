@@ -0,0 +1,152 @@
+"""
+Detectores de rostros configurables.
+
+La detección se ejecuta sobre una copia reducida del frame (lado mayor
+limitado por FACE_DETECTION_MAX_SIDE) y las cajas se reescalan a la
+resolución original. El backend se elige con FACE_DETECTOR_BACKEND:
+
+    - 'hog':    HOG de dlib sobre la imagen reducida (default)
+    - 'haar':   Haar cascade incluido en opencv-python-headless
+    - 'legacy': comportamiento anterior, HOG sobre la imagen completa
+"""
+
+import threading
+from typing import List, Tuple
+
+import numpy as np
+from django.conf import settings
+
+from .dependencias import cv2, face_recognition
+
+
+class HogDetector:
+    """Detector HOG de dlib"""
+
+    def __init__(self, upsample=0):
+        self.upsample = upsample
+
+    def detectar(self, image: np.ndarray) -> List[Tuple]:
+        return face_recognition.face_locations(
+            image,
+            number_of_times_to_upsample=self.upsample,
+            model='hog'
+        )
+
+
+class HaarDetector:
+    """Detector Haar cascade de OpenCV (más rápido, menos preciso que HOG)"""
+
+    CASCADE = 'haarcascade_frontalface_default.xml'
+
+    _local = threading.local()
+
+    def __init__(self, scale_factor=1.1, min_neighbors=5):
+        self.scale_factor = scale_factor
+        self.min_neighbors = min_neighbors
+
+    @classmethod
+    def _clasificador(cls):
+        # CascadeClassifier no es seguro entre hilos: uno por hilo
+        clasificador = getattr(cls._local, 'clasificador', None)
+        if clasificador is None:
+            clasificador = cv2.CascadeClassifier(cv2.data.haarcascades + cls.CASCADE)
+            cls._local.clasificador = clasificador
+        return clasificador
+
+    def detectar(self, image: np.ndarray) -> List[Tuple]:
+        gray = cv2.cvtColor(image, cv2.COLOR_RGB2GRAY)
+        rostros = self._clasificador().detectMultiScale(
+            gray,
+            scaleFactor=self.scale_factor,
+            minNeighbors=self.min_neighbors,
+            minSize=(30, 30)
+        )
+        return [(int(y), int(x + w), int(y + h), int(x)) for (x, y, w, h) in rostros]
+
+
+def obtener_detector():
+    """Retorna el detector configurado en settings y si debe reducir la imagen"""
+    backend = getattr(settings, 'FACE_DETECTOR_BACKEND', 'hog')
+    upsample = getattr(settings, 'FACE_DETECTION_UPSAMPLE', 0)
+
+    if backend == 'haar':
+        return HaarDetector(), True
+    if backend == 'legacy':
+        return HogDetector(upsample=1), False
+    return HogDetector(upsample=upsample), True
+
+
+def reducir_imagen(image: np.ndarray, max_lado: int) -> Tuple[np.ndarray, float]:
+    """
+    Reduce la imagen para que su lado mayor no exceda max_lado.
+
+    Returns:
+        Tupla (imagen reducida, factor de escala aplicado)
+    """
+    height, width = image.shape[:2]
+    lado_mayor = max(height, width)
+    if not max_lado or lado_mayor <= max_lado:
+        return image, 1.0
+
+    escala = max_lado / lado_mayor
+    reducida = cv2.resize(
+        image,
+        (int(round(width * escala)), int(round(height * escala))),
+        interpolation=cv2.INTER_AREA
+    )
+    return reducida, escala
+
+
+def reescalar_ubicaciones(ubicaciones, escala: float, shape) -> List[Tuple]:
+    """Lleva las cajas (top, right, bottom, left) de vuelta a la resolución original"""
+    if escala == 1.0:
+        return [tuple(int(v) for v in ubicacion) for ubicacion in ubicaciones]
+
+    height, width = shape[:2]
+    resultado = []
+    for top, right, bottom, left in ubicaciones:
+        resultado.append((
+            max(0, int(round(top / escala))),
+            min(width, int(round(right / escala))),
+            min(height, int(round(bottom / escala))),
+            max(0, int(round(left / escala))),
+        ))
+    return resultado
+
+
+def detectar_rostros(image: np.ndarray) -> List[Tuple]:
+    """
+    Detecta rostros con el backend configurado.
+
+    Returns:
+        Lista de ubicaciones (top, right, bottom, left) en la resolución original
+    """
+    detector, reducir = obtener_detector()
+    if not reducir:
+        return detector.detectar(image)
+
+    max_lado = getattr(settings, 'FACE_DETECTION_MAX_SIDE', 640)
+    reducida, escala = reducir_imagen(image, max_lado)
+    ubicaciones = detector.detectar(reducida)
+    return reescalar_ubicaciones(ubicaciones, escala, image.shape)
+
+
+def recortar_rostro(image: np.ndarray, ubicacion, margen: float = 0.25):
+    """
+    Recorta la región del rostro con un margen para los landmarks.
+
+    Returns:
+        Tupla (recorte, ubicación relativa al recorte)
+    """
+    top, right, bottom, left = ubicacion
+    height, width = image.shape[:2]
+    margen_y = int((bottom - top) * margen)
+    margen_x = int((right - left) * margen)
+
+    y0 = max(0, top - margen_y)
+    y1 = min(height, bottom + margen_y)
+    x0 = max(0, left - margen_x)
+    x1 = min(width, right + margen_x)
+
+    recorte = np.ascontiguousarray(image[y0:y1, x0:x1])
+    return recorte, (top - y0, right - x0, bottom - y0, left - x0)
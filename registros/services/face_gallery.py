@@ -0,0 +1,249 @@
+"""
+Galería en memoria de encodings faciales.
+Mantiene los encodings de todos los empleados activos en una sola matriz
+contigua (N x 128, float32) para resolver cada búsqueda con una operación
+vectorizada en lugar de recorrer empleado por empleado.
+
+Con FACE_GALLERY_INDICE y al menos FACE_GALLERY_INDICE_MINIMO encodings, la
+búsqueda pasa primero por un índice IVF (ver face_index) y solo recorre la
+galería completa si el índice no encuentra un candidato con margen dentro del
+umbral.
+"""
+
+import threading
+import time
+from typing import List, Optional, Tuple
+
+import numpy as np
+from django.conf import settings
+from django.db.models import Count, Max
+
+from checador.metricas import GALERIA_ROSTROS
+from empleados.face_encoding import decodificar_encoding, decodificar_lote
+from empleados.models import Empleado
+
+from .face_index import IndiceIVF
+
+
+class FaceGallery:
+    """Galería de encodings por proceso, invalidada cuando cambian los empleados"""
+
+    DIMENSIONES = 128
+
+    _lock = threading.Lock()
+    # Estado inmutable: (matriz, ids, normas_cuadradas, firma, índice IVF o None)
+    _estado = None
+    # time.monotonic() de la última comparación de la firma con la base de datos
+    _verificada_en = 0.0
+
+    @staticmethod
+    def _queryset():
+        """Empleados que participan en el reconocimiento"""
+        return Empleado.objects.filter(
+            activo=True,
+            embedding_rostro__isnull=False
+        ).exclude(embedding_rostro=b'')
+
+    @classmethod
+    def _firma_actual(cls) -> Tuple:
+        """
+        Firma barata de la tabla de empleados reconocibles.
+        Detecta cambios hechos por otros procesos (otros workers de gunicorn).
+        """
+        datos = cls._queryset().aggregate(
+            total=Count('id'),
+            ultima_actualizacion=Max('fecha_actualizacion')
+        )
+        return (datos['total'], datos['ultima_actualizacion'])
+
+    @classmethod
+    def cargar(cls):
+        """Carga (o recarga) todos los encodings activos desde la base de datos"""
+        with cls._lock:
+            firma = cls._firma_actual()
+            filas = cls._queryset().values_list('id', 'embedding_rostro')
+
+            ids, blobs = [], []
+            for empleado_id, embedding in filas:
+                ids.append(empleado_id)
+                blobs.append(embedding)
+
+            try:
+                matriz = decodificar_lote(blobs, cls.DIMENSIONES)
+            except Exception:
+                # Algún blob corrupto: decodificar uno por uno y omitir los inválidos
+                ids, matriz = cls._decodificar_tolerante(ids, blobs)
+
+            indice = None
+            if (getattr(settings, 'FACE_GALLERY_INDICE', False)
+                    and len(ids) >= getattr(settings, 'FACE_GALLERY_INDICE_MINIMO', 20000)):
+                indice = IndiceIVF.para_galeria(ids, matriz)
+
+            cls._estado = cls.construir_estado(ids, matriz, firma, indice)
+            cls._verificada_en = time.monotonic()
+            GALERIA_ROSTROS.set(len(ids))
+            return cls._estado
+
+    @staticmethod
+    def construir_estado(ids, matriz, firma=None, indice=None):
+        """
+        Arma el estado de búsqueda a partir de ids y encodings (N x 128).
+        También lo usa el benchmark para galerías sintéticas.
+
+        Returns:
+            Tupla (matriz, ids, normas_cuadradas, firma, índice)
+        """
+        matriz = np.ascontiguousarray(matriz, dtype=np.float32)
+        normas = np.einsum('ij,ij->i', matriz, matriz)
+        return (matriz, np.asarray(ids, dtype=np.int64), normas, firma, indice)
+
+    @classmethod
+    def _decodificar_tolerante(cls, ids, blobs):
+        validos, encodings = [], []
+        for empleado_id, blob in zip(ids, blobs):
+            try:
+                encoding = decodificar_encoding(blob)
+            except Exception:
+                continue
+            if encoding is None or encoding.size != cls.DIMENSIONES:
+                continue
+            validos.append(empleado_id)
+            encodings.append(encoding)
+        if not encodings:
+            return validos, np.empty((0, cls.DIMENSIONES), dtype=np.float32)
+        return validos, np.ascontiguousarray(np.vstack(encodings), dtype=np.float32)
+
+    @classmethod
+    def invalidar(cls):
+        """Descarta la galería; se recargará en la siguiente búsqueda"""
+        with cls._lock:
+            cls._estado = None
+
+    @classmethod
+    def obtener(cls):
+        """
+        Retorna el estado vigente de la galería, recargándolo si cambió la firma.
+
+        La firma se consulta a lo más cada FACE_GALLERY_VERIFICACION_SEGUNDOS
+        para no sumar un viaje a la base de datos a cada reconocimiento. Los
+        cambios hechos en este proceso invalidan la galería de inmediato (ver
+        registros.signals); los de otros procesos se ven al vencer el plazo.
+
+        Returns:
+            Tupla (matriz, ids, normas_cuadradas, firma, índice IVF o None)
+        """
+        estado = cls._estado
+        if estado is None:
+            return cls.cargar()
+        ahora = time.monotonic()
+        if ahora - cls._verificada_en < getattr(settings, 'FACE_GALLERY_VERIFICACION_SEGUNDOS', 5):
+            return estado
+        cls._verificada_en = ahora
+        if estado[3] != cls._firma_actual():
+            estado = cls.cargar()
+        return estado
+
+    @classmethod
+    def tamano(cls) -> int:
+        """Número de encodings cargados en la galería"""
+        estado = cls._estado
+        return 0 if estado is None else len(estado[1])
+
+    @classmethod
+    def buscar(cls, encoding: np.ndarray, estado=None, umbral: Optional[float] = None
+               ) -> Tuple[Optional[int], Optional[float]]:
+        """
+        Busca el encoding más cercano en la galería.
+
+        Args:
+            encoding: Encoding facial a buscar (128 dimensiones)
+            estado: Estado de construir_estado() a usar en lugar de la galería
+            umbral: Distancia de coincidencia; con índice IVF se acepta el mejor
+                candidato si queda a FACE_GALLERY_INDICE_MARGEN por debajo del
+                umbral y si no se busca en toda la galería. Sin umbral la
+                búsqueda siempre es exacta.
+
+        Returns:
+            Tupla (id del empleado más cercano, distancia euclidiana)
+            o (None, None) si la galería está vacía
+        """
+        matriz, ids, normas, _, indice_ivf = estado or cls.obtener()
+        if len(ids) == 0:
+            return None, None
+
+        consulta = np.asarray(encoding, dtype=np.float32)
+        if indice_ivf is not None and umbral is not None:
+            resultado = cls._buscar_indice(indice_ivf, matriz, ids, normas, consulta, umbral)
+            if resultado is not None:
+                return resultado
+
+        # ||a - b||^2 = ||a||^2 - 2 a·b + ||b||^2  (un solo producto matriz-vector)
+        distancias_cuadradas = normas - 2.0 * (matriz @ consulta) + float(consulta @ consulta)
+        indice = int(np.argmin(distancias_cuadradas))
+        distancia = float(np.sqrt(max(distancias_cuadradas[indice], 0.0)))
+        return int(ids[indice]), distancia
+
+    @staticmethod
+    def _buscar_indice(indice_ivf, matriz, ids, normas, consulta, umbral):
+        """
+        Re-rank exacto de los candidatos del índice IVF.
+
+        Un candidato apenas dentro del umbral no basta: otro empleado más
+        cercano puede estar en una lista que no se revisó, y aceptarlo sería
+        una marca a nombre de otra persona. Solo una coincidencia clara (con
+        margen por debajo del umbral) evita la búsqueda lineal.
+
+        Returns:
+            (id, distancia) del mejor candidato si está dentro del umbral
+            menos el margen, None si hay que recurrir a la búsqueda lineal
+        """
+        sondas = getattr(settings, 'FACE_GALLERY_INDICE_SONDAS', 8)
+        margen = getattr(settings, 'FACE_GALLERY_INDICE_MARGEN', 0.15)
+        filas = indice_ivf.candidatos(consulta, sondas)
+        if len(filas) == 0:
+            return None
+        distancias_cuadradas = normas[filas] - 2.0 * (matriz[filas] @ consulta) + float(consulta @ consulta)
+        mejor = int(np.argmin(distancias_cuadradas))
+        distancia = float(np.sqrt(max(distancias_cuadradas[mejor], 0.0)))
+        if distancia > umbral - margen:
+            return None
+        return int(ids[filas[mejor]]), distancia
+
+    @classmethod
+    def buscar_lote(cls, encodings, estado=None, umbral: Optional[float] = None
+                    ) -> List[Tuple[Optional[int], Optional[float]]]:
+        """
+        Busca varios encodings a la vez con un solo producto matriz-matriz.
+
+        Args:
+            encodings: Matriz (M x 128) o lista de encodings
+            estado: Estado de construir_estado() a usar en lugar de la galería
+            umbral: Distancia de coincidencia para usar el índice IVF (ver buscar)
+
+        Returns:
+            Lista de tuplas (id del empleado más cercano, distancia) por encoding
+        """
+        consultas = np.asarray(encodings, dtype=np.float32).reshape(-1, cls.DIMENSIONES)
+        if len(consultas) == 0:
+            return []
+
+        estado = estado or cls.obtener()
+        matriz, ids, normas, _, indice_ivf = estado
+        if len(ids) == 0:
+            return [(None, None)] * len(consultas)
+
+        if indice_ivf is not None and umbral is not None:
+            # Con índice cada consulta se resuelve por separado (la mayoría
+            # sin recorrer la galería completa)
+            return [cls.buscar(consulta, estado=estado, umbral=umbral) for consulta in consultas]
+
+        normas_consulta = np.einsum('ij,ij->i', consultas, consultas)
+        distancias_cuadradas = (
+            normas[np.newaxis, :]
+            - 2.0 * (consultas @ matriz.T)
+            + normas_consulta[:, np.newaxis]
+        )
+        indices = np.argmin(distancias_cuadradas, axis=1)
+        minimas = distancias_cuadradas[np.arange(len(consultas)), indices]
+        distancias = np.sqrt(np.maximum(minimas, 0.0))
+        return [(int(ids[i]), float(d)) for i, d in zip(indices, distancias)]
@@ -0,0 +1,186 @@
+"""
+Índice aproximado (IVF) para galerías de rostros grandes.
+
+Los encodings se agrupan con k-means en ~2·√N listas. Una búsqueda compara
+el encoding contra los centroides, recorre solo las FACE_GALLERY_INDICE_SONDAS
+listas más cercanas y calcula la distancia exacta (vectores completos, sin
+compresión) de esos candidatos. Si ningún candidato queda claramente dentro
+del umbral de coincidencia (FACE_GALLERY_INDICE_MARGEN por debajo),
+FaceGallery repite la búsqueda lineal exacta: así una coincidencia no se
+pierde por el índice, y un candidato dudoso no se acepta cuando el empleado
+correcto podría estar en una lista no revisada.
+
+El índice se guarda en FACE_GALLERY_INDICE_DIR (npz, sin pickle) y al
+recargar la galería se actualiza de forma incremental: las filas sin cambios
+conservan su lista, las nuevas o modificadas se asignan al centroide más
+cercano y las eliminadas se descartan. Los centroides solo se reentrenan
+cuando la galería cambió más de FRACCION_REENTRENAR desde el último
+entrenamiento.
+"""
+
+import logging
+import os
+import time
+from typing import Optional
+
+import numpy as np
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+# Pesos fijos para la firma por fila (detecta encodings modificados)
+_PESOS_FIRMA = np.random.default_rng(20240521).integers(1, 2 ** 61, 128, dtype=np.uint64) | np.uint64(1)
+
+
+def _firmas(matriz: np.ndarray) -> np.ndarray:
+    bits = np.ascontiguousarray(matriz, dtype=np.float32).view(np.uint32).astype(np.uint64)
+    with np.errstate(over='ignore'):
+        return (bits * _PESOS_FIRMA[:bits.shape[1]]).sum(axis=1, dtype=np.uint64)
+
+
+def _asignar(matriz: np.ndarray, centroides: np.ndarray, tamano_bloque: int = 8192) -> np.ndarray:
+    """Índice del centroide más cercano de cada fila (por bloques para acotar memoria)"""
+    normas = np.einsum('ij,ij->i', centroides, centroides)
+    asignacion = np.empty(len(matriz), dtype=np.int32)
+    for inicio in range(0, len(matriz), tamano_bloque):
+        bloque = matriz[inicio:inicio + tamano_bloque]
+        asignacion[inicio:inicio + tamano_bloque] = np.argmin(normas - 2.0 * (bloque @ centroides.T), axis=1)
+    return asignacion
+
+
+def _kmeans(muestra: np.ndarray, listas: int, iteraciones: int, rng) -> np.ndarray:
+    centroides = muestra[rng.choice(len(muestra), listas, replace=False)].copy()
+    for _ in range(iteraciones):
+        asignacion = _asignar(muestra, centroides)
+        sumas = np.zeros_like(centroides)
+        np.add.at(sumas, asignacion, muestra)
+        conteos = np.bincount(asignacion, minlength=listas)
+        con_filas = conteos > 0
+        centroides[con_filas] = sumas[con_filas] / conteos[con_filas, np.newaxis]
+    return centroides
+
+
+class IndiceIVF:
+    """Listas invertidas sobre las filas de la matriz de la galería"""
+
+    VERSION = 1
+    FRACCION_REENTRENAR = 0.2
+    ITERACIONES = 10
+    MUESTRA_POR_LISTA = 32
+
+    def __init__(self, centroides, ids, asignacion, firmas, entrenado_con):
+        self.centroides = np.ascontiguousarray(centroides, dtype=np.float32)
+        self.normas_centroides = np.einsum('ij,ij->i', self.centroides, self.centroides)
+        self.ids = ids
+        self.asignacion = asignacion
+        self.firmas = firmas
+        self.entrenado_con = int(entrenado_con)
+        # Filas de la galería ordenadas por lista y los límites de cada lista
+        self.orden = np.argsort(asignacion, kind='stable')
+        self.limites = np.searchsorted(asignacion[self.orden], np.arange(len(self.centroides) + 1))
+
+    @classmethod
+    def entrenar(cls, ids, matriz, semilla: int = 0) -> 'IndiceIVF':
+        """Entrena los centroides con una muestra de la galería y asigna todas las filas"""
+        rng = np.random.default_rng(semilla)
+        listas = max(1, min(len(matriz), int(2 * np.sqrt(len(matriz)))))
+        tamano_muestra = min(len(matriz), listas * cls.MUESTRA_POR_LISTA)
+        muestra = matriz[rng.choice(len(matriz), tamano_muestra, replace=False)]
+        centroides = _kmeans(muestra, listas, cls.ITERACIONES, rng)
+        return cls(centroides, np.asarray(ids, dtype=np.int64), _asignar(matriz, centroides),
+                   _firmas(matriz), len(matriz))
+
+    def actualizar(self, ids, matriz) -> Optional['IndiceIVF']:
+        """
+        Índice para la galería (ids, matriz) reutilizando los centroides.
+
+        Returns:
+            IndiceIVF actualizado, el mismo si no hubo cambios o None si la
+            galería cambió tanto que conviene reentrenar
+        """
+        ids = np.asarray(ids, dtype=np.int64)
+        firmas = _firmas(matriz)
+        if np.array_equal(ids, self.ids) and np.array_equal(firmas, self.firmas):
+            return self
+
+        # Filas que ya estaban en el índice con el mismo encoding
+        anteriores = {empleado_id: i for i, empleado_id in enumerate(self.ids.tolist())}
+        asignacion = np.full(len(ids), -1, dtype=np.int32)
+        for i, empleado_id in enumerate(ids.tolist()):
+            j = anteriores.get(empleado_id)
+            if j is not None and firmas[i] == self.firmas[j]:
+                asignacion[i] = self.asignacion[j]
+
+        nuevas = asignacion < 0
+        cambios = int(nuevas.sum()) + (len(self.ids) - int((~nuevas).sum()))
+        if cambios > self.FRACCION_REENTRENAR * max(self.entrenado_con, 1):
+            return None
+        if nuevas.any():
+            asignacion[nuevas] = _asignar(matriz[nuevas], self.centroides)
+        return IndiceIVF(self.centroides, ids, asignacion, firmas, self.entrenado_con)
+
+    def candidatos(self, consulta: np.ndarray, sondas: int) -> np.ndarray:
+        """Filas de la galería en las `sondas` listas más cercanas a la consulta"""
+        distancias = self.normas_centroides - 2.0 * (self.centroides @ consulta)
+        sondas = min(sondas, len(distancias))
+        cercanas = np.argpartition(distancias, sondas - 1)[:sondas]
+        return np.concatenate([
+            self.orden[self.limites[lista]:self.limites[lista + 1]] for lista in cercanas
+        ])
+
+    # === PERSISTENCIA ===
+
+    @staticmethod
+    def ruta() -> str:
+        return os.path.join(str(settings.FACE_GALLERY_INDICE_DIR), 'galeria_ivf.npz')
+
+    def guardar(self, ruta: str):
+        """Escritura atómica: otros procesos nunca leen un archivo a medias"""
+        os.makedirs(os.path.dirname(ruta), exist_ok=True)
+        temporal = f'{ruta}.{os.getpid()}.tmp.npz'
+        np.savez(
+            temporal,
+            version=np.int64(self.VERSION),
+            centroides=self.centroides,
+            ids=self.ids,
+            asignacion=self.asignacion,
+            firmas=self.firmas,
+            entrenado_con=np.int64(self.entrenado_con),
+        )
+        os.replace(temporal, ruta)
+
+    @classmethod
+    def cargar(cls, ruta: str) -> Optional['IndiceIVF']:
+        try:
+            with np.load(ruta, allow_pickle=False) as datos:
+                if int(datos['version']) != cls.VERSION:
+                    return None
+                return cls(datos['centroides'], datos['ids'], datos['asignacion'],
+                           datos['firmas'], int(datos['entrenado_con']))
+        except (OSError, KeyError, ValueError):
+            return None
+
+    @classmethod
+    def para_galeria(cls, ids, matriz) -> 'IndiceIVF':
+        """
+        Índice vigente para la galería: el guardado, actualizado de forma
+        incremental, o uno nuevo si no existe o hay que reentrenar.
+        """
+        inicio = time.perf_counter()
+        ruta = cls.ruta()
+        guardado = cls.cargar(ruta)
+        indice = guardado.actualizar(ids, matriz) if guardado is not None else None
+        accion = 'reutilizado' if indice is guardado else 'actualizado'
+        if indice is None:
+            indice = cls.entrenar(ids, matriz)
+            accion = 'entrenado'
+        if indice is not guardado:
+            try:
+                indice.guardar(ruta)
+            except OSError as e:
+                logger.warning(f"⚠️ No se pudo guardar el índice de rostros en {ruta}: {e}")
+        logger.info(
+            f"🗂️ Índice de rostros {accion} ({len(ids)} encodings, {len(indice.centroides)} listas) "
+            f"en {(time.perf_counter() - inicio) * 1000:.0f} ms"
+        )
+        return indice
@@ -1,16 +1,37 @@
 """
 Servicio de reconocimiento facial para el sistema de asistencias.
 Usa face_recognition y OpenCV para procesar imágenes y reconocer rostros.
+Ambos (y PIL) se importan en el primer uso; ver services.dependencias.
 """
 
-import face_recognition
-import cv2
 import numpy as np
-from PIL import Image
-import io
+import time
+from contextlib import contextmanager
 from typing import Optional, Tuple, List, Dict
-from django.core.files.uploadedfile import InMemoryUploadedFile
+from checador.metricas import ETAPA_SEGUNDOS, RECHAZOS, RECONOCIMIENTOS
+from checador.miniaturas import generar_miniaturas_seguro
 from empleados.models import Empleado
+from . import dependencias
+from .dependencias import cv2, face_recognition
+from .face_detection import detectar_rostros, recortar_rostro
+from .face_gallery import FaceGallery
+from .preprocesamiento import preparar_imagen
+
+
+@contextmanager
+def medir_etapa(tiempos: Optional[Dict], etapa: str):
+    """
+    Registra en tiempos[etapa] la duración del bloque en milisegundos y la
+    observa en el histograma checador_etapa_segundos
+    """
+    inicio = time.perf_counter()
+    try:
+        yield
+    finally:
+        duracion = time.perf_counter() - inicio
+        ETAPA_SEGUNDOS.observe(duracion, etapa=etapa)
+        if tiempos is not None:
+            tiempos[etapa] = round(duracion * 1000, 2)
 
 
 class FacialRecognitionService:
@@ -21,10 +42,23 @@ class FacialRecognitionService:
     MIN_FACE_SIZE = (50, 50)  # Tamaño mínimo del rostro en píxeles
     MAX_FACES_ALLOWED = 1  # Máximo de rostros permitidos en una imagen de registro
     
+    @staticmethod
+    def precargar():
+        """
+        Importa la pila de reconocimiento y calienta los modelos de
+        detección y encoding. Lo llaman los procesos que reconocen al
+        arrancar (workers del pool o gunicorn en modo en línea).
+        """
+        dependencias.precargar()
+        vacia = np.zeros((64, 64, 3), dtype=np.uint8)
+        FacialRecognitionService.detect_faces(vacia)
+        face_recognition.face_encodings(vacia, [(0, 64, 64, 0)])
+    
     @staticmethod
     def load_image_from_file(image_file) -> Optional[np.ndarray]:
         """
-        Carga una imagen desde un archivo Django UploadedFile o path.
+        Carga una imagen desde un archivo Django UploadedFile o path
+        (decodificación acotada y orientación EXIF, ver preprocesamiento).
         
         Args:
             image_file: Archivo de imagen (UploadedFile) o path
@@ -32,97 +66,105 @@ class FacialRecognitionService:
         Returns:
             numpy array con la imagen en formato RGB o None si hay error
         """
-        try:
-            if isinstance(image_file, InMemoryUploadedFile):
-                # Convertir InMemoryUploadedFile a PIL Image
-                image = Image.open(image_file)
-                # Convertir a RGB si es necesario
-                if image.mode != 'RGB':
-                    image = image.convert('RGB')
-                # Convertir PIL Image a numpy array
-                image_array = np.array(image)
-                return image_array
-            else:
-                # Si es un path, cargar directamente
-                image = face_recognition.load_image_file(image_file)
-                return image
-        except Exception as e:
-            print(f"Error al cargar imagen: {str(e)}")
-            return None
+        preparada = preparar_imagen(image_file)
+        return None if preparada is None else preparada.array
     
     @staticmethod
     def detect_faces(image: np.ndarray) -> List[Tuple]:
         """
-        Detecta rostros en una imagen.
+        Detecta rostros en una imagen con el backend configurado
+        (FACE_DETECTOR_BACKEND) sobre una copia reducida de la imagen.
         
         Args:
             image: numpy array con la imagen
             
         Returns:
             Lista de ubicaciones de rostros (top, right, bottom, left)
+            en la resolución original
         """
-        face_locations = face_recognition.face_locations(image)
-        return face_locations
+        return detectar_rostros(image)
     
     @staticmethod
-    def validate_image_quality(image: np.ndarray) -> Tuple[bool, str]:
+    def evaluar_calidad(image: np.ndarray) -> Tuple[bool, str, float]:
         """
-        Valida que la imagen tenga la calidad suficiente para reconocimiento.
+        Evalúa la calidad de la imagen y retorna además su nitidez.
+        Permite elegir el mejor frame de una ráfaga.
         
         Args:
             image: numpy array con la imagen
             
         Returns:
-            Tupla (es_válida, mensaje)
+            Tupla (es_válida, mensaje, nitidez como varianza del Laplaciano)
         """
         if image is None or image.size == 0:
-            return False, "Imagen vacía o inválida"
+            return False, "Imagen vacía o inválida", 0.0
         
         # Verificar dimensiones mínimas
         height, width = image.shape[:2]
         if height < 100 or width < 100:
-            return False, f"Imagen muy pequeña ({width}x{height}). Mínimo 100x100 píxeles"
+            return False, f"Imagen muy pequeña ({width}x{height}). Mínimo 100x100 píxeles", 0.0
         
         # Verificar si la imagen está muy oscura o muy clara
         gray = cv2.cvtColor(image, cv2.COLOR_RGB2GRAY)
         mean_brightness = np.mean(gray)
         
         if mean_brightness < 30:
-            return False, "Imagen muy oscura. Mejore la iluminación"
+            return False, "Imagen muy oscura. Mejore la iluminación", 0.0
         elif mean_brightness > 225:
-            return False, "Imagen muy clara. Reduzca la iluminación"
+            return False, "Imagen muy clara. Reduzca la iluminación", 0.0
         
         # Verificar desenfoque (usando Laplaciano)
-        laplacian_var = cv2.Laplacian(gray, cv2.CV_64F).var()
+        laplacian_var = float(cv2.Laplacian(gray, cv2.CV_64F).var())
         if laplacian_var < 100:
-            return False, "Imagen desenfocada. Use una imagen más nítida"
+            return False, "Imagen desenfocada. Use una imagen más nítida", laplacian_var
+        
+        return True, "Imagen válida", laplacian_var
+    
+    @staticmethod
+    def validate_image_quality(image: np.ndarray) -> Tuple[bool, str]:
+        """
+        Valida que la imagen tenga la calidad suficiente para reconocimiento.
         
-        return True, "Imagen válida"
+        Args:
+            image: numpy array con la imagen
+            
+        Returns:
+            Tupla (es_válida, mensaje)
+        """
+        is_valid, message, _ = FacialRecognitionService.evaluar_calidad(image)
+        return is_valid, message
     
     @staticmethod
-    def extract_face_encoding(image: np.ndarray, validate: bool = True) -> Tuple[Optional[np.ndarray], str]:
+    def extract_face_encoding(image: np.ndarray, validate: bool = True,
+                              tiempos: Optional[Dict] = None) -> Tuple[Optional[np.ndarray], str]:
         """
         Extrae el encoding facial de una imagen.
         
         Args:
             image: numpy array con la imagen
             validate: Si debe validar la calidad de la imagen
+            tiempos: Diccionario opcional donde se registran los ms por etapa
             
         Returns:
             Tupla (encoding o None, mensaje)
         """
         if validate:
-            is_valid, message = FacialRecognitionService.validate_image_quality(image)
+            with medir_etapa(tiempos, 'calidad'):
+                is_valid, message = FacialRecognitionService.validate_image_quality(image)
             if not is_valid:
+                RECHAZOS.inc(motivo='calidad')
                 return None, message
         
         # Detectar rostros
-        face_locations = FacialRecognitionService.detect_faces(image)
+        with medir_etapa(tiempos, 'deteccion'):
+            face_locations = FacialRecognitionService.detect_faces(image)
         
         if len(face_locations) == 0:
+            RECHAZOS.inc(motivo='sin_rostro')
             return None, "No se detectó ningún rostro en la imagen"
         
         if len(face_locations) > FacialRecognitionService.MAX_FACES_ALLOWED:
+            RECHAZOS.inc(motivo='varios_rostros')
             return None, f"Se detectaron {len(face_locations)} rostros. Solo debe haber uno"
         
         # Verificar tamaño del rostro
@@ -132,12 +174,16 @@ class FacialRecognitionService:
         
         if face_width < FacialRecognitionService.MIN_FACE_SIZE[0] or \
            face_height < FacialRecognitionService.MIN_FACE_SIZE[1]:
+            RECHAZOS.inc(motivo='rostro_pequeno')
             return None, f"Rostro muy pequeño ({face_width}x{face_height}). Acérquese a la cámara"
         
-        # Extraer encoding
-        face_encodings = face_recognition.face_encodings(image, face_locations)
+        # Extraer encoding solo de la región del rostro
+        with medir_etapa(tiempos, 'encoding'):
+            recorte, ubicacion_recorte = recortar_rostro(image, face_locations[0])
+            face_encodings = face_recognition.face_encodings(recorte, [ubicacion_recorte])
         
         if len(face_encodings) == 0:
+            RECHAZOS.inc(motivo='sin_encoding')
             return None, "No se pudo extraer el encoding facial. Intente con otra imagen"
         
         return face_encodings[0], "Encoding extraído exitosamente"
@@ -171,74 +217,139 @@ class FacialRecognitionService:
         return matches[0], confidence
     
     @staticmethod
-    def recognize_employee(image: np.ndarray) -> Tuple[Optional[Empleado], float, str]:
+    def recognize_employee(image: np.ndarray, tiempos: Optional[Dict] = None,
+                           validate: bool = True) -> Tuple[Optional[Empleado], float, str]:
         """
         Intenta reconocer a un empleado en una imagen.
         
         Args:
             image: numpy array con la imagen
+            tiempos: Diccionario opcional donde se registran los ms por etapa
+            validate: Si debe validar la calidad (False si ya se validó al elegir el frame)
             
         Returns:
             Tupla (empleado o None, confianza, mensaje)
         """
         # Extraer encoding de la imagen
-        unknown_encoding, message = FacialRecognitionService.extract_face_encoding(image)
+        unknown_encoding, message = FacialRecognitionService.extract_face_encoding(
+            image, validate=validate, tiempos=tiempos
+        )
         
         if unknown_encoding is None:
             return None, 0.0, message
         
-        # Obtener todos los empleados activos con rostro registrado
-        empleados = Empleado.objects.filter(
-            activo=True,
-            embedding_rostro__isnull=False
-        ).exclude(embedding_rostro=b'')
+        # Buscar el encoding más cercano en la galería en memoria
+        with medir_etapa(tiempos, 'galeria'):
+            empleado_id, distancia = FaceGallery.buscar(
+                unknown_encoding, umbral=FacialRecognitionService.FACE_TOLERANCE
+            )
         
-        if not empleados.exists():
+        if empleado_id is None:
+            RECONOCIMIENTOS.inc(resultado='galeria_vacia')
             return None, 0.0, "No hay empleados registrados con reconocimiento facial"
         
-        # Buscar coincidencia
-        best_match = None
-        best_confidence = 0.0
+        if distancia > FacialRecognitionService.FACE_TOLERANCE:
+            RECONOCIMIENTOS.inc(resultado='sin_coincidencia')
+            return None, 0.0, "No se encontró coincidencia con ningún empleado registrado"
         
-        for empleado in empleados:
-            known_encoding = empleado.get_face_encoding()
-            if known_encoding is None:
-                continue
+        try:
+            empleado = Empleado.objects.select_related('user').get(pk=empleado_id)
+        except Empleado.DoesNotExist:
+            # El empleado se eliminó después de cargar la galería
+            FaceGallery.invalidar()
+            RECONOCIMIENTOS.inc(resultado='sin_coincidencia')
+            return None, 0.0, "No se encontró coincidencia con ningún empleado registrado"
+        
+        RECONOCIMIENTOS.inc(resultado='coincidencia')
+        # Convertir distancia a porcentaje de confianza (0-100)
+        confidence = max(0, min(100, (1 - distancia) * 100))
+        return empleado, confidence, f"Empleado reconocido con {confidence:.1f}% de confianza"
+    
+    @staticmethod
+    def extraer_encodings_lote(images: List[np.ndarray],
+                               tiempos: Optional[Dict] = None) -> List[Tuple[Optional[np.ndarray], str]]:
+        """
+        Extrae los encodings de varias imágenes (validando su calidad).
+        
+        Args:
+            images: Lista de numpy arrays
+            tiempos: Diccionario opcional donde se registran los ms por etapa
             
-            matches, confidence = FacialRecognitionService.compare_faces(
-                known_encoding,
-                unknown_encoding
-            )
+        Returns:
+            Lista de tuplas (encoding o None, mensaje) en el mismo orden
+        """
+        with medir_etapa(tiempos, 'encodings_lote'):
+            return [
+                FacialRecognitionService.extract_face_encoding(image, validate=True)
+                for image in images
+            ]
+    
+    @staticmethod
+    def recognize_encodings(encodings: List[np.ndarray],
+                            tiempos: Optional[Dict] = None) -> List[Tuple[Optional[Empleado], float, str]]:
+        """
+        Identifica varios encodings con una sola búsqueda en la galería
+        y una sola consulta de empleados.
+        
+        Args:
+            encodings: Lista de encodings (128 dimensiones)
+            tiempos: Diccionario opcional donde se registran los ms por etapa
             
-            if matches and confidence > best_confidence:
-                best_match = empleado
-                best_confidence = confidence
+        Returns:
+            Lista de tuplas (empleado o None, confianza, mensaje) en el mismo orden
+        """
+        with medir_etapa(tiempos, 'galeria'):
+            coincidencias = FaceGallery.buscar_lote(
+                encodings, umbral=FacialRecognitionService.FACE_TOLERANCE
+            )
         
-        if best_match:
-            return best_match, best_confidence, f"Empleado reconocido con {best_confidence:.1f}% de confianza"
-        else:
-            return None, 0.0, "No se encontró coincidencia con ningún empleado registrado"
+        ids = {
+            empleado_id for empleado_id, distancia in coincidencias
+            if empleado_id is not None and distancia <= FacialRecognitionService.FACE_TOLERANCE
+        }
+        empleados = Empleado.objects.select_related('user').in_bulk(ids)
+        if len(empleados) < len(ids):
+            # Algún empleado se eliminó después de cargar la galería
+            FaceGallery.invalidar()
+        
+        resultados = []
+        for empleado_id, distancia in coincidencias:
+            if empleado_id is None:
+                RECONOCIMIENTOS.inc(resultado='galeria_vacia')
+                resultados.append((None, 0.0, "No hay empleados registrados con reconocimiento facial"))
+                continue
+            empleado = empleados.get(empleado_id)
+            if distancia > FacialRecognitionService.FACE_TOLERANCE or empleado is None:
+                RECONOCIMIENTOS.inc(resultado='sin_coincidencia')
+                resultados.append((None, 0.0, "No se encontró coincidencia con ningún empleado registrado"))
+                continue
+            RECONOCIMIENTOS.inc(resultado='coincidencia')
+            confidence = max(0, min(100, (1 - distancia) * 100))
+            resultados.append((empleado, confidence, f"Empleado reconocido con {confidence:.1f}% de confianza"))
+        return resultados
     
     @staticmethod
-    def register_employee_face(empleado: Empleado, image_file) -> Tuple[bool, str]:
+    def register_employee_face(empleado: Empleado, image_file, guardar_foto: bool = False) -> Tuple[bool, str]:
         """
         Registra el rostro de un empleado.
         
         Args:
             empleado: Instancia del empleado
             image_file: Archivo de imagen
+            guardar_foto: Guardar también en foto_rostro el JPEG preparado
+                (en el mismo save que el encoding) y sus miniaturas
             
         Returns:
             Tupla (éxito, mensaje)
         """
-        # Cargar imagen
-        image = FacialRecognitionService.load_image_from_file(image_file)
+        # Decodificar una sola vez para el encoding y la foto guardada
+        preparada = preparar_imagen(image_file)
         
-        if image is None:
+        if preparada is None:
             return False, "No se pudo cargar la imagen"
         
         # Extraer encoding
-        encoding, message = FacialRecognitionService.extract_face_encoding(image, validate=True)
+        encoding, message = FacialRecognitionService.extract_face_encoding(preparada.array, validate=True)
         
         if encoding is None:
             return False, message
@@ -246,7 +357,11 @@ class FacialRecognitionService:
         # Guardar encoding en el empleado
         try:
             empleado.set_face_encoding(encoding)
+            if guardar_foto:
+                empleado.foto_rostro = preparada.jpeg()
             empleado.save()
+            if guardar_foto:
+                generar_miniaturas_seguro(empleado.foto_rostro.storage, empleado.foto_rostro.name, preparada.imagen)
             return True, "Rostro registrado exitosamente"
         except Exception as e:
             return False, f"Error al guardar el rostro: {str(e)}"
@@ -0,0 +1,310 @@
+"""
+Subida en segundo plano de las fotos de las marcas de asistencia
+
+La marca se guarda sin esperar al almacenamiento de objetos: cuando la
+transacción confirma, la foto se escribe en un spool local (FOTOS_SPOOL_DIR)
+y un hilo del proceso la sube a MediaStorage con reintentos y actualiza
+RegistroAsistencia.foto_registro, después de guardar también sus miniaturas
+(checador.miniaturas). Si la transacción se revierte no queda nada en el
+spool que pudiera asociarse a otro registro con el mismo id. Si la subida falla o el proceso
+se reinicia, la foto sigue en el spool y el job del scheduler la reintenta
+cada minuto; solo se borra del spool después de quedar guardada.
+
+Cada entrada del spool son dos archivos con el mismo id
+(<nanosegundos>_<registro_id>_<aleatorio>):
+    <id>.img   contenido de la foto
+    <id>.json  registro, nombre original e intentos
+
+Para subir una entrada, un hilo la reclama renombrando <id>.json a
+<id>.json.subiendo (atómico: solo un proceso lo logra). Los reclamos de
+procesos que murieron se liberan tras FOTOS_SUBIDA_TIMEOUT_MINUTOS.
+"""
+import glob
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.files import File
+from django.db import close_old_connections, transaction
+
+from checador.metricas import ETAPA_SEGUNDOS, FOTOS_PENDIENTES, FOTOS_SUBIDAS
+from checador.miniaturas import eliminar_miniaturas, generar_miniaturas_seguro
+from registros.models import RegistroAsistencia
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_executor_lock = threading.Lock()
+
+SUFIJO_RECLAMO = '.subiendo'
+
+
+def _obtener_executor():
+    """Executor del proceso, creado al primer uso"""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=max(1, getattr(settings, 'FOTOS_SUBIDA_WORKERS', 1)),
+                thread_name_prefix='fotos'
+            )
+        return _executor
+
+
+class FotoRegistroService:
+    """Encola y sube las fotos de registro fuera del camino de la marca"""
+
+    @staticmethod
+    def asincrona() -> bool:
+        return getattr(settings, 'FOTOS_SUBIDA_ASINCRONA', True)
+
+    @staticmethod
+    def directorio() -> str:
+        return str(settings.FOTOS_SPOOL_DIR)
+
+    @staticmethod
+    def asignar(registro, foto):
+        """
+        Asocia la foto a un registro ya guardado (con pk). Con subida
+        asíncrona la encola; si no, la asigna al campo como antes, se sube
+        en el save() del registro y las miniaturas se generan al confirmar.
+        """
+        if FotoRegistroService.asincrona():
+            FotoRegistroService.encolar(registro.pk, foto)
+        else:
+            registro.foto_registro = foto
+            transaction.on_commit(lambda: generar_miniaturas_seguro(
+                registro.foto_registro.storage, registro.foto_registro.name, origen=foto
+            ))
+
+    @staticmethod
+    def encolar(registro_id, foto):
+        """
+        Programa, para cuando la transacción confirme, la copia de la foto al
+        spool y su subida
+
+        Returns:
+            str: id de la entrada en el spool
+        """
+        entrada = f'{time.time_ns()}_{registro_id}_{uuid.uuid4().hex[:8]}'
+
+        def escribir_y_subir():
+            FotoRegistroService._escribir_entrada(entrada, registro_id, foto)
+            _obtener_executor().submit(FotoRegistroService._subir_en_hilo, entrada)
+
+        # robust: un error de disco no convierte en 500 una marca ya confirmada
+        transaction.on_commit(escribir_y_subir, robust=True)
+        return entrada
+
+    @staticmethod
+    def _escribir_entrada(entrada, registro_id, foto):
+        """Copia la foto y sus metadatos al spool"""
+        directorio = FotoRegistroService.directorio()
+        os.makedirs(directorio, exist_ok=True)
+        base = os.path.join(directorio, entrada)
+
+        foto.seek(0)
+        with open(f'{base}.img.tmp', 'wb') as archivo:
+            for bloque in foto.chunks():
+                archivo.write(bloque)
+        os.replace(f'{base}.img.tmp', f'{base}.img')
+        FotoRegistroService._escribir_meta(f'{base}.json', {
+            'registro_id': registro_id,
+            'nombre': os.path.basename(foto.name or 'foto.jpg'),
+            'intentos': 0,
+            'ultimo_error': '',
+        })
+        logger.info(f"📥 Foto del registro #{registro_id} en spool ({entrada})")
+
+    @staticmethod
+    def _subir_en_hilo(entrada):
+        close_old_connections()
+        try:
+            FotoRegistroService.subir(entrada)
+        except Exception:
+            logger.exception(f"❌ Error inesperado subiendo la foto {entrada}")
+        finally:
+            close_old_connections()
+
+    # === SPOOL ===
+
+    @staticmethod
+    def _escribir_meta(ruta, meta):
+        with open(f'{ruta}.tmp', 'w') as archivo:
+            json.dump(meta, archivo)
+        os.replace(f'{ruta}.tmp', ruta)
+
+    @staticmethod
+    def reclamar(entrada) -> bool:
+        """
+        Renombra el .json de la entrada para que solo este hilo la suba
+
+        Returns:
+            bool: True si este llamador se quedó con la entrada
+        """
+        ruta = os.path.join(FotoRegistroService.directorio(), f'{entrada}.json')
+        try:
+            os.rename(ruta, ruta + SUFIJO_RECLAMO)
+        except FileNotFoundError:
+            return False
+        # La antigüedad del reclamo se mide desde ahora, no desde el encolado
+        os.utime(ruta + SUFIJO_RECLAMO)
+        return True
+
+    @staticmethod
+    def _liberar(entrada, meta=None):
+        ruta = os.path.join(FotoRegistroService.directorio(), f'{entrada}.json')
+        if meta is not None:
+            FotoRegistroService._escribir_meta(ruta + SUFIJO_RECLAMO, meta)
+        os.rename(ruta + SUFIJO_RECLAMO, ruta)
+
+    @staticmethod
+    def _descartar(entrada):
+        base = os.path.join(FotoRegistroService.directorio(), entrada)
+        for ruta in (f'{base}.img', f'{base}.json{SUFIJO_RECLAMO}'):
+            try:
+                os.remove(ruta)
+            except FileNotFoundError:
+                pass
+
+    @staticmethod
+    def _entradas(sufijo='.json'):
+        """Ids de las entradas del spool, de la más antigua a la más reciente"""
+        patron = os.path.join(FotoRegistroService.directorio(), f'*{sufijo}')
+        return sorted(os.path.basename(ruta)[:-len(sufijo)] for ruta in glob.glob(patron))
+
+    @staticmethod
+    def _hay_anterior(entrada, registro_id) -> bool:
+        """
+        True si hay una foto anterior del mismo registro sin subir (entrada y
+        salida de un mismo lote): se suben en orden para que gane la última
+        """
+        sufijo = f'_{registro_id}_'
+        return any(
+            otra < entrada and sufijo in otra
+            for otra in FotoRegistroService._entradas() + FotoRegistroService._entradas('.json' + SUFIJO_RECLAMO)
+        )
+
+    # === SUBIDA ===
+
+    @staticmethod
+    def subir(entrada) -> bool:
+        """
+        Sube la foto de una entrada del spool (con FOTOS_SUBIDA_REINTENTOS
+        intentos y espera creciente) y actualiza el registro
+
+        Returns:
+            bool: True si la entrada se procesó y salió del spool
+        """
+        if not FotoRegistroService.reclamar(entrada):
+            return False
+
+        base = os.path.join(FotoRegistroService.directorio(), entrada)
+        try:
+            with open(f'{base}.json{SUFIJO_RECLAMO}') as archivo:
+                meta = json.load(archivo)
+        except (OSError, ValueError) as e:
+            logger.error(f"❌ Entrada de foto {entrada} ilegible, se descarta: {e}")
+            FotoRegistroService._descartar(entrada)
+            return True
+
+        registro_id = meta['registro_id']
+        if FotoRegistroService._hay_anterior(entrada, registro_id):
+            FotoRegistroService._liberar(entrada)
+            return False
+
+        campo = RegistroAsistencia._meta.get_field('foto_registro')
+        reintentos = max(1, getattr(settings, 'FOTOS_SUBIDA_REINTENTOS', 3))
+        nombre = None
+        for intento in range(reintentos):
+            try:
+                with open(f'{base}.img', 'rb') as archivo, ETAPA_SEGUNDOS.medir(etapa='subir_foto'):
+                    nombre = campo.storage.save(
+                        campo.generate_filename(None, meta['nombre']), File(archivo, name=meta['nombre'])
+                    )
+                break
+            except FileNotFoundError:
+                logger.error(f"❌ Falta la imagen de la entrada {entrada}, se descarta")
+                FotoRegistroService._descartar(entrada)
+                return True
+            except Exception as e:
+                meta['ultimo_error'] = str(e)[:500]
+                FOTOS_SUBIDAS.inc(resultado='reintento')
+                logger.warning(f"⚠️ Subida de foto {entrada} falló (intento {intento + 1}/{reintentos}): {e}")
+                if intento + 1 < reintentos:
+                    time.sleep(2 ** intento)
+
+        if nombre is None:
+            meta['intentos'] += 1
+            FotoRegistroService._liberar(entrada, meta)
+            FOTOS_SUBIDAS.inc(resultado='error')
+            logger.error(f"❌ Foto del registro #{registro_id} sigue en spool tras {meta['intentos']} ronda(s)")
+            return False
+
+        generar_miniaturas_seguro(campo.storage, nombre, origen=f'{base}.img')
+        FotoRegistroService._actualizar_registro(registro_id, nombre, campo.storage)
+        FotoRegistroService._descartar(entrada)
+        FOTOS_SUBIDAS.inc(resultado='subida')
+        logger.info(f"📸 Foto del registro #{registro_id} subida: {nombre}")
+        return True
+
+    @staticmethod
+    def _actualizar_registro(registro_id, nombre, storage):
+        """
+        Apunta foto_registro al archivo subido con un UPDATE (sin save(): la
+        marca ya está guardada) y borra la foto que reemplaza
+        """
+        with transaction.atomic():
+            anterior = (
+                RegistroAsistencia.objects.select_for_update()
+                .filter(pk=registro_id)
+                .values_list('foto_registro', flat=True)
+                .first()
+            )
+            actualizados = RegistroAsistencia.objects.filter(pk=registro_id).update(foto_registro=nombre)
+
+        huerfano = nombre if not actualizados else anterior if anterior and anterior != nombre else None
+        if not actualizados:
+            logger.warning(f"⚠️ El registro #{registro_id} ya no existe; se borra su foto subida")
+        if huerfano:
+            try:
+                storage.delete(huerfano)
+            except Exception as e:
+                logger.error(f"❌ Error eliminando archivo {huerfano}: {e}")
+            eliminar_miniaturas(storage, huerfano)
+
+    @staticmethod
+    def procesar_pendientes():
+        """
+        Libera los reclamos de más de FOTOS_SUBIDA_TIMEOUT_MINUTOS (proceso
+        interrumpido) y sube las entradas que ningún hilo tomó
+
+        Returns:
+            dict: Conteo de reclamos liberados, fotos subidas y pendientes
+        """
+        limite = time.time() - 60 * getattr(settings, 'FOTOS_SUBIDA_TIMEOUT_MINUTOS', 10)
+        liberados = 0
+        for entrada in FotoRegistroService._entradas('.json' + SUFIJO_RECLAMO):
+            ruta = os.path.join(FotoRegistroService.directorio(), f'{entrada}.json{SUFIJO_RECLAMO}')
+            try:
+                if os.path.getmtime(ruta) < limite:
+                    FotoRegistroService._liberar(entrada)
+                    liberados += 1
+            except FileNotFoundError:
+                continue
+
+        subidas = 0
+        for entrada in FotoRegistroService._entradas():
+            if FotoRegistroService.subir(entrada):
+                subidas += 1
+
+        pendientes = len(FotoRegistroService._entradas()) + len(
+            FotoRegistroService._entradas('.json' + SUFIJO_RECLAMO)
+        )
+        FOTOS_PENDIENTES.set(pendientes)
+        return {'liberados': liberados, 'subidas': subidas, 'pendientes': pendientes}
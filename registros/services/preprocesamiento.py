@@ -0,0 +1,81 @@
+"""
+Preprocesamiento único de las imágenes subidas (marcas y registro de rostro).
+
+Cada foto se decodifica una sola vez: con JPEG se usa el modo draft de PIL,
+que decodifica directamente a 1/2, 1/4 u 1/8 de la resolución (lo más
+pequeño que siga cubriendo IMAGEN_MAX_LADO), después se aplica la
+orientación EXIF y se limita el lado mayor a IMAGEN_MAX_LADO. El resultado
+alimenta al reconocimiento (arreglo RGB) y, solo si la marca o el registro
+proceden, al JPEG comprimido que se guarda (IMAGEN_CALIDAD_JPEG) en lugar de
+los bytes originales.
+"""
+
+import io
+import logging
+import math
+import os
+from typing import Optional
+
+import numpy as np
+from django.conf import settings
+from django.core.files.base import ContentFile
+
+from .dependencias import Image, ImageOps
+
+logger = logging.getLogger(__name__)
+
+
+class ImagenPreparada:
+    """Imagen ya orientada y acotada, lista para reconocer y para guardar"""
+
+    def __init__(self, imagen, nombre: str):
+        self.imagen = imagen
+        self.nombre = nombre
+        self.array = np.asarray(imagen)
+
+    def jpeg(self, nombre: Optional[str] = None) -> ContentFile:
+        """
+        JPEG comprimido para guardar en el storage
+
+        Args:
+            nombre: Nombre del archivo (por defecto el original con extensión .jpg)
+        """
+        salida = io.BytesIO()
+        self.imagen.save(salida, format='JPEG', quality=getattr(settings, 'IMAGEN_CALIDAD_JPEG', 85))
+        nombre = nombre or f'{os.path.splitext(os.path.basename(self.nombre or "foto"))[0]}.jpg'
+        return ContentFile(salida.getvalue(), name=nombre)
+
+
+def preparar_imagen(archivo, max_lado: Optional[int] = None) -> Optional[ImagenPreparada]:
+    """
+    Decodifica una foto subida (UploadedFile, archivo abierto o path) a
+    tamaño acotado y con la orientación EXIF aplicada.
+
+    Args:
+        archivo: Foto a preparar
+        max_lado: Lado mayor máximo en px (default: IMAGEN_MAX_LADO; 0 = sin límite)
+
+    Returns:
+        ImagenPreparada o None si no es una imagen válida
+    """
+    if max_lado is None:
+        max_lado = getattr(settings, 'IMAGEN_MAX_LADO', 1280)
+    try:
+        if hasattr(archivo, 'seek'):
+            archivo.seek(0)
+        imagen = Image.open(archivo)
+        ancho, alto = imagen.size
+        if max_lado and max(ancho, alto) > max_lado:
+            # Solo tiene efecto con JPEG: el decodificador escala por 1/2, 1/4
+            # u 1/8 sin bajar del tamaño pedido (lado mayor = max_lado)
+            factor = max(ancho, alto) / max_lado
+            imagen.draft('RGB', (math.ceil(ancho / factor), math.ceil(alto / factor)))
+        imagen = ImageOps.exif_transpose(imagen)
+        if imagen.mode != 'RGB':
+            imagen = imagen.convert('RGB')
+        if max_lado and max(imagen.size) > max_lado:
+            imagen.thumbnail((max_lado, max_lado), Image.Resampling.BILINEAR)
+    except Exception as e:
+        logger.warning(f"⚠️ No se pudo decodificar la imagen: {e}")
+        return None
+    return ImagenPreparada(imagen, getattr(archivo, 'name', None) or str(archivo))
@@ -0,0 +1,279 @@
+"""
+Mantenimiento de los resúmenes ResumenDiario (departamento y día) y
+ResumenMensual (empleado y mes).
+
+Los contadores que dependen solo del registro se actualizan en cada
+RegistroAsistencia.save() y al borrar un registro, aplicando únicamente la
+diferencia con F(). Los días esperados (y con ellos las faltas) dependen de
+TurnoEsperado y del paso del tiempo, así que se recalculan con
+reconstruir(): comando reconstruir_resumenes, job diario y cambios de
+horario. Un cambio de departamento reconstruye la historia del empleado.
+
+Solo cuentan como esperados los días anteriores a hoy (el día en curso
+todavía no puede ser falta) de empleados activos.
+"""
+from datetime import date, timedelta
+from functools import reduce
+from operator import or_
+from typing import Optional
+from zoneinfo import ZoneInfo
+
+from django.db import transaction
+from django.db.models import Count, Exists, F, Min, OuterRef, Q, Sum
+from django.db.models.functions import TruncMonth
+from django.utils import timezone
+
+from empleados.models import Empleado
+from registros.models import RegistroAsistencia, ResumenDiario, ResumenMensual
+from turnos.models import TurnoEsperado
+
+MEXICO_TZ = ZoneInfo('America/Mexico_City')
+
+CAMPOS_REGISTRO = [
+    'registros', 'dias_trabajados', 'registros_completos', 'retardos', 'horas_trabajadas',
+]
+
+
+def _ultimo_dia_mes(fecha: date) -> date:
+    return (fecha.replace(day=28) + timedelta(days=4)).replace(day=1) - timedelta(days=1)
+
+
+class ResumenService:
+    """Actualiza y reconstruye los resúmenes de asistencia"""
+
+    @staticmethod
+    def hoy() -> date:
+        return timezone.now().astimezone(MEXICO_TZ).date()
+
+    # === ACTUALIZACIÓN INCREMENTAL ===
+
+    @staticmethod
+    def registrar_cambio(anterior: Optional[dict], nuevo: Optional[dict], empleado=None):
+        """
+        Aplica a los resúmenes la diferencia entre dos aportes de un registro
+        (ver RegistroAsistencia.aporte_resumen). anterior=None es un alta y
+        nuevo=None una baja.
+
+        Args:
+            empleado: Empleado ya cargado, para no consultar su departamento
+        """
+        if anterior is None and nuevo is None:
+            return
+
+        if (anterior and nuevo and anterior['empleado_id'] == nuevo['empleado_id']
+                and anterior['fecha'] == nuevo['fecha']):
+            # Mismo día del mismo empleado: si el día era esperado lo sigue siendo
+            ResumenService._aplicar(
+                nuevo['empleado_id'], nuevo['fecha'],
+                {campo: nuevo[campo] - anterior[campo] for campo in CAMPOS_REGISTRO},
+                empleado
+            )
+            return
+
+        if anterior:
+            delta = {campo: -anterior[campo] for campo in CAMPOS_REGISTRO}
+            delta['asistencias_esperadas'] = -ResumenService._es_dia_esperado(anterior)
+            ResumenService._aplicar(anterior['empleado_id'], anterior['fecha'], delta, empleado, crear=False)
+        if nuevo:
+            delta = {campo: nuevo[campo] for campo in CAMPOS_REGISTRO}
+            delta['asistencias_esperadas'] = ResumenService._es_dia_esperado(nuevo)
+            ResumenService._aplicar(nuevo['empleado_id'], nuevo['fecha'], delta, empleado)
+
+    @staticmethod
+    def _es_dia_esperado(aporte: dict) -> int:
+        """1 si el día ya transcurrió y era laborable según TurnoEsperado"""
+        if aporte['fecha'] >= ResumenService.hoy():
+            return 0
+        return int(TurnoEsperado.objects.filter(
+            empleado_id=aporte['empleado_id'],
+            empleado__activo=True,
+            fecha=aporte['fecha'],
+            hora_entrada__isnull=False,
+            es_descanso=False
+        ).exists())
+
+    @staticmethod
+    def _aplicar(empleado_id, fecha, delta, empleado=None, crear=True):
+        """
+        Suma delta a la fila mensual del empleado y a la diaria de su
+        departamento. Con crear=False (bajas) no se crean filas: si no
+        existen no hay nada que restar.
+        """
+        delta = {campo: valor for campo, valor in delta.items() if valor}
+        if not delta:
+            return
+
+        if empleado is not None and empleado.pk == empleado_id:
+            departamento = empleado.departamento
+        else:
+            departamento = Empleado.objects.filter(pk=empleado_id).values_list(
+                'departamento', flat=True
+            ).first()
+        if departamento is None:
+            return
+
+        cambios = {campo: F(campo) + valor for campo, valor in delta.items()}
+        cambios['fecha_actualizacion'] = timezone.now()
+        filas = (
+            (ResumenMensual, {'empleado_id': empleado_id, 'anio': fecha.year, 'mes': fecha.month},
+             {'departamento': departamento}),
+            (ResumenDiario, {'fecha': fecha, 'departamento': departamento}, {}),
+        )
+        for modelo, claves, defaults in filas:
+            if modelo.objects.filter(**claves).update(**cambios) or not crear:
+                continue
+            fila, _ = modelo.objects.get_or_create(**claves, defaults=defaults)
+            modelo.objects.filter(pk=fila.pk).update(**cambios)
+
+    # === RECONSTRUCCIÓN ===
+
+    @staticmethod
+    def cambiar_departamento(empleado_id, departamento_anterior: str) -> int:
+        """
+        Reconstruye toda la historia de un empleado que cambió de
+        departamento: sus filas mensuales y las diarias del departamento
+        anterior y del nuevo. Los resúmenes siempre agrupan por el
+        departamento actual, igual que la agregación directa de registros.
+
+        Returns:
+            Número de filas de resumen escritas
+        """
+        primeras = [
+            RegistroAsistencia.objects.filter(empleado_id=empleado_id).aggregate(minima=Min('fecha'))['minima'],
+            TurnoEsperado.objects.filter(empleado_id=empleado_id).aggregate(minima=Min('fecha'))['minima'],
+        ]
+        primeras = [fecha for fecha in primeras if fecha]
+        if not primeras:
+            return 0
+        return ResumenService.reconstruir(
+            min(primeras), ResumenService.hoy(), [empleado_id], otros_departamentos=[departamento_anterior]
+        )
+
+    @staticmethod
+    def reconstruir(fecha_inicio: date, fecha_fin: date, empleados=None, otros_departamentos=()) -> int:
+        """
+        Recalcula desde cero los meses completos que tocan [fecha_inicio,
+        fecha_fin]. Con empleados se limita a sus filas mensuales y a las
+        diarias de sus departamentos (más otros_departamentos).
+
+        Todos los meses se calculan juntos: el número de consultas no crece
+        con los meses del rango.
+
+        Returns:
+            Número de filas de resumen escritas
+        """
+        from turnos.services import TurnoEsperadoService
+
+        primer_dia = fecha_inicio.replace(day=1)
+        ultimo_dia = _ultimo_dia_mes(fecha_fin)
+        if ultimo_dia < primer_dia:
+            return 0
+        ultimo_cerrado = min(ultimo_dia, ResumenService.hoy() - timedelta(days=1))
+        meses = []
+        mes = primer_dia
+        while mes <= ultimo_dia:
+            meses.append(mes)
+            mes = _ultimo_dia_mes(mes) + timedelta(days=1)
+
+        if empleados is None:
+            alcance_mensual = Empleado.objects.all()
+            departamentos = None
+            alcance_diario = Empleado.objects.all()
+            departamento_de = dict(alcance_mensual.values_list('id', 'departamento'))
+        else:
+            ids = [getattr(empleado, 'pk', empleado) for empleado in empleados]
+            alcance_mensual = Empleado.objects.filter(pk__in=ids)
+            departamento_de = dict(alcance_mensual.values_list('id', 'departamento'))
+            departamentos = set(departamento_de.values()) | set(otros_departamentos)
+            alcance_diario = Empleado.objects.filter(departamento__in=departamentos)
+
+        if primer_dia <= ultimo_cerrado:
+            TurnoEsperadoService.asegurar_rango(
+                alcance_diario.filter(activo=True), primer_dia, ultimo_cerrado
+            )
+
+        laborable = TurnoEsperado.objects.filter(
+            empleado_id=OuterRef('empleado_id'),
+            fecha=OuterRef('fecha'),
+            hora_entrada__isnull=False,
+            es_descanso=False
+        )
+        registros = RegistroAsistencia.objects.filter(
+            fecha__gte=primer_dia, fecha__lte=ultimo_dia
+        ).annotate(esperado=Exists(laborable)).order_by()
+        agregados = {
+            'registros': Count('id'),
+            'dias_trabajados': Count('id', filter=Q(hora_entrada__isnull=False)),
+            'registros_completos': Count('id', filter=Q(hora_entrada__isnull=False, hora_salida__isnull=False)),
+            'retardos': Count('id', filter=Q(retardo=True)),
+            'horas_trabajadas': Sum('horas_trabajadas'),
+            'asistencias_esperadas': Count('id', filter=Q(
+                esperado=True, fecha__lte=ultimo_cerrado, empleado__activo=True
+            )),
+        }
+        esperados = TurnoEsperado.objects.filter(
+            fecha__gte=primer_dia,
+            fecha__lte=ultimo_cerrado,
+            hora_entrada__isnull=False,
+            es_descanso=False,
+            empleado__activo=True
+        ).order_by()
+
+        # Filas mensuales por empleado y mes
+        mensuales = {}
+
+        def fila_mensual(empleado_id, mes):
+            if (empleado_id, mes) not in mensuales:
+                mensuales[(empleado_id, mes)] = ResumenMensual(
+                    empleado_id=empleado_id,
+                    anio=mes.year,
+                    mes=mes.month,
+                    departamento=departamento_de[empleado_id]
+                )
+            return mensuales[(empleado_id, mes)]
+
+        for datos in registros.filter(empleado__in=alcance_mensual).values(
+            'empleado_id', mes=TruncMonth('fecha')
+        ).annotate(**agregados):
+            fila = fila_mensual(datos.pop('empleado_id'), datos.pop('mes'))
+            datos['horas_trabajadas'] = datos['horas_trabajadas'] or 0
+            for campo, valor in datos.items():
+                setattr(fila, campo, valor)
+        for empleado_id, mes, dias in esperados.filter(empleado__in=alcance_mensual).values(
+            'empleado_id', mes=TruncMonth('fecha')
+        ).annotate(dias=Count('id')).values_list('empleado_id', 'mes', 'dias'):
+            fila_mensual(empleado_id, mes).dias_esperados = dias
+
+        # Filas diarias por departamento
+        diarias = {}
+
+        def fila_diaria(fecha, departamento):
+            if (fecha, departamento) not in diarias:
+                diarias[(fecha, departamento)] = ResumenDiario(fecha=fecha, departamento=departamento)
+            return diarias[(fecha, departamento)]
+
+        for datos in registros.filter(empleado__in=alcance_diario).values(
+            'fecha', depto=F('empleado__departamento')
+        ).annotate(**agregados):
+            fila = fila_diaria(datos.pop('fecha'), datos.pop('depto'))
+            datos['horas_trabajadas'] = datos['horas_trabajadas'] or 0
+            for campo, valor in datos.items():
+                setattr(fila, campo, valor)
+        for fecha, departamento, dias in esperados.filter(empleado__in=alcance_diario).values(
+            'fecha', depto=F('empleado__departamento')
+        ).annotate(dias=Count('id')).values_list('fecha', 'depto', 'dias'):
+            fila_diaria(fecha, departamento).dias_esperados = dias
+
+        with transaction.atomic():
+            ResumenMensual.objects.filter(
+                reduce(or_, (Q(anio=mes.year, mes=mes.month) for mes in meses)),
+                empleado__in=alcance_mensual
+            ).delete()
+            anteriores_diarias = ResumenDiario.objects.filter(fecha__gte=primer_dia, fecha__lte=ultimo_dia)
+            if departamentos is not None:
+                anteriores_diarias = anteriores_diarias.filter(departamento__in=departamentos)
+            anteriores_diarias.delete()
+            ResumenMensual.objects.bulk_create(mensuales.values(), batch_size=1000)
+            ResumenDiario.objects.bulk_create(diarias.values(), batch_size=1000)
+
+        return len(mensuales) + len(diarias)
@@ -0,0 +1,54 @@
+"""
+Señales de la app de registros.
+"""
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from empleados.models import Empleado
+from registros.models import RegistroAsistencia
+from registros.services.face_gallery import FaceGallery
+from registros.services.resumen_service import ResumenService
+
+
+@receiver(post_save, sender=Empleado)
+def invalidar_galeria_al_guardar_empleado(sender, instance, update_fields=None, **kwargs):
+    """
+    Invalida la galería de rostros cuando cambia el encoding o el estatus activo.
+    Cubre set_face_encoding + save(), eliminar_rostro() y cambios en 'activo'.
+    """
+    if update_fields is not None and not {'embedding_rostro', 'activo'} & set(update_fields):
+        return
+    FaceGallery.invalidar()
+
+
+@receiver(post_save, sender=Empleado)
+def reconstruir_resumenes_al_cambiar_departamento(sender, instance, created, update_fields=None, **kwargs):
+    """
+    Los resúmenes agrupan por departamento: al cambiarlo se reconstruye la
+    historia del empleado (al confirmar la transacción). Los update() por
+    queryset no pasan por aquí; después de uno hay que correr
+    reconstruir_resumenes.
+    """
+    if update_fields is not None and 'departamento' not in update_fields:
+        return
+    anterior = getattr(instance, '_departamento_cargado', None)
+    instance._departamento_cargado = instance.departamento
+    if created or anterior is None or anterior == instance.departamento:
+        return
+    transaction.on_commit(lambda: ResumenService.cambiar_departamento(instance.pk, anterior))
+
+
+@receiver(post_delete, sender=Empleado)
+def invalidar_galeria_al_eliminar_empleado(sender, instance, **kwargs):
+    """Invalida la galería de rostros cuando se elimina un empleado"""
+    FaceGallery.invalidar()
+
+
+@receiver(post_delete, sender=RegistroAsistencia)
+def descontar_registro_de_resumenes(sender, instance, **kwargs):
+    """
+    Resta el registro borrado de los resúmenes. Se hace con la señal (y no
+    en delete()) para cubrir también los borrados en cascada y por queryset.
+    """
+    ResumenService.registrar_cambio(getattr(instance, '_aporte_resumen', None), None)
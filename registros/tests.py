@@ -1,3 +1,770 @@
-from django.test import TestCase
+import base64
+import importlib
+import os
+import subprocess
+import sys
+import io
+import tempfile
+from datetime import date, time, timedelta
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+from django.apps import apps
+from django.contrib.auth.models import User
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.management import call_command
+from django.core.files.storage import InMemoryStorage
+from django.db import IntegrityError, connection, transaction
+from django.db.models import Sum
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from checador import conexiones_s3, metricas
+from checador.miniaturas import generar_miniaturas, ruta_miniatura
+from checador.storage_backends import MediaStorage, ReportesStorage, vaciar_borrados
+from checador.testing import PresupuestoConsultasMixin
+from checador.views import ORDEN_REGISTROS, _cursor_registro, _leer_cursor, _pagina_registros
+from empleados.models import Empleado
+from registros.models import MarcaSincronizada, RegistroAsistencia, ResumenDiario, ResumenMensual
+from registros.services.face_gallery import FaceGallery
+from registros.services.face_index import IndiceIVF, _asignar, _firmas
+from registros.services.fotos_service import FotoRegistroService
+from registros.services.preprocesamiento import preparar_imagen
+
+migracion_resumenes = importlib.import_module('registros.migrations.0006_llenar_resumenes')
+
+
+class PresupuestoConsultasVistasTest(PresupuestoConsultasMixin, TestCase):
+    """Las vistas de registros no deben consultar por fila (N+1)"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_user('admin', password='x', is_staff=True)
+        Empleado.objects.create(user=cls.admin, codigo_empleado='A000', departamento='Sistemas')
+
+        hoy = date.today()
+        for i in range(12):
+            user = User.objects.create_user(f'empleado{i}', first_name='Empleado', last_name=str(i))
+            empleado = Empleado.objects.create(
+                user=user, codigo_empleado=f'E{i:03d}', departamento='Operaciones'
+            )
+            for dias in range(5):
+                RegistroAsistencia.objects.create(
+                    empleado=empleado,
+                    fecha=hoy - timedelta(days=dias),
+                    hora_entrada=time(8, i),
+                    hora_salida=time(16),
+                    retardo=i % 3 == 0
+                )
+
+    def setUp(self):
+        self.client.force_login(self.admin)
+
+    def test_registros_lista(self):
+        with self.assertPresupuestoConsultas(6, max_repeticiones=1):
+            response = self.client.get('/registros/')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.context['registros']), 50)
+
+    def test_dashboard(self):
+        with self.assertPresupuestoConsultas(10, max_repeticiones=1):
+            response = self.client.get('/dashboard/')
+
+        self.assertEqual(response.status_code, 200)
+
+    def _marcar(self, tipo, empleado, max_consultas):
+        """
+        Marca con el reconocimiento simulado. El presupuesto incluye lo que
+        corre al confirmar: la subida de la foto (en línea, sin hilo) con
+        sus miniaturas
+        """
+        directorio = tempfile.TemporaryDirectory()
+        self.addCleanup(directorio.cleanup)
+        inmediato = mock.Mock(submit=lambda funcion, *args: funcion(*args))
+        with override_settings(FOTOS_SPOOL_DIR=directorio.name), \
+                mock.patch('registros.views.RecognitionPool.reconocer', return_value=(empleado, 97.0, '')), \
+                mock.patch('registros.services.fotos_service._obtener_executor', return_value=inmediato), \
+                mock.patch.object(RegistroAsistencia._meta.get_field('foto_registro'), 'storage', InMemoryStorage()), \
+                self.assertPresupuestoConsultas(max_consultas, max_repeticiones=1), \
+                self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(f'/api/registros/marcar_{tipo}/', {
+                'tipo': tipo, 'foto': ContentFile(_jpeg(), name=f'{tipo}.jpg'),
+            })
+
+        self.assertEqual(response.status_code, 200, response.data)
+        registro = RegistroAsistencia.objects.get(pk=response.data['registro']['id'])
+        self.assertTrue(registro.foto_registro.name.startswith(f'asistencias/{tipo}'))
+        return registro
+
+    def test_marcar_entrada_y_salida(self):
+        empleado = Empleado.objects.create(
+            user=User.objects.create_user('nuevo'), codigo_empleado='E100', departamento='Operaciones'
+        )
+
+        self._marcar('entrada', empleado, 26)
+        registro = self._marcar('salida', empleado, 18)
+
+        self.assertIsNotNone(registro.hora_salida)
+        mensual = ResumenMensual.objects.get(empleado=empleado, anio=registro.fecha.year, mes=registro.fecha.month)
+        self.assertEqual((mensual.registros, mensual.registros_completos), (1, 1))
+
+    @override_settings(
+        MIDDLEWARE=['checador.presupuesto_consultas.PresupuestoConsultasMiddleware'] + settings.MIDDLEWARE,
+        QUERY_BUDGET_MAX_CONSULTAS=2
+    )
+    def test_middleware_encabezados(self):
+        with self.assertLogs('checador.presupuesto_consultas', 'WARNING'):
+            response = self.client.get('/registros/')
+
+        self.assertEqual(response['X-DB-Consultas'], '5')
+        self.assertIn('db;dur=', response['Server-Timing'])
+        self.assertEqual(response['X-DB-Presupuesto-Excedido'], 'consultas')
+
+
+class MetricasTest(TestCase):
+    """Endpoint /metrics"""
+
+    def test_solo_staff(self):
+        self.assertEqual(self.client.get('/metrics').status_code, 403)
+
+        self.client.force_login(User.objects.create_user('empleado'))
+        self.assertEqual(self.client.get('/metrics').status_code, 403)
+
+    @override_settings(METRICAS_TOKEN='secreto')
+    def test_token_de_scraper(self):
+        response = self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer secreto')
+        self.assertEqual(response.status_code, 200)
+
+        response = self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer otro')
+        self.assertEqual(response.status_code, 403)
+
+    def test_exporta_guardado_de_registro(self):
+        self.client.force_login(User.objects.create_user('admin', is_staff=True))
+        empleado = Empleado.objects.create(
+            user=User.objects.create_user('empleado'), codigo_empleado='E001', departamento='Operaciones'
+        )
+        RegistroAsistencia.objects.create(empleado=empleado, fecha=date.today(), hora_entrada=time(8))
+        metricas.RECHAZOS.inc(motivo='calidad')
+
+        texto = self.client.get('/metrics').content.decode()
+
+        self.assertIn('# TYPE checador_etapa_segundos histogram', texto)
+        self.assertIn('checador_etapa_segundos_count{etapa="guardar_registro"}', texto)
+        self.assertIn('checador_rechazos_imagen_total{motivo="calidad"}', texto)
+
+
+class CargaDiferidaTest(TestCase):
+    """Los procesos que no reconocen no deben importar dlib/OpenCV"""
+
+    def test_urls_y_comandos_sin_pila_de_reconocimiento(self):
+        codigo = (
+            'import sys, django; django.setup(); '
+            'import checador.urls, reportes.scheduler; '
+            'from django.core.management import get_commands, load_command_class; '
+            '[load_command_class(app, nombre) for nombre, app in get_commands().items()]; '
+            'print("CARGADOS=" + ",".join(m for m in ("face_recognition", "dlib", "cv2") if m in sys.modules))'
+        )
+        resultado = subprocess.run(
+            [sys.executable, '-c', codigo],
+            capture_output=True, text=True, env=os.environ.copy(), timeout=120
+        )
+
+        self.assertEqual(resultado.returncode, 0, resultado.stderr)
+        self.assertIn('CARGADOS=\n', resultado.stdout)
+
+
+class IndiceIVFTest(TestCase):
+    """El índice IVF devuelve lo mismo que la búsqueda exacta"""
+
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.ids = np.arange(1, 2001)
+        self.matriz = rng.normal(0, 1 / np.sqrt(128), (2000, 128)).astype(np.float32)
+        self.consultas = (self.matriz[:50] + rng.normal(0, 0.02, (50, 128))).astype(np.float32)
+
+    def test_coincide_con_busqueda_exacta(self):
+        exacto = FaceGallery.construir_estado(self.ids, self.matriz)
+        indexado = FaceGallery.construir_estado(self.ids, self.matriz, indice=IndiceIVF.entrenar(self.ids, self.matriz))
+
+        aproximados = FaceGallery.buscar_lote(self.consultas, estado=indexado, umbral=0.6)
+        exactos = FaceGallery.buscar_lote(self.consultas, estado=exacto)
+        self.assertEqual([i for i, _ in aproximados], [i for i, _ in exactos])
+        np.testing.assert_allclose([d for _, d in aproximados], [d for _, d in exactos], atol=1e-5)
+        # Sin coincidencia dentro del umbral se recurre a la búsqueda lineal
+        lejano = np.full(128, 0.3, dtype=np.float32)
+        self.assertEqual(
+            FaceGallery.buscar(lejano, estado=indexado, umbral=0.6)[0],
+            FaceGallery.buscar(lejano, estado=exacto)[0]
+        )
+
+    def test_actualizacion_incremental_y_persistencia(self):
+        with tempfile.TemporaryDirectory() as directorio, override_settings(FACE_GALLERY_INDICE_DIR=directorio):
+            with self.assertLogs('registros.services.face_index', 'INFO') as logs:
+                indice = IndiceIVF.para_galeria(self.ids, self.matriz)
+                IndiceIVF.para_galeria(self.ids, self.matriz)
+
+                # Alta de un empleado y cambio de rostro de otro
+                ids = np.append(self.ids, 2001)
+                matriz = np.vstack([self.matriz, self.consultas[:1]])
+                matriz[10] = self.consultas[1]
+                actualizado = IndiceIVF.para_galeria(ids, matriz)
+
+            self.assertIn('entrenado', logs.output[0])
+            self.assertIn('reutilizado', logs.output[1])
+            self.assertIn('actualizado', logs.output[2])
+            np.testing.assert_array_equal(actualizado.centroides, indice.centroides)
+            np.testing.assert_array_equal(actualizado.asignacion[:10], indice.asignacion[:10])
+
+            estado = FaceGallery.construir_estado(ids, matriz, indice=IndiceIVF.cargar(IndiceIVF.ruta()))
+            self.assertEqual(FaceGallery.buscar(self.consultas[0], estado=estado, umbral=0.6)[0], 2001)
+
+    @override_settings(FACE_GALLERY_INDICE_SONDAS=1, FACE_GALLERY_INDICE_MARGEN=0.15)
+    def test_coincidencia_en_lista_no_revisada(self):
+        # La consulta está más cerca del centroide 0, pero el empleado correcto
+        # quedó en la lista 1; en la lista 0 hay otro dentro de la tolerancia
+        base = np.zeros((3, 128), dtype=np.float32)
+        base[:, 0] = 1.0
+        centroides = base[:2].copy()
+        centroides[0, 2], centroides[1, 2] = -0.2, 0.3
+        consulta = base[0]
+        correcto, otro = base[1].copy(), base[2].copy()
+        correcto[2] = 0.1
+        otro[2], otro[1] = -0.2, 0.45
+        ids = np.array([1, 2])
+        matriz = np.vstack([correcto, otro])
+        asignacion = _asignar(matriz, centroides)
+        self.assertEqual(asignacion.tolist(), [1, 0])
+        indice = IndiceIVF(centroides, ids, asignacion, _firmas(matriz), len(matriz))
+        estado = FaceGallery.construir_estado(ids, matriz, indice=indice)
+
+        empleado_id, distancia = FaceGallery.buscar(consulta, estado=estado, umbral=0.6)
+
+        self.assertEqual(empleado_id, 1)
+        self.assertAlmostEqual(distancia, 0.1, places=5)
+        self.assertEqual(FaceGallery.buscar_lote([consulta], estado=estado, umbral=0.6)[0][0], 1)
+
+
+class FaceGalleryTest(TestCase):
+    """La firma de la galería se consulta a lo más una vez por plazo"""
+
+    def setUp(self):
+        self.empleado = Empleado.objects.create(
+            user=User.objects.create_user('empleado'), codigo_empleado='E001', departamento='Operaciones'
+        )
+        self.empleado.set_face_encoding(np.full(128, 0.1))
+        self.empleado.save()
+        FaceGallery.invalidar()
+        self.addCleanup(FaceGallery.invalidar)
+
+    @override_settings(FACE_GALLERY_VERIFICACION_SEGUNDOS=5)
+    def test_verificacion_con_plazo(self):
+        with mock.patch('registros.services.face_gallery.time.monotonic', return_value=1000.0) as reloj:
+            cargado = FaceGallery.obtener()
+            with self.assertNumQueries(0):
+                self.assertIs(FaceGallery.obtener(), cargado)
+
+            # Otro proceso da de baja al empleado (sin señales en este proceso)
+            Empleado.objects.filter(pk=self.empleado.pk).update(activo=False, fecha_actualizacion=timezone.now())
+            reloj.return_value = 1004.0
+            self.assertEqual(FaceGallery.tamano(), 1)
+            with self.assertNumQueries(0):
+                self.assertIs(FaceGallery.obtener(), cargado)
+
+            reloj.return_value = 1005.0
+            self.assertEqual(len(FaceGallery.obtener()[1]), 0)
+
+
+def _jpeg(ancho=640, alto=480):
+    from PIL import Image
+
+    contenido = io.BytesIO()
+    Image.new('RGB', (ancho, alto), (200, 150, 100)).save(contenido, format='JPEG')
+    return contenido.getvalue()
+
+
+class AlmacenamientoCaido(InMemoryStorage):
+    def _save(self, name, content):
+        raise OSError('Spaces no responde')
+
+
+@override_settings(FOTOS_SUBIDA_REINTENTOS=1)
+class FotoRegistroServiceTest(TestCase):
+    """Las fotos de las marcas se suben desde el spool después de guardar la marca"""
+
+    def setUp(self):
+        directorio = tempfile.TemporaryDirectory()
+        self.addCleanup(directorio.cleanup)
+        spool = override_settings(FOTOS_SPOOL_DIR=directorio.name)
+        spool.enable()
+        self.addCleanup(spool.disable)
+        self.campo = RegistroAsistencia._meta.get_field('foto_registro')
+        empleado = Empleado.objects.create(
+            user=User.objects.create_user('empleado'), codigo_empleado='E001', departamento='Operaciones'
+        )
+        self.registro = RegistroAsistencia.objects.create(empleado=empleado, fecha=date.today(), hora_entrada=time(8))
+
+    def _encolar(self, nombre):
+        # El spool se escribe al confirmar; la subida del hilo no se ejecuta
+        antes = set(os.listdir(settings.FOTOS_SPOOL_DIR))
+        with mock.patch('registros.services.fotos_service._obtener_executor') as executor, \
+                self.captureOnCommitCallbacks(execute=True) as callbacks:
+            entrada = FotoRegistroService.encolar(self.registro.pk, ContentFile(_jpeg(), name=nombre))
+            self.assertEqual(set(os.listdir(settings.FOTOS_SPOOL_DIR)), antes)
+        self.assertEqual(len(callbacks), 1)
+        executor.return_value.submit.assert_called_once_with(FotoRegistroService._subir_en_hilo, entrada)
+        self.assertEqual(set(os.listdir(settings.FOTOS_SPOOL_DIR)) - antes, {f'{entrada}.img', f'{entrada}.json'})
+        return entrada
+
+    def test_revertir_no_deja_fotos_en_spool(self):
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            try:
+                with transaction.atomic():
+                    FotoRegistroService.encolar(self.registro.pk, ContentFile(_jpeg(), name='entrada.jpg'))
+                    raise IntegrityError('revertir')
+            except IntegrityError:
+                pass
+
+        self.assertEqual(callbacks, [])
+        self.assertEqual(os.listdir(settings.FOTOS_SPOOL_DIR), [])
+
+    def test_reintenta_hasta_subir(self):
+        entrada = self._encolar('entrada.jpg')
+
+        with mock.patch.object(self.campo, 'storage', AlmacenamientoCaido()):
+            self.assertFalse(FotoRegistroService.subir(entrada))
+        self.registro.refresh_from_db()
+        self.assertFalse(self.registro.foto_registro)
+
+        storage = InMemoryStorage()
+        with mock.patch.object(self.campo, 'storage', storage):
+            resultado = FotoRegistroService.procesar_pendientes()
+            self.registro.refresh_from_db()
+            miniaturas = self.registro.miniaturas_foto
+
+        self.assertEqual((resultado['subidas'], resultado['pendientes']), (1, 0))
+        self.registro.refresh_from_db()
+        self.assertTrue(self.registro.foto_registro.name.startswith('asistencias/entrada'))
+        self.assertEqual(storage.open(self.registro.foto_registro.name).read(), _jpeg())
+        self.assertEqual(os.listdir(settings.FOTOS_SPOOL_DIR), [])
+        # Miniaturas junto a la original, con la llave que arman las URLs
+        for nombre, url in miniaturas.items():
+            self.assertTrue(url.endswith(f'_{settings.MINIATURAS_TAMANOS[nombre]}.webp'))
+        self.assertEqual(
+            sorted(storage.listdir('asistencias/miniaturas')[1]),
+            sorted(os.path.basename(ruta_miniatura(self.registro.foto_registro.name, lado))
+                   for lado in settings.MINIATURAS_TAMANOS.values())
+        )
+
+    def test_fotos_del_mismo_registro_en_orden(self):
+        entrada = self._encolar('entrada.jpg')
+        salida = self._encolar('salida.jpg')
+
+        storage = InMemoryStorage()
+        with mock.patch.object(self.campo, 'storage', storage):
+            self.assertFalse(FotoRegistroService.subir(salida))
+            self.assertTrue(FotoRegistroService.subir(entrada))
+            self.assertTrue(FotoRegistroService.subir(salida))
+
+        self.registro.refresh_from_db()
+        self.assertTrue(self.registro.foto_registro.name.startswith('asistencias/salida'))
+        # La foto reemplazada se borra con sus miniaturas
+        self.assertEqual(storage.listdir('asistencias')[1], [os.path.basename(self.registro.foto_registro.name)])
+        self.assertEqual(len(storage.listdir('asistencias/miniaturas')[1]), len(settings.MINIATURAS_TAMANOS))
+
+
+class PreprocesamientoTest(TestCase):
+    """Las fotos se decodifican una vez, acotadas y con la orientación EXIF aplicada"""
+
+    def test_acota_y_orienta(self):
+        from PIL import Image
+
+        original = Image.new('RGB', (2000, 1000), (200, 150, 100))
+        exif = original.getexif()
+        exif[0x0112] = 6  # Orientation: girar 90° para mostrar
+        contenido = io.BytesIO()
+        original.save(contenido, format='JPEG', quality=95, exif=exif)
+        foto = ContentFile(contenido.getvalue(), name='kiosco.png')
+
+        with override_settings(IMAGEN_MAX_LADO=1280):
+            preparada = preparar_imagen(foto)
+
+        self.assertEqual(preparada.array.shape, (1280, 640, 3))
+        jpeg = preparada.jpeg()
+        self.assertEqual(jpeg.name, 'kiosco.jpg')
+        self.assertLess(jpeg.size, len(contenido.getvalue()))
+        self.assertEqual(Image.open(jpeg).size, (640, 1280))
+
+    def test_imagen_invalida(self):
+        self.assertIsNone(preparar_imagen(ContentFile(b'no es imagen', name='x.jpg')))
+
+
+class GenerarMiniaturasCommandTest(TestCase):
+    """El comando genera las miniaturas de las fotos anteriores"""
+
+    def test_backfill(self):
+        from PIL import Image
+
+        storage = InMemoryStorage()
+        campo = RegistroAsistencia._meta.get_field('foto_registro')
+        empleado = Empleado.objects.create(
+            user=User.objects.create_user('empleado'), codigo_empleado='E001', departamento='Operaciones'
+        )
+        nombre = storage.save('asistencias/anterior.jpg', ContentFile(_jpeg(1600, 1200)))
+        RegistroAsistencia.objects.create(empleado=empleado, fecha=date.today(), foto_registro=nombre)
+
+        salida = io.StringIO()
+        with mock.patch.object(campo, 'storage', storage):
+            call_command('generar_miniaturas', fotos='registros', stdout=salida)
+            call_command('generar_miniaturas', fotos='registros', stdout=salida)
+
+        self.assertIn('1 generadas', salida.getvalue())
+        self.assertIn('1 ya tenían miniaturas', salida.getvalue())
+        self.assertEqual(Image.open(storage.open(ruta_miniatura(nombre, 320))).size, (320, 240))
+        self.assertEqual(Image.open(storage.open(ruta_miniatura(nombre, 96))).format, 'WEBP')
+
+
+@override_settings(
+    AWS_ACCESS_KEY_ID='llave', AWS_SECRET_ACCESS_KEY='secreto', AWS_STORAGE_BUCKET_NAME='checador',
+    AWS_S3_ENDPOINT_URL='https://nyc3.digitaloceanspaces.com', AWS_S3_REGION_NAME='nyc3',
+)
+class ConexionesS3Test(TestCase):
+    """Los storages comparten el cliente de S3 y sus llamadas se cuentan"""
+
+    def setUp(self):
+        conexiones_s3.limpiar()
+        self.addCleanup(conexiones_s3.limpiar)
+
+    def test_cliente_compartido(self):
+        media, otra, reportes = MediaStorage(), MediaStorage(), ReportesStorage()
+
+        cliente = media.connection.meta.client
+        self.assertIs(otra.connection.meta.client, cliente)
+        self.assertIs(reportes.connection.meta.client, cliente)
+        self.assertIs(media.bucket.meta.client, cliente)
+        self.assertEqual(cliente.meta.config.max_pool_connections, settings.S3_MAX_POOL_CONNECTIONS)
+        self.assertTrue(cliente.meta.config.tcp_keepalive)
+        self.assertIsNot(media.unsigned_connection.meta.client, cliente)
+
+    def test_cuenta_llamadas_repetidas(self):
+        from botocore.stub import Stubber
+
+        storage = MediaStorage()
+        stubber = Stubber(storage.connection.meta.client)
+        for _ in range(2):
+            stubber.add_response('head_object', {}, {'Bucket': 'checador', 'Key': 'media/foto.jpg'})
+        stubber.add_client_error('head_object', http_status_code=404)
+
+        with stubber, conexiones_s3.RegistroS3() as registro:
+            self.assertTrue(storage.exists('foto.jpg'))
+            self.assertTrue(storage.exists('foto.jpg'))
+            self.assertFalse(storage.exists('otra.jpg'))
+
+        self.assertEqual(registro.llamadas, 3)
+        self.assertEqual(registro.operaciones['HeadObject'], 3)
+        self.assertEqual(registro.repetidas(), [('HeadObject', 'media/foto.jpg', 2)])
+
+
+class LimpiezaArchivosTest(TestCase):
+    """Los archivos reemplazados o de instancias borradas se eliminan al confirmar"""
+
+    def setUp(self):
+        self.storage = InMemoryStorage()
+        parche = mock.patch.object(RegistroAsistencia._meta.get_field('foto_registro'), 'storage', self.storage)
+        parche.start()
+        self.addCleanup(parche.stop)
+        empleado = Empleado.objects.create(
+            user=User.objects.create_user('empleado'), codigo_empleado='E001', departamento='Operaciones'
+        )
+        self.registro = RegistroAsistencia.objects.create(
+            empleado=empleado, fecha=date.today(), hora_entrada=time(8),
+            foto_registro=ContentFile(_jpeg(), name='entrada.jpg')
+        )
+        self.anterior = self.registro.foto_registro.name
+        generar_miniaturas(self.storage, self.anterior)
+
+    def _archivos(self):
+        return sorted(self.storage.listdir('asistencias')[1] + self.storage.listdir('asistencias/miniaturas')[1])
+
+    def test_reemplazo_sin_releer_la_fila(self):
+        registro = RegistroAsistencia.objects.get(pk=self.registro.pk)
+        registro.foto_registro = ContentFile(_jpeg(), name='salida.jpg')
+
+        with self.captureOnCommitCallbacks(execute=True) as callbacks, CaptureQueriesContext(connection) as consultas:
+            registro.save()
+        vaciar_borrados()
+
+        self.assertEqual(len(callbacks), 1)
+        self.assertFalse(any(
+            'foto_registro' in consulta['sql'] and consulta['sql'].startswith('SELECT')
+            for consulta in consultas.captured_queries
+        ))
+        self.assertEqual(self._archivos(), [os.path.basename(registro.foto_registro.name)])
+
+    def test_borrado_de_instancia_en_lote(self):
+        registro = RegistroAsistencia.objects.get(pk=self.registro.pk)
+        registro.hora_salida = time(17)
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            registro.save()
+        self.assertEqual(callbacks, [])
+
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            RegistroAsistencia.objects.filter(pk=registro.pk).delete()
+        vaciar_borrados()
+
+        self.assertEqual(len(callbacks), 1)
+        self.assertEqual(self._archivos(), [])
+
+    def test_modelos_sin_archivos_no_escuchan(self):
+        user = User.objects.get(username='empleado')
+        user.first_name = 'Ana'
+        with self.assertNumQueries(1):
+            user.save()
+
+
+@override_settings(KIOSCO_TOKENS=['kiosco-1'], SINCRONIZACION_VENTANA_HORAS=72)
+class SincronizarMarcasTest(TestCase):
+    """Lotes de marcas de kioscos sin conexión: idempotencia y validaciones"""
+
+    URL = '/api/registros/sincronizar/'
+
+    def setUp(self):
+        self.encoding = np.random.default_rng(3).normal(size=128) * 0.1
+        self.empleado = Empleado.objects.create(
+            user=User.objects.create_user('empleado'), codigo_empleado='E001', departamento='Operaciones'
+        )
+        self.empleado.set_face_encoding(self.encoding)
+        self.empleado.save()
+        FaceGallery.invalidar()
+        self.addCleanup(FaceGallery.invalidar)
+
+    def marca(self, clave, momento=None, tipo='entrada'):
+        momento = momento or timezone.now() - timedelta(hours=1)
+        return {'clave': clave, 'tipo': tipo, 'momento': momento.isoformat(), 'embedding': self.encoding.tolist()}
+
+    def sincronizar(self, *marcas, token='kiosco-1'):
+        encabezados = {'HTTP_X_KIOSCO_TOKEN': token} if token else {}
+        return self.client.post(self.URL, {'dispositivo': 'kiosco-1', 'marcas': list(marcas)},
+                                content_type='application/json', **encabezados)
+
+    def test_reenvio_no_duplica(self):
+        primera = self.sincronizar(self.marca('k1'))
+        segunda = self.sincronizar(self.marca('k1'))
+
+        self.assertEqual(primera.status_code, 200)
+        self.assertTrue(primera.data['resultados'][0]['success'])
+        self.assertFalse(primera.data['resultados'][0]['duplicada'])
+        self.assertEqual(segunda.data['procesadas'], 0)
+        self.assertTrue(segunda.data['resultados'][0]['duplicada'])
+        self.assertEqual(segunda.data['resultados'][0]['registro_id'], primera.data['resultados'][0]['registro_id'])
+        self.assertEqual(RegistroAsistencia.objects.count(), 1)
+        self.assertEqual(MarcaSincronizada.objects.count(), 1)
+
+    def test_clave_repetida_en_el_lote(self):
+        response = self.sincronizar(self.marca('k1'), self.marca('k1'))
+
+        self.assertEqual(response.data['procesadas'], 1)
+        self.assertEqual([r['duplicada'] for r in response.data['resultados']], [False, True])
+        self.assertEqual(RegistroAsistencia.objects.count(), 1)
+
+    def test_clave_procesada_en_paralelo(self):
+        # Otro proceso guardó la clave entre la búsqueda inicial y el INSERT
+        existente = MarcaSincronizada.objects.create(
+            clave_idempotencia='k1', dispositivo='kiosco-2', tipo='entrada',
+            momento_cliente=timezone.now(), exito=False, mensaje='Procesada en paralelo'
+        )
+        filtrar = MarcaSincronizada.objects.filter
+        llamadas = []
+
+        def filtrar_sin_ver_la_primera_vez(*args, **kwargs):
+            llamadas.append(kwargs)
+            return MarcaSincronizada.objects.none() if len(llamadas) == 1 else filtrar(*args, **kwargs)
+
+        with mock.patch.object(MarcaSincronizada.objects, 'filter', side_effect=filtrar_sin_ver_la_primera_vez):
+            response = self.sincronizar(self.marca('k1'))
+
+        resultado = response.data['resultados'][0]
+        self.assertTrue(resultado['duplicada'])
+        self.assertEqual(resultado['message'], existente.mensaje)
+        # El savepoint de la marca se revirtió: no queda registro de asistencia
+        self.assertEqual(RegistroAsistencia.objects.count(), 0)
+
+    def test_momento_fuera_de_ventana(self):
+        response = self.sincronizar(
+            self.marca('futuro', timezone.now() + timedelta(days=1)),
+            self.marca('antigua', timezone.now() - timedelta(days=30)),
+        )
+
+        resultados = {r['clave']: r for r in response.data['resultados']}
+        self.assertFalse(resultados['futuro']['success'])
+        self.assertIn('futuro', resultados['futuro']['message'])
+        self.assertFalse(resultados['antigua']['success'])
+        self.assertIn('ventana', resultados['antigua']['message'])
+        self.assertEqual(RegistroAsistencia.objects.count(), 0)
+
+    def test_embedding_requiere_kiosco(self):
+        self.assertEqual(self.sincronizar(self.marca('k1'), token=None).status_code, 403)
+        self.assertEqual(self.sincronizar(self.marca('k1'), token='otro').status_code, 403)
+        self.assertFalse(MarcaSincronizada.objects.exists())
+
+    def test_foto_atrasada_sin_kiosco(self):
+        # Una foto con momento del cliente no puede registrar una entrada atrasada de forma anónima
+        marca = self.marca('k1', timezone.now() - timedelta(hours=48))
+        del marca['embedding']
+        marca['foto'] = base64.b64encode(_jpeg()).decode()
+
+        with mock.patch('registros.views.RecognitionPool.extraer_encodings') as extraer:
+            response = self.sincronizar(marca, token=None)
+
+        self.assertEqual(response.status_code, 403)
+        extraer.assert_not_called()
+        self.assertFalse(RegistroAsistencia.objects.exists())
+        self.assertFalse(MarcaSincronizada.objects.exists())
+
+
+class ResumenesTest(TestCase):
+    """Llenado inicial de los resúmenes y cambio de departamento"""
+
+    def setUp(self):
+        self.empleado = Empleado.objects.create(
+            user=User.objects.create_user('empleado'), codigo_empleado='E001', departamento='Operaciones'
+        )
+        Empleado.objects.create(user=User.objects.create_user('otro'), codigo_empleado='E002', departamento='Operaciones')
+        for dia in (5, 6):
+            RegistroAsistencia.objects.create(
+                empleado=self.empleado, fecha=date(2025, 12, dia), hora_entrada=time(8), hora_salida=time(16)
+            )
+
+    def diarios(self):
+        return dict(ResumenDiario.objects.values_list('departamento').annotate(total=Sum('registros')))
+
+    def test_migracion_llena_resumenes(self):
+        ResumenDiario.objects.all().delete()
+        ResumenMensual.objects.all().delete()
+
+        migracion_resumenes.llenar_resumenes(apps, None)
+
+        mensual = ResumenMensual.objects.get(empleado=self.empleado, anio=2025, mes=12)
+        self.assertEqual((mensual.registros, mensual.horas_trabajadas), (2, 16))
+        self.assertEqual(self.diarios(), {'Operaciones': 2})
+
+    def test_cambio_de_departamento(self):
+        self.assertEqual(self.diarios(), {'Operaciones': 2})
+        empleado = Empleado.objects.get(pk=self.empleado.pk)
+
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            empleado.puesto = 'Supervisor'
+            empleado.save()
+        self.assertEqual(callbacks, [])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            empleado.departamento = 'Almacén'
+            empleado.save()
+
+        self.assertEqual(self.diarios(), {'Almacén': 2})
+        self.assertEqual(ResumenMensual.objects.get(empleado=empleado, anio=2025, mes=12).departamento, 'Almacén')
+
+        # Las ediciones posteriores ya no restan del departamento anterior
+        registro = RegistroAsistencia.objects.get(empleado=empleado, fecha=date(2025, 12, 5))
+        registro.delete()
+        self.assertEqual(self.diarios(), {'Almacén': 1})
+
+
+class PaginacionPorLlaveTest(TestCase):
+    """Cursores (fecha, hora_entrada, id) del listado de registros"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_user('admin', is_staff=True)
+        empleados = [
+            Empleado.objects.create(
+                user=User.objects.create_user(f'empleado{i}'), codigo_empleado=f'E{i:03d}', departamento='Operaciones'
+            )
+            for i in range(5)
+        ]
+        # Mismo día con horas repetidas (desempate por id), horas del mismo
+        # segundo que solo difieren en microsegundos y sin hora de entrada
+        cls.hoy = timezone.now().date()
+        ayer = cls.hoy - timedelta(days=1)
+        for empleado, fecha, entrada in (
+            (empleados[0], cls.hoy, time(8, 0, 0, 250000)),
+            (empleados[1], cls.hoy, time(8, 0, 0, 250000)),
+            (empleados[2], cls.hoy, None),
+            (empleados[3], cls.hoy, time(9, 0, 0, 500000)),
+            (empleados[4], cls.hoy, time(8, 0, 0, 750000)),
+            (empleados[0], ayer, time(7, 0, 0, 125000)),
+            (empleados[1], ayer, None),
+        ):
+            RegistroAsistencia.objects.create(empleado=empleado, fecha=fecha, hora_entrada=entrada)
+        cls.orden = list(RegistroAsistencia.objects.order_by(*ORDEN_REGISTROS).values_list('pk', flat=True))
+
+    def test_orden_con_hora_nula(self):
+        registros = {registro.pk: registro for registro in RegistroAsistencia.objects.all()}
+        self.assertEqual(
+            [(registros[pk].fecha == self.hoy, registros[pk].hora_entrada) for pk in self.orden],
+            [
+                (True, None), (True, time(9, 0, 0, 500000)), (True, time(8, 0, 0, 750000)),
+                (True, time(8, 0, 0, 250000)), (True, time(8, 0, 0, 250000)),
+                (False, None), (False, time(7, 0, 0, 125000)),
+            ]
+        )
+        self.assertGreater(self.orden[3], self.orden[4])
+
+    def test_cursor_con_microsegundos(self):
+        registro = RegistroAsistencia.objects.get(pk=self.orden[2])
+        cursor = _cursor_registro(registro)
+        self.assertEqual(_leer_cursor(cursor), (self.hoy, time(8, 0, 0, 750000), registro.pk))
+
+        # Ni el registro del cursor ni los del mismo segundo se repiten o se saltan
+        pagina, _, _ = _pagina_registros(RegistroAsistencia.objects.all(), despues=cursor, tamano=2)
+        self.assertEqual([registro.pk for registro in pagina], self.orden[3:5])
+        pagina, _, _ = _pagina_registros(RegistroAsistencia.objects.all(), antes=cursor, tamano=2)
+        self.assertEqual([registro.pk for registro in pagina], self.orden[0:2])
+
+    def test_recorrido_en_ambos_sentidos(self):
+        registros = RegistroAsistencia.objects.all()
+        for tamano in range(1, len(self.orden) + 2):
+            with self.subTest(tamano=tamano):
+                paginas, despues = [], None
+                while True:
+                    pagina, siguiente, anterior = _pagina_registros(registros, despues=despues, tamano=tamano)
+                    self.assertEqual(anterior is None, despues is None)
+                    paginas.append([registro.pk for registro in pagina])
+                    if siguiente is None:
+                        break
+                    despues = siguiente
+                self.assertEqual(sum(paginas, []), self.orden)
+                # La última página no ofrece siguiente aunque quede exactamente llena
+                self.assertTrue(0 < len(paginas[-1]) <= tamano)
+
+                # De regreso desde la última página con el cursor 'antes'
+                antes = _cursor_registro(RegistroAsistencia.objects.get(pk=paginas[-1][0]))
+                for numero, esperada in reversed(list(enumerate(paginas[:-1]))):
+                    pagina, siguiente, antes = _pagina_registros(registros, antes=antes, tamano=tamano)
+                    self.assertEqual([registro.pk for registro in pagina], esperada)
+                    self.assertIsNotNone(siguiente)
+                    # Solo la primera página no tiene anterior
+                    self.assertEqual(antes is None, numero == 0)
+
+    def test_cursor_invalido(self):
+        for valor in ('basura', '2026-01-01|8:00|1', '2026-13-01||1', '2026-01-01||x', 'a|b'):
+            with self.subTest(valor=valor):
+                self.assertIsNone(_leer_cursor(valor))
+
+        self.client.force_login(self.admin)
+        response = self.client.get('/registros/', {'despues': 'basura', 'antes': '1|2|3'})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([registro.pk for registro in response.context['registros']], self.orden)
+        self.assertIsNone(response.context['url_anterior'])
+
+    def test_cursor_en_hora_nula(self):
+        cursor = _cursor_registro(RegistroAsistencia.objects.get(pk=self.orden[0]))
+        self.assertEqual(_leer_cursor(cursor), (self.hoy, None, self.orden[0]))
+
+        pagina, _, anterior = _pagina_registros(RegistroAsistencia.objects.all(), despues=cursor, tamano=2)
+
+        self.assertEqual([registro.pk for registro in pagina], self.orden[1:3])
+        self.assertIsNotNone(anterior)
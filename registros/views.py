@@ -2,18 +2,57 @@ from rest_framework import viewsets, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated, AllowAny
-from django.db import models
+from django.conf import settings
+from django.db import transaction, IntegrityError
+from django.core.files.uploadedfile import SimpleUploadedFile
 from django.utils import timezone
 from datetime import datetime, date, timedelta
 from zoneinfo import ZoneInfo
-from .models import RegistroAsistencia
+import base64
+import binascii
+import hmac
+import logging
+import numpy as np
+from .models import RegistroAsistencia, MarcaSincronizada
 
 # Zona horaria de México
 MEXICO_TZ = ZoneInfo('America/Mexico_City')
 from empleados.models import Empleado
 from .services import FacialRecognitionService
+from .services.facial_recognition import medir_etapa
+from .services.fotos_service import FotoRegistroService
+from .services.preprocesamiento import preparar_imagen
+from .recognition_pool import RecognitionPool, ReconocimientoOcupadoError, ReconocimientoTimeoutError
 from rest_framework import serializers as rest_serializers
 
+logger = logging.getLogger(__name__)
+
+
+def _es_kiosco_autorizado(request):
+    """Kiosco con un token de KIOSCO_TOKENS (X-Kiosco-Token) o staff con JWT"""
+    token = request.META.get('HTTP_X_KIOSCO_TOKEN', '')
+    if token and any(
+        hmac.compare_digest(token.encode(), valido.encode())
+        for valido in getattr(settings, 'KIOSCO_TOKENS', []) if valido
+    ):
+        return True
+    return bool(request.user and request.user.is_authenticated and request.user.is_staff)
+
+
+def _fuera_de_ventana(momento, ahora):
+    """Mensaje de rechazo si el momento de una marca sin conexión no es aceptable"""
+    tolerancia = timedelta(seconds=getattr(settings, 'SINCRONIZACION_TOLERANCIA_FUTURO', 300))
+    if momento > ahora + tolerancia:
+        return 'El momento de la marca está en el futuro'
+    if momento < ahora - timedelta(hours=getattr(settings, 'SINCRONIZACION_VENTANA_HORAS', 72)):
+        return 'La marca es más antigua que la ventana de sincronización'
+    return None
+
+
+def _server_timing(tiempos):
+    """Formatea los tiempos por etapa como encabezado Server-Timing"""
+    return ', '.join(f'{etapa};dur={duracion}' for etapa, duracion in tiempos.items())
+
 
 class RegistroAsistenciaSerializer(rest_serializers.ModelSerializer):
     """Serializer para registros de asistencia"""
@@ -21,6 +60,7 @@ class RegistroAsistenciaSerializer(rest_serializers.ModelSerializer):
     empleado_codigo = rest_serializers.CharField(source='empleado.codigo_empleado', read_only=True)
     esta_completo = rest_serializers.ReadOnlyField()
     tiempo_trabajado_str = rest_serializers.ReadOnlyField()
+    miniaturas_foto = rest_serializers.ReadOnlyField()
     
     class Meta:
         model = RegistroAsistencia
@@ -37,12 +77,82 @@ class MarcarAsistenciaSerializer(rest_serializers.Serializer):
     ubicacion = rest_serializers.CharField(required=False, allow_blank=True)
 
 
+class MarcarAsistenciaRafagaSerializer(rest_serializers.Serializer):
+    """Serializer para marcar asistencia con una ráfaga de frames"""
+    fotos = rest_serializers.ListField(
+        child=rest_serializers.ImageField(),
+        min_length=1,
+        max_length=5
+    )
+    latitud = rest_serializers.DecimalField(max_digits=9, decimal_places=6, required=False, allow_null=True)
+    longitud = rest_serializers.DecimalField(max_digits=9, decimal_places=6, required=False, allow_null=True)
+    ubicacion = rest_serializers.CharField(required=False, allow_blank=True)
+
+
+class ImagenBase64Field(rest_serializers.Field):
+    """Imagen JPEG/PNG enviada como base64 (opcionalmente como data URL)"""
+
+    def __init__(self, nombre='captura.jpg', **kwargs):
+        self.nombre = nombre
+        super().__init__(**kwargs)
+
+    def to_internal_value(self, data):
+        if not isinstance(data, str) or not data:
+            raise rest_serializers.ValidationError('Se esperaba una imagen en base64')
+        if data.startswith('data:') and ',' in data:
+            data = data.split(',', 1)[1]
+        try:
+            contenido = base64.b64decode(data, validate=True)
+        except (binascii.Error, ValueError):
+            raise rest_serializers.ValidationError('Base64 inválido')
+        return SimpleUploadedFile(self.nombre, contenido, content_type='image/jpeg')
+
+
+class MarcaPendienteSerializer(rest_serializers.Serializer):
+    """Marca capturada por el kiosco mientras no tenía conexión"""
+    clave = rest_serializers.CharField(max_length=64)
+    tipo = rest_serializers.ChoiceField(choices=['entrada', 'salida'])
+    momento = rest_serializers.DateTimeField()
+    foto = ImagenBase64Field(required=False)
+    embedding = rest_serializers.ListField(
+        child=rest_serializers.FloatField(),
+        min_length=128,
+        max_length=128,
+        required=False
+    )
+    latitud = rest_serializers.DecimalField(max_digits=9, decimal_places=6, required=False, allow_null=True)
+    longitud = rest_serializers.DecimalField(max_digits=9, decimal_places=6, required=False, allow_null=True)
+    ubicacion = rest_serializers.CharField(required=False, allow_blank=True)
+
+    def validate(self, attrs):
+        if ('foto' in attrs) == ('embedding' in attrs):
+            raise rest_serializers.ValidationError('Cada marca debe incluir foto o embedding (solo uno)')
+        return attrs
+
+
+class SincronizarMarcasSerializer(rest_serializers.Serializer):
+    """Lote de marcas encoladas por un kiosco"""
+    dispositivo = rest_serializers.CharField(max_length=100, required=False, allow_blank=True)
+    marcas = MarcaPendienteSerializer(many=True)
+
+    def validate_marcas(self, marcas):
+        if not marcas:
+            raise rest_serializers.ValidationError('El lote está vacío')
+        if len(marcas) > RegistroAsistenciaViewSet.MAX_MARCAS_LOTE:
+            raise rest_serializers.ValidationError(
+                f'Máximo {RegistroAsistenciaViewSet.MAX_MARCAS_LOTE} marcas por lote'
+            )
+        return marcas
+
+
 class RegistroAsistenciaViewSet(viewsets.ModelViewSet):
     """ViewSet para registros de asistencia"""
     queryset = RegistroAsistencia.objects.all().select_related('empleado', 'empleado__user')
     permission_classes = [IsAuthenticated]
     serializer_class = RegistroAsistenciaSerializer
     
+    MAX_MARCAS_LOTE = 20
+    
     def get_queryset(self):
         queryset = super().get_queryset()
         
@@ -74,34 +184,306 @@ class RegistroAsistenciaViewSet(viewsets.ModelViewSet):
         """Marcar salida con reconocimiento facial"""
         return self._marcar_asistencia(request, 'salida')
     
+    @action(detail=False, methods=['post'], permission_classes=[AllowAny])
+    def marcar_entrada_rafaga(self, request):
+        """Marcar entrada con una ráfaga de frames (se reconoce el más nítido)"""
+        return self._marcar_asistencia_rafaga(request, 'entrada')
+    
+    @action(detail=False, methods=['post'], permission_classes=[AllowAny])
+    def marcar_salida_rafaga(self, request):
+        """Marcar salida con una ráfaga de frames (se reconoce el más nítido)"""
+        return self._marcar_asistencia_rafaga(request, 'salida')
+    
+    @action(detail=False, methods=['post'], permission_classes=[AllowAny])
+    def sincronizar(self, request):
+        """
+        Sincroniza un lote de marcas encoladas por un kiosco sin conexión.
+        
+        Cada marca trae su clave de idempotencia, el momento en que se capturó
+        y una foto en base64 o un embedding ya calculado. El reconocimiento se
+        hace en lote y las marcas se aplican en una sola transacción, con un
+        resultado por marca. Reenviar el mismo lote es seguro: las claves ya
+        procesadas devuelven el resultado guardado.
+        
+        Todo el lote requiere un kiosco autenticado (X-Kiosco-Token): el
+        momento de cada marca lo pone el cliente, y los embeddings se saltan
+        la detección de rostro en el servidor. Las marcas con momento en el
+        futuro o más antiguas que SINCRONIZACION_VENTANA_HORAS se rechazan
+        (con su resultado guardado).
+        """
+        if not _es_kiosco_autorizado(request):
+            return Response({
+                'success': False,
+                'message': 'Solo los kioscos autorizados pueden sincronizar marcas'
+            }, status=status.HTTP_403_FORBIDDEN)
+        
+        serializer = SincronizarMarcasSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        dispositivo = serializer.validated_data.get('dispositivo', '')
+        marcas = serializer.validated_data['marcas']
+        tiempos = {}
+        
+        claves = {marca['clave'] for marca in marcas}
+        procesadas = {
+            marca.clave_idempotencia: marca
+            for marca in MarcaSincronizada.objects.filter(
+                clave_idempotencia__in=claves
+            ).select_related('empleado__user')
+        }
+        
+        # Marcas nuevas (una por clave), en orden cronológico para que la
+        # entrada se aplique antes que la salida del mismo empleado
+        nuevas = {}
+        for marca in marcas:
+            if marca['clave'] not in procesadas:
+                nuevas.setdefault(marca['clave'], marca)
+        nuevas = sorted(nuevas.values(), key=lambda marca: marca['momento'])
+        
+        # Encodings: calcular los de las fotos en un solo trabajo del pool
+        encodings = {}
+        errores = {}
+        con_foto = []
+        ahora = timezone.now()
+        with medir_etapa(tiempos, 'carga'):
+            for marca in nuevas:
+                rechazo = _fuera_de_ventana(marca['momento'], ahora)
+                if rechazo:
+                    errores[marca['clave']] = rechazo
+                    continue
+                if 'embedding' in marca:
+                    encodings[marca['clave']] = np.asarray(marca['embedding'], dtype=np.float32)
+                    continue
+                preparada = preparar_imagen(marca['foto'])
+                if preparada is None:
+                    errores[marca['clave']] = 'No se pudo cargar la imagen'
+                else:
+                    marca['foto'] = preparada
+                    con_foto.append((marca['clave'], preparada.array))
+        
+        try:
+            extraidos = RecognitionPool.extraer_encodings(
+                [image for _, image in con_foto], tiempos=tiempos
+            )
+        except ReconocimientoOcupadoError:
+            return Response({
+                'success': False,
+                'message': 'El sistema está ocupado. Reintente la sincronización'
+            }, status=status.HTTP_503_SERVICE_UNAVAILABLE, headers={'Retry-After': '5'})
+        except ReconocimientoTimeoutError:
+            return Response({
+                'success': False,
+                'message': 'El reconocimiento del lote tardó demasiado. Reintente la sincronización'
+            }, status=status.HTTP_504_GATEWAY_TIMEOUT)
+        
+        for (clave, _), (encoding, mensaje) in zip(con_foto, extraidos):
+            if encoding is None:
+                errores[clave] = mensaje
+            else:
+                encodings[clave] = encoding
+        
+        # Una sola búsqueda en la galería para todo el lote
+        claves_reconocer = [marca['clave'] for marca in nuevas if marca['clave'] in encodings]
+        reconocidos = dict(zip(
+            claves_reconocer,
+            FacialRecognitionService.recognize_encodings(
+                [encodings[clave] for clave in claves_reconocer], tiempos=tiempos
+            ) if claves_reconocer else []
+        ))
+        
+        concurrentes = set()
+        with medir_etapa(tiempos, 'aplicar'), transaction.atomic():
+            for marca in nuevas:
+                clave = marca['clave']
+                empleado, confianza, mensaje = reconocidos.get(clave, (None, 0.0, errores.get(clave)))
+                try:
+                    # Savepoint por marca: un fallo no revierte las demás
+                    with transaction.atomic():
+                        procesadas[clave] = self._aplicar_marca_sincronizada(
+                            marca, dispositivo, empleado, confianza, mensaje
+                        )
+                except IntegrityError:
+                    # La misma clave se procesó en paralelo (reintento concurrente)
+                    existente = MarcaSincronizada.objects.select_related(
+                        'empleado__user'
+                    ).filter(clave_idempotencia=clave).first()
+                    if existente is None:
+                        raise
+                    procesadas[clave] = existente
+                    concurrentes.add(clave)
+        
+        logger.info(f"🔄 Sincronización de {len(marcas)} marcas ({len(nuevas)} nuevas) en ms: {tiempos}")
+        
+        nuevas_claves = {marca['clave'] for marca in nuevas}
+        resultados = []
+        vistas = set()
+        for marca in marcas:
+            clave = marca['clave']
+            duplicada = clave not in nuevas_claves or clave in vistas or clave in concurrentes
+            vistas.add(clave)
+            resultados.append(procesadas[clave].como_resultado(duplicada=duplicada))
+        
+        return Response({
+            'success': True,
+            'procesadas': len(nuevas),
+            'duplicadas': sum(1 for resultado in resultados if resultado['duplicada']),
+            'resultados': resultados
+        }, status=status.HTTP_200_OK, headers={'Server-Timing': _server_timing(tiempos)})
+    
+    def _aplicar_marca_sincronizada(self, marca, dispositivo, empleado, confianza, mensaje):
+        """Aplica una marca del lote y guarda su resultado bajo su clave"""
+        registro = None
+        if empleado is not None:
+            preparada = marca.get('foto')
+            foto = None
+            if preparada is not None:
+                foto = preparada.jpeg(f"sync_{empleado.codigo_empleado}_{marca['momento']:%Y%m%d_%H%M%S}.jpg")
+            registro, error = self._registrar_marca(
+                empleado, confianza, marca['tipo'], foto,
+                latitud=marca.get('latitud'),
+                longitud=marca.get('longitud'),
+                ubicacion=marca.get('ubicacion', ''),
+                momento=marca['momento']
+            )
+            mensaje = error or f"{marca['tipo'].capitalize()} registrada exitosamente"
+        
+        return MarcaSincronizada.objects.create(
+            clave_idempotencia=marca['clave'],
+            dispositivo=dispositivo,
+            tipo=marca['tipo'],
+            momento_cliente=marca['momento'],
+            empleado=empleado,
+            registro=registro,
+            exito=registro is not None,
+            mensaje=(mensaje or '')[:255],
+            confianza_reconocimiento=confianza if empleado is not None else None
+        )
+    
     def _marcar_asistencia(self, request, tipo):
         """Método auxiliar para marcar entrada/salida"""
         serializer = MarcarAsistenciaSerializer(data=request.data)
         serializer.is_valid(raise_exception=True)
         
         foto = serializer.validated_data['foto']
-        latitud = serializer.validated_data.get('latitud')
-        longitud = serializer.validated_data.get('longitud')
-        ubicacion = serializer.validated_data.get('ubicacion', '')
         
-        # Cargar y reconocer rostro
-        image = FacialRecognitionService.load_image_from_file(foto)
-        if image is None:
+        # Decodificar una sola vez (midiendo cada etapa)
+        tiempos = {}
+        with medir_etapa(tiempos, 'carga'):
+            preparada = preparar_imagen(foto)
+        if preparada is None:
             return Response({
                 'success': False,
                 'message': 'No se pudo cargar la imagen'
             }, status=status.HTTP_400_BAD_REQUEST)
         
-        empleado, confianza, mensaje = FacialRecognitionService.recognize_employee(image)
+        return self._reconocer_y_registrar(preparada, tipo, serializer.validated_data, tiempos)
+    
+    def _marcar_asistencia_rafaga(self, request, tipo):
+        """
+        Marca entrada/salida a partir de una ráfaga de frames.
+        Evalúa la calidad de todos los frames y solo reconoce el más nítido.
+        """
+        serializer = MarcarAsistenciaRafagaSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        
+        fotos = serializer.validated_data['fotos']
+        tiempos = {}
+        mejor = None
+        mensaje_rechazo = 'No se pudo cargar ninguna imagen'
+        
+        with medir_etapa(tiempos, 'seleccion'):
+            for foto in fotos:
+                preparada = preparar_imagen(foto)
+                if preparada is None:
+                    continue
+                es_valida, mensaje, nitidez = FacialRecognitionService.evaluar_calidad(preparada.array)
+                if not es_valida:
+                    mensaje_rechazo = mensaje
+                    continue
+                if mejor is None or nitidez > mejor[1]:
+                    mejor = (preparada, nitidez)
+        
+        if mejor is None:
+            return Response({
+                'success': False,
+                'message': mensaje_rechazo,
+                'frames_evaluados': len(fotos)
+            }, status=status.HTTP_400_BAD_REQUEST)
+        
+        preparada, nitidez = mejor
+        logger.info(f"🎞️ Ráfaga de {len(fotos)} frames, nitidez elegida: {nitidez:.1f}")
+        # La calidad ya se validó al seleccionar el frame
+        respuesta = self._reconocer_y_registrar(
+            preparada, tipo, serializer.validated_data, tiempos, validar=False
+        )
+        respuesta.data['frames_evaluados'] = len(fotos)
+        respuesta.data['nitidez'] = round(nitidez, 1)
+        return respuesta
+    
+    def _reconocer_y_registrar(self, preparada, tipo, datos, tiempos, validar=True):
+        """
+        Reconoce el rostro con el pool de procesos y registra la marca; la
+        foto guardada es el JPEG de la misma imagen preparada
+        """
+        try:
+            empleado, confianza, mensaje = RecognitionPool.reconocer(
+                preparada.array, tiempos=tiempos, validar=validar
+            )
+        except ReconocimientoOcupadoError:
+            return Response({
+                'success': False,
+                'message': 'El sistema está ocupado. Intente de nuevo en unos segundos'
+            }, status=status.HTTP_503_SERVICE_UNAVAILABLE, headers={'Retry-After': '2'})
+        except ReconocimientoTimeoutError:
+            return Response({
+                'success': False,
+                'message': 'El reconocimiento tardó demasiado. Intente de nuevo'
+            }, status=status.HTTP_504_GATEWAY_TIMEOUT)
+        logger.info(f"⏱️ Reconocimiento ({tipo}) en ms: {tiempos}")
         
         if not empleado:
             return Response({
                 'success': False,
                 'message': mensaje
+            }, status=status.HTTP_400_BAD_REQUEST, headers={'Server-Timing': _server_timing(tiempos)})
+        
+        with medir_etapa(tiempos, 'jpeg'):
+            foto = preparada.jpeg()
+        registro, error = self._registrar_marca(
+            empleado, confianza, tipo, foto,
+            latitud=datos.get('latitud'),
+            longitud=datos.get('longitud'),
+            ubicacion=datos.get('ubicacion', '')
+        )
+        if error:
+            return Response({
+                'success': False,
+                'message': error
             }, status=status.HTTP_400_BAD_REQUEST)
         
+        ahora = registro.hora_entrada if tipo == 'entrada' else registro.hora_salida
+        return Response({
+            'success': True,
+            'message': f'{tipo.capitalize()} registrada exitosamente',
+            'empleado': empleado.nombre_completo,
+            'codigo': empleado.codigo_empleado,
+            'confianza': f'{confianza:.1f}%',
+            'hora': ahora.strftime('%H:%M:%S'),
+            'registro': RegistroAsistenciaSerializer(registro).data
+        }, status=status.HTTP_200_OK, headers={'Server-Timing': _server_timing(tiempos)})
+    
+    def _registrar_marca(self, empleado, confianza, tipo, foto, latitud=None, longitud=None,
+                         ubicacion='', momento=None):
+        """
+        Aplica una entrada/salida de un empleado ya reconocido.
+        
+        Args:
+            momento: datetime de la marca (por defecto, ahora)
+        
+        Returns:
+            Tupla (registro, None) o (None, mensaje de error)
+        """
         # Obtener o crear registro del día (usando hora de México)
-        ahora_mexico = timezone.now().astimezone(MEXICO_TZ)
+        ahora_mexico = (momento or timezone.now()).astimezone(MEXICO_TZ)
         hoy = ahora_mexico.date()
         ayer = hoy - timedelta(days=1)
         ahora = ahora_mexico.time()
@@ -138,10 +520,7 @@ class RegistroAsistenciaViewSet(viewsets.ModelViewSet):
                         fecha=hoy,
                     )
                 except RegistroAsistencia.DoesNotExist:
-                    return Response({
-                        'success': False,
-                        'message': 'No hay entrada registrada para marcar salida'
-                    }, status=status.HTTP_400_BAD_REQUEST)
+                    return None, 'No hay entrada registrada para marcar salida'
             else:
                 registro, created = RegistroAsistencia.objects.get_or_create(
                     empleado=empleado,
@@ -158,86 +537,30 @@ class RegistroAsistenciaViewSet(viewsets.ModelViewSet):
         # Actualizar según el tipo
         if tipo == 'entrada':
             if registro.hora_entrada:
-                return Response({
-                    'success': False,
-                    'message': f'Ya hay una entrada registrada hoy a las {registro.hora_entrada}'
-                }, status=status.HTTP_400_BAD_REQUEST)
+                return None, f'Ya hay una entrada registrada hoy a las {registro.hora_entrada}'
             registro.hora_entrada = ahora
         else:  # salida
             if not registro.hora_entrada:
-                return Response({
-                    'success': False,
-                    'message': 'No hay entrada registrada para marcar salida'
-                }, status=status.HTTP_400_BAD_REQUEST)
+                return None, 'No hay entrada registrada para marcar salida'
             if registro.hora_salida:
-                return Response({
-                    'success': False,
-                    'message': f'Ya hay una salida registrada hoy a las {registro.hora_salida}'
-                }, status=status.HTTP_400_BAD_REQUEST)
+                return None, f'Ya hay una salida registrada hoy a las {registro.hora_salida}'
             registro.hora_salida = ahora
         
-        # Guardar foto
-        registro.foto_registro = foto
+        # Foto (las marcas sincronizadas con embedding no traen foto): se
+        # sube en segundo plano después de confirmar la marca
+        if foto is not None:
+            FotoRegistroService.asignar(registro, foto)
         registro.reconocimiento_facial = True
         registro.confianza_reconocimiento = confianza
         registro.save()
-        
-        return Response({
-            'success': True,
-            'message': f'{tipo.capitalize()} registrada exitosamente',
-            'empleado': empleado.nombre_completo,
-            'codigo': empleado.codigo_empleado,
-            'confianza': f'{confianza:.1f}%',
-            'hora': ahora.strftime('%H:%M:%S'),
-            'registro': RegistroAsistenciaSerializer(registro).data
-        }, status=status.HTTP_200_OK)
+
+        return registro, None
 
     def _es_turno_nocturno(self, empleado, fecha):
         """
-        Verifica si el empleado tiene un turno nocturno para la fecha dada.
-        Busca en: RolMensual, Horario con turno, AsignacionTurno
+        Verifica si el empleado tiene un turno nocturno para la fecha dada
+        (RolMensual > Horario > AsignacionTurno, ver ScheduleResolver).
         """
-        from turnos.models import RolMensual, AsignacionTurno
-
-        # 1. Buscar en RolMensual (mayor prioridad)
-        try:
-            rol = RolMensual.objects.select_related('turno').get(
-                empleado=empleado,
-                fecha=fecha,
-                es_descanso=False,
-                turno__isnull=False
-            )
-            if rol.turno and rol.turno.cruza_medianoche:
-                return True
-        except RolMensual.DoesNotExist:
-            pass
-
-        # 2. Buscar en Horario del día de la semana
-        dia_semana = fecha.isoweekday()  # 1=Lunes, 7=Domingo
-        try:
-            horario = empleado.horarios.select_related('turno').get(
-                dia_semana=dia_semana,
-                activo=True
-            )
-            if horario.turno and horario.turno.cruza_medianoche:
-                return True
-            # Si no tiene turno pero las horas indican turno nocturno
-            if horario.hora_salida < horario.hora_entrada:
-                return True
-        except:
-            pass
-
-        # 3. Buscar en AsignacionTurno
-        asignaciones = AsignacionTurno.objects.filter(
-            empleado=empleado,
-            activo=True,
-            fecha_inicio__lte=fecha
-        ).filter(
-            models.Q(fecha_fin__isnull=True) | models.Q(fecha_fin__gte=fecha)
-        ).select_related('turno')
-
-        for asignacion in asignaciones:
-            if asignacion.aplica_en_fecha(fecha) and asignacion.turno.cruza_medianoche:
-                return True
+        from turnos.services import ScheduleResolver
 
-        return False
+        return ScheduleResolver([empleado], fecha).es_turno_nocturno(empleado, fecha)
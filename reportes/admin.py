@@ -2,7 +2,7 @@
 Configuración del admin para reportes
 """
 from django.contrib import admin
-from reportes.models import ConfiguracionReporte, DestinatarioReporte, HistorialReporte
+from reportes.models import ConfiguracionReporte, DestinatarioReporte, HistorialReporte, TrabajoReporte
 
 
 @admin.register(ConfiguracionReporte)
@@ -96,3 +96,23 @@ class HistorialReporteAdmin(admin.ModelAdmin):
     def has_delete_permission(self, request, obj=None):
         # Permitir eliminar solo para limpiar historial antiguo
         return request.user.is_superuser
+
+
+@admin.register(TrabajoReporte)
+class TrabajoReporteAdmin(admin.ModelAdmin):
+    """Admin para los trabajos de generación de reportes"""
+    
+    list_display = ['id', 'fecha_creacion', 'fecha_inicio', 'fecha_fin', 'estado', 'progreso', 'enviar_correo']
+    list_filter = ['estado', 'enviar_correo', 'fecha_creacion']
+    ordering = ['-fecha_creacion']
+    date_hierarchy = 'fecha_creacion'
+    
+    readonly_fields = [
+        'fecha_inicio', 'fecha_fin', 'enviar_correo', 'estado', 'progreso', 'etapa',
+        'archivo', 'mensaje_error', 'solicitado_por', 'fecha_creacion',
+        'fecha_inicio_proceso', 'fecha_fin_proceso'
+    ]
+    
+    def has_add_permission(self, request):
+        # Los trabajos se crean desde la API
+        return False
@@ -0,0 +1,40 @@
+# Generated by Django 6.0 on 2026-10-17 01:26
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reportes', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TrabajoReporte',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fecha_inicio', models.DateField(verbose_name='Fecha Inicio del Periodo')),
+                ('fecha_fin', models.DateField(verbose_name='Fecha Fin del Periodo')),
+                ('enviar_correo', models.BooleanField(default=False, help_text='Al terminar, envía el reporte a los destinatarios activos', verbose_name='Enviar por Correo')),
+                ('estado', models.CharField(choices=[('pendiente', 'Pendiente'), ('procesando', 'Procesando'), ('completado', 'Completado'), ('error', 'Error')], default='pendiente', max_length=20, verbose_name='Estado')),
+                ('progreso', models.PositiveSmallIntegerField(default=0, verbose_name='Progreso (%)')),
+                ('etapa', models.CharField(blank=True, max_length=100, verbose_name='Etapa')),
+                ('archivo', models.CharField(blank=True, help_text='Ruta del archivo dentro de ReportesStorage', max_length=255, verbose_name='Archivo')),
+                ('mensaje_error', models.TextField(blank=True, verbose_name='Mensaje de Error')),
+                ('fecha_creacion', models.DateTimeField(auto_now_add=True)),
+                ('fecha_inicio_proceso', models.DateTimeField(blank=True, null=True, verbose_name='Inicio del Proceso')),
+                ('fecha_fin_proceso', models.DateTimeField(blank=True, null=True, verbose_name='Fin del Proceso')),
+                ('solicitado_por', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='trabajos_reporte', to=settings.AUTH_USER_MODEL, verbose_name='Solicitado por')),
+            ],
+            options={
+                'verbose_name': 'Trabajo de Reporte',
+                'verbose_name_plural': 'Trabajos de Reportes',
+                'ordering': ['-fecha_creacion'],
+                'indexes': [models.Index(fields=['estado', 'fecha_creacion'], name='reportes_tr_estado_b191d5_idx')],
+            },
+        ),
+    ]
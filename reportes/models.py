@@ -121,3 +121,64 @@ class HistorialReporte(models.Model):
     
     def __str__(self):
         return f"Reporte {self.fecha_inicio} - {self.fecha_fin} ({self.estado})"
+
+
+class TrabajoReporte(models.Model):
+    """Generación asíncrona de un reporte Excel (y su envío opcional por correo)"""
+    
+    ESTADO_CHOICES = [
+        ('pendiente', 'Pendiente'),
+        ('procesando', 'Procesando'),
+        ('completado', 'Completado'),
+        ('error', 'Error'),
+    ]
+    
+    fecha_inicio = models.DateField(verbose_name='Fecha Inicio del Periodo')
+    fecha_fin = models.DateField(verbose_name='Fecha Fin del Periodo')
+    enviar_correo = models.BooleanField(
+        default=False,
+        verbose_name='Enviar por Correo',
+        help_text='Al terminar, envía el reporte a los destinatarios activos'
+    )
+    estado = models.CharField(
+        max_length=20,
+        choices=ESTADO_CHOICES,
+        default='pendiente',
+        verbose_name='Estado'
+    )
+    progreso = models.PositiveSmallIntegerField(default=0, verbose_name='Progreso (%)')
+    etapa = models.CharField(max_length=100, blank=True, verbose_name='Etapa')
+    archivo = models.CharField(
+        max_length=255,
+        blank=True,
+        verbose_name='Archivo',
+        help_text='Ruta del archivo dentro de ReportesStorage'
+    )
+    mensaje_error = models.TextField(blank=True, verbose_name='Mensaje de Error')
+    solicitado_por = models.ForeignKey(
+        'auth.User',
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='trabajos_reporte',
+        verbose_name='Solicitado por'
+    )
+    
+    fecha_creacion = models.DateTimeField(auto_now_add=True)
+    fecha_inicio_proceso = models.DateTimeField(null=True, blank=True, verbose_name='Inicio del Proceso')
+    fecha_fin_proceso = models.DateTimeField(null=True, blank=True, verbose_name='Fin del Proceso')
+    
+    class Meta:
+        verbose_name = 'Trabajo de Reporte'
+        verbose_name_plural = 'Trabajos de Reportes'
+        ordering = ['-fecha_creacion']
+        indexes = [
+            models.Index(fields=['estado', 'fecha_creacion']),
+        ]
+    
+    def __str__(self):
+        return f"Trabajo #{self.pk} {self.fecha_inicio} - {self.fecha_fin} ({self.estado})"
+    
+    @property
+    def terminado(self):
+        return self.estado in ('completado', 'error')
@@ -48,7 +48,13 @@ def verificar_ausencias_job():
     MEXICO_TZ = ZoneInfo('America/Mexico_City')
     ahora_mexico = timezone.now().astimezone(MEXICO_TZ)
 
-    ausentes = AusenciasAlertService.obtener_ausentes(ahora_mexico)
+    estadisticas = {}
+    ausentes = AusenciasAlertService.obtener_ausentes(ahora_mexico, estadisticas=estadisticas)
+    print(
+        f"[{ahora_mexico.strftime('%H:%M')}] Verificación de ausencias: "
+        f"{estadisticas['ausentes']} ausente(s), {estadisticas['filas_leidas']} filas leídas, "
+        f"{estadisticas['consultas']} consultas, {estadisticas['ms']} ms"
+    )
 
     if not ausentes:
         return
@@ -60,6 +66,68 @@ def verificar_ausencias_job():
         print(f"[{ahora_mexico.strftime('%H:%M')}] ✗ Error alerta ausencias: {resultado['message']}")
 
 
+@util.close_old_connections
+def materializar_turnos_job():
+    """
+    Corre diario. Extiende el horizonte de TurnoEsperado para que los días
+    que entran al rango ya estén materializados.
+    """
+    from empleados.models import Empleado
+    from turnos.services import TurnoEsperadoService
+
+    fecha_inicio, fecha_fin = TurnoEsperadoService.horizonte()
+    total = TurnoEsperadoService.asegurar_rango(
+        Empleado.objects.filter(activo=True), fecha_inicio, fecha_fin
+    )
+    print(f"[{timezone.now()}] ✓ Turnos esperados materializados: {total}")
+
+
+@util.close_old_connections
+def reconstruir_resumenes_job():
+    """
+    Corre diario después de materializar turnos. Recalcula los resúmenes del
+    mes de ayer y del actual: ayer pasa a contar como día esperado y se
+    corrige cualquier desviación de la actualización incremental.
+    """
+    from registros.services.resumen_service import ResumenService
+
+    hoy = ResumenService.hoy()
+    total = ResumenService.reconstruir(hoy - timedelta(days=1), hoy)
+    print(f"[{timezone.now()}] ✓ Resúmenes de asistencia reconstruidos: {total} filas")
+
+
+@util.close_old_connections
+def procesar_trabajos_reporte_job():
+    """
+    Corre cada minuto. Procesa los trabajos de reporte que quedaron
+    pendientes (p. ej. tras reiniciar el proceso) y marca los interrumpidos.
+    """
+    from reportes.services.trabajos_service import TrabajoReporteService
+
+    resultado = TrabajoReporteService.procesar_pendientes()
+    if resultado['procesados'] or resultado['interrumpidos']:
+        print(
+            f"[{timezone.now()}] Trabajos de reporte: {resultado['procesados']} procesado(s), "
+            f"{resultado['interrumpidos']} interrumpido(s)"
+        )
+
+
+@util.close_old_connections
+def subir_fotos_pendientes_job():
+    """
+    Corre cada minuto. Sube las fotos de registro que siguen en el spool
+    local (almacenamiento lento o caído, o proceso reiniciado).
+    """
+    from registros.services.fotos_service import FotoRegistroService
+
+    resultado = FotoRegistroService.procesar_pendientes()
+    if resultado['subidas'] or resultado['liberados'] or resultado['pendientes']:
+        print(
+            f"[{timezone.now()}] Fotos de registro: {resultado['subidas']} subida(s), "
+            f"{resultado['pendientes']} pendiente(s), {resultado['liberados']} reclamo(s) liberado(s)"
+        )
+
+
 @util.close_old_connections
 def delete_old_job_executions(max_age=604_800):
     """
@@ -150,6 +218,46 @@ def start_scheduler():
     except Exception as e:
         print(f"Error al configurar reporte semanal: {e}")
     
+    # Job para materializar turnos esperados (diario a las 00:15)
+    scheduler.add_job(
+        materializar_turnos_job,
+        trigger=CronTrigger(hour=0, minute=15),
+        id="materializar_turnos",
+        max_instances=1,
+        replace_existing=True,
+        name="Materializar turnos esperados"
+    )
+    
+    # Job para reconstruir resúmenes de asistencia (diario a las 00:30)
+    scheduler.add_job(
+        reconstruir_resumenes_job,
+        trigger=CronTrigger(hour=0, minute=30),
+        id="reconstruir_resumenes",
+        max_instances=1,
+        replace_existing=True,
+        name="Reconstruir resúmenes de asistencia"
+    )
+    
+    # Job para trabajos de reporte pendientes (cada minuto)
+    scheduler.add_job(
+        procesar_trabajos_reporte_job,
+        trigger=CronTrigger(minute='*'),
+        id="procesar_trabajos_reporte",
+        max_instances=1,
+        replace_existing=True,
+        name="Procesar trabajos de reporte pendientes"
+    )
+    
+    # Job para fotos de registro pendientes de subir (cada minuto)
+    scheduler.add_job(
+        subir_fotos_pendientes_job,
+        trigger=CronTrigger(minute='*'),
+        id="subir_fotos_pendientes",
+        max_instances=1,
+        replace_existing=True,
+        name="Subir fotos de registro pendientes"
+    )
+    
     # Job para limpiar ejecuciones antiguas (diario a las 00:00)
     scheduler.add_job(
         delete_old_job_executions,
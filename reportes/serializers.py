@@ -1,8 +1,11 @@
 """
 Serializers para la API de reportes
 """
+from datetime import timedelta
+from django.utils import timezone
 from rest_framework import serializers
-from reportes.models import ConfiguracionReporte, DestinatarioReporte, HistorialReporte
+from reportes.models import ConfiguracionReporte, DestinatarioReporte, HistorialReporte, TrabajoReporte
+from reportes.services.trabajos_service import TrabajoReporteService
 
 
 class ConfiguracionReporteSerializer(serializers.ModelSerializer):
@@ -60,3 +63,52 @@ class HistorialReporteSerializer(serializers.ModelSerializer):
             'numero_empleados'
         ]
         read_only_fields = '__all__'
+
+
+class TrabajoReporteSerializer(serializers.ModelSerializer):
+    """Serializer para consultar el estado de un trabajo de reporte"""
+    
+    estado_display = serializers.CharField(source='get_estado_display', read_only=True)
+    url_descarga = serializers.SerializerMethodField()
+    
+    class Meta:
+        model = TrabajoReporte
+        fields = [
+            'id',
+            'fecha_inicio',
+            'fecha_fin',
+            'enviar_correo',
+            'estado',
+            'estado_display',
+            'progreso',
+            'etapa',
+            'mensaje_error',
+            'url_descarga',
+            'fecha_creacion',
+            'fecha_inicio_proceso',
+            'fecha_fin_proceso'
+        ]
+        read_only_fields = fields
+    
+    def get_url_descarga(self, obj):
+        return TrabajoReporteService.url_descarga(obj)
+
+
+class SolicitudReporteSerializer(serializers.Serializer):
+    """Valida el periodo de un reporte solicitado; sin fechas usa la semana actual"""
+    
+    fecha_inicio = serializers.DateField(required=False)
+    fecha_fin = serializers.DateField(required=False)
+    enviar_correo = serializers.BooleanField(required=False, default=False)
+    
+    def validate(self, data):
+        if ('fecha_inicio' in data) != ('fecha_fin' in data):
+            raise serializers.ValidationError('Indique fecha_inicio y fecha_fin, o ninguna')
+        if 'fecha_inicio' not in data:
+            # Por defecto: semana actual (lunes de esta semana hasta hoy)
+            hoy = timezone.now().date()
+            data['fecha_inicio'] = hoy - timedelta(days=hoy.weekday())
+            data['fecha_fin'] = hoy
+        if data['fecha_inicio'] > data['fecha_fin']:
+            raise serializers.ValidationError('La fecha de inicio debe ser anterior a la fecha fin')
+        return data
@@ -2,106 +2,106 @@
 Servicio para detectar y notificar ausencias de empleados
 que no han registrado entrada después de 30 min de su horario.
 """
+import time
 from datetime import datetime, timedelta
 from zoneinfo import ZoneInfo
 
 from django.conf import settings
 from django.core.mail import EmailMessage
+from django.db import connection
 
 from empleados.models import Empleado
 from registros.models import RegistroAsistencia
 from reportes.models import DestinatarioReporte
+from turnos.models import TurnoEsperado
+from turnos.services import TurnoEsperadoService
 
 MEXICO_TZ = ZoneInfo('America/Mexico_City')
 
 
-def _obtener_entrada_esperada(empleado, fecha):
-    """
-    Retorna (hora_entrada, es_descanso) para el empleado en la fecha dada,
-    siguiendo la misma prioridad que RegistroAsistencia._obtener_turno_del_dia.
-    Retorna None si el empleado no tiene horario asignado para ese día.
-    """
-    from django.db.models import Q
-    from turnos.models import RolMensual, AsignacionTurno
-
-    dia_semana = fecha.isoweekday()
-
-    # 1. RolMensual (override diario)
-    try:
-        rol = RolMensual.objects.select_related('turno').get(
-            empleado=empleado,
-            fecha=fecha,
-        )
-        if rol.es_descanso:
-            return (None, True)
-        if rol.turno:
-            return (rol.turno.hora_entrada, False)
-        return None
-    except RolMensual.DoesNotExist:
-        pass
-
-    # 2. Horario por día de semana
-    try:
-        horario = empleado.horarios.get(dia_semana=dia_semana, activo=True)
-        return (horario.hora_entrada, False)
-    except Exception:
-        pass
-
-    # 3. AsignacionTurno
-    asignaciones = AsignacionTurno.objects.filter(
-        empleado=empleado,
-        activo=True,
-        fecha_inicio__lte=fecha,
-    ).filter(
-        Q(fecha_fin__isnull=True) | Q(fecha_fin__gte=fecha)
-    ).select_related('turno')
-
-    for asignacion in asignaciones:
-        if asignacion.aplica_en_fecha(fecha):
-            return (asignacion.turno.hora_entrada, False)
-
-    return None
-
-
 class AusenciasAlertService:
 
     @staticmethod
-    def obtener_ausentes(ahora_mexico):
+    def obtener_ausentes(ahora_mexico, estadisticas=None):
         """
         Retorna empleados cuya hora_entrada_esperada + 30 min cayó en la ventana
         (ahora - 60min, ahora - 30min] y no han registrado entrada hoy.
+
+        Se resuelve en un número constante de consultas, sin importar cuántos
+        empleados haya: turnos esperados de hoy, entradas de hoy y empleados
+        ausentes.
+
+        Args:
+            ahora_mexico: datetime actual en zona horaria de México
+            estadisticas: Diccionario opcional donde se registran duración (ms),
+                consultas y filas leídas
         """
-        hoy = ahora_mexico.date()
-        ahora_dt = datetime.combine(hoy, ahora_mexico.time())
-        ventana_inicio = ahora_dt - timedelta(minutes=60)
-        ventana_fin = ahora_dt - timedelta(minutes=30)
-
-        empleados_activos = Empleado.objects.filter(activo=True).prefetch_related('horarios')
-
-        ausentes = []
-        for empleado in empleados_activos:
-            info = _obtener_entrada_esperada(empleado, hoy)
-            if not info:
-                continue
-            hora_entrada, es_descanso = info
-            if es_descanso or hora_entrada is None:
-                continue
-
-            entrada_dt = datetime.combine(hoy, hora_entrada)
-            if not (ventana_inicio < entrada_dt <= ventana_fin):
-                continue
-
-            tiene_entrada = RegistroAsistencia.objects.filter(
-                empleado=empleado,
-                fecha=hoy,
-                hora_entrada__isnull=False,
-            ).exists()
-
-            if not tiene_entrada:
-                ausentes.append({
-                    'empleado': empleado,
-                    'hora_esperada': hora_entrada,
-                })
+        inicio = time.perf_counter()
+        consultas = []
+
+        def contar_consulta(execute, sql, params, many, context):
+            consultas.append(sql)
+            return execute(sql, params, many, context)
+
+        with connection.execute_wrapper(contar_consulta):
+            hoy = ahora_mexico.date()
+            ahora_dt = datetime.combine(hoy, ahora_mexico.time())
+            ventana_inicio = ahora_dt - timedelta(minutes=60)
+            ventana_fin = ahora_dt - timedelta(minutes=30)
+
+            empleados_activos = Empleado.objects.filter(activo=True)
+            TurnoEsperadoService.asegurar_rango(empleados_activos, hoy, hoy)
+
+            # Entradas esperadas de hoy de todos los empleados (una consulta)
+            esperados = list(
+                TurnoEsperado.objects.filter(
+                    empleado__activo=True,
+                    fecha=hoy,
+                    hora_entrada__isnull=False,
+                    es_descanso=False,
+                ).values_list('empleado_id', 'hora_entrada')
+            )
+
+            # Filtro de ventana en memoria
+            candidatos = {
+                empleado_id: hora_entrada
+                for empleado_id, hora_entrada in esperados
+                if ventana_inicio < datetime.combine(hoy, hora_entrada) <= ventana_fin
+            }
+
+            # Entradas de hoy de los candidatos (una consulta)
+            con_entrada = set()
+            if candidatos:
+                con_entrada = set(
+                    RegistroAsistencia.objects.filter(
+                        empleado_id__in=candidatos.keys(),
+                        fecha=hoy,
+                        hora_entrada__isnull=False,
+                    ).values_list('empleado_id', flat=True)
+                )
+
+            ausentes_ids = [empleado_id for empleado_id in candidatos if empleado_id not in con_entrada]
+            ausentes = []
+            if ausentes_ids:
+                empleados = Empleado.objects.filter(
+                    id__in=ausentes_ids
+                ).select_related('user').order_by('codigo_empleado')
+                ausentes = [
+                    {
+                        'empleado': empleado,
+                        'hora_esperada': candidatos[empleado.id],
+                    }
+                    for empleado in empleados
+                ]
+
+        if estadisticas is not None:
+            estadisticas.update({
+                'ms': round((time.perf_counter() - inicio) * 1000, 2),
+                'consultas': len(consultas),
+                'filas_leidas': len(esperados) + len(con_entrada) + len(ausentes),
+                'candidatos': len(candidatos),
+                'ausentes': len(ausentes),
+            })
 
         return ausentes
 
@@ -0,0 +1,158 @@
+"""
+Caché de archivos Excel generados, direccionada por contenido
+
+La clave de un reporte combina el periodo con una huella de los datos que
+lo alimentan: conteo, suma de ids y último fecha_actualizacion de los
+registros del periodo, de los turnos esperados del periodo, de los
+resúmenes mensuales de sus meses y de los empleados, más el contenido de
+los usuarios de los empleados (los nombres salen de auth.User, que no tiene
+fecha de actualización). Cualquier alta, baja o edición (save()) de un
+registro del periodo cambia la huella, así que un archivo viejo ya no puede
+encontrarse.
+"""
+import hashlib
+import json
+import logging
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db.models import Count, Max, Q, Sum
+
+from checador.storage_backends import ReportesStorage, storage_compartido
+from empleados.models import Empleado
+from registros.models import RegistroAsistencia, ResumenMensual
+from turnos.models import TurnoEsperado
+
+logger = logging.getLogger(__name__)
+
+
+class ReporteCacheService:
+    """Busca y guarda reportes generados en ReportesStorage"""
+
+    CARPETA = 'cache'
+
+    # Subir cuando cambie el formato del Excel para invalidar lo ya guardado
+    VERSION_FORMATO = 1
+
+    @staticmethod
+    def huella(fecha_inicio, fecha_fin):
+        """
+        Versión de los datos del periodo (5 consultas)
+
+        Returns:
+            dict: Agregados de registros, turnos esperados, resúmenes
+            mensuales, empleados y usuarios
+        """
+        def agregados(queryset):
+            datos = queryset.aggregate(
+                filas=Count('id'),
+                suma_ids=Sum('id'),
+                ultima=Max('fecha_actualizacion')
+            )
+            return [
+                datos['filas'],
+                datos['suma_ids'] or 0,
+                datos['ultima'].isoformat() if datos['ultima'] else None
+            ]
+
+        periodo = {'fecha__gte': fecha_inicio, 'fecha__lte': fecha_fin}
+        meses = Q()
+        anio, mes = fecha_inicio.year, fecha_inicio.month
+        while (anio, mes) <= (fecha_fin.year, fecha_fin.month):
+            meses |= Q(anio=anio, mes=mes)
+            anio, mes = (anio + 1, 1) if mes == 12 else (anio, mes + 1)
+
+        # Nombres tal como salen en el reporte
+        usuarios = hashlib.sha256()
+        for fila in User.objects.filter(empleado__isnull=False).order_by('pk').values_list(
+            'pk', 'username', 'first_name', 'last_name'
+        ):
+            usuarios.update(json.dumps(fila).encode())
+
+        return {
+            'registros': agregados(RegistroAsistencia.objects.filter(**periodo)),
+            'turnos': agregados(TurnoEsperado.objects.filter(**periodo)),
+            'resumenes': agregados(ResumenMensual.objects.filter(meses)),
+            'empleados': agregados(Empleado.objects.all()),
+            'usuarios': usuarios.hexdigest(),
+        }
+
+    @staticmethod
+    def nombre(fecha_inicio, fecha_fin, huella):
+        """Ruta en ReportesStorage del archivo para el periodo y la huella dados"""
+        contenido = json.dumps(
+            {
+                'version': ReporteCacheService.VERSION_FORMATO,
+                'periodo': [fecha_inicio.isoformat(), fecha_fin.isoformat()],
+                'huella': huella,
+            },
+            sort_keys=True
+        )
+        digest = hashlib.sha256(contenido.encode()).hexdigest()[:32]
+        return f'{ReporteCacheService._prefijo(fecha_inicio, fecha_fin)}{digest}.xlsx'
+
+    @staticmethod
+    def _prefijo(fecha_inicio, fecha_fin):
+        return (
+            f'{ReporteCacheService.CARPETA}/'
+            f'{fecha_inicio.strftime("%Y%m%d")}_{fecha_fin.strftime("%Y%m%d")}_'
+        )
+
+    @staticmethod
+    def obtener_o_generar(excel_service, progreso=None):
+        """
+        Devuelve el Excel del periodo de excel_service desde la caché o, si
+        no existe para la huella actual, lo genera y lo guarda.
+
+        Args:
+            excel_service: ExcelReportService del periodo
+            progreso: Callable opcional progreso(porcentaje, etapa)
+
+        Returns:
+            tuple: (archivo posicionado al inicio, nombre en ReportesStorage
+            o None si no se guardó, True si fue un acierto de caché)
+        """
+        fecha_inicio, fecha_fin = excel_service.fecha_inicio, excel_service.fecha_fin
+
+        if not getattr(settings, 'REPORTES_CACHE_ACTIVO', True):
+            return excel_service.generar_reporte_completo(progreso=progreso), None, False
+
+        huella = ReporteCacheService.huella(fecha_inicio, fecha_fin)
+        nombre = ReporteCacheService.nombre(fecha_inicio, fecha_fin, huella)
+        storage = storage_compartido(ReportesStorage)
+
+        if storage.exists(nombre):
+            logger.info(f"♻️ Reporte en caché: {nombre}")
+            if progreso:
+                progreso(90, 'Reutilizando archivo en caché')
+            return storage.open(nombre, 'rb'), nombre, True
+
+        archivo = excel_service.generar_reporte_completo(progreso=progreso)
+
+        # Si los datos cambiaron mientras se generaba, el archivo no
+        # corresponde a la huella calculada: se entrega, pero no se guarda
+        if ReporteCacheService.huella(fecha_inicio, fecha_fin) != huella:
+            logger.warning(f"⚠️ Datos modificados durante la generación; no se guarda en caché {nombre}")
+            return archivo, None, False
+
+        if progreso:
+            progreso(95, 'Subiendo archivo')
+        storage.save(nombre, archivo)
+        archivo.seek(0)
+        ReporteCacheService._eliminar_versiones_anteriores(storage, fecha_inicio, fecha_fin, nombre)
+        logger.info(f"💾 Reporte guardado en caché: {nombre}")
+        return archivo, nombre, False
+
+    @staticmethod
+    def _eliminar_versiones_anteriores(storage, fecha_inicio, fecha_fin, vigente):
+        """Borra los archivos del mismo periodo con huellas anteriores"""
+        prefijo = ReporteCacheService._prefijo(fecha_inicio, fecha_fin)
+        carpeta, inicio_nombre = prefijo.rsplit('/', 1)
+        try:
+            _, archivos = storage.listdir(carpeta)
+            for archivo in archivos:
+                ruta = f'{carpeta}/{archivo}'
+                if archivo.startswith(inicio_nombre) and ruta != vigente:
+                    storage.delete(ruta)
+        except Exception as e:
+            logger.error(f"❌ Error limpiando caché de reportes {prefijo}: {e}")
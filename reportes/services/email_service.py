@@ -7,6 +7,7 @@ from django.template.loader import render_to_string
 from django.conf import settings
 
 from reportes.models import DestinatarioReporte, ConfiguracionReporte, HistorialReporte
+from reportes.services.cache_service import ReporteCacheService
 from reportes.services.excel_service import ExcelReportService
 
 
@@ -25,10 +26,14 @@ class EmailReportService:
         self.fecha_fin = fecha_fin
         self.excel_service = ExcelReportService(fecha_inicio, fecha_fin)
 
-    def enviar_reporte_semanal(self):
+    def enviar_reporte_semanal(self, excel_file=None):
         """
         Envía el reporte semanal a todos los destinatarios activos
 
+        Args:
+            excel_file: Archivo Excel ya generado por self.excel_service
+                (por ejemplo, por un TrabajoReporte). Si no se indica, se genera aquí.
+
         Returns:
             dict: Resultado del envío con estado y mensaje
         """
@@ -49,10 +54,12 @@ class EmailReportService:
                     'message': 'El envío de reportes está desactivado'
                 }
 
-            # Generar archivo Excel
-            excel_file = self.excel_service.generar_reporte_completo()
+            # Generar archivo Excel, o reutilizarlo si los datos del periodo no cambiaron
+            if excel_file is None:
+                excel_file, _, _ = ReporteCacheService.obtener_o_generar(self.excel_service)
 
-            # Obtener datos para el correo
+            # Datos para el correo: reutilizan el mismo resumen (si el Excel
+            # salió de la caché, aquí se calcula por primera vez)
             top_retardos = self.excel_service.obtener_top_retardos(5)
             empleados_faltas = self.excel_service.obtener_empleados_con_faltas()
 
@@ -87,6 +94,7 @@ class EmailReportService:
             # Adjuntar archivo Excel
             filename = f'reporte_asistencias_{self.fecha_inicio.strftime("%Y%m%d")}_{self.fecha_fin.strftime("%Y%m%d")}.xlsx'
             email.attach(filename, excel_file.read(), 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
+            excel_file.close()
 
             # Enviar
             email.send(fail_silently=False)
@@ -1,15 +1,26 @@
 """
 Servicio para generar reportes en Excel
+
+El libro se genera en modo write_only de openpyxl: las filas se escriben en
+orden y se descartan, los estilos son NamedStyle compartidos y el archivo se
+guarda en un SpooledTemporaryFile, así que la memoria no crece con la
+longitud del periodo.
 """
+import tempfile
 from datetime import datetime, timedelta
-from io import BytesIO
-from django.db.models import Count, Q, Sum
+from django.conf import settings
+from django.db.models import Count, Exists, F, IntegerField, OuterRef, Q, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
 from openpyxl import Workbook
-from openpyxl.styles import Font, Alignment, PatternFill, Border, Side
-from openpyxl.utils import get_column_letter
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Font, Alignment, PatternFill, Border, Side, NamedStyle
+from openpyxl.worksheet.cell_range import CellRange
 
 from empleados.models import Empleado
 from registros.models import RegistroAsistencia
+from registros.services.resumen_service import ResumenService
+from turnos.models import TurnoEsperado
+from turnos.services import TurnoEsperadoService
 
 
 class ExcelReportService:
@@ -20,6 +31,9 @@ class ExcelReportService:
     COLOR_TOP_RETARDOS = 'FFFFC000'
     COLOR_FALTAS = 'FFFF0000'
     
+    # Filas del detalle que se leen por lote de la base de datos
+    TAMANO_LOTE_DETALLE = 2000
+    
     def __init__(self, fecha_inicio, fecha_fin):
         """
         Inicializa el servicio
@@ -30,73 +44,92 @@ class ExcelReportService:
         """
         self.fecha_inicio = fecha_inicio
         self.fecha_fin = fecha_fin
-        self.workbook = Workbook()
+        self.workbook = None
+        self._resumen = None
+        self._progreso = lambda porcentaje, etapa: None
         
-    def generar_reporte_completo(self):
+    def generar_reporte_completo(self, progreso=None):
         """
         Genera el reporte completo con dos hojas:
         1. Concentrado: resumen por empleado
         2. Detalle: todos los registros
         
+        Args:
+            progreso: Callable opcional progreso(porcentaje, etapa) que se
+                invoca al avanzar cada hoja y cada lote del detalle
+        
         Returns:
-            BytesIO: Archivo Excel en memoria
+            SpooledTemporaryFile: Archivo Excel posicionado al inicio (en
+            memoria hasta REPORTES_SPOOL_MAX_BYTES, después en disco)
         """
-        # Eliminar hoja por defecto
-        if 'Sheet' in self.workbook.sheetnames:
-            self.workbook.remove(self.workbook['Sheet'])
+        self._progreso = progreso or (lambda porcentaje, etapa: None)
+        self.workbook = Workbook(write_only=True)
+        self._registrar_estilos()
         
         # Crear hojas
+        self._progreso(5, 'Concentrado')
         self._crear_hoja_concentrado()
-        self._crear_hoja_detalle()
+        self._progreso(30, 'Detalle de registros')
+        self._crear_hoja_detalle(con_progreso=progreso is not None)
         
-        # Guardar en memoria
-        output = BytesIO()
+        self._progreso(90, 'Guardando archivo')
+        output = tempfile.SpooledTemporaryFile(
+            max_size=getattr(settings, 'REPORTES_SPOOL_MAX_BYTES', 8 * 1024 * 1024),
+            suffix='.xlsx'
+        )
         self.workbook.save(output)
         output.seek(0)
         return output
     
-    def _crear_hoja_concentrado(self):
-        """Crea la hoja de concentrado con resumen por empleado"""
-        ws = self.workbook.create_sheet('Concentrado', 0)
+    def _registrar_estilos(self):
+        """Registra los estilos con nombre que comparten todas las celdas"""
+        borde = Side(style='thin')
+        bordes = Border(left=borde, right=borde, top=borde, bottom=borde)
         
-        # Título del reporte
-        ws.merge_cells('A1:F1')
-        titulo_cell = ws['A1']
-        titulo_cell.value = f'Reporte de Asistencias - {self.fecha_inicio.strftime("%d/%m/%Y")} al {self.fecha_fin.strftime("%d/%m/%Y")}'
-        titulo_cell.font = Font(size=14, bold=True)
-        titulo_cell.alignment = Alignment(horizontal='center', vertical='center')
+        self.workbook.add_named_style(NamedStyle(
+            name='titulo',
+            font=Font(size=14, bold=True),
+            alignment=Alignment(horizontal='center', vertical='center')
+        ))
+        self.workbook.add_named_style(NamedStyle(
+            name='encabezado',
+            font=Font(bold=True, color='FFFFFF'),
+            fill=PatternFill(start_color=self.COLOR_HEADER, end_color=self.COLOR_HEADER, fill_type='solid'),
+            alignment=Alignment(horizontal='center', vertical='center'),
+            border=bordes
+        ))
+        self.workbook.add_named_style(NamedStyle(
+            name='celda',
+            border=bordes
+        ))
+        self.workbook.add_named_style(NamedStyle(
+            name='resaltado',
+            font=Font(bold=True),
+            fill=PatternFill(start_color=self.COLOR_TOP_RETARDOS, end_color=self.COLOR_TOP_RETARDOS, fill_type='solid'),
+            border=bordes
+        ))
+    
+    @staticmethod
+    def _celda(ws, valor, estilo='celda'):
+        celda = WriteOnlyCell(ws, value=valor)
+        celda.style = estilo
+        return celda
+    
+    def _escribir_titulo(self, ws, titulo, ultima_columna):
+        """Escribe el título combinado y la fila vacía que lo separa de los encabezados"""
+        ws.merged_cells.add(CellRange(f'A1:{ultima_columna}1'))
         ws.row_dimensions[1].height = 25
+        ws.append([self._celda(ws, titulo, 'titulo')])
+        ws.append([])
+    
+    def _escribir_encabezados(self, ws, headers):
+        ws.append([self._celda(ws, header, 'encabezado') for header in headers])
+    
+    def _crear_hoja_concentrado(self):
+        """Crea la hoja de concentrado con resumen por empleado"""
+        ws = self.workbook.create_sheet('Concentrado')
         
-        # Encabezados
-        headers = ['Código', 'Nombre', 'Días Trabajados', 'Faltas', 'Retardos', 'Horas Totales']
-        for col, header in enumerate(headers, start=1):
-            cell = ws.cell(row=3, column=col)
-            cell.value = header
-            cell.font = Font(bold=True, color='FFFFFF')
-            cell.fill = PatternFill(start_color=self.COLOR_HEADER, end_color=self.COLOR_HEADER, fill_type='solid')
-            cell.alignment = Alignment(horizontal='center', vertical='center')
-        
-        # Obtener datos de empleados
-        datos_empleados = self._obtener_datos_concentrado()
-        
-        # Escribir datos
-        row = 4
-        for empleado_data in datos_empleados:
-            ws.cell(row, 1, empleado_data['codigo'])
-            ws.cell(row, 2, empleado_data['nombre'])
-            ws.cell(row, 3, empleado_data['dias_trabajados'])
-            ws.cell(row, 4, empleado_data['faltas'])
-            
-            # Retardos con formato especial si están en el top 5
-            retardos_cell = ws.cell(row, 5, empleado_data['retardos'])
-            if empleado_data.get('top_retardos', False):
-                retardos_cell.fill = PatternFill(start_color=self.COLOR_TOP_RETARDOS, end_color=self.COLOR_TOP_RETARDOS, fill_type='solid')
-                retardos_cell.font = Font(bold=True)
-            
-            ws.cell(row, 6, round(empleado_data['horas_totales'], 2))
-            row += 1
-        
-        # Ajustar anchos de columna
+        # Ajustar anchos de columna (antes de escribir filas)
         ws.column_dimensions['A'].width = 12
         ws.column_dimensions['B'].width = 35
         ws.column_dimensions['C'].width = 15
@@ -104,55 +137,36 @@ class ExcelReportService:
         ws.column_dimensions['E'].width = 10
         ws.column_dimensions['F'].width = 15
         
-        # Aplicar bordes
-        self._aplicar_bordes(ws, 3, len(datos_empleados) + 3, len(headers))
-        
-    def _crear_hoja_detalle(self):
-        """Crea la hoja de detalle con todos los registros"""
-        ws = self.workbook.create_sheet('Detalle de Registros')
-        
-        # Título
-        ws.merge_cells('A1:H1')
-        titulo_cell = ws['A1']
-        titulo_cell.value = f'Detalle de Registros - {self.fecha_inicio.strftime("%d/%m/%Y")} al {self.fecha_fin.strftime("%d/%m/%Y")}'
-        titulo_cell.font = Font(size=14, bold=True)
-        titulo_cell.alignment = Alignment(horizontal='center', vertical='center')
-        ws.row_dimensions[1].height = 25
+        # Título del reporte
+        self._escribir_titulo(
+            ws,
+            f'Reporte de Asistencias - {self.fecha_inicio.strftime("%d/%m/%Y")} al {self.fecha_fin.strftime("%d/%m/%Y")}',
+            'F'
+        )
         
         # Encabezados
-        headers = ['Código', 'Nombre', 'Fecha', 'Entrada', 'Salida', 'Horas', 'Retardo', 'Notas']
-        for col, header in enumerate(headers, start=1):
-            cell = ws.cell(row=3, column=col)
-            cell.value = header
-            cell.font = Font(bold=True, color='FFFFFF')
-            cell.fill = PatternFill(start_color=self.COLOR_HEADER, end_color=self.COLOR_HEADER, fill_type='solid')
-            cell.alignment = Alignment(horizontal='center', vertical='center')
-        
-        # Obtener registros
-        registros = RegistroAsistencia.objects.filter(
-            fecha__gte=self.fecha_inicio,
-            fecha__lte=self.fecha_fin
-        ).select_related('empleado', 'empleado__user').order_by('empleado__codigo_empleado', 'fecha')
+        self._escribir_encabezados(
+            ws, ['Código', 'Nombre', 'Días Trabajados', 'Faltas', 'Retardos', 'Horas Totales']
+        )
         
         # Escribir datos
-        row = 4
-        for registro in registros:
-            ws.cell(row, 1, registro.empleado.codigo_empleado)
-            ws.cell(row, 2, registro.empleado.nombre_completo)
-            ws.cell(row, 3, registro.fecha.strftime('%d/%m/%Y'))
-            ws.cell(row, 4, registro.hora_entrada.strftime('%H:%M') if registro.hora_entrada else '-')
-            ws.cell(row, 5, registro.hora_salida.strftime('%H:%M') if registro.hora_salida else '-')
-            ws.cell(row, 6, round(registro.horas_trabajadas, 2))
-            
-            retardo_cell = ws.cell(row, 7, 'Sí' if registro.retardo else 'No')
-            if registro.retardo:
-                retardo_cell.fill = PatternFill(start_color=self.COLOR_TOP_RETARDOS, end_color=self.COLOR_TOP_RETARDOS, fill_type='solid')
-                retardo_cell.font = Font(bold=True)
-            
-            ws.cell(row, 8, registro.notas or '')
-            row += 1
+        for empleado_data in self._obtener_datos_concentrado():
+            # Retardos con formato especial si están en el top 5
+            estilo_retardos = 'resaltado' if empleado_data.get('top_retardos', False) else 'celda'
+            ws.append([
+                self._celda(ws, empleado_data['codigo']),
+                self._celda(ws, empleado_data['nombre']),
+                self._celda(ws, empleado_data['dias_trabajados']),
+                self._celda(ws, empleado_data['faltas']),
+                self._celda(ws, empleado_data['retardos'], estilo_retardos),
+                self._celda(ws, round(empleado_data['horas_totales'], 2)),
+            ])
+        
+    def _crear_hoja_detalle(self, con_progreso=False):
+        """Crea la hoja de detalle con todos los registros"""
+        ws = self.workbook.create_sheet('Detalle de Registros')
         
-        # Ajustar anchos
+        # Ajustar anchos (antes de escribir filas)
         ws.column_dimensions['A'].width = 12
         ws.column_dimensions['B'].width = 35
         ws.column_dimensions['C'].width = 12
@@ -162,76 +176,159 @@ class ExcelReportService:
         ws.column_dimensions['G'].width = 10
         ws.column_dimensions['H'].width = 30
         
-        # Aplicar bordes
-        if row > 4:
-            self._aplicar_bordes(ws, 3, row - 1, len(headers))
+        # Título
+        self._escribir_titulo(
+            ws,
+            f'Detalle de Registros - {self.fecha_inicio.strftime("%d/%m/%Y")} al {self.fecha_fin.strftime("%d/%m/%Y")}',
+            'H'
+        )
+        
+        # Encabezados
+        self._escribir_encabezados(
+            ws, ['Código', 'Nombre', 'Fecha', 'Entrada', 'Salida', 'Horas', 'Retardo', 'Notas']
+        )
+        
+        # Obtener registros en lotes (sin instanciar modelos ni cachear el queryset)
+        del_periodo = RegistroAsistencia.objects.filter(
+            fecha__gte=self.fecha_inicio,
+            fecha__lte=self.fecha_fin
+        )
+        # El conteo solo se paga si alguien sigue el avance
+        total = del_periodo.count() if con_progreso else 0
+        registros = del_periodo.order_by('empleado__codigo_empleado', 'fecha').values_list(
+            'empleado__codigo_empleado',
+            'empleado__user__first_name',
+            'empleado__user__last_name',
+            'empleado__user__username',
+            'fecha',
+            'hora_entrada',
+            'hora_salida',
+            'horas_trabajadas',
+            'retardo',
+            'notas'
+        ).iterator(chunk_size=self.TAMANO_LOTE_DETALLE)
+        
+        # Escribir datos
+        for fila, (codigo, nombre, apellido, username, fecha, hora_entrada,
+                   hora_salida, horas, retardo, notas) in enumerate(registros, 1):
+            if total and fila % self.TAMANO_LOTE_DETALLE == 0:
+                self._progreso(30 + 60 * fila // total, f'Detalle de registros ({fila}/{total})')
+            # Mismo criterio que Empleado.nombre_completo
+            nombre_completo = f'{nombre} {apellido}'.strip() or username
+            ws.append([
+                self._celda(ws, codigo),
+                self._celda(ws, nombre_completo),
+                self._celda(ws, fecha.strftime('%d/%m/%Y')),
+                self._celda(ws, hora_entrada.strftime('%H:%M') if hora_entrada else '-'),
+                self._celda(ws, hora_salida.strftime('%H:%M') if hora_salida else '-'),
+                self._celda(ws, round(horas, 2)),
+                self._celda(ws, 'Sí' if retardo else 'No', 'resaltado' if retardo else 'celda'),
+                self._celda(ws, notas or ''),
+            ])
     
-    def _obtener_datos_concentrado(self):
+    def obtener_resumen(self):
         """
-        Obtiene los datos concentrados por empleado
+        Resumen por empleado activo calculado con una sola consulta anotada
+        (días trabajados, retardos, horas y faltas del periodo). Si el periodo
+        son meses completos ya cerrados se lee de ResumenMensual en lugar de
+        los registros. Se calcula una vez por instancia y lo comparten la
+        hoja Concentrado, el top de retardos y la lista de faltas.
         
         Returns:
-            list: Lista de diccionarios con datos de cada empleado
+            list: Lista de diccionarios por empleado, ordenada por código
         """
-        # Obtener empleados activos que tienen registros en el periodo
-        empleados = Empleado.objects.filter(
-            activo=True,
-            registros__fecha__gte=self.fecha_inicio,
-            registros__fecha__lte=self.fecha_fin
-        ).distinct()
+        if self._resumen is not None:
+            return self._resumen
         
-        datos = []
-        total_dias = (self.fecha_fin - self.fecha_inicio).days + 1
+        empleados = Empleado.objects.filter(activo=True).select_related('user')
+        if self._periodo_en_meses_cerrados():
+            empleados = self._anotar_desde_resumenes(empleados)
+        else:
+            empleados = self._anotar_desde_registros(empleados)
         
-        for empleado in empleados:
-            # Registros del empleado en el periodo
-            registros = RegistroAsistencia.objects.filter(
-                empleado=empleado,
-                fecha__gte=self.fecha_inicio,
-                fecha__lte=self.fecha_fin
-            )
-            
-            dias_trabajados = registros.count()
-            retardos = registros.filter(retardo=True).count()
-            horas_totales = registros.aggregate(Sum('horas_trabajadas'))['horas_trabajadas__sum'] or 0
-            
-            # Calcular faltas (días sin registro - simplificado)
-            # En un sistema real, considerarías días laborables, vacaciones, etc.
-            faltas = max(0, total_dias - dias_trabajados)
-            
-            datos.append({
+        datos = [
+            {
                 'codigo': empleado.codigo_empleado,
                 'nombre': empleado.nombre_completo,
-                'dias_trabajados': dias_trabajados,
-                'faltas': faltas,
-                'retardos': retardos,
-                'horas_totales': horas_totales,
+                'dias_trabajados': empleado.dias_trabajados or 0,
+                'faltas': empleado.total_faltas or 0,
+                'retardos': empleado.total_retardos or 0,
+                'horas_totales': empleado.horas_totales or 0,
                 'empleado_id': empleado.id
-            })
-        
-        # Ordenar por retardos descendente y marcar top 5
-        datos.sort(key=lambda x: x['retardos'], reverse=True)
-        for i in range(min(5, len(datos))):
-            if datos[i]['retardos'] > 0:
-                datos[i]['top_retardos'] = True
+            }
+            for empleado in empleados.order_by('codigo_empleado')
+        ]
         
-        # Reordenar por código de empleado
-        datos.sort(key=lambda x: x['codigo'])
+        # Marcar top 5 de retardos
+        for empleado_data in sorted(datos, key=lambda x: x['retardos'], reverse=True)[:5]:
+            if empleado_data['retardos'] > 0:
+                empleado_data['top_retardos'] = True
         
+        self._resumen = datos
         return datos
     
-    def _aplicar_bordes(self, ws, start_row, end_row, num_cols):
-        """Aplica bordes a un rango de celdas"""
-        thin_border = Border(
-            left=Side(style='thin'),
-            right=Side(style='thin'),
-            top=Side(style='thin'),
-            bottom=Side(style='thin')
+    def _periodo_en_meses_cerrados(self):
+        """True si el periodo va del día 1 a fin de mes y ya terminó"""
+        return (
+            self.fecha_inicio.day == 1
+            and (self.fecha_fin + timedelta(days=1)).day == 1
+            and self.fecha_fin < ResumenService.hoy()
+        )
+    
+    def _anotar_desde_resumenes(self, empleados):
+        """Totales del periodo sumando las filas de ResumenMensual"""
+        meses = Q()
+        anio, mes = self.fecha_inicio.year, self.fecha_inicio.month
+        while (anio, mes) <= (self.fecha_fin.year, self.fecha_fin.month):
+            meses |= Q(resumenes_mensuales__anio=anio, resumenes_mensuales__mes=mes)
+            anio, mes = (anio + 1, 1) if mes == 12 else (anio, mes + 1)
+        
+        return empleados.annotate(
+            dias_trabajados=Sum('resumenes_mensuales__registros', filter=meses),
+            total_retardos=Sum('resumenes_mensuales__retardos', filter=meses),
+            horas_totales=Sum('resumenes_mensuales__horas_trabajadas', filter=meses),
+            total_faltas=Sum(
+                F('resumenes_mensuales__dias_esperados') - F('resumenes_mensuales__asistencias_esperadas'),
+                filter=meses
+            )
+        )
+    
+    def _anotar_desde_registros(self, empleados):
+        """Totales del periodo agregando RegistroAsistencia y TurnoEsperado"""
+        TurnoEsperadoService.asegurar_rango(empleados, self.fecha_inicio, self.fecha_fin)
+        
+        periodo = Q(registros__fecha__gte=self.fecha_inicio, registros__fecha__lte=self.fecha_fin)
+        
+        # Faltas: días laborables según su turno esperado sin registro
+        registro_del_dia = RegistroAsistencia.objects.filter(
+            empleado_id=OuterRef('empleado_id'),
+            fecha=OuterRef('fecha')
         )
+        faltas = TurnoEsperado.objects.filter(
+            empleado_id=OuterRef('pk'),
+            fecha__gte=self.fecha_inicio,
+            fecha__lte=self.fecha_fin,
+            hora_entrada__isnull=False,
+            es_descanso=False
+        ).exclude(
+            Exists(registro_del_dia)
+        ).order_by().values('empleado_id').annotate(total=Count('id')).values('total')
         
-        for row in range(start_row, end_row + 1):
-            for col in range(1, num_cols + 1):
-                ws.cell(row, col).border = thin_border
+        return empleados.annotate(
+            dias_trabajados=Count('registros', filter=periodo),
+            total_retardos=Count('registros', filter=periodo & Q(registros__retardo=True)),
+            horas_totales=Sum('registros__horas_trabajadas', filter=periodo),
+            total_faltas=Coalesce(Subquery(faltas, output_field=IntegerField()), Value(0))
+        )
+    
+    def _obtener_datos_concentrado(self):
+        """
+        Obtiene los datos concentrados por empleado
+        
+        Returns:
+            list: Empleados activos con registros en el periodo
+        """
+        return [datos for datos in self.obtener_resumen() if datos['dias_trabajados'] > 0]
     
     def obtener_top_retardos(self, limit=5):
         """
@@ -243,22 +340,16 @@ class ExcelReportService:
         Returns:
             list: Lista de diccionarios con código, nombre y cantidad de retardos
         """
-        empleados = Empleado.objects.filter(
-            activo=True,
-            registros__fecha__gte=self.fecha_inicio,
-            registros__fecha__lte=self.fecha_fin,
-            registros__retardo=True
-        ).annotate(
-            total_retardos=Count('registros', filter=Q(registros__retardo=True))
-        ).order_by('-total_retardos')[:limit]
+        con_retardos = [datos for datos in self.obtener_resumen() if datos['retardos'] > 0]
+        con_retardos.sort(key=lambda x: x['retardos'], reverse=True)
         
         return [
             {
-                'codigo': emp.codigo_empleado,
-                'nombre': emp.nombre_completo,
-                'retardos': emp.total_retardos
+                'codigo': datos['codigo'],
+                'nombre': datos['nombre'],
+                'retardos': datos['retardos']
             }
-            for emp in empleados
+            for datos in con_retardos[:limit]
         ]
     
     def obtener_empleados_con_faltas(self):
@@ -266,27 +357,14 @@ class ExcelReportService:
         Obtiene empleados que faltaron en el periodo
         
         Returns:
-            list: Lista de diccionarios con código, nombre y fechas faltantes
+            list: Lista de diccionarios con código, nombre y número de faltas
         """
-        # Simplificado: empleados activos que no tienen registros completos
-        empleados = Empleado.objects.filter(activo=True)
-        empleados_faltas = []
-        
-        for empleado in empleados:
-            registros = RegistroAsistencia.objects.filter(
-                empleado=empleado,
-                fecha__gte=self.fecha_inicio,
-                fecha__lte=self.fecha_fin
-            ).count()
-            
-            # Si tiene menos registros que días en el periodo
-            total_dias = (self.fecha_fin - self.fecha_inicio).days + 1
-            if registros < total_dias:
-                faltas = total_dias - registros
-                empleados_faltas.append({
-                    'codigo': empleado.codigo_empleado,
-                    'nombre': empleado.nombre_completo,
-                    'faltas': faltas
-                })
-        
-        return empleados_faltas
+        return [
+            {
+                'codigo': datos['codigo'],
+                'nombre': datos['nombre'],
+                'faltas': datos['faltas']
+            }
+            for datos in self.obtener_resumen()
+            if datos['faltas'] > 0
+        ]
@@ -0,0 +1,213 @@
+"""
+Servicio para generar reportes en segundo plano
+
+La petición HTTP solo crea un TrabajoReporte en estado 'pendiente'; un hilo
+del proceso (o el job periódico del scheduler, si el proceso se reinició)
+lo reclama con un UPDATE condicional, obtiene el Excel de la caché de
+ReportesStorage (o lo genera y lo guarda ahí) y, si se pidió, lo envía por
+correo. El avance se escribe en el propio trabajo para que el endpoint de
+estado lo consulte.
+"""
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+
+from checador.storage_backends import ReportesStorage, storage_compartido
+from reportes.models import TrabajoReporte
+from reportes.services.cache_service import ReporteCacheService
+from reportes.services.email_service import EmailReportService
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _obtener_executor():
+    """Executor del proceso, creado al primer uso"""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=max(1, getattr(settings, 'REPORTES_TRABAJOS_WORKERS', 1)),
+                thread_name_prefix='reportes'
+            )
+        return _executor
+
+
+class TrabajoReporteService:
+    """Encola, procesa y expone los trabajos de generación de reportes"""
+
+    CONTENT_TYPE_EXCEL = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+
+    @staticmethod
+    def encolar(fecha_inicio, fecha_fin, enviar_correo=False, usuario=None):
+        """
+        Crea el trabajo y lo manda al executor cuando la transacción confirma
+
+        Returns:
+            TrabajoReporte: Trabajo en estado 'pendiente'
+        """
+        trabajo = TrabajoReporte.objects.create(
+            fecha_inicio=fecha_inicio,
+            fecha_fin=fecha_fin,
+            enviar_correo=enviar_correo,
+            solicitado_por=usuario if usuario is not None and usuario.is_authenticated else None
+        )
+        transaction.on_commit(
+            lambda: _obtener_executor().submit(TrabajoReporteService._procesar_en_hilo, trabajo.pk)
+        )
+        logger.info(f"📥 Trabajo de reporte #{trabajo.pk} encolado ({fecha_inicio} - {fecha_fin})")
+        return trabajo
+
+    @staticmethod
+    def _procesar_en_hilo(trabajo_id):
+        close_old_connections()
+        try:
+            TrabajoReporteService.procesar(trabajo_id)
+        except Exception:
+            logger.exception(f"❌ Error inesperado en trabajo de reporte #{trabajo_id}")
+        finally:
+            close_old_connections()
+
+    @staticmethod
+    def reclamar(trabajo_id):
+        """
+        Pasa el trabajo de 'pendiente' a 'procesando' con un UPDATE
+        condicional; solo un proceso/hilo puede ganarlo.
+
+        Returns:
+            bool: True si este llamador se quedó con el trabajo
+        """
+        return TrabajoReporte.objects.filter(pk=trabajo_id, estado='pendiente').update(
+            estado='procesando',
+            progreso=0,
+            etapa='Iniciando',
+            fecha_inicio_proceso=timezone.now()
+        ) == 1
+
+    @staticmethod
+    def procesar(trabajo_id):
+        """
+        Genera, guarda y (opcionalmente) envía el reporte de un trabajo
+
+        Returns:
+            bool: True si el trabajo fue reclamado y procesado por este llamador
+        """
+        if not TrabajoReporteService.reclamar(trabajo_id):
+            return False
+
+        trabajo = TrabajoReporte.objects.get(pk=trabajo_id)
+
+        def progreso(porcentaje, etapa):
+            TrabajoReporte.objects.filter(pk=trabajo_id).update(progreso=porcentaje, etapa=etapa[:100])
+
+        email_service = EmailReportService(trabajo.fecha_inicio, trabajo.fecha_fin)
+        try:
+            excel_file, nombre, _ = ReporteCacheService.obtener_o_generar(
+                email_service.excel_service, progreso=progreso
+            )
+            if nombre is None:
+                # No quedó en caché (datos modificados a media generación o
+                # caché desactivada): se guarda solo para este trabajo
+                progreso(95, 'Subiendo archivo')
+                nombre = storage_compartido(ReportesStorage).save(TrabajoReporteService.nombre_archivo(trabajo), excel_file)
+                excel_file.seek(0)
+        except Exception as e:
+            logger.error(f"❌ Trabajo de reporte #{trabajo_id} falló: {e}")
+            TrabajoReporteService._finalizar(trabajo_id, 'error', mensaje_error=str(e))
+            return True
+
+        mensaje_error = ''
+        if trabajo.enviar_correo:
+            progreso(98, 'Enviando correo')
+            excel_file.seek(0)
+            resultado = email_service.enviar_reporte_semanal(excel_file=excel_file)
+            if not resultado['success']:
+                mensaje_error = resultado['message']
+        excel_file.close()
+
+        TrabajoReporteService._finalizar(
+            trabajo_id,
+            'error' if mensaje_error else 'completado',
+            archivo=nombre,
+            mensaje_error=mensaje_error
+        )
+        logger.info(f"✅ Trabajo de reporte #{trabajo_id} terminado: {nombre}")
+        return True
+
+    @staticmethod
+    def _finalizar(trabajo_id, estado, archivo='', mensaje_error=''):
+        close_old_connections()
+        TrabajoReporte.objects.filter(pk=trabajo_id).update(
+            estado=estado,
+            progreso=100,
+            etapa='Terminado' if estado == 'completado' else 'Con error',
+            archivo=archivo,
+            mensaje_error=mensaje_error,
+            fecha_fin_proceso=timezone.now()
+        )
+
+    @staticmethod
+    def procesar_pendientes():
+        """
+        Marca como error los trabajos interrumpidos (procesando desde hace más
+        de REPORTES_TRABAJO_TIMEOUT_MINUTOS) y procesa los pendientes que
+        ningún hilo tomó, por ejemplo tras reiniciar el proceso.
+
+        Returns:
+            dict: Conteo de trabajos interrumpidos y procesados
+        """
+        limite = timezone.now() - timedelta(
+            minutes=getattr(settings, 'REPORTES_TRABAJO_TIMEOUT_MINUTOS', 30)
+        )
+        interrumpidos = TrabajoReporte.objects.filter(
+            estado='procesando',
+            fecha_inicio_proceso__lt=limite
+        ).update(
+            estado='error',
+            mensaje_error='El proceso se interrumpió antes de terminar',
+            fecha_fin_proceso=timezone.now()
+        )
+
+        procesados = 0
+        pendientes = TrabajoReporte.objects.filter(estado='pendiente').order_by('fecha_creacion')
+        for trabajo_id in pendientes.values_list('id', flat=True):
+            if TrabajoReporteService.procesar(trabajo_id):
+                procesados += 1
+
+        return {'interrumpidos': interrumpidos, 'procesados': procesados}
+
+    @staticmethod
+    def nombre_archivo(trabajo):
+        """Ruta del archivo dentro de ReportesStorage"""
+        return (
+            f'excel/{trabajo.fecha_inicio.year}/'
+            f'reporte_asistencias_{trabajo.fecha_inicio.strftime("%Y%m%d")}_'
+            f'{trabajo.fecha_fin.strftime("%Y%m%d")}_{trabajo.pk}.xlsx'
+        )
+
+    @staticmethod
+    def url_descarga(trabajo):
+        """
+        URL firmada (expira en REPORTES_URL_EXPIRACION segundos) del archivo
+        del trabajo, o None si todavía no hay archivo
+        """
+        if not trabajo.archivo:
+            return None
+        nombre_descarga = (
+            f'reporte_asistencias_{trabajo.fecha_inicio.strftime("%Y%m%d")}_'
+            f'{trabajo.fecha_fin.strftime("%Y%m%d")}.xlsx'
+        )
+        return storage_compartido(ReportesStorage).url(
+            trabajo.archivo,
+            parameters={
+                'ResponseContentDisposition': f'attachment; filename="{nombre_descarga}"',
+                'ResponseContentType': TrabajoReporteService.CONTENT_TYPE_EXCEL,
+            }
+        )
@@ -1,3 +1,359 @@
-from django.test import TestCase
+import io
+from datetime import date, datetime, time, timedelta
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.files.storage import InMemoryStorage
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from openpyxl import load_workbook
+from rest_framework.test import APIClient
+
+from checador.testing import PresupuestoConsultasMixin
+from empleados.models import Empleado
+from horarios.models import Horario
+from registros.models import RegistroAsistencia, ResumenMensual
+from registros.services.resumen_service import ResumenService
+from reportes.models import TrabajoReporte
+from reportes.services.ausencias_service import MEXICO_TZ, AusenciasAlertService
+from reportes.services.cache_service import ReporteCacheService
+from reportes.services.excel_service import ExcelReportService
+from reportes.services.trabajos_service import TrabajoReporteService
+from turnos.models import AsignacionTurno, RolMensual, Turno
+
+
+class PresupuestoConsultasReportesTest(PresupuestoConsultasMixin, TestCase):
+    """Los reportes se resuelven en consultas constantes, no por empleado"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.hoy = date.today()
+        turno = Turno.objects.create(
+            nombre='Matutino', codigo='MAT', hora_entrada=time(8), hora_salida=time(16)
+        )
+        for i in range(15):
+            user = User.objects.create_user(f'empleado{i}', first_name='Empleado', last_name=str(i))
+            empleado = Empleado.objects.create(
+                user=user, codigo_empleado=f'E{i:03d}', departamento='Operaciones'
+            )
+            AsignacionTurno.objects.create(
+                empleado=empleado, turno=turno, fecha_inicio=cls.hoy - timedelta(days=30),
+                aplica_sabado=True, aplica_domingo=True
+            )
+            if i % 2:
+                RegistroAsistencia.objects.create(
+                    empleado=empleado, fecha=cls.hoy - timedelta(days=1),
+                    hora_entrada=time(8, 5), hora_salida=time(16)
+                )
+
+    def test_obtener_ausentes(self):
+        ahora = datetime.combine(self.hoy, time(8, 45), tzinfo=MEXICO_TZ)
+
+        # Incluye materializar los turnos esperados de hoy
+        with self.assertPresupuestoConsultas(12, max_repeticiones=1):
+            ausentes = AusenciasAlertService.obtener_ausentes(ahora)
+
+        self.assertEqual(len(ausentes), 15)
+
+    def test_obtener_resumen(self):
+        servicio = ExcelReportService(self.hoy - timedelta(days=7), self.hoy - timedelta(days=1))
+
+        with self.assertPresupuestoConsultas(12, max_repeticiones=1):
+            resumen = servicio.obtener_resumen()
+
+        self.assertEqual(len(resumen), 15)
+        self.assertEqual(sum(fila['dias_trabajados'] for fila in resumen), 7)
+
+
+class AusenciasAlertTest(TestCase):
+    """Ventana (ahora - 60 min, ahora - 30 min] de obtener_ausentes"""
+
+    @classmethod
+    def setUpTestData(cls):
+        # Lunes 19 de enero de 2026 a las 9:00: la ventana es (8:00, 8:30]
+        cls.hoy = date(2026, 1, 19)
+        cls.ahora = datetime.combine(cls.hoy, time(9), tzinfo=MEXICO_TZ)
+        cls.empleados = {}
+        for codigo, entrada in (
+            ('ANTES', time(8)),
+            ('INICIO', time(8, 1)),
+            ('LIMITE', time(8, 30)),
+            ('DESPUES', time(8, 31)),
+            ('CON_ENTRADA', time(8, 15)),
+            ('INACTIVO', time(8, 15)),
+        ):
+            empleado = Empleado.objects.create(
+                user=User.objects.create_user(codigo.lower()), codigo_empleado=codigo,
+                departamento='Operaciones', activo=codigo != 'INACTIVO'
+            )
+            Horario.objects.create(
+                empleado=empleado, dia_semana=cls.hoy.isoweekday(),
+                hora_entrada=entrada, hora_salida=time(16)
+            )
+            cls.empleados[codigo] = empleado
+        descanso = Empleado.objects.create(
+            user=User.objects.create_user('descanso'), codigo_empleado='DESCANSO', departamento='Operaciones'
+        )
+        Horario.objects.create(
+            empleado=descanso, dia_semana=cls.hoy.isoweekday(), hora_entrada=time(8, 15), hora_salida=time(16)
+        )
+        RolMensual.objects.create(empleado=descanso, fecha=cls.hoy, es_descanso=True)
+        RegistroAsistencia.objects.create(
+            empleado=cls.empleados['CON_ENTRADA'], fecha=cls.hoy, hora_entrada=time(8, 40)
+        )
+
+    def test_ventana_de_tolerancia(self):
+        estadisticas = {}
+        ausentes = AusenciasAlertService.obtener_ausentes(self.ahora, estadisticas)
+
+        self.assertEqual(
+            [(ausente['empleado'].codigo_empleado, ausente['hora_esperada']) for ausente in ausentes],
+            [('INICIO', time(8, 1)), ('LIMITE', time(8, 30))]
+        )
+        self.assertEqual(estadisticas['candidatos'], 3)
+        self.assertEqual(estadisticas['ausentes'], 2)
+
+    def test_sin_candidatos(self):
+        temprano = datetime.combine(self.hoy, time(7), tzinfo=MEXICO_TZ)
+
+        self.assertEqual(AusenciasAlertService.obtener_ausentes(temprano), [])
+
+
+class ReporteExcelTest(TestCase):
+    """Libro generado en modo write_only con estilos con nombre"""
+
+    @classmethod
+    def setUpTestData(cls):
+        turno = Turno.objects.create(nombre='Matutino', codigo='MAT', hora_entrada=time(8), hora_salida=time(16))
+        for i, entrada in enumerate((time(8), time(8, 30))):
+            empleado = Empleado.objects.create(
+                user=User.objects.create_user(f'empleado{i}', first_name='Empleado', last_name=str(i)),
+                codigo_empleado=f'E{i:03d}', departamento='Operaciones'
+            )
+            AsignacionTurno.objects.create(empleado=empleado, turno=turno, fecha_inicio=date(2026, 1, 1))
+            RegistroAsistencia.objects.create(
+                empleado=empleado, fecha=date(2026, 1, 19), hora_entrada=entrada, hora_salida=time(16)
+            )
+
+    def test_titulo_combinado_y_estilos(self):
+        progreso = []
+        servicio = ExcelReportService(date(2026, 1, 19), date(2026, 1, 23))
+
+        libro = load_workbook(servicio.generar_reporte_completo(lambda *avance: progreso.append(avance)))
+
+        self.assertEqual(libro.sheetnames, ['Concentrado', 'Detalle de Registros'])
+        concentrado = libro['Concentrado']
+        self.assertEqual(concentrado['A1'].value, 'Reporte de Asistencias - 19/01/2026 al 23/01/2026')
+        self.assertIn('A1:F1', {str(rango) for rango in concentrado.merged_cells.ranges})
+        self.assertTrue(concentrado['A1'].font.b)
+        self.assertEqual(concentrado['A1'].font.sz, 14)
+        self.assertEqual(concentrado['A1'].style, 'titulo')
+
+        self.assertEqual([celda.value for celda in concentrado[3]], [
+            'Código', 'Nombre', 'Días Trabajados', 'Faltas', 'Retardos', 'Horas Totales'
+        ])
+        self.assertEqual(concentrado['A3'].style, 'encabezado')
+        self.assertEqual(concentrado['A3'].fill.fgColor.rgb, ExcelReportService.COLOR_HEADER)
+        self.assertEqual(concentrado['A3'].border.left.style, 'thin')
+
+        # Solo el empleado con retardo queda resaltado
+        self.assertEqual([concentrado[f'E{fila}'].style for fila in (4, 5)], ['celda', 'resaltado'])
+        self.assertEqual(concentrado['E5'].fill.fgColor.rgb, ExcelReportService.COLOR_TOP_RETARDOS)
+        self.assertEqual([concentrado[f'D{fila}'].value for fila in (4, 5)], [4, 4])
+
+        detalle = libro['Detalle de Registros']
+        self.assertIn('A1:H1', {str(rango) for rango in detalle.merged_cells.ranges})
+        self.assertEqual(
+            [celda.value for celda in detalle[5]],
+            ['E001', 'Empleado 1', '19/01/2026', '08:30', '16:00', 7.5, 'Sí', None]
+        )
+        self.assertEqual(detalle['G5'].style, 'resaltado')
+        self.assertEqual(detalle.max_row, 5)
+
+        self.assertEqual(progreso[0], (5, 'Concentrado'))
+        self.assertEqual(progreso[-1], (90, 'Guardando archivo'))
+
+
+class ResumenMesCerradoTest(TestCase):
+    """Un mes cerrado da los mismos totales desde ResumenMensual que desde los registros"""
+
+    @classmethod
+    def setUpTestData(cls):
+        turno = Turno.objects.create(nombre='Matutino', codigo='MAT', hora_entrada=time(8), hora_salida=time(16))
+        marcas = {
+            # Enero de 2026: lunes 19 a domingo 25, con retardo el martes y un sábado trabajado
+            'E000': [(date(2026, 1, 19), time(8)), (date(2026, 1, 20), time(8, 30)), (date(2026, 1, 24), time(8))],
+            'E001': [(date(2026, 1, 5), time(8, 5)), (date(2026, 1, 6), None)],
+            'E002': [],
+        }
+        for codigo, dias in marcas.items():
+            empleado = Empleado.objects.create(
+                user=User.objects.create_user(codigo.lower()), codigo_empleado=codigo, departamento='Operaciones'
+            )
+            AsignacionTurno.objects.create(empleado=empleado, turno=turno, fecha_inicio=date(2026, 1, 1))
+            for fecha, entrada in dias:
+                RegistroAsistencia.objects.create(
+                    empleado=empleado, fecha=fecha, hora_entrada=entrada, hora_salida=time(16) if entrada else None
+                )
+        ResumenService.reconstruir(date(2026, 1, 1), date(2026, 1, 31))
+
+    def totales(self, empleados):
+        return {
+            empleado.codigo_empleado: (
+                empleado.dias_trabajados or 0, empleado.total_retardos or 0,
+                round(empleado.horas_totales or 0, 2), empleado.total_faltas or 0,
+            )
+            for empleado in empleados
+        }
+
+    def test_resumenes_igual_a_registros(self):
+        servicio = ExcelReportService(date(2026, 1, 1), date(2026, 1, 31))
+        self.assertTrue(servicio._periodo_en_meses_cerrados())
+        empleados = Empleado.objects.filter(activo=True)
+
+        desde_resumenes = self.totales(servicio._anotar_desde_resumenes(empleados))
+        desde_registros = self.totales(servicio._anotar_desde_registros(empleados))
+
+        self.assertEqual(desde_resumenes, desde_registros)
+        # 22 días laborables en enero de 2026
+        self.assertEqual(desde_registros, {
+            'E000': (3, 1, 23.5, 20),
+            'E001': (2, 0, 7.92, 20),
+            'E002': (0, 0, 0, 22),
+        })
+
+
+@override_settings(REPORTES_CACHE_ACTIVO=False)
+class TrabajoReporteTest(TestCase):
+    """Reclamo, avance y estado de los trabajos de reporte en segundo plano"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_user('admin', is_staff=True)
+
+    def setUp(self):
+        self.storage = InMemoryStorage()
+        parche = mock.patch('reportes.services.trabajos_service.storage_compartido', return_value=self.storage)
+        parche.start()
+        self.addCleanup(parche.stop)
+        self.trabajo = TrabajoReporte.objects.create(fecha_inicio=date(2026, 1, 19), fecha_fin=date(2026, 1, 23))
+
+    def test_reclamar_una_sola_vez(self):
+        self.assertTrue(TrabajoReporteService.reclamar(self.trabajo.pk))
+        self.assertFalse(TrabajoReporteService.reclamar(self.trabajo.pk))
+
+        self.trabajo.refresh_from_db()
+        self.assertEqual((self.trabajo.estado, self.trabajo.etapa), ('procesando', 'Iniciando'))
+        self.assertIsNotNone(self.trabajo.fecha_inicio_proceso)
+
+    def test_dos_workers_un_trabajo(self):
+        avance = []
+
+        def generar(excel_service, progreso=None):
+            # Un segundo worker toma el mismo trabajo mientras el primero genera
+            avance.append(TrabajoReporteService.procesar(self.trabajo.pk))
+            progreso(50, 'Detalle de registros')
+            trabajo = TrabajoReporte.objects.get(pk=self.trabajo.pk)
+            avance.append((trabajo.estado, trabajo.progreso, trabajo.etapa))
+            return io.BytesIO(b'xlsx'), None, False
+
+        with mock.patch.object(ReporteCacheService, 'obtener_o_generar', side_effect=generar) as obtener:
+            self.assertTrue(TrabajoReporteService.procesar(self.trabajo.pk))
+
+        obtener.assert_called_once()
+        self.assertEqual(avance, [False, ('procesando', 50, 'Detalle de registros')])
+        self.trabajo.refresh_from_db()
+        self.assertEqual((self.trabajo.estado, self.trabajo.progreso, self.trabajo.etapa), ('completado', 100, 'Terminado'))
+        self.assertEqual(self.trabajo.archivo, TrabajoReporteService.nombre_archivo(self.trabajo))
+        self.assertTrue(self.storage.exists(self.trabajo.archivo))
+
+    def test_error_al_generar(self):
+        with mock.patch.object(ReporteCacheService, 'obtener_o_generar', side_effect=RuntimeError('sin memoria')), \
+                self.assertLogs('reportes.services.trabajos_service', 'ERROR'):
+            self.assertTrue(TrabajoReporteService.procesar(self.trabajo.pk))
+
+        self.trabajo.refresh_from_db()
+        self.assertEqual((self.trabajo.estado, self.trabajo.mensaje_error), ('error', 'sin memoria'))
+        self.assertEqual(self.trabajo.archivo, '')
+
+    def test_procesar_pendientes(self):
+        interrumpido = TrabajoReporte.objects.create(
+            fecha_inicio=date(2026, 1, 19), fecha_fin=date(2026, 1, 23), estado='procesando',
+            fecha_inicio_proceso=timezone.now() - timedelta(hours=2)
+        )
+
+        resultado = TrabajoReporteService.procesar_pendientes()
+
+        self.assertEqual(resultado, {'interrumpidos': 1, 'procesados': 1})
+        interrumpido.refresh_from_db()
+        self.assertEqual(interrumpido.estado, 'error')
+        self.trabajo.refresh_from_db()
+        self.assertEqual(self.trabajo.estado, 'completado')
+        self.assertTrue(self.storage.exists(self.trabajo.archivo))
+
+    def test_endpoint_de_estado(self):
+        client = APIClient()
+        client.force_authenticate(self.admin)
+        url = f'/api/reportes/trabajos/{self.trabajo.pk}/'
+
+        respuesta = client.get(url)
+        self.assertEqual((respuesta.data['estado'], respuesta.data['progreso']), ('pendiente', 0))
+        self.assertIsNone(respuesta.data['url_descarga'])
+
+        TrabajoReporte.objects.filter(pk=self.trabajo.pk).update(
+            estado='completado', progreso=100, archivo='excel/2026/reporte.xlsx'
+        )
+        with mock.patch.object(self.storage, 'url', return_value='https://spaces/firmada', create=True) as url_firmada:
+            respuesta = client.get(url)
+
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertEqual(respuesta.data['url_descarga'], 'https://spaces/firmada')
+        self.assertEqual(url_firmada.call_args.args, ('excel/2026/reporte.xlsx',))
+        self.assertIn('attachment', url_firmada.call_args.kwargs['parameters']['ResponseContentDisposition'])
+
+    def test_crear_responde_202(self):
+        client = APIClient()
+        client.force_authenticate(self.admin)
+
+        with self.captureOnCommitCallbacks() as callbacks:
+            respuesta = client.post('/api/reportes/trabajos/', {
+                'fecha_inicio': '2026-01-19', 'fecha_fin': '2026-01-23'
+            }, format='json')
+
+        self.assertEqual(respuesta.status_code, 202)
+        self.assertEqual(respuesta['Location'], f"/api/reportes/trabajos/{respuesta.data['id']}/")
+        self.assertEqual(respuesta.data['estado'], 'pendiente')
+        # El executor se invoca solo al confirmar
+        self.assertEqual(len(callbacks), 1)
+
+
+class HuellaCacheTest(TestCase):
+    """La huella del periodo cambia con todo lo que aparece en el reporte"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.empleado = Empleado.objects.create(
+            user=User.objects.create_user('empleado', first_name='Ana'), codigo_empleado='E001',
+            departamento='Operaciones'
+        )
+        RegistroAsistencia.objects.create(empleado=cls.empleado, fecha=date(2026, 1, 19), hora_entrada=time(8))
+
+    def huella(self):
+        return ReporteCacheService.huella(date(2026, 1, 1), date(2026, 1, 31))
+
+    def test_cambia_con_el_nombre_del_usuario(self):
+        anterior = self.huella()
+        User.objects.filter(pk=self.empleado.user_id).update(first_name='Ana María')
+
+        self.assertNotEqual(self.huella(), anterior)
+
+    def test_cambia_con_los_resumenes_del_periodo(self):
+        anterior = self.huella()
+        ResumenMensual.objects.filter(empleado=self.empleado, anio=2026, mes=1).update(
+            dias_esperados=20, fecha_actualizacion=timezone.now()
+        )
+        self.assertNotEqual(self.huella(), anterior)
+
+        anterior = self.huella()
+        ResumenMensual.objects.create(empleado=self.empleado, anio=2026, mes=2, departamento='Operaciones')
+        self.assertEqual(self.huella(), anterior)
@@ -7,13 +7,15 @@ from rest_framework.routers import DefaultRouter
 from reportes.views import (
     ConfiguracionReporteViewSet,
     DestinatarioReporteViewSet,
-    HistorialReporteViewSet
+    HistorialReporteViewSet,
+    TrabajoReporteViewSet
 )
 
 router = DefaultRouter()
 router.register(r'configuracion', ConfiguracionReporteViewSet, basename='configuracion-reporte')
 router.register(r'destinatarios', DestinatarioReporteViewSet, basename='destinatario-reporte')
 router.register(r'historial', HistorialReporteViewSet, basename='historial-reporte')
+router.register(r'trabajos', TrabajoReporteViewSet, basename='trabajo-reporte')
 
 urlpatterns = [
     path('', include(router.urls)),
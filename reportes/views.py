@@ -2,19 +2,22 @@
 Vistas para la API de reportes
 """
 from datetime import datetime, timedelta
-from rest_framework import viewsets, status
+from django.urls import reverse
+from rest_framework import mixins, viewsets, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated, IsAdminUser
 from django.utils import timezone
 
-from reportes.models import ConfiguracionReporte, DestinatarioReporte, HistorialReporte
+from reportes.models import ConfiguracionReporte, DestinatarioReporte, HistorialReporte, TrabajoReporte
 from reportes.serializers import (
     ConfiguracionReporteSerializer,
     DestinatarioReporteSerializer,
-    HistorialReporteSerializer
+    HistorialReporteSerializer,
+    SolicitudReporteSerializer,
+    TrabajoReporteSerializer
 )
-from reportes.services.email_service import EmailReportService
+from reportes.services.trabajos_service import TrabajoReporteService
 
 
 class ConfiguracionReporteViewSet(viewsets.ModelViewSet):
@@ -69,13 +72,14 @@ class HistorialReporteViewSet(viewsets.ReadOnlyModelViewSet):
     @action(detail=False, methods=['post'])
     def enviar_reporte_manual(self, request):
         """
-        Envía un reporte manual para un periodo específico
+        Encola el envío de un reporte manual para un periodo específico
         
         Parámetros:
         - fecha_inicio (opcional): Fecha de inicio en formato YYYY-MM-DD
         - fecha_fin (opcional): Fecha fin en formato YYYY-MM-DD
         
-        Si no se proporcionan fechas, usa la semana anterior
+        Si no se proporcionan fechas, usa la semana actual. Responde 202 con
+        el trabajo creado; el Excel y el correo se generan en segundo plano.
         """
         fecha_inicio_str = request.data.get('fecha_inicio')
         fecha_fin_str = request.data.get('fecha_fin')
@@ -104,19 +108,48 @@ class HistorialReporteViewSet(viewsets.ReadOnlyModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-        # Enviar reporte
-        email_service = EmailReportService(fecha_inicio, fecha_fin)
-        resultado = email_service.enviar_reporte_semanal()
+        # Encolar generación y envío
+        trabajo = TrabajoReporteService.encolar(
+            fecha_inicio, fecha_fin, enviar_correo=True, usuario=request.user
+        )
         
-        if resultado['success']:
-            return Response({
-                'mensaje': resultado['message'],
-                'destinatarios': resultado.get('destinatarios', []),
-                'fecha_inicio': fecha_inicio.isoformat(),
-                'fecha_fin': fecha_fin.isoformat()
-            }, status=status.HTTP_200_OK)
-        else:
-            return Response(
-                {'error': resultado['message']},
-                status=status.HTTP_500_INTERNAL_SERVER_ERROR
-            )
+        return Response({
+            'mensaje': 'Reporte en proceso; se enviará al terminar',
+            'trabajo': TrabajoReporteSerializer(trabajo).data,
+            'url_estado': request.build_absolute_uri(
+                reverse('trabajo-reporte-detail', args=[trabajo.pk])
+            ),
+            'fecha_inicio': fecha_inicio.isoformat(),
+            'fecha_fin': fecha_fin.isoformat()
+        }, status=status.HTTP_202_ACCEPTED)
+
+
+class TrabajoReporteViewSet(mixins.CreateModelMixin, viewsets.ReadOnlyModelViewSet):
+    """
+    ViewSet para generar reportes en segundo plano
+    
+    POST crea el trabajo y responde 202 de inmediato; GET /{id}/ devuelve el
+    estado, el progreso y, al terminar, una URL firmada de descarga.
+    """
+    
+    queryset = TrabajoReporte.objects.all()
+    serializer_class = TrabajoReporteSerializer
+    permission_classes = [IsAuthenticated, IsAdminUser]
+    filterset_fields = ['estado', 'fecha_inicio', 'fecha_fin']
+    ordering = ['-fecha_creacion']
+    
+    def create(self, request, *args, **kwargs):
+        solicitud = SolicitudReporteSerializer(data=request.data)
+        solicitud.is_valid(raise_exception=True)
+        trabajo = TrabajoReporteService.encolar(
+            solicitud.validated_data['fecha_inicio'],
+            solicitud.validated_data['fecha_fin'],
+            enviar_correo=solicitud.validated_data['enviar_correo'],
+            usuario=request.user
+        )
+        serializer = self.get_serializer(trabajo)
+        return Response(
+            serializer.data,
+            status=status.HTTP_202_ACCEPTED,
+            headers={'Location': reverse('trabajo-reporte-detail', args=[trabajo.pk])}
+        )
@@ -1,6 +1,6 @@
 from django.contrib import admin
 from django import forms
-from .models import Turno, AsignacionTurno, RolMensual
+from .models import Turno, AsignacionTurno, RolMensual, TurnoEsperado
 
 
 class TurnoAdminForm(forms.ModelForm):
@@ -141,3 +141,19 @@ class RolMensualAdmin(admin.ModelAdmin):
         if not change:
             obj.creado_por = request.user
         super().save_model(request, obj, form, change)
+
+
+@admin.register(TurnoEsperado)
+class TurnoEsperadoAdmin(admin.ModelAdmin):
+    """Solo lectura: la tabla se mantiene con señales y materializar_turnos"""
+    list_display = ['empleado', 'fecha', 'turno', 'hora_entrada', 'hora_salida', 'es_descanso', 'origen']
+    list_filter = ['origen', 'es_descanso', 'fecha']
+    search_fields = ['empleado__codigo_empleado']
+    ordering = ['-fecha', 'empleado__codigo_empleado']
+    date_hierarchy = 'fecha'
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
@@ -3,3 +3,7 @@ from django.apps import AppConfig
 
 class TurnosConfig(AppConfig):
     name = 'turnos'
+
+    def ready(self):
+        """Registra las señales de la app"""
+        from turnos import signals  # noqa: F401
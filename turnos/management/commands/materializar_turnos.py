@@ -0,0 +1,69 @@
+"""
+Management command para rellenar la tabla TurnoEsperado
+"""
+from datetime import datetime, timedelta
+from django.core.management.base import BaseCommand
+
+from empleados.models import Empleado
+from turnos.services import TurnoEsperadoService
+
+
+class Command(BaseCommand):
+    help = 'Materializa el turno esperado de cada empleado por fecha (TurnoEsperado)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--fecha-inicio',
+            type=str,
+            help='Primer día (formato: YYYY-MM-DD). Por defecto: inicio del horizonte'
+        )
+        parser.add_argument(
+            '--fecha-fin',
+            type=str,
+            help='Último día (formato: YYYY-MM-DD). Por defecto: fin del horizonte'
+        )
+        parser.add_argument(
+            '--empleado',
+            type=str,
+            help='Código de empleado (por defecto: todos los activos)'
+        )
+        parser.add_argument(
+            '--dias-por-lote',
+            type=int,
+            default=31,
+            help='Días que se calculan por lote (default: 31)'
+        )
+
+    def handle(self, *args, **options):
+        fecha_inicio, fecha_fin = TurnoEsperadoService.horizonte()
+        try:
+            if options['fecha_inicio']:
+                fecha_inicio = datetime.strptime(options['fecha_inicio'], '%Y-%m-%d').date()
+            if options['fecha_fin']:
+                fecha_fin = datetime.strptime(options['fecha_fin'], '%Y-%m-%d').date()
+        except ValueError:
+            self.stdout.write(self.style.ERROR('Formato de fecha inválido. Use YYYY-MM-DD'))
+            return
+
+        if fecha_fin < fecha_inicio:
+            self.stdout.write(self.style.ERROR('La fecha fin debe ser posterior a la fecha de inicio'))
+            return
+
+        if options['empleado']:
+            empleados = Empleado.objects.filter(codigo_empleado=options['empleado'])
+        else:
+            empleados = Empleado.objects.filter(activo=True)
+        empleado_ids = list(empleados.values_list('id', flat=True))
+
+        self.stdout.write(self.style.WARNING(
+            f'Materializando turnos de {len(empleado_ids)} empleados del {fecha_inicio} al {fecha_fin}...'
+        ))
+
+        total = 0
+        inicio_lote = fecha_inicio
+        while inicio_lote <= fecha_fin:
+            fin_lote = min(fecha_fin, inicio_lote + timedelta(days=options['dias_por_lote'] - 1))
+            total += TurnoEsperadoService.materializar(empleado_ids, inicio_lote, fin_lote)
+            inicio_lote = fin_lote + timedelta(days=1)
+
+        self.stdout.write(self.style.SUCCESS(f'✓ {total} turnos esperados escritos'))
@@ -0,0 +1,38 @@
+# Generated by Django 6.0 on 2026-10-17 01:21
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('empleados', '0003_convertir_embeddings_binario'),
+        ('turnos', '0003_alter_turno_codigo'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TurnoEsperado',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fecha', models.DateField(verbose_name='Fecha')),
+                ('hora_entrada', models.TimeField(blank=True, null=True, verbose_name='Hora de Entrada')),
+                ('hora_salida', models.TimeField(blank=True, null=True, verbose_name='Hora de Salida')),
+                ('tolerancia_minutos', models.IntegerField(default=0, verbose_name='Tolerancia (minutos)')),
+                ('cruza_medianoche', models.BooleanField(default=False, verbose_name='Cruza Medianoche')),
+                ('es_descanso', models.BooleanField(default=False, verbose_name='Es Descanso')),
+                ('origen', models.CharField(blank=True, help_text='rol, horario o asignacion (vacío si no tiene horario)', max_length=10, verbose_name='Origen')),
+                ('fecha_actualizacion', models.DateTimeField(auto_now=True)),
+                ('empleado', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='turnos_esperados', to='empleados.empleado', verbose_name='Empleado')),
+                ('turno', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='turnos_esperados', to='turnos.turno', verbose_name='Turno')),
+            ],
+            options={
+                'verbose_name': 'Turno Esperado',
+                'verbose_name_plural': 'Turnos Esperados',
+                'ordering': ['fecha', 'empleado'],
+                'indexes': [models.Index(fields=['fecha', 'hora_entrada'], name='turnos_turn_fecha_0663fa_idx')],
+                'unique_together': {('empleado', 'fecha')},
+            },
+        ),
+    ]
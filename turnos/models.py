@@ -343,3 +343,82 @@ class RolMensual(models.Model):
             resultado[rol.empleado_id][rol.fecha.day] = rol
 
         return resultado
+
+
+class TurnoEsperado(models.Model):
+    """
+    Turno efectivo precalculado por empleado y fecha.
+
+    Materializa la prioridad RolMensual > Horario > AsignacionTurno para que
+    alertas, retardos y reportes lean una fila indexada en lugar de recorrer
+    la cadena. Se mantiene con señales (turnos.signals) y se rellena con el
+    comando materializar_turnos. Un día sin horario se guarda con
+    hora_entrada vacía; la ausencia de fila significa "no materializado".
+    """
+
+    empleado = models.ForeignKey(
+        Empleado,
+        on_delete=models.CASCADE,
+        related_name='turnos_esperados',
+        verbose_name='Empleado'
+    )
+    fecha = models.DateField(verbose_name='Fecha')
+    turno = models.ForeignKey(
+        Turno,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='turnos_esperados',
+        verbose_name='Turno'
+    )
+    hora_entrada = models.TimeField(
+        null=True,
+        blank=True,
+        verbose_name='Hora de Entrada'
+    )
+    hora_salida = models.TimeField(
+        null=True,
+        blank=True,
+        verbose_name='Hora de Salida'
+    )
+    tolerancia_minutos = models.IntegerField(
+        default=0,
+        verbose_name='Tolerancia (minutos)'
+    )
+    cruza_medianoche = models.BooleanField(
+        default=False,
+        verbose_name='Cruza Medianoche'
+    )
+    es_descanso = models.BooleanField(
+        default=False,
+        verbose_name='Es Descanso'
+    )
+    origen = models.CharField(
+        max_length=10,
+        blank=True,
+        verbose_name='Origen',
+        help_text='rol, horario o asignacion (vacío si no tiene horario)'
+    )
+
+    fecha_actualizacion = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = 'Turno Esperado'
+        verbose_name_plural = 'Turnos Esperados'
+        ordering = ['fecha', 'empleado']
+        unique_together = ['empleado', 'fecha']
+        indexes = [
+            models.Index(fields=['fecha', 'hora_entrada']),
+        ]
+
+    def __str__(self):
+        if self.es_descanso:
+            return f"{self.empleado_id} - {self.fecha} - Descanso"
+        if self.hora_entrada:
+            return f"{self.empleado_id} - {self.fecha} - {self.hora_entrada.strftime('%H:%M')}"
+        return f"{self.empleado_id} - {self.fecha} - Sin horario"
+
+    @property
+    def es_laborable(self):
+        """Indica si el empleado debía trabajar ese día"""
+        return bool(self.hora_entrada) and not self.es_descanso
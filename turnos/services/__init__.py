@@ -0,0 +1,4 @@
+from .schedule_resolver import ScheduleResolver, TurnoEfectivo
+from .turno_esperado import TurnoEsperadoService
+
+__all__ = ['ScheduleResolver', 'TurnoEfectivo', 'TurnoEsperadoService']
@@ -0,0 +1,201 @@
+"""
+Resolución del turno efectivo de cada empleado por fecha.
+
+Prioridad: RolMensual > Horario > AsignacionTurno.
+
+    - Un RolMensual de descanso marca el día como descanso.
+    - Un RolMensual con turno define el turno del día.
+    - Un RolMensual sin turno ni descanso no sobrescribe nada.
+
+El resolver lee primero la tabla materializada TurnoEsperado (una consulta)
+y solo si falta alguna fila precarga los tres orígenes para el conjunto de
+empleados y el rango de fechas (tres consultas más). Responde desde memoria.
+"""
+
+from datetime import date, time, timedelta
+from typing import Dict, Iterable, NamedTuple, Optional, Tuple
+
+from django.db.models import Q, QuerySet
+
+from horarios.models import Horario
+from turnos.models import AsignacionTurno, RolMensual, Turno, TurnoEsperado
+
+
+class TurnoEfectivo(NamedTuple):
+    """Turno que le toca a un empleado en una fecha"""
+    hora_entrada: Optional[time]
+    hora_salida: Optional[time]
+    tolerancia_minutos: int
+    cruza_medianoche: bool
+    es_descanso: bool = False
+    turno: Optional[Turno] = None
+    origen: str = ''  # 'rol', 'horario' o 'asignacion'
+
+
+DESCANSO = TurnoEfectivo(None, None, 0, False, es_descanso=True, origen='rol')
+
+
+class ScheduleResolver:
+    """Turnos efectivos de varios empleados en un rango de fechas"""
+
+    # Tolerancia para turnos que vienen de RolMensual o AsignacionTurno
+    TOLERANCIA_DEFAULT = 10
+
+    def __init__(self, empleados, fecha_inicio: date, fecha_fin: Optional[date] = None,
+                 usar_materializado: bool = True):
+        """
+        Args:
+            empleados: QuerySet, lista de Empleado o lista de ids
+            fecha_inicio: Primer día del rango
+            fecha_fin: Último día del rango (por defecto, fecha_inicio)
+            usar_materializado: Leer TurnoEsperado antes de calcular la cadena
+                (False para recalcular la tabla materializada)
+        """
+        self.fecha_inicio = fecha_inicio
+        self.fecha_fin = fecha_fin or fecha_inicio
+        self._filtro_empleados = self._normalizar_empleados(empleados)
+
+        self._roles: Dict[Tuple[int, date], RolMensual] = {}
+        self._horarios: Dict[Tuple[int, int], Horario] = {}
+        self._asignaciones: Dict[int, list] = {}
+        self._origenes_cargados = False
+        self._mapa: Dict[Tuple[int, date], Optional[TurnoEfectivo]] = {}
+        if usar_materializado:
+            self._cargar_materializados()
+
+    @staticmethod
+    def _normalizar_empleados(empleados):
+        if isinstance(empleados, QuerySet):
+            # Se usa como subconsulta: no agrega consultas
+            return empleados.values('pk')
+        return [getattr(empleado, 'pk', empleado) for empleado in empleados]
+
+    def _cargar_materializados(self):
+        """Carga las filas de TurnoEsperado del rango (una consulta)"""
+        filas = TurnoEsperado.objects.filter(
+            empleado_id__in=self._filtro_empleados,
+            fecha__gte=self.fecha_inicio,
+            fecha__lte=self.fecha_fin
+        ).select_related('turno')
+        for fila in filas:
+            self._mapa[(fila.empleado_id, fila.fecha)] = self.desde_materializado(fila)
+
+    @staticmethod
+    def desde_materializado(fila: TurnoEsperado) -> Optional[TurnoEfectivo]:
+        """Convierte una fila de TurnoEsperado en TurnoEfectivo (None si no tiene horario)"""
+        if fila.es_descanso:
+            return DESCANSO
+        if fila.hora_entrada is None:
+            return None
+        return TurnoEfectivo(
+            hora_entrada=fila.hora_entrada,
+            hora_salida=fila.hora_salida,
+            tolerancia_minutos=fila.tolerancia_minutos,
+            cruza_medianoche=fila.cruza_medianoche,
+            turno=fila.turno,
+            origen=fila.origen
+        )
+
+    def _cargar_origenes(self):
+        """Precarga roles, horarios y asignaciones (una consulta por origen)"""
+        self._origenes_cargados = True
+        roles = RolMensual.objects.filter(
+            empleado_id__in=self._filtro_empleados,
+            fecha__gte=self.fecha_inicio,
+            fecha__lte=self.fecha_fin
+        ).select_related('turno')
+        for rol in roles:
+            self._roles[(rol.empleado_id, rol.fecha)] = rol
+
+        horarios = Horario.objects.filter(
+            empleado_id__in=self._filtro_empleados,
+            activo=True
+        ).select_related('turno')
+        for horario in horarios:
+            self._horarios[(horario.empleado_id, horario.dia_semana)] = horario
+
+        asignaciones = AsignacionTurno.objects.filter(
+            empleado_id__in=self._filtro_empleados,
+            activo=True,
+            fecha_inicio__lte=self.fecha_fin
+        ).filter(
+            Q(fecha_fin__isnull=True) | Q(fecha_fin__gte=self.fecha_inicio)
+        ).select_related('turno').order_by('-fecha_inicio', 'id')
+        for asignacion in asignaciones:
+            self._asignaciones.setdefault(asignacion.empleado_id, []).append(asignacion)
+
+    def turno(self, empleado, fecha: date) -> Optional[TurnoEfectivo]:
+        """
+        Turno efectivo del empleado en la fecha.
+
+        Args:
+            empleado: Empleado o id
+            fecha: Fecha dentro del rango precargado
+
+        Returns:
+            TurnoEfectivo (es_descanso=True en días de descanso) o None si no
+            tiene horario asignado
+        """
+        if not (self.fecha_inicio <= fecha <= self.fecha_fin):
+            raise ValueError(
+                f'La fecha {fecha} está fuera del rango precargado '
+                f'({self.fecha_inicio} - {self.fecha_fin})'
+            )
+        empleado_id = getattr(empleado, 'pk', empleado)
+        clave = (empleado_id, fecha)
+        if clave not in self._mapa:
+            self._mapa[clave] = self._resolver(empleado_id, fecha)
+        return self._mapa[clave]
+
+    def _resolver(self, empleado_id: int, fecha: date) -> Optional[TurnoEfectivo]:
+        if not self._origenes_cargados:
+            self._cargar_origenes()
+
+        # 1. RolMensual (override diario)
+        rol = self._roles.get((empleado_id, fecha))
+        if rol is not None:
+            if rol.es_descanso:
+                return DESCANSO
+            if rol.turno:
+                return self._desde_turno(rol.turno, 'rol')
+
+        # 2. Horario del día de la semana
+        horario = self._horarios.get((empleado_id, fecha.isoweekday()))
+        if horario is not None:
+            return TurnoEfectivo(
+                hora_entrada=horario.hora_entrada,
+                hora_salida=horario.hora_salida,
+                tolerancia_minutos=horario.tolerancia_minutos,
+                cruza_medianoche=horario.cruza_medianoche,
+                turno=horario.turno,
+                origen='horario'
+            )
+
+        # 3. AsignacionTurno (la de inicio más reciente que aplique)
+        for asignacion in self._asignaciones.get(empleado_id, ()):
+            if asignacion.aplica_en_fecha(fecha):
+                return self._desde_turno(asignacion.turno, 'asignacion')
+
+        return None
+
+    def _desde_turno(self, turno: Turno, origen: str) -> TurnoEfectivo:
+        return TurnoEfectivo(
+            hora_entrada=turno.hora_entrada,
+            hora_salida=turno.hora_salida,
+            tolerancia_minutos=self.TOLERANCIA_DEFAULT,
+            cruza_medianoche=turno.cruza_medianoche,
+            turno=turno,
+            origen=origen
+        )
+
+    def es_turno_nocturno(self, empleado, fecha: date) -> bool:
+        """Indica si el turno del empleado en la fecha cruza medianoche"""
+        turno = self.turno(empleado, fecha)
+        return bool(turno and turno.cruza_medianoche)
+
+    def fechas(self) -> Iterable[date]:
+        """Fechas del rango precargado"""
+        fecha = self.fecha_inicio
+        while fecha <= self.fecha_fin:
+            yield fecha
+            fecha += timedelta(days=1)
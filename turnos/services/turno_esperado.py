@@ -0,0 +1,132 @@
+"""
+Mantenimiento de la tabla materializada TurnoEsperado.
+
+Las filas se recalculan con ScheduleResolver (sin leer la propia tabla) y se
+escriben con un solo bulk_create con upsert sobre (empleado, fecha).
+"""
+
+from datetime import date, timedelta
+from typing import Optional, Tuple
+from zoneinfo import ZoneInfo
+
+from django.conf import settings
+from django.db.models import Max, Min, QuerySet
+from django.utils import timezone
+
+from empleados.models import Empleado
+from turnos.models import TurnoEsperado
+
+from .schedule_resolver import ScheduleResolver
+
+MEXICO_TZ = ZoneInfo('America/Mexico_City')
+
+CAMPOS_ACTUALIZABLES = [
+    'turno', 'hora_entrada', 'hora_salida', 'tolerancia_minutos',
+    'cruza_medianoche', 'es_descanso', 'origen', 'fecha_actualizacion',
+]
+
+
+class TurnoEsperadoService:
+    """Materializa y refresca los turnos esperados"""
+
+    @staticmethod
+    def horizonte(hoy: Optional[date] = None) -> Tuple[date, date]:
+        """Rango de fechas que se mantiene materializado alrededor de hoy"""
+        hoy = hoy or timezone.now().astimezone(MEXICO_TZ).date()
+        return (
+            hoy - timedelta(days=getattr(settings, 'TURNOS_ESPERADOS_DIAS_ATRAS', 62)),
+            hoy + timedelta(days=getattr(settings, 'TURNOS_ESPERADOS_DIAS_ADELANTE', 62)),
+        )
+
+    @staticmethod
+    def materializar(empleados, fecha_inicio: date, fecha_fin: date, tamano_lote: int = 1000) -> int:
+        """
+        Recalcula y guarda el turno esperado de los empleados en el rango.
+
+        Args:
+            empleados: QuerySet, lista de Empleado o lista de ids
+            fecha_inicio: Primer día
+            fecha_fin: Último día (inclusive)
+
+        Returns:
+            Número de filas escritas
+        """
+        if fecha_fin < fecha_inicio:
+            return 0
+        if isinstance(empleados, QuerySet):
+            empleado_ids = list(empleados.values_list('pk', flat=True))
+        else:
+            empleado_ids = [getattr(empleado, 'pk', empleado) for empleado in empleados]
+        if not empleado_ids:
+            return 0
+
+        resolver = ScheduleResolver(empleado_ids, fecha_inicio, fecha_fin, usar_materializado=False)
+        ahora = timezone.now()
+        filas = []
+        for empleado_id in empleado_ids:
+            for fecha in resolver.fechas():
+                turno = resolver.turno(empleado_id, fecha)
+                fila = TurnoEsperado(empleado_id=empleado_id, fecha=fecha, fecha_actualizacion=ahora)
+                if turno is not None:
+                    fila.turno = turno.turno
+                    fila.hora_entrada = turno.hora_entrada
+                    fila.hora_salida = turno.hora_salida
+                    fila.tolerancia_minutos = turno.tolerancia_minutos
+                    fila.cruza_medianoche = turno.cruza_medianoche
+                    fila.es_descanso = turno.es_descanso
+                    fila.origen = turno.origen
+                filas.append(fila)
+
+        TurnoEsperado.objects.bulk_create(
+            filas,
+            batch_size=tamano_lote,
+            update_conflicts=True,
+            unique_fields=['empleado', 'fecha'],
+            update_fields=CAMPOS_ACTUALIZABLES,
+        )
+        return len(filas)
+
+    @staticmethod
+    def refrescar_empleado(empleado_id: int, desde: Optional[date] = None,
+                           hasta: Optional[date] = None) -> int:
+        """
+        Recalcula las filas de un empleado después de un cambio en su
+        horario o asignaciones: el horizonte más cualquier fecha ya
+        materializada, acotado opcionalmente a [desde, hasta].
+        """
+        inicio, fin = TurnoEsperadoService.horizonte()
+        existentes = TurnoEsperado.objects.filter(empleado_id=empleado_id).aggregate(
+            minima=Min('fecha'), maxima=Max('fecha')
+        )
+        if existentes['minima']:
+            inicio = min(inicio, existentes['minima'])
+            fin = max(fin, existentes['maxima'])
+        if desde:
+            inicio = max(inicio, desde)
+        if hasta:
+            fin = min(fin, hasta)
+        return TurnoEsperadoService.materializar([empleado_id], inicio, fin)
+
+    @staticmethod
+    def asegurar_rango(empleados, fecha_inicio: date, fecha_fin: date) -> int:
+        """
+        Materializa el rango si le faltan filas (p. ej. fechas fuera del
+        horizonte o empleados nuevos). Pensado para reportes que hacen JOIN
+        directo contra TurnoEsperado.
+
+        Returns:
+            Número de filas escritas (0 si ya estaba completo)
+        """
+        if not isinstance(empleados, QuerySet):
+            ids = [getattr(empleado, 'pk', empleado) for empleado in empleados]
+            empleados = Empleado.objects.filter(pk__in=ids)
+        dias = (fecha_fin - fecha_inicio).days + 1
+        esperadas = empleados.count() * dias
+        existentes = TurnoEsperado.objects.filter(
+            empleado__in=empleados.values('pk'),
+            fecha__gte=fecha_inicio,
+            fecha__lte=fecha_fin
+        ).count()
+        if existentes >= esperadas:
+            return 0
+        return TurnoEsperadoService.materializar(empleados, fecha_inicio, fecha_fin)
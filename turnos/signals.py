@@ -0,0 +1,144 @@
+"""
+Señales que mantienen actualizada la tabla TurnoEsperado.
+
+Los cambios de una transacción se acumulan (empleados y rango de fechas) y
+se aplican en un solo transaction.on_commit: un materializar por rango
+distinto (normalmente uno) y un solo ResumenService.reconstruir para los días
+ya transcurridos, cuyas faltas dependen del turno esperado. Así una
+asignación masiva de N empleados no repite el recálculo N veces, y si la
+transacción se revierte no se hace ningún trabajo.
+"""
+
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import Max, Min
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from empleados.models import Empleado
+from horarios.models import Horario
+
+from .models import AsignacionTurno, RolMensual, Turno, TurnoEsperado
+from .services import TurnoEsperadoService
+
+class _RefrescoPendiente:
+    """Empleados y fechas a recalcular al confirmar la transacción actual"""
+
+    def __init__(self):
+        # Empleados a recalcular completos: horizonte y filas ya materializadas
+        self.completos = set()
+        # empleado_id -> (desde, hasta) de cambios acotados a ciertos días
+        self.rangos = {}
+
+    def agregar(self, empleado_ids, desde=None, hasta=None):
+        if desde is None:
+            self.completos.update(empleado_ids)
+            return
+        for empleado_id in empleado_ids:
+            anterior = self.rangos.get(empleado_id, (desde, hasta))
+            self.rangos[empleado_id] = (min(anterior[0], desde), max(anterior[1], hasta))
+
+    def __call__(self):
+        # Al borrar un empleado sus horarios se borran en cascada: no hay nada que refrescar
+        existentes = set(Empleado.objects.filter(
+            pk__in=self.completos | set(self.rangos)
+        ).values_list('pk', flat=True))
+        if not existentes:
+            return
+
+        horizonte = TurnoEsperadoService.horizonte()
+        completos = self.completos & existentes
+        # Los recálculos completos cubren también las filas ya materializadas fuera del horizonte
+        limites = {
+            fila['empleado_id']: (fila['minima'], fila['maxima'])
+            for fila in TurnoEsperado.objects.filter(empleado_id__in=completos)
+            .values('empleado_id').annotate(minima=Min('fecha'), maxima=Max('fecha')).order_by()
+        }
+        por_rango = {}
+        for empleado_id in existentes:
+            rangos = [self.rangos[empleado_id]] if empleado_id in self.rangos else []
+            if empleado_id in completos:
+                rangos += [horizonte, limites.get(empleado_id, horizonte)]
+            rango = (min(desde for desde, _ in rangos), max(hasta for _, hasta in rangos))
+            por_rango.setdefault(rango, []).append(empleado_id)
+
+        for (desde, hasta), empleado_ids in por_rango.items():
+            TurnoEsperadoService.materializar(empleado_ids, desde, hasta)
+
+        # Resúmenes: desde el cambio más antiguo; los completos, hasta ayer
+        acotados = [self.rangos[empleado_id] for empleado_id in existentes if empleado_id in self.rangos]
+        desde = min([desde for desde, _ in acotados] + ([horizonte[0]] if completos else []))
+        hasta = None if completos else max(hasta for _, hasta in acotados)
+        _reconstruir_resumenes(existentes, desde, hasta)
+
+
+def _programar_refresco(empleado_ids, desde=None, hasta=None):
+    """
+    Agrega los empleados al refresco de la transacción actual; el primer
+    cambio de la transacción registra el on_commit. Fuera de un bloque
+    atómico (autocommit) on_commit ejecuta el refresco en el acto.
+    """
+    empleado_ids = set(empleado_ids)
+    if not empleado_ids:
+        return
+    conexion = transaction.get_connection()
+    pendiente = getattr(conexion, 'refresco_turnos_pendiente', None)
+    # Si el savepoint o la transacción donde se registró se revirtió, su
+    # on_commit ya no está en la cola y se empieza uno nuevo
+    if pendiente is None or not any(hook is pendiente for _, hook, _ in conexion.run_on_commit):
+        pendiente = conexion.refresco_turnos_pendiente = _RefrescoPendiente()
+        # Se agrega antes de registrar: en autocommit el hook corre de inmediato
+        pendiente.agregar(empleado_ids, desde, hasta)
+        transaction.on_commit(pendiente)
+        return
+    pendiente.agregar(empleado_ids, desde, hasta)
+
+
+def _reconstruir_resumenes(empleado_ids, desde, hasta=None):
+    from registros.services.resumen_service import ResumenService
+
+    ayer = ResumenService.hoy() - timedelta(days=1)
+    hasta = min(hasta, ayer) if hasta else ayer
+    if desde <= hasta:
+        ResumenService.reconstruir(desde, hasta, empleado_ids)
+
+
+@receiver(post_save, sender=RolMensual)
+@receiver(post_delete, sender=RolMensual)
+def refrescar_por_rol(sender, instance, **kwargs):
+    """Un rol afecta solo a su día"""
+    _programar_refresco([instance.empleado_id], instance.fecha, instance.fecha)
+
+
+@receiver(post_save, sender=Horario)
+@receiver(post_delete, sender=Horario)
+def refrescar_por_horario(sender, instance, **kwargs):
+    _programar_refresco([instance.empleado_id])
+
+
+@receiver(post_save, sender=AsignacionTurno)
+@receiver(post_delete, sender=AsignacionTurno)
+def refrescar_por_asignacion(sender, instance, **kwargs):
+    # No se acota al periodo de la asignación: al editarla, su periodo
+    # anterior también cambia
+    _programar_refresco([instance.empleado_id])
+
+
+@receiver(post_save, sender=Turno)
+def refrescar_por_turno(sender, instance, created, **kwargs):
+    if created:
+        return
+    empleado_ids = TurnoEsperado.objects.filter(
+        turno=instance
+    ).values_list('empleado_id', flat=True).distinct()
+    _programar_refresco(empleado_ids)
+
+
+@receiver(pre_delete, sender=Turno)
+def refrescar_por_turno_eliminado(sender, instance, **kwargs):
+    # Antes de borrar: después, el FK de TurnoEsperado ya quedó en NULL
+    empleado_ids = list(
+        TurnoEsperado.objects.filter(turno=instance).values_list('empleado_id', flat=True).distinct()
+    )
+    _programar_refresco(empleado_ids)
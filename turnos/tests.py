@@ -1,3 +1,218 @@
-from django.test import TestCase
+from datetime import date, time, timedelta
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.db import IntegrityError, transaction
+from django.test import TestCase, TransactionTestCase, override_settings
+from rest_framework.test import APIClient
+
+from checador.testing import PresupuestoConsultasMixin
+from empleados.models import Empleado
+from horarios.models import Horario
+from turnos.models import AsignacionTurno, RolMensual, Turno, TurnoEsperado
+from turnos.services import ScheduleResolver, TurnoEsperadoService
+
+
+class PresupuestoConsultasTurnosTest(PresupuestoConsultasMixin, TestCase):
+    """Los endpoints de turnos no deben consultar por empleado (N+1)"""
+
+    # Consultas del on_commit de turnos/signals.py: materializar y reconstruir
+    # los resúmenes, sin importar cuántos empleados cambiaron
+    RECALCULO_AL_CONFIRMAR = 25
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_user('admin', password='x', is_staff=True)
+        cls.turno = Turno.objects.create(
+            nombre='Matutino', codigo='MAT', hora_entrada=time(8), hora_salida=time(16)
+        )
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def crear_empleados(self, cantidad, inicio=0):
+        empleados = []
+        for i in range(inicio, inicio + cantidad):
+            user = User.objects.create_user(f'empleado{i}', first_name='Empleado', last_name=str(i))
+            empleados.append(Empleado.objects.create(
+                user=user, codigo_empleado=f'E{i:03d}', departamento='Operaciones'
+            ))
+        return empleados
+
+    def test_empleados_disponibles_consultas_constantes(self):
+        empleados = self.crear_empleados(15)
+        for empleado in empleados[:5]:
+            AsignacionTurno.objects.create(
+                empleado=empleado, turno=self.turno, fecha_inicio=date(2026, 1, 1)
+            )
+
+        with self.assertPresupuestoConsultas(3, max_repeticiones=1):
+            response = self.client.get(
+                '/api/asignaciones/empleados_disponibles/', {'fecha': '2026-01-15'}
+            )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['total'], 10)
+
+    # Horizonte corto: cada bulk_create de TurnoEsperado cabe en un solo
+    # INSERT también en SQLite (999 parámetros por consulta)
+    @override_settings(TURNOS_ESPERADOS_DIAS_ATRAS=3, TURNOS_ESPERADOS_DIAS_ADELANTE=3)
+    def test_asignar_masivo_sin_consultas_por_empleado(self):
+        empleados = self.crear_empleados(10)
+        ids = [empleado.id for empleado in empleados] + [999999]
+
+        # Por asignación solo quedan el savepoint (y su liberación), la
+        # validación de solapamiento y el INSERT; empleado, usuario y turno
+        # no se releen. Los turnos esperados y los resúmenes se recalculan
+        # una sola vez al confirmar, con un número fijo de consultas
+        with self.assertPresupuestoConsultas(4 + 4 * len(empleados) + self.RECALCULO_AL_CONFIRMAR), \
+                self.captureOnCommitCallbacks(execute=True) as callbacks:
+            response = self.client.post('/api/asignaciones/asignar_masivo/', {
+                'empleados_ids': ids,
+                'turno_id': self.turno.id,
+                'fecha_inicio': '2026-01-19',
+            }, format='json')
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['exitosas'], 10)
+        self.assertEqual(response.data['errores'], 1)
+        self.assertEqual(len(callbacks), 1)
+
+
+class ScheduleResolverTest(TestCase):
+    """Prioridad RolMensual > Horario > AsignacionTurno y días de descanso"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.matutino = Turno.objects.create(nombre='Matutino', codigo='MAT', hora_entrada=time(8), hora_salida=time(16))
+        cls.nocturno = Turno.objects.create(
+            nombre='Nocturno', codigo='NOC', hora_entrada=time(22), hora_salida=time(6), cruza_medianoche=True
+        )
+        cls.empleado = Empleado.objects.create(
+            user=User.objects.create_user('empleado'), codigo_empleado='E001', departamento='Operaciones'
+        )
+        # Semana del lunes 19 de enero de 2026
+        AsignacionTurno.objects.create(empleado=cls.empleado, turno=cls.matutino, fecha_inicio=date(2026, 1, 1))
+        Horario.objects.create(
+            empleado=cls.empleado, dia_semana=1, hora_entrada=time(9), hora_salida=time(17), tolerancia_minutos=5
+        )
+        RolMensual.objects.create(empleado=cls.empleado, fecha=date(2026, 1, 20), turno=cls.nocturno)
+        RolMensual.objects.create(empleado=cls.empleado, fecha=date(2026, 1, 21), es_descanso=True)
+        # Rol sin turno ni descanso: no sobrescribe el horario del lunes
+        RolMensual.objects.create(empleado=cls.empleado, fecha=date(2026, 1, 26))
+
+    def esperados(self):
+        return {
+            date(2026, 1, 19): ('horario', time(9), 5, False),
+            date(2026, 1, 20): ('rol', time(22), ScheduleResolver.TOLERANCIA_DEFAULT, False),
+            date(2026, 1, 21): ('rol', None, 0, True),
+            date(2026, 1, 22): ('asignacion', time(8), ScheduleResolver.TOLERANCIA_DEFAULT, False),
+            date(2026, 1, 26): ('horario', time(9), 5, False),
+        }
+
+    def assertTurnos(self, resolver):
+        for fecha, (origen, entrada, tolerancia, descanso) in self.esperados().items():
+            with self.subTest(fecha=fecha):
+                turno = resolver.turno(self.empleado, fecha)
+                self.assertEqual(
+                    (turno.origen, turno.hora_entrada, turno.tolerancia_minutos, turno.es_descanso),
+                    (origen, entrada, tolerancia, descanso)
+                )
+        # La asignación no aplica en sábado
+        self.assertIsNone(resolver.turno(self.empleado, date(2026, 1, 24)))
+        self.assertTrue(resolver.es_turno_nocturno(self.empleado, date(2026, 1, 20)))
+
+    def test_prioridad_de_origenes(self):
+        with self.assertNumQueries(4):
+            resolver = ScheduleResolver([self.empleado.pk], date(2026, 1, 19), date(2026, 1, 26))
+            self.assertTurnos(resolver)
+
+    def test_desde_tabla_materializada(self):
+        TurnoEsperadoService.materializar([self.empleado.pk], date(2026, 1, 19), date(2026, 1, 26))
+
+        with self.assertNumQueries(1):
+            resolver = ScheduleResolver(Empleado.objects.all(), date(2026, 1, 19), date(2026, 1, 26))
+            self.assertTurnos(resolver)
+
+    def test_fecha_fuera_de_rango(self):
+        resolver = ScheduleResolver([self.empleado.pk], date(2026, 1, 19))
+        with self.assertRaises(ValueError):
+            resolver.turno(self.empleado, date(2026, 1, 20))
+
+
+class RefrescoTurnosTest(TestCase):
+    """Las señales juntan los cambios de una transacción en un solo on_commit"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.turno = Turno.objects.create(nombre='Matutino', codigo='MAT', hora_entrada=time(8), hora_salida=time(16))
+        cls.empleados = [
+            Empleado.objects.create(
+                user=User.objects.create_user(f'empleado{i}'), codigo_empleado=f'E{i:03d}', departamento='Operaciones'
+            )
+            for i in range(3)
+        ]
+
+    @override_settings(TURNOS_ESPERADOS_DIAS_ATRAS=3, TURNOS_ESPERADOS_DIAS_ADELANTE=3)
+    def test_un_solo_refresco_por_transaccion(self):
+        inicio, fin = TurnoEsperadoService.horizonte()
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            for empleado in self.empleados:
+                AsignacionTurno.objects.create(empleado=empleado, turno=self.turno, fecha_inicio=inicio)
+            Horario.objects.create(
+                empleado=self.empleados[0], dia_semana=inicio.isoweekday(), hora_entrada=time(9), hora_salida=time(17)
+            )
+            # Fecha fuera del horizonte: el rol se materializa solo para su día
+            RolMensual.objects.create(empleado=self.empleados[1], fecha=fin + timedelta(days=30), turno=self.turno)
+
+        self.assertEqual(len(callbacks), 1)
+        self.assertEqual(
+            TurnoEsperado.objects.filter(fecha__gte=inicio, fecha__lte=fin).count(),
+            len(self.empleados) * ((fin - inicio).days + 1)
+        )
+        self.assertEqual(
+            TurnoEsperado.objects.get(empleado=self.empleados[0], fecha=inicio).origen, 'horario'
+        )
+        self.assertTrue(
+            TurnoEsperado.objects.filter(empleado=self.empleados[1], fecha=fin + timedelta(days=30)).exists()
+        )
+
+    def test_savepoint_revertido(self):
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            try:
+                with transaction.atomic():
+                    AsignacionTurno.objects.create(
+                        empleado=self.empleados[0], turno=self.turno, fecha_inicio=date(2026, 1, 1)
+                    )
+                    raise IntegrityError('revertir')
+            except IntegrityError:
+                pass
+            RolMensual.objects.create(empleado=self.empleados[1], fecha=date(2026, 1, 20), turno=self.turno)
+
+        # El on_commit del savepoint revertido se descartó y se registró uno nuevo
+        self.assertEqual(len(callbacks), 1)
+        self.assertFalse(AsignacionTurno.objects.exists())
+        self.assertFalse(TurnoEsperado.objects.filter(origen='asignacion').exists())
+        self.assertEqual(
+            TurnoEsperado.objects.get(empleado=self.empleados[1], fecha=date(2026, 1, 20)).origen, 'rol'
+        )
+
+
+class RefrescoTurnosAutocommitTest(TransactionTestCase):
+    """Sin bloque atómico el refresco se aplica al guardar"""
+
+    @override_settings(TURNOS_ESPERADOS_DIAS_ATRAS=3, TURNOS_ESPERADOS_DIAS_ADELANTE=3)
+    def test_horario_en_autocommit(self):
+        empleado = Empleado.objects.create(
+            user=User.objects.create_user('autocommit'), codigo_empleado='E900', departamento='Operaciones'
+        )
+        inicio, fin = TurnoEsperadoService.horizonte()
+        self.assertFalse(transaction.get_connection().in_atomic_block)
+
+        Horario.objects.create(
+            empleado=empleado, dia_semana=inicio.isoweekday(), hora_entrada=time(9), hora_salida=time(17)
+        )
+
+        esperado = TurnoEsperado.objects.get(empleado=empleado, fecha=inicio)
+        self.assertEqual(esperado.origen, 'horario')
+        self.assertEqual(esperado.hora_entrada, time(9))
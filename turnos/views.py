@@ -2,15 +2,16 @@ from rest_framework import viewsets, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
-from django.db.models import Q
+from django.db import transaction
+from django.db.models import Exists, OuterRef, Q
 from datetime import datetime, timedelta
-from .models import Turno, AsignacionTurno
+from .models import Turno, AsignacionTurno, TurnoEsperado
 from .serializers import (
     TurnoSerializer, 
     AsignacionTurnoSerializer,
-    AsignacionTurnoCreateSerializer,
-    RolSemanalSerializer
+    AsignacionTurnoCreateSerializer
 )
+from .services import TurnoEsperadoService
 from empleados.models import Empleado
 
 
@@ -43,6 +44,9 @@ class AsignacionTurnoViewSet(viewsets.ModelViewSet):
     queryset = AsignacionTurno.objects.select_related('empleado', 'turno').all()
     permission_classes = [IsAuthenticated]
     
+    # Clave de rol_semanal para los días con horario pero sin turno
+    SIN_TURNO = 'SIN_TURNO'
+    
     def get_serializer_class(self):
         if self.action in ['create', 'update', 'partial_update']:
             return AsignacionTurnoCreateSerializer
@@ -108,22 +112,31 @@ class AsignacionTurnoViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-        # Obtener asignaciones en el rango de fechas
-        asignaciones = AsignacionTurno.objects.select_related(
-            'empleado', 'empleado__user', 'turno'
-        ).filter(
-            activo=True,
-            fecha_inicio__lte=fecha_fin_obj
-        ).filter(
-            Q(fecha_fin__gte=fecha_inicio_obj) | Q(fecha_fin__isnull=True)
-        )
+        # Turnos esperados del rango (tabla materializada)
+        empleados = Empleado.objects.filter(activo=True)
         
         # Filtrar por departamento si se proporciona
         if departamento:
-            asignaciones = asignaciones.filter(empleado__departamento=departamento)
+            empleados = empleados.filter(departamento=departamento)
+        
+        TurnoEsperadoService.asegurar_rango(empleados, fecha_inicio_obj, fecha_fin_obj)
+        turnos_esperados = TurnoEsperado.objects.select_related(
+            'empleado', 'empleado__user', 'turno'
+        ).filter(
+            empleado__in=empleados,
+            fecha__gte=fecha_inicio_obj,
+            fecha__lte=fecha_fin_obj,
+            hora_entrada__isnull=False,
+            es_descanso=False
+        ).order_by('fecha', 'empleado__codigo_empleado')
+        
+        por_fecha = {}
+        for turno_esperado in turnos_esperados:
+            por_fecha.setdefault(turno_esperado.fecha, []).append(turno_esperado)
         
         # Construir el rol semanal
         rol = []
+        turnos_serializados = {}
         current_date = fecha_inicio_obj
         
         while current_date <= fecha_fin_obj:
@@ -133,24 +146,30 @@ class AsignacionTurnoViewSet(viewsets.ModelViewSet):
                 'turnos': {}
             }
             
-            # Obtener asignaciones que aplican en esta fecha
-            for asignacion in asignaciones:
-                if asignacion.aplica_en_fecha(current_date):
-                    turno_codigo = asignacion.turno.codigo
-                    
-                    if turno_codigo not in dia_data['turnos']:
-                        dia_data['turnos'][turno_codigo] = {
-                            'turno': TurnoSerializer(asignacion.turno).data,
-                            'empleados': []
-                        }
-                    
-                    dia_data['turnos'][turno_codigo]['empleados'].append({
-                        'id': asignacion.empleado.id,
-                        'codigo_empleado': asignacion.empleado.codigo_empleado,
-                        'nombre_completo': asignacion.empleado.nombre_completo,
-                        'departamento': asignacion.empleado.departamento,
-                        'puesto': asignacion.empleado.puesto
-                    })
+            # Empleados con turno en esta fecha; los horarios sin turno van
+            # agrupados en SIN_TURNO con 'turno': None
+            for turno_esperado in por_fecha.get(current_date, []):
+                turno = turno_esperado.turno
+                empleado = turno_esperado.empleado
+                codigo = turno.codigo if turno else self.SIN_TURNO
+                
+                if codigo not in dia_data['turnos']:
+                    if turno and turno.id not in turnos_serializados:
+                        turnos_serializados[turno.id] = TurnoSerializer(turno).data
+                    dia_data['turnos'][codigo] = {
+                        'turno': turnos_serializados[turno.id] if turno else None,
+                        'empleados': []
+                    }
+                
+                dia_data['turnos'][codigo]['empleados'].append({
+                    'id': empleado.id,
+                    'codigo_empleado': empleado.codigo_empleado,
+                    'nombre_completo': empleado.nombre_completo,
+                    'departamento': empleado.departamento,
+                    'puesto': empleado.puesto,
+                    'hora_entrada': turno_esperado.hora_entrada.strftime('%H:%M'),
+                    'hora_salida': turno_esperado.hora_salida.strftime('%H:%M') if turno_esperado.hora_salida else None
+                })
             
             rol.append(dia_data)
             current_date += timedelta(days=1)
@@ -185,32 +204,31 @@ class AsignacionTurnoViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-        # Obtener todos los empleados activos
-        empleados = Empleado.objects.filter(activo=True)
+        # Empleados activos sin asignación vigente en la fecha (una sola consulta)
+        asignacion_vigente = AsignacionTurno.objects.filter(
+            empleado=OuterRef('pk'),
+            activo=True,
+            fecha_inicio__lte=fecha_obj
+        ).filter(
+            Q(fecha_fin__gte=fecha_obj) | Q(fecha_fin__isnull=True)
+        )
+        empleados = Empleado.objects.select_related('user').filter(activo=True).exclude(
+            Exists(asignacion_vigente)
+        )
         
         if departamento:
             empleados = empleados.filter(departamento=departamento)
         
-        # Filtrar empleados que no tienen asignación en la fecha
-        empleados_disponibles = []
-        
-        for empleado in empleados:
-            tiene_asignacion = AsignacionTurno.objects.filter(
-                empleado=empleado,
-                activo=True,
-                fecha_inicio__lte=fecha_obj
-            ).filter(
-                Q(fecha_fin__gte=fecha_obj) | Q(fecha_fin__isnull=True)
-            ).exists()
-            
-            if not tiene_asignacion:
-                empleados_disponibles.append({
-                    'id': empleado.id,
-                    'codigo_empleado': empleado.codigo_empleado,
-                    'nombre_completo': empleado.nombre_completo,
-                    'departamento': empleado.departamento,
-                    'puesto': empleado.puesto
-                })
+        empleados_disponibles = [
+            {
+                'id': empleado.id,
+                'codigo_empleado': empleado.codigo_empleado,
+                'nombre_completo': empleado.nombre_completo,
+                'departamento': empleado.departamento,
+                'puesto': empleado.puesto
+            }
+            for empleado in empleados
+        ]
         
         return Response({
             'fecha': fecha,
@@ -267,9 +285,24 @@ class AsignacionTurnoViewSet(viewsets.ModelViewSet):
         asignaciones_creadas = []
         errores = []
         
+        # Todos los empleados en una consulta (con su usuario para el serializer)
+        ids_validos = []
         for empleado_id in empleados_ids:
             try:
-                empleado = Empleado.objects.get(id=empleado_id, activo=True)
+                ids_validos.append(int(empleado_id))
+            except (TypeError, ValueError):
+                pass
+        empleados = Empleado.objects.select_related('user').filter(activo=True).in_bulk(ids_validos)
+        
+        with transaction.atomic():
+            for empleado_id in empleados_ids:
+                try:
+                    empleado = empleados.get(int(empleado_id))
+                except (TypeError, ValueError):
+                    empleado = None
+                if empleado is None:
+                    errores.append(f'Empleado con ID {empleado_id} no encontrado')
+                    continue
                 
                 # Preparar datos de asignación
                 asignacion_data = {
@@ -290,17 +323,19 @@ class AsignacionTurnoViewSet(viewsets.ModelViewSet):
                     if dia_lower in dias_map:
                         asignacion_data[dias_map[dia_lower]] = True
                 
-                # Crear asignación
-                asignacion = AsignacionTurno(**asignacion_data)
-                asignacion.full_clean()  # Validar
-                asignacion.save()
-                
-                asignaciones_creadas.append(AsignacionTurnoSerializer(asignacion).data)
-                
-            except Empleado.DoesNotExist:
-                errores.append(f'Empleado con ID {empleado_id} no encontrado')
-            except Exception as e:
-                errores.append(f'Error al asignar empleado {empleado_id}: {str(e)}')
+                try:
+                    # Cada asignación en su propio savepoint: un error no
+                    # revierte las demás
+                    with transaction.atomic():
+                        asignacion = AsignacionTurno(**asignacion_data)
+                        # empleado y turno ya están cargados: no revalidar las FK
+                        asignacion.full_clean(exclude=['empleado', 'turno'])
+                        asignacion.save()
+                    
+                    asignaciones_creadas.append(AsignacionTurnoSerializer(asignacion).data)
+                    
+                except Exception as e:
+                    errores.append(f'Error al asignar empleado {empleado_id}: {str(e)}')
         
         return Response({
             'exitosas': len(asignaciones_creadas),